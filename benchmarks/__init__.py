@@ -0,0 +1,3 @@
+"""
+Benchmarks for JIFMaker, run with ``python -m benchmarks.<name>`` from the repository root
+"""
@@ -0,0 +1,45 @@
+"""
+Shared helpers for the JIFMaker benchmarks
+"""
+
+import os
+import subprocess
+import time
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def make_test_video(path, source="testsrc2", size="1280x720", rate=30, duration=10):
+    """Render a deterministic test clip with one of FFmpeg's lavfi sources (reused if it already exists)"""
+    if os.path.exists(path):
+        return path
+
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi",
+        "-i", f"{source}=size={size}:rate={rate}",
+        "-t", str(duration),
+        "-pix_fmt", "yuv420p",
+        path
+    ]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+def run_timed(commands):
+    """Run a list of commands one after another and return the elapsed wall time in seconds"""
+    start = time.perf_counter()
+    for cmd in commands:
+        subprocess.run(cmd, capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+def frame_hashes(path):
+    """Return the per-frame MD5 hashes of a media file, used to check that two outputs decode identically"""
+    cmd = ["ffmpeg", "-v", "error", "-i", path, "-f", "framemd5", "-"]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return [line.rsplit(",", 1)[-1].strip() for line in result.stdout.splitlines() if not line.startswith("#")]
+
@@ -0,0 +1,74 @@
+"""
+Compare the FFmpeg and in-process Pillow backends over clip lengths and output widths, and show what auto picks
+
+Usage: python -m benchmarks.bench_backends [--durations 1 3 10] [--widths 160 320 640] [--repeat 3]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from PIL import Image
+
+from jifmaker.backends import choose_backend, get_backend, output_pixels
+from jifmaker.engine import ConversionOptions, MediaInfo, format_time
+from benchmarks._common import make_test_video
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def best_of(backend, input_file, output_file, options, info, repeat):
+    """Return (fastest elapsed seconds, output size) over repeat conversions"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = backend.convert(input_file, output_file, options, info)
+        times.append(time.perf_counter() - start)
+    return min(times), result.size
+
+
+def report(label, input_file, output_dir, options, info, repeat):
+    auto = choose_backend(input_file, options, info).name
+    cells = []
+    for name in ("ffmpeg", "pillow"):
+        elapsed, size = best_of(get_backend(name), input_file, os.path.join(output_dir, f"{name}.gif"), options, info,
+                                repeat)
+        cells.append(f"{name} {elapsed:6.3f} s {size / 1024:8.1f} KB")
+    print(f"  {label:<22} {'  '.join(cells)}  auto: {auto}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FFmpeg and Pillow encoding backends")
+    parser.add_argument("--durations", type=int, nargs="+", default=[1, 3, 10], help="Clip lengths in seconds")
+    parser.add_argument("--widths", type=int, nargs="+", default=[160, 320, 640], help="Output GIF widths")
+    parser.add_argument("--fps", type=int, default=10, help="Output frame rate")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the fastest is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        longest = max(args.durations)
+        input_file = make_test_video(os.path.join(work_dir, "input.mp4"), size="1280x720", duration=longest)
+        info = MediaInfo(input_file, 1280, 720, float(longest), 30.0, "h264", True)
+
+        print(f"Video input: 1280x720 @ 30 fps -> {args.fps} fps GIF, best of {args.repeat}")
+        for duration in args.durations:
+            for width in args.widths:
+                options = ConversionOptions(fps=args.fps, width=width, end_time=format_time(duration))
+                label = f"{duration}s {width}px ({output_pixels(options, info) / 1e6:.1f} MP)"
+                report(label, input_file, work_dir, options, info, args.repeat)
+
+        # Animated GIF input, the Pillow backend reads it without any FFmpeg process
+        gif_file = os.path.join(work_dir, "input.gif")
+        frames = [Image.new("RGB", (480, 270), (index * 8 % 256, 64, 255 - index * 8 % 256)) for index in range(30)]
+        frames[0].save(gif_file, save_all=True, append_images=frames[1:], duration=100, loop=0)
+        print("GIF input: 480x270, 30 frames")
+        for width in args.widths:
+            report(f"{width}px", gif_file, work_dir, ConversionOptions(fps=args.fps, width=width), None, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
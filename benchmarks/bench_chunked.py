@@ -0,0 +1,56 @@
+"""
+Measure how chunked parallel encoding scales with the number of workers against a single encode
+
+Usage: python -m benchmarks.bench_chunked [--duration 120] [--size 1280x720] [--workers 1 2 4 8]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from jifmaker.chunked import convert_chunked
+from jifmaker.engine import ConversionOptions, MediaInfo, convert
+from benchmarks._common import make_test_video, frame_hashes
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Benchmark chunked parallel GIF encoding")
+    parser.add_argument("--duration", type=int, default=120, help="Length of the synthetic input in seconds")
+    parser.add_argument("--size", default="1280x720", help="Resolution of the synthetic input")
+    parser.add_argument("--width", type=int, default=640, help="Output GIF width")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[n for n in (1, 2, 4, 8, 16, 32) if n <= cores] or [1],
+                        help="Worker counts to try (default: powers of two up to the number of cores)")
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.split("x"))
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = make_test_video(os.path.join(work_dir, "input.mp4"), size=args.size, duration=args.duration)
+        info = MediaInfo(input_file, width, height, float(args.duration), 30.0, "h264", True)
+
+        single_file = os.path.join(work_dir, "single.gif")
+        start = time.perf_counter()
+        convert(input_file, single_file, ConversionOptions(width=args.width))
+        single_time = time.perf_counter() - start
+        single_hashes = frame_hashes(single_file)
+
+        print(f"Input: {args.size} @ 30 fps, {args.duration}s -> {args.width}px GIF on {cores} cores")
+        print(f"  {'single':<12} {single_time:8.2f} s  {os.path.getsize(single_file) / 1024:10.1f} KB")
+        for workers in args.workers:
+            output_file = os.path.join(work_dir, f"chunked_{workers}.gif")
+            result = convert_chunked(input_file, output_file, ConversionOptions(width=args.width, chunks=workers),
+                                     info, jobs=workers)
+            identical = "identical" if frame_hashes(output_file) == single_hashes else "DIFFERENT frames"
+            print(f"  {f'{workers} workers':<12} {result.elapsed:8.2f} s  {result.size / 1024:10.1f} KB  "
+                  f"{single_time / result.elapsed:5.2f}x  {identical}")
+
+
+if __name__ == "__main__":
+    main()
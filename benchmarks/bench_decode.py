@@ -0,0 +1,59 @@
+"""
+Conversion time of a 4K input to small GIFs with the default decode and with fast decode, for a codec that can decode
+at reduced size (MPEG-4 Part 2) and one that cannot (H.264)
+
+Usage: python -m benchmarks.bench_decode [--duration 10] [--widths 320 640] [--frame-skip 1 2]
+"""
+
+import os
+import argparse
+import tempfile
+import dataclasses
+
+from jifmaker.decode import plan_decode
+from jifmaker.engine import ConversionOptions, MediaInfo, build_plan
+from benchmarks._common import make_test_video, run_timed
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fast decode against the default decode")
+    parser.add_argument("--duration", type=int, default=10, help="Length of the input in seconds")
+    parser.add_argument("--widths", type=int, nargs="+", default=[320, 640], help="Output widths")
+    parser.add_argument("--frame-skip", type=int, nargs="+", default=[1, 2], help="Frame skip values")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The AVI muxer's default video codec is MPEG-4 Part 2
+        sources = [("h264", make_test_video(os.path.join(work_dir, "input.mp4"), size="3840x2160",
+                                            duration=args.duration)),
+                   ("mpeg4", make_test_video(os.path.join(work_dir, "input.avi"), size="3840x2160",
+                                             duration=args.duration))]
+        print(f"Video input: {args.duration}s 3840x2160 @ 30 fps")
+
+        for codec, input_file in sources:
+            info = MediaInfo(input_file, width=3840, height=2160, duration=args.duration, fps=30.0, codec=codec,
+                             has_video=True)
+            for width in args.widths:
+                for frame_skip in args.frame_skip:
+                    options = ConversionOptions(width=width, fps=15, frame_skip=frame_skip, reuse_palette=False)
+                    output_file = os.path.join(work_dir, "output.gif")
+                    times = []
+                    sizes = []
+                    for fast in (False, True):
+                        variant = dataclasses.replace(options, fast_decode=fast)
+                        plan = build_plan(input_file, output_file, variant, work_dir, info)
+                        times.append(run_timed([stage.args for stage in plan.stages]))
+                        sizes.append(os.path.getsize(output_file))
+                    decode = plan_decode(dataclasses.replace(options, fast_decode=True), info)
+                    print(f"  {codec:5} -> {width}px, frame skip {frame_skip}: default {times[0]:6.2f}s  "
+                          f"fast {times[1]:6.2f}s  ({times[0] / times[1]:.1f}x, {sizes[1] / sizes[0]:.0%} size)  "
+                          f"{decode.describe()}")
+
+
+if __name__ == "__main__":
+    main()
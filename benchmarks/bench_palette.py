@@ -0,0 +1,41 @@
+"""
+Compare the sampled palette with the full-range palettegen scan on time and mean quantization error
+
+Usage: python -m benchmarks.bench_palette [--durations 10 60 300] [--width 480]
+"""
+
+import os
+import argparse
+import tempfile
+
+from jifmaker.engine import ConversionOptions, MediaInfo, format_time
+from jifmaker.palette import compare_palettes
+from benchmarks._common import make_test_video
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sampled against full-range palette generation")
+    parser.add_argument("--durations", type=int, nargs="+", default=[10, 60, 300], help="Clip lengths in seconds")
+    parser.add_argument("--width", type=int, default=480, help="Output GIF width")
+    parser.add_argument("--fps", type=int, default=15, help="Output frame rate")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        longest = max(args.durations)
+        input_file = make_test_video(os.path.join(work_dir, "input.mp4"), size="1280x720", duration=longest)
+        info = MediaInfo(input_file, 1280, 720, float(longest), 30.0, "h264", True)
+
+        print(f"Video input: 1280x720 @ 30 fps -> {args.width}px {args.fps} fps palette")
+        for duration in args.durations:
+            options = ConversionOptions(width=args.width, fps=args.fps, end_time=format_time(duration))
+            comparison = compare_palettes(input_file, options, info, work_dir)
+            print(f"  {duration:>4}s  {comparison.describe()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Show that the streaming pipeline keeps peak memory flat as clips get longer, next to the buffered in-process encode
+
+Usage: python -m benchmarks.bench_pipeline [--durations 10 30 60] [--width 800] [--memory-limit 256]
+"""
+
+import os
+import argparse
+import tempfile
+
+from jifmaker.backends import get_backend
+from jifmaker.engine import ConversionOptions, MediaInfo, format_time
+from jifmaker.pipeline import MB
+from benchmarks._common import make_test_video
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark peak memory of buffered and streamed Pillow encodes")
+    parser.add_argument("--durations", type=int, nargs="+", default=[10, 30, 60], help="Clip lengths in seconds")
+    parser.add_argument("--width", type=int, default=800, help="Output GIF width")
+    parser.add_argument("--fps", type=int, default=15, help="Output frame rate")
+    parser.add_argument("--memory-limit", type=int, default=256, help="Limit in MB for the streamed encodes")
+    args = parser.parse_args()
+
+    backend = get_backend("pillow")
+    with tempfile.TemporaryDirectory() as work_dir:
+        longest = max(args.durations)
+        input_file = make_test_video(os.path.join(work_dir, "input.mp4"), size="1280x720", duration=longest)
+        info = MediaInfo(input_file, 1280, 720, float(longest), 30.0, "h264", True)
+        output_file = os.path.join(work_dir, "output.gif")
+
+        print(f"Video input: 1280x720 @ 30 fps -> {args.width}px {args.fps} fps GIF")
+        for duration in args.durations:
+            cells = []
+            # A limit far above the clip size keeps every frame in memory, streamed runs first so the memory freed
+            # after a buffered encode does not count against its limit
+            for label, limit in (("streamed", args.memory_limit), ("buffered", 1 << 20)):
+                options = ConversionOptions(width=args.width, fps=args.fps, end_time=format_time(duration),
+                                            memory_limit=limit)
+                result = backend.convert(input_file, output_file, options, info)
+                cells.append(f"{label} {result.elapsed:6.1f} s {result.peak_memory / MB:6.0f} MB peak")
+            print(f"  {duration:>4}s  {'  '.join(cells)}")
+
+
+if __name__ == "__main__":
+    main()
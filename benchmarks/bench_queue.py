@@ -0,0 +1,75 @@
+"""
+Compare running a batch of queued jobs one after another with running several at once through the window's queue
+
+Usage: python -m benchmarks.bench_queue [--files 6] [--jobs 1 2 4] [--duration 5]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+
+from jifmaker.engine import ConversionOptions, MediaInfo
+from jifmaker.jobs import DONE, JobQueue
+from jifmaker.worker import QueueRunner
+from benchmarks._common import make_test_video
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def run_queue(inputs, work_dir, options, info, max_jobs):
+    """Queue every input, run the queue to the end and return the wall time in seconds"""
+    queue = JobQueue()
+    for index, input_file in enumerate(inputs):
+        queue.add(input_file, os.path.join(work_dir, f"out_{index}.gif"), options, info)
+    runner = QueueRunner(queue, os.path.join(work_dir, "temp"), max_jobs)
+
+    loop = QEventLoop()
+    timer = QTimer()
+    timer.timeout.connect(lambda: loop.quit() if not runner.workers and queue.next_job() is None else None)
+    start = time.perf_counter()
+    runner.schedule()
+    timer.start(20)
+    loop.exec_()
+    elapsed = time.perf_counter() - start
+
+    failed = [job for job in queue.jobs if job.status != DONE]
+    if failed:
+        raise RuntimeError(f"Job {failed[0].id} {failed[0].describe()}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the job queue at different concurrency levels")
+    parser.add_argument("--files", type=int, default=6, help="Number of queued files")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4], help="Concurrent jobs to compare")
+    parser.add_argument("--duration", type=int, default=5, help="Length of each input in seconds")
+    parser.add_argument("--backend", default="ffmpeg", help="Encoder the jobs use")
+    args = parser.parse_args()
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The same clip under different names, each job still decodes and encodes it on its own
+        clip = make_test_video(os.path.join(work_dir, "input.mp4"), size="1280x720", duration=args.duration)
+        inputs = [clip] * args.files
+        info = MediaInfo(clip, 1280, 720, float(args.duration), 30.0, "h264", True)
+        options = ConversionOptions(width=480, fps=15, backend=args.backend)
+
+        print(f"{args.files} files of {args.duration}s 1280x720 -> 480px GIF on {os.cpu_count()} cores")
+        baseline = None
+        for jobs in args.jobs:
+            elapsed = run_queue(inputs, work_dir, options, info, jobs)
+            baseline = baseline or elapsed
+            print(f"  {jobs} at a time: {elapsed:6.2f} s  {args.files / elapsed:5.2f} files/s  "
+                  f"{baseline / elapsed:4.2f}x")
+    del app
+
+
+if __name__ == "__main__":
+    main()
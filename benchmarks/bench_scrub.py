@@ -0,0 +1,73 @@
+"""
+Measure preview scrubbing latency: cold seeks against frames served by the LRU cache and prefetcher
+
+Usage: python -m benchmarks.bench_scrub [--size 3840x2160] [--duration 20] [--steps 40]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import statistics
+
+from jifmaker.frames import FrameCache, FramePrefetcher, FrameSource, scrub_step
+from jifmaker.main import PREVIEW_DECODE_SIZE, SCRUB_CACHE_BYTES
+from benchmarks._common import make_test_video
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preview scrubbing latency")
+    parser.add_argument("--size", default="3840x2160", help="Resolution of the synthetic input")
+    parser.add_argument("--duration", type=int, default=20, help="Length of the synthetic input in seconds")
+    parser.add_argument("--steps", type=int, default=40, help="Number of consecutive scrub steps")
+    parser.add_argument("--dwell", type=float, default=0.25, help="Seconds spent on each position while dragging")
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.split("x"))
+    rate = 30
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = make_test_video(os.path.join(work_dir, "input.mp4"), size=args.size, rate=rate,
+                                     duration=args.duration)
+        step = scrub_step(args.duration, rate)
+
+        # Every step decoded on demand, what the preview did before the cache existed
+        source = FrameSource(input_file, width, height, PREVIEW_DECODE_SIZE)
+        cold = []
+        for index in range(args.steps):
+            start = time.perf_counter()
+            source.frame_at(index * step)
+            cold.append(time.perf_counter() - start)
+
+        # The same drag with the prefetcher filling the cache ahead of the cursor
+        cache = FrameCache(SCRUB_CACHE_BYTES)
+        prefetcher = FramePrefetcher(FrameSource(input_file, width, height, PREVIEW_DECODE_SIZE), cache, step)
+        warm = []
+        try:
+            for index in range(args.steps):
+                start = time.perf_counter()
+                prefetcher.request(index)
+                while index not in cache:
+                    time.sleep(0.001)
+                cache.get(index)
+                warm.append(time.perf_counter() - start)
+                time.sleep(args.dwell)
+        finally:
+            prefetcher.close()
+
+    print(f"Input: {args.size} @ {rate} fps, {args.steps} steps of {step * 1000:.0f} ms, "
+          f"decoded at {source.width}x{source.height}")
+    for label, samples in (("on demand", cold), ("cached", warm)):
+        samples = sorted(samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        print(f"  {label:<10} median {statistics.median(samples) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms")
+    print(f"  cache: {cache.hits} hits, {cache.misses} misses, {cache.nbytes / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
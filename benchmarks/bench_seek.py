@@ -0,0 +1,73 @@
+"""
+Decode time of short trims late in a long input: seeking after -i, FFmpeg's input seeking and the keyframe seek plan
+
+Usage: python -m benchmarks.bench_seek [--duration 300] [--positions 0.25 0.5 0.9] [--length 5]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from jifmaker.cache import ProbeCache
+from jifmaker.trim import Seek, format_seconds, format_timestamp, keyframe_times, plan_seek
+from benchmarks._common import make_test_video, run_timed
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def decode_command(input_file, seek, filters):
+    """Return an FFmpeg command that decodes the trim of seek through filters and discards the frames"""
+    return ["ffmpeg", "-v", "error", "-nostdin"] + seek.input_args(input_file) + \
+        ["-vf", ",".join(seek.filters() + filters), "-an", "-f", "null", "-"]
+
+
+def output_seek_command(input_file, start, length, filters):
+    """Return the command with -ss and -t after -i, which decodes everything before the trim and drops it"""
+    return ["ffmpeg", "-v", "error", "-nostdin", "-i", input_file, "-ss", format_timestamp(start),
+            "-t", format_seconds(length), "-vf", ",".join(filters), "-an", "-f", "null", "-"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decode time of late trims with different seeking")
+    parser.add_argument("--duration", type=int, default=300, help="Length of the input in seconds")
+    parser.add_argument("--positions", type=float, nargs="+", default=[0.25, 0.5, 0.9],
+                        help="Trim starts as fractions of the input")
+    parser.add_argument("--length", type=float, default=5, help="Trim length in seconds")
+    parser.add_argument("--width", type=int, default=480, help="Output width")
+    args = parser.parse_args()
+
+    filters = [f"fps=15,scale={args.width}:-1:flags=lanczos"]
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = make_test_video(os.path.join(work_dir, "input.mp4"), size="1280x720", duration=args.duration)
+        cache = ProbeCache(os.path.join(work_dir, "keyframes.sqlite3"))
+
+        start = time.perf_counter()
+        keyframes = keyframe_times(input_file, cache)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        keyframe_times(input_file, cache)
+        warm = time.perf_counter() - start
+        cache.close()
+        print(f"Video input: {args.duration}s 1280x720 @ 30 fps, {len(keyframes or [])} keyframes")
+        print(f"Keyframe probe: {cold:.2f}s, {warm * 1000:.1f} ms cached")
+
+        # Odd millisecond starts so the keyframe plan has an offset to trim, and one exactly on a keyframe, which
+        # rounded to milliseconds can fall just before it and make FFmpeg start from the keyframe before
+        starts = [round(args.duration * position) + 0.437 for position in args.positions]
+        if keyframes and len(keyframes) > 1:
+            starts.append(keyframes[len(keyframes) // 2])
+        for trim_start in starts:
+            output_seek = run_timed([output_seek_command(input_file, trim_start, args.length, filters)])
+            input_seek = run_timed([decode_command(input_file, Seek(trim_start, args.length), filters)])
+            seek = plan_seek(trim_start, args.length, keyframes)
+            keyframe_seek = run_timed([decode_command(input_file, seek, filters)])
+            print(f"  {args.length:g}s at {format_timestamp(trim_start)}: after -i {output_seek:6.2f}s  "
+                  f"input seek {input_seek:5.2f}s  keyframe seek {keyframe_seek:5.2f}s  ({seek.describe()})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Compare the two-pass (palettegen, then paletteuse) and single-pass GIF encodes
+
+Usage: python -m benchmarks.bench_single_pass [--duration 30] [--size 1920x1080] [--repeat 3]
+"""
+
+import os
+import argparse
+import tempfile
+
+from jifmaker.engine import ConversionOptions, build_plan
+from benchmarks._common import make_test_video, run_timed, frame_hashes
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-pass vs two-pass GIF encoding")
+    parser.add_argument("--duration", type=int, default=30, help="Length of the synthetic input in seconds")
+    parser.add_argument("--size", default="1920x1080", help="Resolution of the synthetic input")
+    parser.add_argument("--width", type=int, default=640, help="Output GIF width")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode, the best time is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = make_test_video(os.path.join(work_dir, "input.mp4"), size=args.size, duration=args.duration)
+
+        results = {}
+        for label, single_pass in (("two-pass", False), ("single-pass", True)):
+            output_file = os.path.join(work_dir, f"{label}.gif")
+            options = ConversionOptions(width=args.width, single_pass=single_pass)
+            commands = [stage.args for stage in build_plan(input_file, output_file, options, work_dir).stages]
+            best = min(run_timed(commands) for _ in range(args.repeat))
+            results[label] = (best, os.path.getsize(output_file), frame_hashes(output_file))
+
+    two_pass, single = results["two-pass"], results["single-pass"]
+    print(f"Input: {args.size} @ 30 fps, {args.duration}s -> {args.width}px GIF (best of {args.repeat})")
+    for label, (elapsed, size, _) in results.items():
+        print(f"  {label:<12} {elapsed:8.2f} s  {size / 1024:10.1f} KB")
+    print(f"  speedup      {two_pass[0] / single[0]:8.2f}x")
+    print(f"  identical frames: {'yes' if two_pass[2] == single[2] else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure startup: interpreter baseline, ``jifmaker --version`` and the time until the window first paints, each in a
+fresh process, and fail when the first paint is over budget
+
+Usage: python -m benchmarks.bench_startup [--repeat 5] [--budget 300]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+PAINT_BUDGET_MS = 300  # Process start to first window paint
+
+PAINTED = "painted"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def paint_window():
+    """Open the window and exit as soon as it has painted, run in the measured child process"""
+    from PyQt5.QtCore import QEvent, QObject
+    from PyQt5.QtWidgets import QApplication
+    from jifmaker.main import JIFMaker
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint:
+                print(PAINTED, flush=True)
+                app.quit()
+            return False
+
+    app = QApplication(sys.argv)
+    window = JIFMaker()
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.show()
+    app.exec_()
+
+
+def time_process(cmd, until=None):
+    """Return the milliseconds from starting cmd to its exit, or to the first output line equal to until"""
+    env = dict(os.environ)
+    if sys.platform.startswith("linux") and not env.get("DISPLAY") and not env.get("WAYLAND_DISPLAY"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+    if until is None:
+        process.stdout.read()
+        process.wait()
+    else:
+        for line in process.stdout:
+            if line.strip() == until:
+                break
+    elapsed = (time.perf_counter() - start) * 1000
+    process.stdout.read()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JIFMaker startup")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement, the median is reported")
+    parser.add_argument("--budget", type=float, default=PAINT_BUDGET_MS, help="First paint budget in milliseconds")
+    parser.add_argument("--paint", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.paint:
+        paint_window()
+        return 0
+
+    measurements = [
+        ("python -c pass", [sys.executable, "-c", "pass"], None),
+        ("jifmaker --version", [sys.executable, "-m", "jifmaker.cli", "--version"], None),
+        ("jifmaker batch --help", [sys.executable, "-m", "jifmaker.cli", "batch", "--help"], None),
+        ("first window paint", [sys.executable, "-m", "benchmarks.bench_startup", "--paint"], PAINTED),
+    ]
+    paint = 0.0
+    for label, cmd, until in measurements:
+        times = [time_process(cmd, until) for _ in range(args.repeat)]
+        median = statistics.median(times)
+        print(f"  {label:<24} {median:7.1f} ms  (min {min(times):.1f}, max {max(times):.1f})")
+        paint = median
+
+    if paint > args.budget:
+        print(f"First paint took {paint:.0f} ms, over the {args.budget:.0f} ms budget")
+        return 1
+    print(f"First paint within the {args.budget:.0f} ms budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Reproducible benchmark suite: deterministic lavfi inputs converted through the standard option matrix, each case in
+its own process so its wall time, CPU time (including FFmpeg) and peak RSS are measured alone
+
+Usage: python -m benchmarks.suite run [--quick] [--repeat 3] [--inputs-dir DIR] [-o results.json] [--baseline FILE]
+       python -m benchmarks.suite compare BASELINE RESULTS [--time 0.15] [--size 0.02] [--memory 0.15]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import dataclasses
+from datetime import datetime, timezone
+
+from jifmaker.backends import choose_backend
+from jifmaker.engine import ConversionOptions, MediaInfo
+from jifmaker.telemetry import wait_process
+from benchmarks._common import make_test_video
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+INPUTS = [  # (name, lavfi source, size, seconds), rendered at 30 fps
+    ("testsrc2-240p-2s", "testsrc2", "320x240", 2),
+    ("testsrc2-720p-6s", "testsrc2", "1280x720", 6),
+    ("mandelbrot-480p-4s", "mandelbrot", "640x480", 4),
+    ("color-720p-4s", "color", "1280x720", 4),  # Static content, every frame after the first is unchanged
+]
+
+QUICK_INPUTS = ["testsrc2-240p-2s", "mandelbrot-480p-4s"]
+
+BASE_OPTIONS = {"fps": 15, "width": 480, "colors": 256, "dither": "bayer", "frame_skip": 1, "gifsicle": False}
+
+MATRIX = [  # (label, overrides of BASE_OPTIONS), one setting changed at a time
+    ("base", {}),
+    ("fps=10", {"fps": 10}),
+    ("fps=24", {"fps": 24}),
+    ("width=320", {"width": 320}),
+    ("width=800", {"width": 800}),
+    ("colors=64", {"colors": 64}),
+    ("dither=none", {"dither": "none"}),
+    ("dither=floyd_steinberg", {"dither": "floyd_steinberg"}),
+    ("frame_skip=2", {"frame_skip": 2}),
+    ("gifsicle", {"gifsicle": True}),
+    ("backend=ffmpeg", {"backend": "ffmpeg"}),  # auto encodes short clips in process
+]
+
+QUICK_MATRIX = ["base", "width=320", "colors=64", "frame_skip=2", "backend=ffmpeg"]
+
+THRESHOLDS = {"wall": 0.15, "bytes": 0.02, "peak_rss": 0.15}  # Relative increase that counts as a regression
+
+NOISE_FLOOR = {"wall": 0.05, "bytes": 0, "peak_rss": 4 * 1024 * 1024}  # Absolute changes below these are noise
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def suite_cases(quick=False):
+    """Return the (input spec, matrix label, overrides) cases of the full or the quick suite"""
+    inputs = [spec for spec in INPUTS if not quick or spec[0] in QUICK_INPUTS]
+    matrix = [entry for entry in MATRIX if not quick or entry[0] in QUICK_MATRIX]
+    return [(spec, label, overrides) for spec in inputs for label, overrides in matrix]
+
+
+def case_options(overrides):
+    """Return the ConversionOptions of a case, palette caching is off so every run does the same work"""
+    return ConversionOptions(**dict(BASE_OPTIONS, **overrides), reuse_palette=False)
+
+
+def run_case(case):
+    """Convert the input of case (a dict, see measure) and print the backend and output size as JSON"""
+    options = ConversionOptions(**case["options"])
+    info = MediaInfo(**case["info"])
+    backend = choose_backend(case["input"], options, info, case["output"])
+    result = backend.convert(case["input"], case["output"], options, info)
+    print(json.dumps({"backend": backend.name, "bytes": result.size}))
+
+
+def measure(input_file, info, options, output_file):
+    """Run one conversion in a child process, returns its wall time, CPU time, peak RSS, backend and output bytes
+
+    CPU time and peak RSS come from wait4, they cover the child and the FFmpeg processes it waited for.
+    """
+    case = {"input": input_file, "output": output_file, "options": dataclasses.asdict(options),
+            "info": dataclasses.asdict(info)}
+    cmd = [sys.executable, "-m", "benchmarks.suite", "case", json.dumps(case)]
+    start = time.perf_counter()
+    # Read the output before wait4 reaps the child, a single merged pipe cannot fill up while the other is read
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    output = process.stdout.read()
+    usage = wait_process(process)
+    wall = time.perf_counter() - start
+    process.stdout.close()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, output)
+
+    measured = json.loads(output.strip().splitlines()[-1])
+    measured["wall"] = wall
+    if usage is not None:
+        measured["cpu"] = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        measured["peak_rss"] = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return measured
+
+
+def ffmpeg_version():
+    try:
+        output = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout
+    except OSError:
+        return ""
+    return output.splitlines()[0] if output else ""
+
+
+def run_suite(inputs_dir, quick=False, repeat=3, log=print):
+    """Run the suite and return the results document, each case reports the fastest of repeat runs"""
+    gifsicle = shutil.which("gifsicle") is not None
+    results = []
+    with tempfile.TemporaryDirectory(prefix="jifmaker_suite_") as work_dir:
+        for (name, source, size, seconds), label, overrides in suite_cases(quick):
+            if overrides.get("gifsicle") and not gifsicle:
+                log(f"  {name:<20} {label:<24} skipped, gifsicle is not installed")
+                continue
+            input_file = make_test_video(os.path.join(inputs_dir, f"{name}.mp4"), source, size, 30, seconds)
+            width, height = (int(value) for value in size.split("x"))
+            info = MediaInfo(input_file, width, height, float(seconds), 30.0, "h264", True)
+            options = case_options(overrides)
+
+            runs = [measure(input_file, info, options, os.path.join(work_dir, "output.gif")) for _ in range(repeat)]
+            result = {"case": f"{name}/{label}", "input": name, "label": label, "options": overrides,
+                      "backend": runs[0]["backend"], "bytes": runs[0]["bytes"],
+                      "wall": min(run["wall"] for run in runs)}
+            if "cpu" in runs[0]:
+                result["cpu"] = min(run["cpu"] for run in runs)
+                result["peak_rss"] = max(run["peak_rss"] for run in runs)
+            results.append(result)
+            log(f"  {name:<20} {label:<24} {result['wall']:7.2f} s  cpu {result.get('cpu', 0):7.2f} s  "
+                f"rss {result.get('peak_rss', 0) / 2 ** 20:6.0f} MB  {result['bytes'] / 1024:9.1f} KB  "
+                f"({result['backend']})")
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count(), "ffmpeg": ffmpeg_version()},
+        "quick": quick,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, thresholds=None):
+    """Compare two results documents case by case
+
+    Returns (lines, regressions): a line per case with the relative change of each metric, and the lines of the
+    cases where a metric grew by more than its threshold and its noise floor.
+    """
+    thresholds = dict(THRESHOLDS, **(thresholds or {}))
+    before = {result["case"]: result for result in baseline["results"]}
+    lines = []
+    regressions = []
+    for result in current["results"]:
+        old = before.pop(result["case"], None)
+        if old is None:
+            lines.append(f"  {result['case']:<46} new case")
+            continue
+        cells = []
+        flagged = []
+        for metric, threshold in thresholds.items():
+            if metric not in result or metric not in old or not old[metric]:
+                continue
+            change = result[metric] / old[metric] - 1
+            cells.append(f"{metric} {change:+6.1%}")
+            if change > threshold and result[metric] - old[metric] > NOISE_FLOOR[metric]:
+                flagged.append(metric)
+        line = f"  {result['case']:<46} {'  '.join(cells)}"
+        if flagged:
+            line += f"  REGRESSION ({', '.join(flagged)})"
+            regressions.append(line)
+        lines.append(line)
+    lines.extend(f"  {case:<46} missing from the results" for case in before)
+    return lines, regressions
+
+
+def print_comparison(baseline, current, thresholds=None):
+    """Print the comparison and return the exit code, 1 if anything regressed"""
+    lines, regressions = compare_results(baseline, current, thresholds)
+    print("\n".join(lines))
+    print(f"{len(regressions)} regressions in {len(current['results'])} cases")
+    return 1 if regressions else 0
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproducible JIFMaker benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the suite and save the results as JSON")
+    run.add_argument("--quick", action="store_true", help="Run a small subset of inputs and options")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per case, the fastest is recorded")
+    run.add_argument("--inputs-dir", default=os.path.join(tempfile.gettempdir(), "jifmaker_bench_inputs"),
+                     help="Where the generated inputs are kept between runs")
+    run.add_argument("-o", "--output", default="benchmark_results.json", help="Results file")
+    run.add_argument("--baseline", help="Compare the results with this results file")
+
+    compare = commands.add_parser("compare", help="Flag regressions of results against a baseline")
+    compare.add_argument("baseline", help="Baseline results file")
+    compare.add_argument("results", help="Results file to check")
+    for metric, flag in (("wall", "--time"), ("bytes", "--size"), ("peak_rss", "--memory")):
+        compare.add_argument(flag, dest=metric, type=float, default=THRESHOLDS[metric],
+                             help=f"Relative increase that is a regression (default: {THRESHOLDS[metric]:g})")
+
+    case = commands.add_parser("case", help="Run a single case, used by run")
+    case.add_argument("case", help="Case as JSON")
+
+    args = parser.parse_args(argv)
+    if args.command == "case":
+        run_case(json.loads(args.case))
+        return 0
+    if args.command == "compare":
+        thresholds = {metric: getattr(args, metric) for metric in THRESHOLDS}
+        return print_comparison(load(args.baseline), load(args.results), thresholds)
+
+    os.makedirs(args.inputs_dir, exist_ok=True)
+    print(f"Running the {'quick' if args.quick else 'full'} suite, best of {args.repeat}, inputs in {args.inputs_dir}")
+    document = run_suite(args.inputs_dir, args.quick, args.repeat)
+    with open(args.output, "w") as file:
+        json.dump(document, file, indent=2)
+    print(f"Saved {len(document['results'])} results to {args.output}")
+    if args.baseline:
+        return print_comparison(load(args.baseline), document)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""
+Encoding backends: the FFmpeg subprocess chain, and an in-process Pillow/NumPy encoder for short clips and images
+"""
+
+import os
+import time
+import subprocess
+import collections
+import dataclasses
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from jifmaker.cache import find_tool
+from jifmaker.chunked import Cancelled, convert_chunked
+from jifmaker.decode import plan_decode
+from jifmaker.engine import (ConversionResult, MediaInfo, build_filters, convert, input_seek, output_height,
+                             partial_path, time_to_seconds, trimmed_duration)
+from jifmaker.formats import output_format
+from jifmaker.optimize import optimize_gif
+from jifmaker.pipeline import (MB, WORKING_FRAMES, FramePool, PeakTracker, decimate, decode_raw, frame_delays, pooled,
+                               prefetch, quantize, resident_memory, sample_frames, start_decoder, stop_decoder,
+                               write_gif)
+from jifmaker.quantize import PALETTE_SAMPLES, PaletteLUT, build_palette, load_palette, palette_from_samples
+from jifmaker.telemetry import JobReport, StageMetrics, file_size, run_stage, thread_cpu_time
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+IMAGE_EXTENSIONS = (".gif", ".webp")  # Animated images Pillow can open without ffprobe
+
+PILLOW_ONLY_EXTENSIONS = (".webp",)  # FFmpeg cannot decode animated WebP, Pillow reads these frames itself
+
+PILLOW_PIXEL_BUDGET = 24_000_000  # Output pixels (frames x width x height) the in-process encoder buffers, ~72 MB
+
+PILLOW_DITHER = {"none": "none", "bayer": "bayer"}  # Error diffusion modes fall back to Pillow's Floyd-Steinberg
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class Backend:
+    """Turns an input file into a GIF with ConversionOptions"""
+
+    name = ""
+
+    def available(self):
+        """Return True if everything the backend runs is installed"""
+        raise NotImplementedError
+
+    def convert(self, input_file, output_file, options, info=None, log=None, progress=None, cancelled=None):
+        """Convert input_file to output_file, returns a ConversionResult
+
+        progress(done, total) reports frames, cancelled() is polled and raises Cancelled once it is true.
+        """
+        raise NotImplementedError
+
+
+class FFmpegBackend(Backend):
+    """The palettegen/paletteuse FFmpeg chain, split into parallel chunks when options.chunks > 1"""
+
+    name = "ffmpeg"
+
+    def available(self):
+        return find_tool("ffmpeg") is not None
+
+    def convert(self, input_file, output_file, options, info=None, log=None, progress=None, cancelled=None):
+        if options.chunks > 1 and output_format(output_file).is_gif:
+            return convert_chunked(input_file, output_file, options, info, log=log)
+        return convert(input_file, output_file, options, log, info)
+
+
+class PillowBackend(Backend):
+    """Decode, quantize and write the GIF in process
+
+    Frames come out of a single FFmpeg process already cropped and scaled, animated WebP (and everything when FFmpeg
+    is missing) is read and scaled by Pillow. One palette is computed for the whole clip and each frame is mapped
+    onto it with a NumPy lookup table, so there is no palette PNG. Clips that fit in options.memory_limit are decoded
+    once and held in memory, longer ones are streamed through the jifmaker.pipeline stages twice, once to sample the
+    palette and once to encode, with memory bounded by the limit.
+    """
+
+    name = "pillow"
+
+    def available(self):
+        return True
+
+    def convert(self, input_file, output_file, options, info=None, log=None, progress=None, cancelled=None):
+        with PeakTracker() as tracker:
+            return self._convert(input_file, output_file, options, info, log, progress, cancelled, tracker)
+
+    def _convert(self, input_file, output_file, options, info, log, progress, cancelled, tracker):
+        log = log or (lambda message: None)
+        start = time.perf_counter()
+        # CPU time of this thread only, the FFmpeg decoder feeding it is not included
+        cpu_start = thread_cpu_time()
+        report = JobReport(input_file, output_file, backend=self.name)
+        if options.dither not in PILLOW_DITHER:
+            log(f"{options.dither} dithering is not available in process, using Floyd-Steinberg")
+
+        info = info or image_info(input_file)
+        if info is None or not info.has_video:
+            raise ValueError(f"{input_file} has no probed video stream to decode")
+        shape = frame_shape(options, info)
+        frame_size = int(np.prod(shape))
+        expected = max(1, round(trimmed_duration(options, info) * options.fps))
+        limit = options.memory_limit * MB
+        resident = resident_memory()
+        if limit < FramePool.required(shape, resident):
+            # What is already resident is not ours to free, stream with the fewest buffers instead of failing
+            limit = FramePool.required(shape, resident)
+            log(f"A memory limit of {options.memory_limit} MB is too low for {shape[1]}x{shape[0]} frames next to the "
+                f"{resident / MB:.0f} MB in use, using {-(-limit // MB)} MB")
+        # Transparency optimization keeps one palette entry free, after the colors, for pixels that did not change
+        optimize = options.optimize_transparency and expected > 1
+        colors = options.colors - 1 if optimize else options.colors
+
+        # Short clips are decoded once and kept, as long as every frame fits next to what is already resident
+        frames = None
+        pool = None
+        if info.duration > 0 and (expected + WORKING_FRAMES) * frame_size <= limit - resident:
+            log(f"Decoding {os.path.basename(input_file)} in process")
+            frames = collections.deque()
+            for frame in self.iter_frames(input_file, options, info):
+                if cancelled is not None and cancelled():
+                    raise Cancelled()
+                frames.append(frame)
+                if (len(frames) + WORKING_FRAMES) * frame_size > limit - resident:
+                    log("More frames than expected, streaming instead")
+                    frames = None
+                    break
+            if frames is not None and not frames:
+                raise ValueError(f"No frames decoded from {input_file}")
+
+        # A shared palette replaces the one computed from the frames, and the sampling pass of a streamed encode
+        palette = load_palette(options.palette_file, colors) if options.palette_file else None
+        if palette is not None:
+            log(f"Reusing palette {options.palette_file}")
+        if frames is not None:
+            total = len(frames)
+            if palette is None:
+                palette = build_palette(list(frames), colors)
+            source = (frames.popleft() for _ in range(total))  # Each frame is dropped once it is encoded
+        else:
+            pool = FramePool.within(shape, limit, resident)
+            log(f"Streaming {os.path.basename(input_file)} through {pool.count} frame buffers "
+                f"({pool.nbytes / MB:.0f} MB of the {-(-limit // MB)} MB limit)")
+            if palette is None:
+                samples = sample_frames(self.iter_frames(input_file, options, info, pool, cancelled), expected,
+                                        PALETTE_SAMPLES, pool)
+                palette = palette_from_samples(samples, colors)
+            total = expected
+            source = self.iter_frames(input_file, options, info, pool, cancelled)
+        transparent = len(palette) if optimize else None
+        lut = PaletteLUT(palette)
+        log(f"Mapping {total} frames onto {len(palette)} colors")
+
+        def counted(frames):
+            for index, frame in enumerate(frames):
+                yield frame
+                if progress is not None:
+                    progress(min(index + 1, total), total)
+
+        indices = quantize(decimate(counted(source), frame_delays(options.fps), options.frame_diff, pool),
+                           lambda frame: np.asarray(quantize_frame(lut, frame, options.dither)), pool)
+
+        partial_file = partial_path(output_file)
+        try:
+            written = write_gif(partial_file, indices, palette, (shape[1], shape[0]), options.loop, transparent,
+                                cancelled=cancelled)
+            if not written:
+                raise ValueError(f"No frames decoded from {input_file}")
+            report.add(StageMetrics("encode", "in-process GIF creation", time.perf_counter() - start,
+                                    thread_cpu_time() - cpu_start, written, file_size(input_file),
+                                    file_size(partial_file), tracker.peak() or None))
+
+            if options.optimize_frames:
+                stage_start, stage_cpu, bytes_in = time.perf_counter(), thread_cpu_time(), file_size(partial_file)
+                log(optimize_gif(partial_file).describe())
+                report.add(StageMetrics("optimize", "frame optimization", time.perf_counter() - stage_start,
+                                        thread_cpu_time() - stage_cpu, bytes_in=bytes_in,
+                                        bytes_out=file_size(partial_file)))
+            if options.gifsicle:
+                args = ["gifsicle", f"-O{options.gifsicle_level}", partial_file, "-o", partial_file]
+                log(f"Running gifsicle optimization: {' '.join(args)}")
+                metrics, stderr = run_stage("gifsicle", "gifsicle optimization", args)
+                report.add(metrics)
+                if metrics.exit_code != 0:
+                    raise subprocess.CalledProcessError(metrics.exit_code, args, stderr=stderr)
+            os.replace(partial_file, output_file)
+        finally:
+            indices.close()
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+
+        peak = tracker.peak()
+        if peak:
+            log(f"Peak memory {peak / MB:.0f} MB (limit {-(-limit // MB)} MB)")
+        return ConversionResult(output_file, os.path.getsize(output_file), time.perf_counter() - start, peak,
+                                report.finish())
+
+    def iter_frames(self, input_file, options, info=None, pool=None, cancelled=None):
+        """Yield the cropped and scaled (H, W, 3) uint8 frames of the trimmed range at options.fps
+
+        With a FramePool the frames are pool buffers, decoded ahead in a thread, that the caller has to release.
+        """
+        if pool is not None:
+            if decodes_with_pillow(input_file):
+                return prefetch(pooled(self.iter_frames(input_file, options), pool, cancelled), pool=pool)
+            cmd = _video_command(input_file, options, info or image_info(input_file))
+            return prefetch(decode_raw(cmd, pool, cancelled), pool=pool)
+        return self._frames(input_file, options, info)
+
+    def _frames(self, input_file, options, info):
+        if not decodes_with_pillow(input_file):
+            yield from _video_frames(input_file, options, info or image_info(input_file))
+            return
+
+        start = time_to_seconds(options.start_time)
+        end = time_to_seconds(options.end_time) if options.end_time else None
+        if end is not None and end <= start:
+            end = None  # Invalid trim, like build_plan process the whole input
+
+        timed = _image_frames(input_file)
+        if options.frame_skip > 1:
+            timed = (item for index, item in enumerate(timed) if index % options.frame_skip == 0 or item[1] is None)
+
+        size = None
+        for frame in resample(timed, start, end, options.fps):
+            image = Image.fromarray(frame, "RGB")
+            if any([options.top, options.bottom, options.left, options.right]):
+                image = image.crop((options.left, options.top, image.width - options.right,
+                                    image.height - options.bottom))
+            if size is None:
+                size = (options.width, scaled_height(options, image.width, image.height))
+            yield np.asarray(image.resize(size, Image.Resampling.LANCZOS))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+BACKENDS = {backend.name: backend for backend in (FFmpegBackend(), PillowBackend())}
+
+
+def get_backend(name):
+    """Return the backend registered as name, raises ValueError for unknown names"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def is_image_input(input_file):
+    """Return True for animated image formats whose size Pillow reads without ffprobe"""
+    return os.path.splitext(input_file)[1].lower() in IMAGE_EXTENSIONS
+
+
+def decodes_with_pillow(input_file):
+    """Return True if the Pillow backend reads the frames of input_file itself instead of through FFmpeg"""
+    return os.path.splitext(input_file)[1].lower() in PILLOW_ONLY_EXTENSIONS or not find_tool("ffmpeg")
+
+
+def image_info(input_file):
+    """Return a MediaInfo for an animated GIF or WebP read from its headers by Pillow, None for other files"""
+    if not is_image_input(input_file) or not os.path.isfile(input_file):
+        return None
+    with Image.open(input_file) as image:
+        frames = getattr(image, "n_frames", 1)
+        duration = 0
+        for index in range(frames):
+            image.seek(index)
+            image.load()  # WebP only reports a frame's duration once it is decoded
+            duration += image.info.get("duration") or 100
+        duration /= 1000
+        return MediaInfo(input_file, image.width, image.height, duration, frames / duration if duration else 0.0,
+                         image.format.lower(), True)
+
+
+def output_pixels(options, info):
+    """Return how many pixels the trimmed output holds in total, frames x width x height"""
+    frames = trimmed_duration(options, info) * options.fps
+    return int(frames * options.width * max(output_height(options, info), 1))
+
+
+def pillow_supports(options):
+    """Return True if the in-process encoder honours every setting of options the way FFmpeg would
+
+    It has no error diffusion dithering other than Floyd-Steinberg and always crops frames to the pixels that
+    changed, which no_extensions turns off in FFmpeg.
+    """
+    return options.dither in PILLOW_DITHER and not options.no_extensions
+
+
+def choose_backend(input_file, options, info=None, output_file=None):
+    """Return the backend for options.backend, picking one by input size when it is "auto"
+
+    The in-process encoder decodes once and skips the palette PNG, but holds every output frame in memory, so it
+    takes clips up to PILLOW_PIXEL_BUDGET and inputs only it can read. Longer clips, inputs of unknown size, chunked
+    encodes and settings it cannot honour (see pillow_supports) go to FFmpeg. The in-process encoder only writes GIF,
+    other output formats always go to FFmpeg.
+    """
+    ffmpeg, pillow = BACKENDS["ffmpeg"], BACKENDS["pillow"]
+    if output_file and not output_format(output_file).is_gif:
+        return ffmpeg
+    if options.backend != "auto":
+        return get_backend(options.backend)
+    if options.chunks > 1 and ffmpeg.available():
+        return ffmpeg
+    if decodes_with_pillow(input_file):
+        return pillow
+    if not pillow_supports(options):
+        return ffmpeg
+    info = info or image_info(input_file)
+    if info is not None and info.has_video and output_pixels(options, info) <= PILLOW_PIXEL_BUDGET:
+        return pillow
+    return ffmpeg
+
+
+def frame_shape(options, info):
+    """Return the (height, width, 3) shape of the output frames for an input of info's size"""
+    width = info.width - options.left - options.right
+    height = info.height - options.top - options.bottom
+    return scaled_height(options, width, height), options.width, 3
+
+
+def scaled_height(options, width, height):
+    """Return the output height for a width x height picture, keeping its aspect ratio when options.height is -1"""
+    return options.height if options.height > 0 else max(1, round(options.width * height / width))
+
+
+def quantize_frame(lut, frame, dither):
+    """Return a "P" image of frame on the lut palette, dithered as close to the FFmpeg mode as Pillow allows"""
+    mode = PILLOW_DITHER.get(dither)
+    if mode is not None:
+        return lut.to_image(frame, mode)
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(lut.palette.tobytes())
+    return Image.fromarray(frame, "RGB").quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+
+
+def resample(timed_frames, start, end, fps):
+    """Pick the frame shown at every 1/fps step from start until end (or the last frame)
+
+    timed_frames yields (timestamp, frame) in display order, a None frame marks when the last one stops showing.
+    Frames are repeated or dropped to land on the grid.
+    """
+    count = 0
+    previous = None
+    for timestamp, frame in timed_frames:
+        # A frame is shown from its timestamp until the next one begins
+        while previous is not None and start + count / fps < timestamp - 1e-6:
+            if end is not None and start + count / fps >= end - 1e-6:
+                return
+            yield previous
+            count += 1
+        if frame is None:
+            return
+        previous = frame
+    if previous is not None and (end is None or start + count / fps < end - 1e-6):
+        yield previous
+
+
+def _image_frames(input_file):
+    """Yield (timestamp, RGB array) for the frames of an animated GIF or WebP"""
+    with Image.open(input_file) as image:
+        timestamp = 0.0
+        for frame in ImageSequence.Iterator(image):
+            yield timestamp, np.asarray(frame.convert("RGB"))
+            timestamp += (frame.info.get("duration") or 100) / 1000
+        yield timestamp, None
+
+
+def _video_command(input_file, options, info):
+    """Return the FFmpeg command that trims, crops, resamples and scales input_file into an rgb24 rawvideo pipe"""
+    if info is None or not info.has_video:
+        raise ValueError(f"{input_file} has no probed video stream to decode")
+    # The same chain as the FFmpeg backend, without mpdecimate which decimate does on the arrays
+    decode = plan_decode(options, info)
+    filters = build_filters(dataclasses.replace(options, height=frame_shape(options, info)[0], frame_diff=0), decode)
+
+    seek = input_seek(input_file, options)
+    cmd = ["ffmpeg", "-v", "error", "-nostdin"] + decode.input_args() + seek.input_args(input_file)
+    cmd.extend(["-vf", ",".join(seek.filters() + filters), "-an", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"])
+    return cmd
+
+
+def _video_frames(input_file, options, info):
+    """Yield output frames from one FFmpeg process, each in a newly allocated array
+
+    Raises CalledProcessError once the frames run out if FFmpeg failed.
+    """
+    cmd = _video_command(input_file, options, info)
+    height, width, _ = frame_shape(options, info)
+    frame_size = width * height * 3
+    decoder = start_decoder(cmd)
+    ended = False
+    try:
+        while True:
+            data = decoder[0].stdout.read(frame_size)
+            if len(data) < frame_size:
+                ended = True
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+    finally:
+        stop_decoder(decoder, cmd, ended)
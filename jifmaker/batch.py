@@ -0,0 +1,294 @@
+"""
+Headless batch conversion for JIFMaker (``jifmaker batch``)
+"""
+
+import os
+import glob
+import argparse
+import time
+import tempfile
+import subprocess
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from jifmaker.cache import find_tool
+from jifmaker.engine import (ConversionOptions, BACKEND_NAMES, MEDIA_EXTENSIONS, DITHER_MODES, FFMPEG_NOT_FOUND,
+                             backend_for, default_output_path, frame_report, probe)
+from jifmaker.formats import FORMAT_NAMES, FORMATS, output_format
+from jifmaker.target import convert_to_size, parse_size
+from jifmaker.telemetry import JobReport, Metrics, append_report
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def add_arguments(parser):
+    """Add the batch options, mirroring the Basic Processing and Advanced Compression tabs"""
+    parser.add_argument("inputs", nargs="+", help="Input files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", help="Directory for the GIFs (default: next to each input)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Search input directories recursively")
+    parser.add_argument("-j", "--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Number of concurrent conversions (default: half the cores, FFmpeg threads each one)")
+    parser.add_argument("--report", metavar="FILE",
+                        help="Append a JSON line per job with the time, frames, bytes and memory of every stage")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="Write Prometheus-style counters summed over the jobs, updated after every job")
+    parser.add_argument("--suffix", default="_processed", help="Suffix added to output file names")
+    parser.add_argument("--force", action="store_true", help="Convert files even if the output is up to date")
+    parser.add_argument("--shared-palette", action="store_true",
+                        help="Compute one palette across all inputs and encode every file with it")
+    add_option_arguments(parser)
+
+
+def add_option_arguments(parser):
+    """Add the conversion settings options_from_args reads, shared by batch and watch"""
+    defaults = ConversionOptions()
+
+    basic = parser.add_argument_group("basic processing")
+    basic.add_argument("--fps", type=int, default=defaults.fps, help="Output frame rate")
+    basic.add_argument("--width", type=int, default=defaults.width, help="Output width")
+    basic.add_argument("--height", type=int, default=defaults.height, help="Output height (-1 keeps aspect ratio)")
+    basic.add_argument("--colors", type=int, default=defaults.colors, help="Max colors (2-256)")
+    basic.add_argument("--dither", choices=DITHER_MODES, default=defaults.dither, help="Dithering algorithm")
+    basic.add_argument("--no-loop", action="store_true", help="Play the GIF once instead of looping")
+    basic.add_argument("--start", default=defaults.start_time, help="Trim start (HH:MM:SS[.mmm])")
+    basic.add_argument("--end", default=defaults.end_time, help="Trim end (HH:MM:SS[.mmm])")
+    basic.add_argument("--crop", type=int, nargs=4, default=[0, 0, 0, 0], metavar=("TOP", "BOTTOM", "LEFT", "RIGHT"),
+                       help="Margins to crop in pixels")
+
+    advanced = parser.add_argument_group("advanced compression")
+    advanced.add_argument("--frame-skip", type=int, default=defaults.frame_skip, help="Process only every Nth frame")
+    advanced.add_argument("--frame-diff", type=int, default=defaults.frame_diff, help="Min frame difference (%%)")
+    advanced.add_argument("--no-optimize-transparency", action="store_true", help="Disable transparency optimization")
+    advanced.add_argument("--no-extensions", action="store_true", help="Disable GIF extensions")
+    advanced.add_argument("--single-pass", action="store_true", help="Generate and apply the palette in one run")
+    advanced.add_argument("--optimize-frames", action="store_true",
+                          help="Crop frames to the pixels that changed with the built-in optimizer")
+    advanced.add_argument("--gifsicle", action="store_true", help="Optimize the output with gifsicle")
+    advanced.add_argument("--gifsicle-level", type=int, choices=[1, 2, 3], default=defaults.gifsicle_level,
+                          help="Gifsicle optimization level")
+    advanced.add_argument("--chunks", type=int, default=defaults.chunks,
+                          help="Encode each file as N time chunks in parallel with one shared palette")
+    advanced.add_argument("--backend", choices=BACKEND_NAMES, default=defaults.backend,
+                          help="Encoder, auto uses the in-process Pillow encoder for clips that fit in memory")
+    advanced.add_argument("--memory-limit", type=int, default=defaults.memory_limit, metavar="MB",
+                          help="Memory the in-process encoder may use, longer clips are streamed")
+    advanced.add_argument("--sampled-palette", action="store_true",
+                          help="Compute the palette from evenly spaced keyframes instead of every frame")
+    advanced.add_argument("--fast-decode", action="store_true",
+                          help="Decode with threads, at reduced size where the codec can and with a cheaper scaler")
+    advanced.add_argument("--no-palette-cache", action="store_true",
+                          help="Always generate the palette instead of reusing one cached for the same frames")
+    advanced.add_argument("--target-size", type=target_size,
+                          help="Lower fps, width and colors until the GIF fits this size (e.g. 8MB, 500K)")
+
+    output = parser.add_argument_group("output format")
+    output.add_argument("--format", choices=FORMAT_NAMES, default="gif",
+                        help="Output format, WebP, APNG, MP4 and WebM are encoded in one pass without a palette")
+    output.add_argument("--quality", type=int, default=defaults.quality,
+                        help="Quality of lossy WebP, MP4 and WebM outputs (0-100)")
+    output.add_argument("--lossless", action="store_true", help="Encode WebP outputs losslessly")
+    output.add_argument("--webp-method", type=int, choices=range(7), default=defaults.webp_method, metavar="0-6",
+                        help="WebP compression effort, higher is smaller and slower")
+
+
+def target_size(text):
+    """argparse type for --target-size"""
+    try:
+        return parse_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def options_from_args(args):
+    """Build ConversionOptions from parsed batch arguments"""
+    top, bottom, left, right = args.crop
+    return ConversionOptions(
+        fps=args.fps,
+        width=args.width,
+        height=args.height,
+        colors=args.colors,
+        dither=args.dither,
+        loop=not args.no_loop,
+        start_time=args.start,
+        end_time=args.end,
+        top=top,
+        bottom=bottom,
+        left=left,
+        right=right,
+        frame_skip=args.frame_skip,
+        frame_diff=args.frame_diff,
+        optimize_transparency=not args.no_optimize_transparency,
+        no_extensions=args.no_extensions,
+        single_pass=args.single_pass,
+        optimize_frames=args.optimize_frames,
+        gifsicle=args.gifsicle,
+        gifsicle_level=args.gifsicle_level,
+        chunks=max(1, args.chunks),
+        backend=args.backend,
+        memory_limit=args.memory_limit,
+        quality=args.quality,
+        lossless=args.lossless,
+        webp_method=args.webp_method,
+        reuse_palette=not args.no_palette_cache,
+        sampled_palette=args.sampled_palette,
+        fast_decode=args.fast_decode,
+    )
+
+
+def find_inputs(patterns, recursive=False, suffix="_processed"):
+    """Expand files, directories and glob patterns into a sorted list of media files"""
+    found = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                candidates = [os.path.join(root, name) for root, _, names in os.walk(pattern) for name in names]
+            else:
+                candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+            candidates = [path for path in candidates if path.lower().endswith(MEDIA_EXTENSIONS)]
+        elif os.path.isfile(pattern):
+            candidates = [pattern]
+        else:
+            candidates = [path for path in glob.glob(pattern, recursive=True)
+                          if path.lower().endswith(MEDIA_EXTENSIONS)]
+
+        for path in sorted(candidates):
+            # Never feed our own outputs back in
+            if os.path.splitext(path)[0].endswith(suffix) or not os.path.isfile(path):
+                continue
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                found.append(path)
+    return found
+
+
+def is_up_to_date(input_file, output_file):
+    """Return True if output_file exists and is newer than input_file"""
+    return os.path.exists(output_file) and os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+
+
+def convert_job(input_file, output_file, options, budget=None):
+    """Convert one file, searching for settings under budget (bytes) first when it is given
+
+    Returns (ConversionResult, TargetResult or None).
+    """
+    if budget is None:
+        # The automatic backend choice needs the input size, without ffprobe FFmpeg is used
+        info = probe(input_file) if options.backend != "ffmpeg" and find_tool("ffprobe") else None
+        backend = backend_for(input_file, options, info, output_file)
+        return backend.convert(input_file, output_file, options, info), None
+    if not find_tool("ffprobe"):
+        raise ValueError("ffprobe not found, it is needed to convert to a target size")
+    return convert_to_size(input_file, output_file, options, probe(input_file), budget)
+
+
+def run(args):
+    """Entry point for ``jifmaker batch``, returns the process exit code"""
+    if not find_tool("ffmpeg"):
+        print(f"Error: {FFMPEG_NOT_FOUND}")
+        return 1
+
+    options = options_from_args(args)
+    inputs = find_inputs(args.inputs, args.recursive, args.suffix)
+    if not inputs:
+        print("No media files found")
+        return 1
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    jobs = []
+    skipped = 0
+    for input_file in inputs:
+        output_file = default_output_path(input_file, args.output_dir, args.suffix, FORMATS[args.format].extensions[0])
+        if not args.force and is_up_to_date(input_file, output_file):
+            skipped += 1
+            continue
+        jobs.append((input_file, output_file))
+
+    workers = max(1, min(args.jobs, len(jobs)))
+    with tempfile.TemporaryDirectory(prefix="jifmaker_batch_") as temp_dir:
+        if args.shared_palette and jobs:
+            from jifmaker.palette import build_shared_palette  # NumPy, only loaded when a shared palette is asked for
+            palette_file = os.path.join(temp_dir, "shared_palette.png")
+            try:
+                palette = build_shared_palette([input_file for input_file, _ in jobs], options, palette_file)
+            except (OSError, ValueError) as e:
+                print(f"Error: could not build the shared palette: {e}")
+                return 1
+            print(f"Shared palette of {len(palette)} colors from {len(jobs)} files")
+            options = dataclasses.replace(options, palette_file=palette_file)
+        print(f"Converting {len(jobs)} files with {workers} workers ({skipped} up to date)")
+        return convert_jobs(jobs, options, workers, skipped, args.target_size, args.report, args.metrics)
+
+
+def record_job(report, report_path, metrics, metrics_path):
+    """Append report to the JSON-lines file and update the counters file, when they were asked for"""
+    if report_path:
+        append_report(report_path, report)
+    if metrics_path:
+        metrics.add(report)
+        metrics.write(metrics_path)
+
+
+def convert_jobs(jobs, options, workers, skipped, budget, report_path=None, metrics_path=None):
+    """Convert (input, output) pairs on workers threads, printing a line per file and a summary, returns exit code"""
+
+    converted = failed = 0
+    bytes_in = bytes_out = 0
+    metrics = Metrics()
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(convert_job, input_file, output_file, options, budget):
+                   (input_file, output_file) for input_file, output_file in jobs}
+        for count, future in enumerate(as_completed(futures), 1):
+            input_file, output_file = futures[future]
+            try:
+                result, target = future.result()
+            except subprocess.CalledProcessError as e:
+                failed += 1
+                print(f"[{count}/{len(jobs)}] FAILED {input_file}: {e}")
+                lines = (e.stderr or "").strip().splitlines()
+                if lines:
+                    print(lines[-1])
+                record_job(JobReport(input_file, output_file).finish(False, str(e)), report_path, metrics,
+                           metrics_path)
+                continue
+            except Exception as e:  # Any other error fails this file only, the rest of the batch carries on
+                failed += 1
+                print(f"[{count}/{len(jobs)}] FAILED {input_file}: {e}")
+                record_job(JobReport(input_file, output_file).finish(False, str(e)), report_path, metrics,
+                           metrics_path)
+                continue
+
+            converted += 1
+            bytes_in += os.path.getsize(input_file)
+            bytes_out += result.size
+            print(f"[{count}/{len(jobs)}] {input_file} -> {output_file} "
+                  f"({result.size / (1024 * 1024):.1f} MB, {result.elapsed:.1f}s)")
+            if result.peak_memory:
+                print(f"    memory: {result.peak_memory / (1024 * 1024):.0f} MB peak (limit {options.memory_limit} MB)")
+            if target is not None:
+                print(f"    target: {target.describe()}")
+            used = target.options if target is not None else options
+            if used.frame_diff > 0 and output_format(output_file).is_gif:
+                # The output is already written, an unreadable report must not stop the remaining jobs
+                try:
+                    print(f"    frames: {frame_report(output_file, used.fps).describe()}")
+                except (OSError, ValueError) as e:
+                    print(f"    frames: not available ({e})")
+            if result.report is not None:
+                print(f"    stages: {', '.join(f'{stage.name} {stage.wall:.1f}s' for stage in result.report.stages)}")
+                record_job(result.report, report_path, metrics, metrics_path)
+
+    wall = max(time.perf_counter() - start, 1e-9)
+    mb_in, mb_out = bytes_in / (1024 * 1024), bytes_out / (1024 * 1024)
+    print(f"Converted {converted} files ({skipped} skipped, {failed} failed) in {wall:.1f}s")
+    print(f"Throughput: {converted / wall:.2f} files/s, {mb_in / wall:.2f} MB/s in, {mb_out / wall:.2f} MB/s out")
+
+    return 1 if failed else 0
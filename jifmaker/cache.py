@@ -0,0 +1,232 @@
+"""
+On-disk caches shared by the window and the command line, and the in-memory lookup of external tools
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class ProbeCache:
+    """SQLite store of raw ffprobe output keyed by (absolute path, size, mtime_ns) with LRU eviction
+
+    Entries are evicted past max_entries rows or max_bytes of stored data. The cache is only an optimization, a
+    database that is locked by another process or cannot be written is treated as a miss or a skipped write.
+    """
+
+    def __init__(self, path, max_entries=5000, max_bytes=32 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # Batch conversions probe from worker threads, every access goes through the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS probes ("
+                           "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, data TEXT, last_used REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS probes_last_used ON probes (last_used)")
+        self._conn.commit()
+
+    def get(self, file_path):
+        """Return the cached ffprobe JSON for file_path, None if it is unknown, the file changed or the read failed"""
+        key, size, mtime_ns = file_key(file_path)
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT size, mtime_ns, data FROM probes WHERE path = ?", (key,)).fetchone()
+                if row is not None and row[0] == size and row[1] == mtime_ns:
+                    self._conn.execute("UPDATE probes SET last_used = ? WHERE path = ?", (time.time(), key))
+                    self._conn.commit()
+                    self.hits += 1
+                    return row[2]
+            except sqlite3.Error:
+                self._rollback()
+            self.misses += 1
+            return None
+
+    def put(self, file_path, data):
+        """Store the ffprobe JSON for file_path, evicting the least recently used entries over the caps
+
+        Nothing is stored if the database cannot be written.
+        """
+        key, size, mtime_ns = file_key(file_path)
+        with self._lock:
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)",
+                                   (key, size, mtime_ns, data, time.time()))
+                self._conn.execute("DELETE FROM probes WHERE path IN (SELECT path FROM probes "
+                                   "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+                self._conn.execute("DELETE FROM probes WHERE path IN (SELECT path FROM (SELECT path, "
+                                   "SUM(LENGTH(data)) OVER (ORDER BY last_used DESC) AS total FROM probes) "
+                                   "WHERE total > ?)", (self.max_bytes,))
+                self._conn.commit()
+            except sqlite3.Error:
+                self._rollback()
+
+    def _rollback(self):
+        try:
+            self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+
+    def describe(self):
+        """Return the hit/miss counters for the log"""
+        return f"probe cache: {self.hits} hits, {self.misses} misses"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PaletteCache:
+    """Directory of palette PNGs named by the hash of everything that decides their colors, see engine.palette_key
+
+    Files are touched when they are used and the least recently used ones are deleted over max_entries.
+    """
+
+    def __init__(self, directory, max_entries=500):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        """Return the path of the cached palette for key, None if there is none"""
+        path = self.path(key)
+        with self._lock:
+            try:
+                os.utime(path)
+            except OSError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return path
+
+    def put(self, key, palette_file):
+        """Copy a generated palette into the cache, renamed into place so readers never see a partial file"""
+        with self._lock:
+            temp_file = os.path.join(self.directory, f".{key}.{threading.get_ident()}.png")
+            shutil.copyfile(palette_file, temp_file)
+            os.replace(temp_file, self.path(key))
+            entries = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(self.directory)
+                             if entry.name.endswith(".png") and not entry.name.startswith("."))
+            for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+                os.remove(path)
+
+    def __len__(self):
+        return sum(name.endswith(".png") and not name.startswith(".") for name in os.listdir(self.directory))
+
+    def describe(self):
+        """Return the hit/miss counters for the log"""
+        return f"palette cache: {self.hits} hits, {self.misses} misses"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+_probe_cache = None
+_probe_cache_lock = threading.Lock()
+
+_palette_cache = None
+
+_keyframe_cache = None
+
+_tools = {}  # Tool name -> path, None when it is not installed
+
+
+
+def user_cache_dir():
+    """Return the per-user cache directory, JIFMAKER_CACHE_DIR overrides the platform default"""
+    if os.environ.get("JIFMAKER_CACHE_DIR"):
+        return os.environ["JIFMAKER_CACHE_DIR"]
+    if sys.platform == "win32":
+        root = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+        return os.path.join(root, "jifmaker", "Cache")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Caches/jifmaker")
+    return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "jifmaker")
+
+
+def file_key(file_path):
+    """Return the (absolute path, size, mtime_ns) triple that identifies one version of a file"""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+def get_probe_cache():
+    """Return the shared ProbeCache, kept in memory if the cache directory is not writable"""
+    global _probe_cache
+    with _probe_cache_lock:
+        if _probe_cache is None:
+            try:
+                cache_dir = user_cache_dir()
+                os.makedirs(cache_dir, exist_ok=True)
+                _probe_cache = ProbeCache(os.path.join(cache_dir, "probe.sqlite3"))
+            except (OSError, sqlite3.Error):
+                _probe_cache = ProbeCache(":memory:")
+        return _probe_cache
+
+
+def get_keyframe_cache():
+    """Return the shared keyframe cache, a ProbeCache of JSON keyframe time lists kept apart from the ffprobe output"""
+    global _keyframe_cache
+    with _probe_cache_lock:
+        if _keyframe_cache is None:
+            try:
+                cache_dir = user_cache_dir()
+                os.makedirs(cache_dir, exist_ok=True)
+                _keyframe_cache = ProbeCache(os.path.join(cache_dir, "keyframes.sqlite3"))
+            except (OSError, sqlite3.Error):
+                _keyframe_cache = ProbeCache(":memory:")
+        return _keyframe_cache
+
+
+def get_palette_cache():
+    """Return the shared PaletteCache, in a temporary directory if the cache directory is not writable"""
+    global _palette_cache
+    with _probe_cache_lock:
+        if _palette_cache is None:
+            try:
+                directory = os.path.join(user_cache_dir(), "palettes")
+                os.makedirs(directory, exist_ok=True)
+            except OSError:
+                directory = tempfile.mkdtemp(prefix="jifmaker_palettes_")
+            _palette_cache = PaletteCache(directory)
+        return _palette_cache
+
+
+def find_tool(name):
+    """Return the path of an external tool such as ffmpeg, ffprobe or gifsicle, None if it is not installed
+
+    The PATH is searched once per tool and process, clear_tools() forgets the results.
+    """
+    with _probe_cache_lock:
+        if name not in _tools:
+            _tools[name] = shutil.which(name)
+        return _tools[name]
+
+
+def clear_tools():
+    """Forget where the external tools were found, e.g. after one was installed"""
+    with _probe_cache_lock:
+        _tools.clear()
@@ -0,0 +1,208 @@
+"""
+Chunked parallel encoding: one global palette, time chunks encoded side by side, then joined into a single GIF
+"""
+
+import os
+import sys
+import math
+import time
+import tempfile
+import threading
+import subprocess
+import dataclasses
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from jifmaker.cache import find_tool
+from jifmaker.engine import (ConversionPlan, ConversionResult, Stage, build_plan, convert, partial_path, probe,
+                             remember_palette, time_to_seconds, trimmed_duration)
+from jifmaker.gifio import concat_gifs, read_gif
+from jifmaker.telemetry import JobReport, StageMetrics, file_size, run_stage, thread_cpu_time
+from jifmaker.trim import format_timestamp
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class Cancelled(Exception):
+    """Raised by run_chunked when cancelled() became true"""
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def chunk_ranges(start, duration, chunks):
+    """Split the trimmed range into at most chunks (start, length) pieces on whole seconds
+
+    Whole seconds keep every chunk start on the output frame grid, so no frame is lost or doubled at the seams. Only
+    the last piece can be shorter than the others.
+    """
+    length = max(1, math.ceil(duration / max(chunks, 1)))
+    ranges = []
+    position = start
+    while position < start + duration:
+        ranges.append((position, min(length, start + duration - position)))
+        position += length
+    return ranges
+
+
+def build_chunked_plan(input_file, output_file, options, info, temp_dir):
+    """Return a plan with the global palette stage, one encode stage per chunk and the optional post-processing stages
+
+    Chunk stages write chunk_N.gif files to temp_dir, run_chunked joins them into output_file before the frame
+    optimization and gifsicle stages run. A range that splits into fewer than two chunks, such as one of unknown
+    duration, gets the plan of a single encode instead.
+    """
+    start = time_to_seconds(options.start_time)
+    ranges = chunk_ranges(start, trimmed_duration(options, info), options.chunks)
+    if len(ranges) < 2:
+        return build_plan(input_file, output_file, dataclasses.replace(options, chunks=1), temp_dir, info)
+
+    base = dataclasses.replace(options, single_pass=False, optimize_frames=False, gifsicle=False, chunks=1)
+    plan = ConversionPlan(input_file, output_file, options)
+
+    # The palette pass covers the whole trim range, every chunk is mapped onto the same colors. There is no palette
+    # stage when a shared or cached palette is used
+    whole = build_plan(input_file, output_file, base, temp_dir, info)
+    plan.stages.extend(stage for stage in whole.stages if stage.name == "palette")
+    plan.palette_path, plan.palette_key = whole.palette_path, whole.palette_key
+    base = dataclasses.replace(base, palette_file=whole.palette_path, reuse_palette=False)
+
+    for index, (chunk_start, length) in enumerate(ranges):
+        end_time = format_timestamp(chunk_start + length) if index + 1 < len(ranges) else options.end_time
+        # The chunk count splits the decoder threads of a fast decode between the chunks running side by side
+        chunk_options = dataclasses.replace(base, start_time=format_timestamp(chunk_start), end_time=end_time,
+                                            chunks=options.chunks)
+        chunk_file = os.path.join(temp_dir, f"chunk_{index}.gif")
+        encode = build_plan(input_file, chunk_file, chunk_options, temp_dir, info).stages[-1]
+        plan.stages.append(Stage("chunk", f"chunk {index + 1}/{len(ranges)} ({format_timestamp(chunk_start)})",
+                                 encode.args))
+        # Each chunk keeps its full length even if Min Frame Difference dropped its last frames
+        plan.chunk_lengths.append(length if index + 1 < len(ranges) or time_to_seconds(end_time) > start else None)
+
+    if options.optimize_frames:
+        plan.stages.append(Stage("optimize", "frame optimization",
+                                 [sys.executable, "-m", "jifmaker.optimize", output_file]))
+    if options.gifsicle:
+        plan.stages.append(Stage("gifsicle", "gifsicle optimization",
+                                 ["gifsicle", f"-O{options.gifsicle_level}", output_file, "-o", output_file]))
+    return plan
+
+
+def _run(stage, cancelled, report=None):
+    """Run one stage, killing it as soon as cancelled() is true, and add its metrics to report"""
+    metrics, stderr = run_stage(stage.name, stage.description, stage.args, cancelled)
+    if report is not None:
+        report.add(metrics)
+    if metrics.exit_code != 0:
+        if cancelled is not None and cancelled():
+            raise Cancelled()
+        raise subprocess.CalledProcessError(metrics.exit_code, stage.args, stderr=stderr)
+
+
+def run_chunked(plan, jobs=None, log=None, progress=None, cancelled=None, report=None):
+    """Run a plan from build_chunked_plan, encoding up to jobs chunks at the same time
+
+    progress(done, total, frames) is called after every chunk and the metrics of every stage are added to report (a
+    telemetry.JobReport). A plan without chunks, which build_chunked_plan returns for short ranges, is run stage by
+    stage. Raises Cancelled, CalledProcessError or OSError.
+    """
+    log = log or (lambda message: None)
+    stages = {name: [stage for stage in plan.stages if stage.name == name] for name in ("palette", "chunk")}
+    chunk_files = [stage.args[-1] for stage in stages["chunk"]]
+    if not chunk_files:
+        for stage in plan.stages:
+            log(f"Running {stage.description}: {' '.join(stage.args)}")
+            _run(stage, cancelled, report)
+            remember_palette(plan, stage)
+        return
+    jobs = jobs or len(chunk_files)
+    fps = plan.options.fps
+
+    if not stages["palette"]:
+        log(f"Reusing palette {plan.palette_path}")
+    for palette in stages["palette"]:
+        log(f"Running {palette.description}: {' '.join(palette.args)}")
+        _run(palette, cancelled, report)
+        remember_palette(plan, palette)
+
+    log(f"Encoding {len(chunk_files)} chunks with {min(jobs, len(chunk_files))} workers")
+    frames = done = 0
+    lock = threading.Lock()
+
+    # One failed chunk stops the others instead of letting them run to completion
+    failed = threading.Event()
+
+    def stop():
+        return failed.is_set() or (cancelled is not None and cancelled())
+
+    def encode(stage):
+        nonlocal frames, done
+        _run(stage, stop, report)
+        with lock:
+            done += 1
+            frames += len(read_gif(stage.args[-1]).frames)
+            log(f"Finished {stage.description}")
+            if progress is not None:
+                progress(done, len(chunk_files), frames)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(encode, stage) for stage in stages["chunk"]]
+        try:
+            # Waiting on the first exception rather than in submission order stops the others as soon as any fails;
+            # the stopped chunks then raise Cancelled, so the first failure is the one raised
+            finished, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            errors = [future.exception() for future in finished if future.exception() is not None]
+            if errors:
+                raise errors[0]
+        except BaseException:
+            failed.set()
+            for future in futures:
+                future.cancel()
+            raise
+
+    durations = [round(length * 100) if length is not None else 0 for length in plan.chunk_lengths]
+    join_start, join_cpu = time.perf_counter(), thread_cpu_time()
+    count = concat_gifs(chunk_files, plan.output_file, durations)
+    if report is not None:
+        report.add(StageMetrics("join", "chunk joining", time.perf_counter() - join_start,
+                                thread_cpu_time() - join_cpu, count, sum(map(file_size, chunk_files)),
+                                file_size(plan.output_file)))
+    log(f"Joined {len(chunk_files)} chunks into {count} frames at {fps} fps")
+
+    for stage in plan.stages:
+        if stage.name in ("palette", "chunk"):
+            continue
+        log(f"Running {stage.description}: {' '.join(stage.args)}")
+        _run(stage, cancelled, report)
+
+
+def convert_chunked(input_file, output_file, options, info=None, jobs=None, log=None):
+    """Convert input_file with build_chunked_plan and run_chunked, writing to a temporary name first
+
+    Without info or ffprobe the duration to split is unknown, input_file is then encoded in one piece.
+    """
+    if info is None and not find_tool("ffprobe"):
+        if log:
+            log("ffprobe not found, encoding without chunks")
+        return convert(input_file, output_file, dataclasses.replace(options, chunks=1), log)
+
+    start = time.perf_counter()
+    info = info or probe(input_file)
+    partial_file = partial_path(output_file)
+    report = JobReport(input_file, output_file)
+
+    with tempfile.TemporaryDirectory(prefix="jifmaker_chunks_") as temp_dir:
+        try:
+            plan = build_chunked_plan(input_file, partial_file, options, info, temp_dir)
+            run_chunked(plan, jobs, log, report=report)
+            os.replace(partial_file, output_file)
+        finally:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+
+    return ConversionResult(output_file, os.path.getsize(output_file), time.perf_counter() - start,
+                            report=report.finish())
@@ -0,0 +1,57 @@
+"""
+Command line entry point for JIFMaker: --version and the subcommands run without importing Qt, which is only loaded
+to open the window
+"""
+
+import sys
+import argparse
+import importlib
+
+from jifmaker import __version__
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+COMMANDS = {  # Subcommand -> (module with add_arguments and run, help)
+    "batch": ("jifmaker.batch", "Convert files and directories without opening the window"),
+    "compare": ("jifmaker.compare", "Compare output size and encode time across formats"),
+    "watch": ("jifmaker.watch", "Convert media files as they appear in a directory"),
+}
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def build_parser(command=None):
+    """Return the argument parser with the options of command, the modules of the other subcommands are not imported"""
+    parser = argparse.ArgumentParser(prog="jifmaker", description="JIFMaker - Convert videos to GIFs")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+    subparsers = parser.add_subparsers(dest="command")
+    for name, (module, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        if name == command:
+            importlib.import_module(module).add_arguments(subparser)
+    return parser
+
+
+def main(argv=None):
+    """Main entry point for the application, returns the process exit code"""
+    argv = sys.argv[1:] if argv is None else argv
+    # The top-level parser only has flags, so the first other argument names the subcommand
+    command = next((arg for arg in argv if not arg.startswith("-")), None)
+    args = build_parser(command).parse_args(argv)
+
+    if args.command:
+        return importlib.import_module(COMMANDS[args.command][0]).run(args)
+
+    from jifmaker.main import run_window
+    return run_window()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
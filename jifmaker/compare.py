@@ -0,0 +1,107 @@
+"""
+Format comparison for JIFMaker (``jifmaker compare``): one input converted to every output format with the same
+size, frame rate and trim, reported by file size and encode time
+"""
+
+import os
+import tempfile
+import subprocess
+import dataclasses
+from dataclasses import dataclass
+
+from jifmaker.cache import find_tool
+from jifmaker.engine import FFMPEG_NOT_FOUND, ConversionOptions, backend_for, format_size, probe
+from jifmaker.formats import FORMAT_NAMES, FORMATS
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class FormatResult:
+    """Size and encode time of one output format, error is set instead when the encode failed"""
+    name: str
+    size: int = 0
+    elapsed: float = 0.0
+    error: str = ""
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def add_arguments(parser):
+    """Add the compare options"""
+    defaults = ConversionOptions()
+    parser.add_argument("input", help="Input file")
+    parser.add_argument("--formats", nargs="+", choices=FORMAT_NAMES, default=FORMAT_NAMES, help="Formats to compare")
+    parser.add_argument("--fps", type=int, default=defaults.fps, help="Output frame rate")
+    parser.add_argument("--width", type=int, default=defaults.width, help="Output width")
+    parser.add_argument("--start", default="", help="Trim start (HH:MM:SS.mmm)")
+    parser.add_argument("--end", default="", help="Trim end (HH:MM:SS.mmm)")
+    parser.add_argument("--quality", type=int, default=defaults.quality,
+                        help="Quality of lossy WebP, MP4 and WebM outputs (0-100)")
+
+
+def compare_formats(input_file, options, names=FORMAT_NAMES, temp_dir=None, info=None):
+    """Convert input_file with options to each format in names, returns a FormatResult per format
+
+    Each format is encoded the way a conversion to it would be, GIF by the backend engine.backend_for picks. The palette
+    cache is not used, a cached palette would leave the GIF time without its palette pass. A format that fails to
+    encode gets a FormatResult with its error, the other formats are still compared.
+    """
+    options = dataclasses.replace(options, reuse_palette=False)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="jifmaker_compare_", dir=temp_dir) as work_dir:
+        for name in names:
+            output_file = os.path.join(work_dir, f"compare{FORMATS[name].extensions[0]}")
+            try:
+                backend = backend_for(input_file, options, info, output_file)
+                result = backend.convert(input_file, output_file, options, info)
+            except subprocess.CalledProcessError as e:
+                lines = (e.stderr or "").strip().splitlines()
+                results.append(FormatResult(name, error=lines[-1] if lines else str(e)))
+                continue
+            except (OSError, ValueError) as e:
+                results.append(FormatResult(name, error=str(e)))
+                continue
+            results.append(FormatResult(name, result.size, result.elapsed))
+    return results
+
+
+def format_report(results):
+    """Return the results as a table, sizes and times relative to GIF when it is among them"""
+    gif = next((result for result in results if result.name == "gif" and not result.error), None)
+    lines = [f"{'Format':<8}{'Size':>12}{'Time':>10}  vs GIF"]
+    for result in results:
+        label = FORMATS[result.name].label
+        if result.error:
+            lines.append(f"{label:<8}  failed: {result.error}")
+            continue
+        relative = ""
+        if gif is not None and result is not gif and result.size and result.elapsed:
+            relative = f"  {result.size / gif.size:>6.0%} size, {gif.elapsed / result.elapsed:.1f}x speed"
+        lines.append(f"{label:<8}{format_size(result.size / 1024):>12}{result.elapsed:>9.2f}s{relative}")
+    return "\n".join(lines)
+
+
+def run(args):
+    """Entry point for ``jifmaker compare``, returns the process exit code"""
+    if not find_tool("ffmpeg"):
+        print(f"Error: {FFMPEG_NOT_FOUND}")
+        return 1
+    if not os.path.isfile(args.input):
+        print(f"Error: {args.input} does not exist")
+        return 1
+    options = ConversionOptions(fps=args.fps, width=args.width, start_time=args.start, end_time=args.end,
+                                quality=args.quality)
+    try:
+        info = probe(args.input)
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        info = None  # Without ffprobe every format is encoded by FFmpeg
+    results = compare_formats(args.input, options, args.formats, info=info)
+    print(format_report(results))
+    return 1 if any(result.error for result in results) else 0
@@ -0,0 +1,119 @@
+"""
+Fast decode: decoder threads, codec-level downscaled decoding, skipped non-reference frames and a cheaper scaler
+when the output is much smaller than the source
+"""
+
+import os
+from dataclasses import dataclass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+LOWRES_CODECS = {  # Decoders that can decode at 1/2, 1/4 or 1/8 size (-lowres 1 to 3), H.264 and later cannot
+    "mjpeg": 3,
+    "mpeg1video": 3,
+    "mpeg2video": 3,
+    "mpeg4": 3,
+    "h263": 3,
+    "msmpeg4v1": 3,
+    "msmpeg4v2": 3,
+    "msmpeg4v3": 3,
+    "wmv1": 3,
+    "wmv2": 3,
+    "dvvideo": 3,
+}
+
+SCALER = "lanczos"  # Sharpest, its kernel widens with the downscale ratio and so does its cost
+
+FAST_SCALER = "area"  # Averages the source pixels under each output pixel, as good as lanczos for large ratios
+
+FAST_SCALE_RATIO = 3  # Decoded width per output pixel from which FAST_SCALER is used
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Decode:
+    """How the input of a conversion is decoded and scaled, the defaults leave both to FFmpeg and lanczos"""
+    threads: int = 0  # Decoder threads, 0 lets FFmpeg use one per core
+    lowres: int = 0  # Decode at 1 / 2 ** lowres of the source size
+    skip_nonref: bool = False  # Skip non-reference frames, most of which frame skipping would drop anyway
+    scaler: str = SCALER
+
+    @property
+    def factor(self):
+        return 2 ** self.lowres
+
+    def input_args(self):
+        """Return the decoder options, they must come before -i so that they only apply to this input"""
+        args = []
+        if self.threads:
+            args.extend(["-threads", str(self.threads)])
+        if self.lowres:
+            args.extend(["-lowres", str(self.lowres)])
+        if self.skip_nonref:
+            args.extend(["-skip_frame", "noref"])
+        return args
+
+    def describe(self):
+        parts = [f"{self.threads} decoder thread{'s' if self.threads > 1 else ''}" if self.threads else
+                 "automatic decoder threads"]
+        if self.lowres:
+            parts.append(f"decoding at 1/{self.factor} size")
+        if self.skip_nonref:
+            parts.append("skipping non-reference frames")
+        parts.append(f"{self.scaler} scaling")
+        return "Fast decode: " + ", ".join(parts)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def decode_threads(jobs=1):
+    """Return the decoder threads for one of jobs FFmpeg processes running side by side, so they share the cores"""
+    return max(1, (os.cpu_count() or 1) // max(1, jobs))
+
+
+def lowres_level(options, info):
+    """Return the largest -lowres level that still decodes at least the output size, 0 if the codec has none
+
+    The crop margins are given in source pixels, a level is only used when they divide evenly at its size.
+    """
+    if info is None or not info.width or not info.height:
+        return 0
+    width = info.width - options.left - options.right
+    height = info.height - options.top - options.bottom
+    margins = (options.top, options.bottom, options.left, options.right)
+    level = LOWRES_CODECS.get(info.codec, 0)
+    while level > 0:
+        factor = 2 ** level
+        if (width >= options.width * factor and (options.height <= 0 or height >= options.height * factor) and
+                all(margin % factor == 0 for margin in margins)):
+            return level
+        level -= 1
+    return 0
+
+
+def plan_decode(options, info=None):
+    """Return the Decode for options, the defaults unless options.fast_decode is set
+
+    The decoder threads are split between the chunks of a parallel encode. The codec and source size in info pick
+    the lowres level and the scaler, without info only the threads and frame skipping apply.
+    """
+    if not options.fast_decode:
+        return Decode()
+    lowres = lowres_level(options, info)
+    scaler = SCALER
+    if info is not None and info.width:
+        decoded = (info.width - options.left - options.right) / 2 ** lowres
+        if decoded >= options.width * FAST_SCALE_RATIO:
+            scaler = FAST_SCALER
+    return Decode(decode_threads(options.chunks), lowres, options.frame_skip > 1, scaler)
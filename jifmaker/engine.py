@@ -0,0 +1,536 @@
+"""
+Conversion engine for JIFMaker, probes inputs and builds and runs the FFmpeg commands without importing Qt
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import subprocess
+from dataclasses import dataclass, field
+
+from jifmaker.cache import file_key, find_tool, get_palette_cache, get_probe_cache
+from jifmaker.decode import Decode, plan_decode
+from jifmaker.formats import output_format
+from jifmaker.gifio import read_gif
+from jifmaker.telemetry import JobReport, run_stage
+from jifmaker.trim import format_timestamp, keyframe_times, parse_timestamp, plan_seek
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+MEDIA_EXTENSIONS = (".gif", ".mp4", ".avi", ".mov", ".mkv", ".webm", ".webp")
+
+DITHER_MODES = ["bayer", "heckbert", "floyd_steinberg", "sierra2", "sierra2_4a", "none"]
+
+GIFSICLE_LEVELS = ["O1 (Fast)", "O2", "O3 (Best)"]  # Labels for gifsicle -O1 to -O3
+
+BACKEND_NAMES = ["auto", "ffmpeg", "pillow"]  # Choices of ConversionOptions.backend, see jifmaker.backends
+
+DECIMATE_HI = 64 * 12  # mpdecimate defaults, a frame is kept if any 8x8 block differs by more than DECIMATE_HI
+
+DECIMATE_LO = 64 * 5  # or if more than the Min Frame Difference share of blocks differ by more than DECIMATE_LO
+
+PALETTE_STATS_MODE = "diff"  # palettegen statistics, weighted towards what changes between frames
+
+SAMPLED_STATS_MODE = "full"  # Sampled frames are not consecutive, there is no motion for diff to weigh
+
+PALETTE_SAMPLE_SPACING = 2.0  # Seconds of input per frame a sampled palette is computed from
+PALETTE_SAMPLES_MIN = 8
+PALETTE_SAMPLES_MAX = 64
+PALETTE_SAMPLE_SPAN = 0.5  # Seconds each seeked sample input may decode, its first frame is the one used
+
+FFMPEG_NOT_FOUND = ("FFmpeg not found. Please install FFmpeg and ensure it's in your PATH.\n\n"
+                    "Download from: https://ffmpeg.org/download.html")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class ConversionOptions:
+    """Settings exposed by the Basic Processing and Advanced Compression tabs"""
+    fps: int = 15
+    width: int = 800
+    height: int = -1
+    colors: int = 256
+    dither: str = "bayer"
+    loop: bool = True
+    start_time: str = ""
+    end_time: str = ""
+    top: int = 0
+    bottom: int = 0
+    left: int = 0
+    right: int = 0
+    frame_skip: int = 1
+    frame_diff: int = 10
+    optimize_transparency: bool = True
+    no_extensions: bool = False
+    single_pass: bool = False
+    gifsicle: bool = False
+    gifsicle_level: int = 3
+    chunks: int = 1  # Encode the trim range as this many chunks in parallel, 1 encodes it in one piece
+    backend: str = "auto"  # "ffmpeg", "pillow" or "auto" to pick one by input size, see jifmaker.backends
+    optimize_frames: bool = False  # Crop frames to changed pixels with the built-in optimizer, see jifmaker.optimize
+    memory_limit: int = 512  # MB the in-process encoder may use, longer clips are streamed, see jifmaker.pipeline
+    reuse_palette: bool = True  # Take the palette from the palette cache when the same one was generated before
+    palette_file: str = ""  # Encode with this palette PNG instead of generating one, e.g. a shared palette
+    sampled_palette: bool = False  # Compute the palette from frames at evenly spaced keyframes, not the whole range
+    fast_decode: bool = False  # Decode with threads, at reduced size and with a cheaper scaler, see jifmaker.decode
+    quality: int = 75  # 0 to 100 for lossy WebP, MP4 and WebM outputs, see jifmaker.formats
+    lossless: bool = False  # Encode WebP outputs losslessly
+    webp_method: int = 4  # WebP compression effort, 0 (fastest) to 6 (smallest)
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    """Properties of an input file reported by ffprobe"""
+    path: str
+    width: int = 0
+    height: int = 0
+    duration: float = 0.0
+    fps: float = 0.0
+    codec: str = "N/A"
+    has_video: bool = False
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One external command of a conversion plan"""
+    name: str
+    description: str
+    args: list = field(default_factory=list)
+
+
+@dataclass
+class ConversionPlan:
+    """The ordered stages that turn input_file into output_file"""
+    input_file: str
+    output_file: str
+    options: ConversionOptions
+    stages: list = field(default_factory=list)
+    palette_path: str = ""  # Palette the encode stage maps onto, empty for single-pass plans
+    palette_key: str = ""  # Palette cache key the palette stage's output is stored under once it ran
+    chunk_lengths: list = field(default_factory=list)  # Seconds of each chunk stage, None for one that runs to the end
+
+    def command_line(self):
+        """Return the stages as a single shell-style command line"""
+        return " && ".join(" ".join(stage.args) for stage in self.stages)
+
+
+@dataclass(frozen=True)
+class FrameReport:
+    """How many frames Min Frame Difference merged into the delay of the frame before them"""
+    expected: int
+    written: int
+    saved: int  # Approximate bytes the merged frames would have taken
+
+    @property
+    def removed(self):
+        return self.expected - self.written
+
+    def describe(self):
+        share = self.removed / self.expected * 100 if self.expected else 0
+        return (f"Removed {self.removed} of {self.expected} frames ({share:.0f}%), "
+                f"saving about {format_size(self.saved / 1024)}")
+
+
+@dataclass(frozen=True)
+class ConversionResult:
+    """Summary of a finished conversion"""
+    output_file: str
+    size: int
+    elapsed: float
+    peak_memory: int = 0  # Peak resident bytes of an in-process encode, 0 for FFmpeg processes or overlapping encodes
+    report: object = None  # telemetry.JobReport with the cost of every stage
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def time_to_seconds(time_str):
+    """Convert HH:MM:SS format, optionally with milliseconds (HH:MM:SS.mmm), to seconds"""
+    return parse_timestamp(time_str)
+
+
+def format_time(seconds):
+    """Format seconds into HH:MM:SS format"""
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+def parse_frame_rate(fps_str):
+    """Convert an ffprobe rate such as "30000/1001" to a float, 0 if it is invalid"""
+    try:
+        if '/' in fps_str:
+            num, den = fps_str.split('/')
+            return float(num) / float(den) if float(den) != 0 else 0
+        return float(fps_str)
+    except (ValueError, ZeroDivisionError):
+        return 0
+
+
+def parse_probe_output(file_path, info):
+    """Build a MediaInfo from the parsed JSON of ffprobe -show_format -show_streams"""
+    # Find video stream
+    video_stream = None
+    for stream in info.get('streams', []):
+        if stream.get('codec_type') == 'video':
+            video_stream = stream
+            break
+
+    if not video_stream:
+        return MediaInfo(path=file_path)
+
+    return MediaInfo(
+        path=file_path,
+        width=int(video_stream.get('width', 0)),
+        height=int(video_stream.get('height', 0)),
+        duration=float(video_stream.get('duration', info.get('format', {}).get('duration', 0))),
+        fps=parse_frame_rate(video_stream.get('avg_frame_rate', '0/1')),
+        codec=video_stream.get('codec_name', 'N/A'),
+        has_video=True,
+    )
+
+
+def probe(file_path, cache=None):
+    """Return the MediaInfo of file_path, raises FileNotFoundError without ffprobe
+
+    Results are looked up in the shared on-disk ProbeCache first (or the given cache), pass cache=False to always
+    run ffprobe.
+    """
+    if cache is None:
+        cache = get_probe_cache()
+    elif cache is False:
+        cache = None
+
+    data = cache.get(file_path) if cache is not None else None
+    if data is None:
+        if not find_tool("ffprobe"):
+            raise FileNotFoundError("ffprobe")
+
+        cmd = [
+            "ffprobe",
+            "-v", "quiet",
+            "-print_format", "json",
+            "-show_format",
+            "-show_streams",
+            file_path
+        ]
+        data = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        if cache is not None:
+            cache.put(file_path, data)
+
+    return parse_probe_output(file_path, json.loads(data))
+
+
+def output_height(options, info):
+    """Return the output height, derived from the source aspect ratio when it is automatic"""
+    if options.height > 0:
+        return options.height
+    if info.width > 0:
+        return int(options.width * (info.height / info.width))
+    return 0
+
+
+def trimmed_duration(options, info):
+    """Return the length in seconds of the trimmed range of the input"""
+    duration = info.duration
+    start_sec = 0
+    if options.start_time and options.start_time != "00:00:00":
+        start_sec = time_to_seconds(options.start_time)
+        duration -= start_sec
+    if options.end_time:
+        end_sec = time_to_seconds(options.end_time)
+        if end_sec > 0:
+            duration = min(duration, end_sec - start_sec)
+    return max(duration, 0)
+
+
+def format_size(size_kb):
+    """Format a size in KB for display"""
+    if size_kb < 1024:
+        return f"{size_kb:.1f} KB"
+    return f"{size_kb / 1024:.1f} MB"
+
+
+def default_output_path(input_file, output_dir=None, suffix="_processed", extension=".gif"):
+    """Return the output path JIFMaker suggests for an input file"""
+    base = os.path.splitext(input_file)[0]
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return f"{base}{suffix}{extension}"
+
+
+def partial_path(output_file):
+    """Return the temporary name an output is written to before it is renamed into place"""
+    out_dir, out_name = os.path.split(os.path.abspath(output_file))
+    return os.path.join(out_dir, f".{out_name}.part{os.path.splitext(out_name)[1]}")
+
+
+def picture_filters(options, decode=None):
+    """Return the crop and scale filters, which change what a frame looks like but not which frames there are
+
+    The crop margins are divided down to the size a reduced-size decode (decode.lowres) delivers frames at.
+    """
+    decode = decode or Decode()
+    filters = []
+    if any([options.top, options.bottom, options.left, options.right]):
+        # Use input-relative expressions so the source dimensions are not needed up front
+        top, bottom, left, right = (margin // decode.factor for margin in
+                                    (options.top, options.bottom, options.left, options.right))
+        filters.append(f"crop=iw-{left + right}:ih-{top + bottom}:{left}:{top}")
+    height = options.height if options.height > 0 else -1  # Let FFmpeg preserve the aspect ratio
+    filters.append(f"scale={options.width}:{height}:flags={decode.scaler}")
+    return filters
+
+
+def build_filters(options, decode=None):
+    """Return the crop/select/fps/scale chain shared by the palette and encode passes"""
+    *filters, scale = picture_filters(options, decode)
+    if options.frame_skip > 1:
+        filters.append(f"select='not(mod(n\\,{options.frame_skip}))'")
+    filters.append(f"fps={options.fps},{scale}")
+    if options.frame_diff > 0:
+        # Drop frames that barely differ from the last kept one, the GIF muxer extends that frame's delay instead
+        filters.append(f"mpdecimate=hi={DECIMATE_HI}:lo={DECIMATE_LO}:frac={options.frame_diff / 100:g}")
+    return filters
+
+
+def frame_report(output_file, fps):
+    """Compare the frames of a finished GIF with the count its duration implies at fps
+
+    Merged frames would mostly have been tiny delta frames, each is costed like the smaller kept ones (the 10th
+    percentile of the frames after the first).
+    """
+    frames = read_gif(output_file).frames
+    duration = sum(frame.delay for frame in frames) / 100
+    expected = max(len(frames), round(duration * fps))
+    deltas = sorted(len(frame) for frame in frames[1:])
+    per_frame = deltas[len(deltas) // 10] if deltas else 0
+    return FrameReport(expected, len(frames), (expected - len(frames)) * per_frame)
+
+
+def input_seek(input_file, options):
+    """Return the trim.Seek for the trim range of options, through the cached keyframes of input_file when it is trimmed
+
+    An end time at or before the start is an invalid trim and the input is processed to its end.
+    """
+    start = time_to_seconds(options.start_time)
+    duration = None
+    if options.end_time:
+        duration = time_to_seconds(options.end_time) - start
+        if duration <= 0:
+            duration = None  # Invalid trim, process full video
+    return plan_seek(start, duration, keyframe_times(input_file) if start > 0 else None)
+
+
+def palette_key(input_file, options):
+    """Return the palette cache key for input_file with options, None if input_file is not a readable file
+
+    The key covers the input version, trim range, crop, frame skip, output size, colors, stats mode and fast decode,
+    which scales the frames differently. Frame rate, dither, loop and the other encode settings do not change which
+    colors the clip has, so a palette generated at one frame rate is reused at another.
+    """
+    try:
+        path, size, mtime_ns = file_key(input_file)
+    except OSError:
+        return None
+    start = time_to_seconds(options.start_time)
+    end = time_to_seconds(options.end_time) if options.end_time else 0
+    parts = [path, size, mtime_ns, start, end if end > start else 0, options.top, options.bottom, options.left,
+             options.right, options.frame_skip, options.width, options.height, options.colors,
+             SAMPLED_STATS_MODE if options.sampled_palette else PALETTE_STATS_MODE, options.fast_decode]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def palette_sample_count(duration, fps):
+    """Return how many frames a sampled palette of a duration seconds clip is computed from
+
+    One frame every PALETTE_SAMPLE_SPACING seconds, within PALETTE_SAMPLES_MIN and PALETTE_SAMPLES_MAX. Returns 0
+    when the clip has so few frames that scanning all of them costs about the same.
+    """
+    count = min(max(round(duration / PALETTE_SAMPLE_SPACING), PALETTE_SAMPLES_MIN), PALETTE_SAMPLES_MAX)
+    return count if 2 * count < duration * fps else 0
+
+
+def sampled_palette_args(input_file, options, start, duration, palettegen, palette_path, decode=None):
+    """Return the FFmpeg command for a palette computed from sampled frames, None if the whole range is as cheap
+
+    With a known duration the input is opened once per sample, each seeked to the keyframe before an evenly spaced
+    position and cut to its first frame. Otherwise only the keyframes of the trim range are decoded.
+    """
+    decode = decode or Decode()
+    filters = ",".join(picture_filters(options, decode))
+    # Only the first frame of each sample is used, skipping non-reference frames gains nothing
+    decoder = [arg for arg in decode.input_args() if arg not in ("-skip_frame", "noref")]
+    if duration is None:
+        args = ["ffmpeg", "-y"] + decoder + ["-skip_frame", "nokey"]
+        if start > 0:
+            args.extend(["-ss", format_timestamp(start)])
+        return args + ["-i", input_file, "-vf", f"{filters},{palettegen}", palette_path]
+
+    count = palette_sample_count(duration, options.fps)
+    if not count:
+        return None
+    args = ["ffmpeg", "-y"]
+    graph = []
+    for index in range(count):
+        position = start + (index + 0.5) * duration / count
+        args.extend(decoder + ["-noaccurate_seek", "-ss", f"{position:.3f}", "-t", str(PALETTE_SAMPLE_SPAN),
+                               "-i", input_file])
+        graph.append(f"[{index}:v]trim=end_frame=1,{filters}[s{index}]")
+    inputs = "".join(f"[s{index}]" for index in range(count))
+    return args + ["-filter_complex", ";".join(graph) + f";{inputs}concat=n={count}:v=1:a=0,{palettegen}",
+                   palette_path]
+
+
+def remember_palette(plan, stage):
+    """Store the palette a finished palette stage wrote in the palette cache, so the next plan can skip the stage"""
+    if stage.name == "palette" and plan.palette_key and os.path.exists(plan.palette_path):
+        try:
+            get_palette_cache().put(plan.palette_key, plan.palette_path)
+        except OSError:
+            pass  # The cache is an optimization, a full disk must not fail the conversion
+
+
+def build_plan(input_file, output_file, options, temp_dir, info=None):
+    """Return the palette, GIF and optional frame optimization and gifsicle stages that convert input_file
+
+    Outputs in the other formats of jifmaker.formats, picked by the extension of output_file, have no palette and no
+    GIF post-processing, they are encoded in a single stage.
+
+    info is used to space out the frames of a sampled palette when no end time is set and to pick the reduced size
+    and scaler of a fast decode.
+    """
+    palette_path = os.path.join(temp_dir, "palette.png")
+
+    seek = input_seek(input_file, options)
+    start_sec, duration = seek.start, seek.duration
+
+    # Input options shared by every pass, -t must come before -i or it limits the palette input of the encode pass
+    decode = plan_decode(options, info)
+    input_args = decode.input_args() + seek.input_args(input_file)
+
+    # Shared filter chain, the palette is computed from exactly the frames that get encoded
+    filters = seek.filters() + build_filters(options, decode)
+    palettegen = f"palettegen=max_colors={options.colors}:stats_mode={PALETTE_STATS_MODE}"
+    paletteuse = f"paletteuse=dither={options.dither}:diff_mode=rectangle"
+
+    plan = ConversionPlan(input_file, output_file, options)
+    output = output_format(output_file)
+    if not output.is_gif:
+        args = ["ffmpeg", "-y"] + input_args + ["-vf", ",".join(filters + output.filters())]
+        plan.stages.append(Stage("encode", f"{output.label} creation", args + output.output_args(options) +
+                                 [output_file]))
+        return plan
+
+    # A shared palette, or one generated before for the same frames, makes the palette pass unnecessary
+    key = palette_key(input_file, options) if options.reuse_palette and not options.palette_file else None
+    cached = get_palette_cache().get(key) if key else None
+    if options.palette_file or cached:
+        plan.palette_path = options.palette_file or cached
+        gif_cmd = ["ffmpeg", "-y"] + input_args + ["-i", plan.palette_path]
+        gif_cmd.extend(["-filter_complex", f"{','.join(filters)}[x];[x][1:v]{paletteuse}"])
+    elif options.single_pass:
+        # Single pass: decode, crop, fps and scale once, then split into palettegen and paletteuse
+        gif_cmd = ["ffmpeg", "-y"] + input_args
+        gif_cmd.extend(["-filter_complex",
+                        f"{','.join(filters)},split[a][b];[a]{palettegen}[p];[b][p]{paletteuse}"])
+    else:
+        # First pass: generate palette, from the whole range or from frames sampled across it
+        sampled = None
+        if options.sampled_palette:
+            length = duration
+            if length is None and info is not None and info.duration > start_sec:
+                length = info.duration - start_sec
+            sampled = sampled_palette_args(input_file, options, start_sec, length,
+                                           f"palettegen=max_colors={options.colors}:stats_mode={SAMPLED_STATS_MODE}",
+                                           palette_path, decode)
+        if sampled is not None:
+            plan.stages.append(Stage("palette", "sampled palette generation", sampled))
+        else:
+            plan.stages.append(Stage("palette", "palette generation",
+                                     ["ffmpeg", "-y"] + input_args + ["-vf", ",".join(filters + [palettegen]),
+                                                                      palette_path]))
+        plan.palette_path = palette_path
+        plan.palette_key = key or ""
+
+        # Second pass: create GIF
+        gif_cmd = ["ffmpeg", "-y"] + input_args + ["-i", palette_path]
+        gif_cmd.extend(["-filter_complex", f"{','.join(filters)}[x];[x][1:v]{paletteuse}"])
+
+    # Add compression options
+    if options.optimize_transparency:
+        gif_cmd.extend(["-gifflags", "+transdiff"])
+    if options.no_extensions:
+        gif_cmd.extend(["-gifflags", "-offsetting"])
+    gif_cmd.extend(["-loop", "0" if options.loop else "-1"])
+    gif_cmd.append(output_file)
+    plan.stages.append(Stage("encode", "GIF creation", gif_cmd))
+
+    # The built-in frame optimizer runs in its own process like the other stages
+    if options.optimize_frames:
+        plan.stages.append(Stage("optimize", "frame optimization",
+                                 [sys.executable, "-m", "jifmaker.optimize", output_file]))
+
+    # Add gifsicle optimization if requested
+    if options.gifsicle:
+        plan.stages.append(Stage("gifsicle", "gifsicle optimization",
+                                 ["gifsicle", f"-O{options.gifsicle_level}", output_file, "-o", output_file]))
+
+    return plan
+
+
+def backend_for(input_file, options, info=None, output_file=None):
+    """Return the backend jifmaker.backends.choose_backend picks for options
+
+    The backends pull in NumPy and Pillow, which the window and the size estimate do not need until the first
+    conversion, so they are only imported here.
+    """
+    from jifmaker.backends import choose_backend
+    return choose_backend(input_file, options, info, output_file)
+
+
+def convert(input_file, output_file, options=None, log=None, info=None):
+    """Convert input_file to output_file, writing to a temporary name first so failures leave no partial output"""
+    options = options or ConversionOptions()
+    log = log or (lambda message: None)
+    start = time.perf_counter()
+    report = JobReport(input_file, output_file)
+
+    partial_file = partial_path(output_file)
+
+    # Each conversion gets its own temp dir so concurrent palettes never collide
+    with tempfile.TemporaryDirectory(prefix="jifmaker_") as temp_dir:
+        try:
+            plan = build_plan(input_file, partial_file, options, temp_dir, info)
+            if plan.palette_path and not any(stage.name == "palette" for stage in plan.stages):
+                log(f"Reusing palette {plan.palette_path}")
+            if options.fast_decode:
+                log(plan_decode(options, info).describe())
+            for stage in plan.stages:
+                log(f"Running {stage.description}: {' '.join(stage.args)}")
+                metrics, stderr = run_stage(stage.name, stage.description, stage.args)
+                report.add(metrics)
+                if metrics.exit_code != 0:
+                    raise subprocess.CalledProcessError(metrics.exit_code, stage.args, stderr=stderr)
+                remember_palette(plan, stage)
+            os.replace(partial_file, output_file)
+        finally:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+
+    return ConversionResult(output_file, os.path.getsize(output_file), time.perf_counter() - start,
+                            report=report.finish())
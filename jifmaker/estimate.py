@@ -0,0 +1,201 @@
+"""
+Output size estimation from short sample encodes of the trimmed range with the current settings
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+import statistics
+import dataclasses
+from dataclasses import dataclass
+from collections import OrderedDict
+
+from jifmaker.cache import file_key, find_tool
+from jifmaker.engine import backend_for, format_size, time_to_seconds, trimmed_duration
+from jifmaker.formats import output_format
+from jifmaker.gifio import read_gif
+from jifmaker.trim import format_timestamp
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+SAMPLE_COUNT = 3
+
+SAMPLE_LENGTH = 2  # Seconds of input encoded per sample window
+
+MIN_SPREAD = 0.1  # Samples never capture every scene, the range is at least +/- 10%
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class SizeEstimate:
+    """Predicted output size in bytes with a confidence range, exact when the whole range was encoded"""
+    size: int
+    low: int
+    high: int
+    samples: int
+    sampled_seconds: float
+    elapsed: float
+    exact: bool = False
+
+    def describe(self):
+        """Return the estimate for the size label"""
+        if self.exact or self.low == self.high:
+            return format_size(self.size / 1024)
+        return f"{format_size(self.size / 1024)} ({format_size(self.low / 1024)} - {format_size(self.high / 1024)})"
+
+
+class EstimateCache:
+    """Thread-safe LRU of SizeEstimates keyed by settings_hash"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            estimate = self._entries.get(key)
+            if estimate is not None:
+                self._entries.move_to_end(key)
+            return estimate
+
+    def put(self, key, estimate):
+        with self._lock:
+            self._entries[key] = estimate
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+_estimate_cache = EstimateCache()
+
+
+def settings_hash(input_file, options, samples=SAMPLE_COUNT, sample_length=SAMPLE_LENGTH, output_file=None):
+    """Return a digest of the input file version, the output format and every setting that affects the output size"""
+    key = (file_key(input_file), output_format(output_file or "").name, dataclasses.astuple(options), samples,
+           sample_length)
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+def sample_windows(start, duration, samples=SAMPLE_COUNT, sample_length=SAMPLE_LENGTH):
+    """Return (start, length) windows in whole seconds spread evenly over the trimmed range
+
+    A single window covering the whole range is returned when the samples would cover most of it anyway.
+    """
+    if duration <= samples * sample_length * 1.5:
+        return [(start, max(1, int(round(duration))))]
+
+    windows = []
+    for index in range(samples):
+        center = start + (index + 0.5) * duration / samples
+        window_start = min(max(int(center - sample_length / 2), start), int(start + duration) - sample_length)
+        windows.append((window_start, sample_length))
+    return windows
+
+
+def encode_sample(input_file, options, start, length, temp_dir, output=None, info=None):
+    """Encode one window of input_file with options, returns (bytes outside frames, list of frame sizes)
+
+    The sample is written in the OutputFormat output, GIF by default, by the backend a conversion of the whole range
+    would use. Other formats are not split into frames, the whole sample is returned as a single frame so its size
+    scales with the duration.
+    """
+    output = output or output_format("")
+    output_file = os.path.join(temp_dir, f"sample{output.extensions[0]}")
+    backend = backend_for(input_file, options, info, output_file)
+    # A window is too short to be worth chunks, without gifsicle the estimate is for the unoptimized GIF. Palettes of
+    # sample windows are never used by a real conversion, they are kept out of the palette cache
+    sample_options = dataclasses.replace(options, start_time=format_timestamp(start),
+                                         end_time=format_timestamp(start + length), chunks=1, reuse_palette=False,
+                                         gifsicle=options.gifsicle and find_tool("gifsicle") is not None)
+    backend.convert(input_file, output_file, sample_options, info)
+    if not output.is_gif:
+        return 0, [os.path.getsize(output_file)]
+    frames = [len(frame) for frame in read_gif(output_file).frames]
+    return os.path.getsize(output_file) - sum(frames), frames
+
+
+def extrapolate(overhead, frames, length, duration):
+    """Predict the size of a duration seconds GIF from one encoded window of length seconds
+
+    The first frame of a window is stored whole while the rest only hold what changed, so it is counted once and the
+    following frames are scaled up to the full frame count.
+    """
+    if not frames:
+        return overhead
+    total_frames = len(frames) / length * duration
+    if len(frames) == 1:
+        return overhead + frames[0] * total_frames
+    steady = sum(frames[1:]) / (len(frames) - 1)
+    return overhead + frames[0] + steady * max(total_frames - 1, 0)
+
+
+def estimate_output_size(input_file, options, info, samples=SAMPLE_COUNT, sample_length=SAMPLE_LENGTH, cache=None,
+                         cancelled=None, output_file=None):
+    """Estimate the output size by encoding sampled windows and extrapolating their byte rate
+
+    The samples are encoded in the format the extension of output_file picks, GIF when it is None. Returns None if
+    the input has no video or cancelled() became true between two samples. Results are cached per settings_hash in
+    the shared EstimateCache (or the given cache).
+    """
+    if not info or not info.has_video:
+        return None
+    cache = _estimate_cache if cache is None else cache
+    key = settings_hash(input_file, options, samples, sample_length, output_file)
+    estimate = cache.get(key)
+    if estimate is not None:
+        return estimate
+
+    start = time_to_seconds(options.start_time)
+    duration = trimmed_duration(options, info)
+    windows = sample_windows(start, duration, samples, sample_length)
+    output = output_format(output_file or "")
+    begin = time.perf_counter()
+
+    predictions = []
+    with tempfile.TemporaryDirectory(prefix="jifmaker_estimate_") as temp_dir:
+        for window_start, length in windows:
+            if cancelled is not None and cancelled():
+                return None
+            overhead, frames = encode_sample(input_file, options, window_start, length, temp_dir, output, info)
+            if len(windows) == 1 and length >= duration:
+                size = overhead + sum(frames)
+                estimate = SizeEstimate(size, size, size, 1, length, time.perf_counter() - begin, exact=True)
+                cache.put(key, estimate)
+                return estimate
+            predictions.append(extrapolate(overhead, frames, length, duration))
+
+    # Each window predicts the whole output, their spread gives the confidence range
+    mean = statistics.mean(predictions)
+    error = 2 * statistics.stdev(predictions) / len(predictions) ** 0.5 if len(predictions) > 1 else mean
+    error = max(error, mean * MIN_SPREAD)
+    estimate = SizeEstimate(
+        size=int(mean),
+        low=int(max(mean - error, min(predictions))),
+        high=int(mean + error),
+        samples=len(windows),
+        sampled_seconds=sum(length for _, length in windows),
+        elapsed=time.perf_counter() - begin,
+    )
+
+    cache.put(key, estimate)
+    return estimate
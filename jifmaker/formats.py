@@ -0,0 +1,97 @@
+"""
+Output formats: the encoder profiles for animated WebP, APNG and silent looping MP4 and WebM, picked by the output
+file's extension, next to the palette-based GIF chain of jifmaker.engine
+"""
+
+import os
+from dataclasses import dataclass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+CRF_RANGE = {"mp4": (18, 38), "webm": (15, 50)}  # CRF at quality 100 and at quality 0, lower is better
+
+EVEN_SIZE = "crop=trunc(iw/2)*2:trunc(ih/2)*2"  # 4:2:0 chroma covers 2x2 pixels, MP4 and WebM need even sizes
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """An output container and its encoder settings"""
+    name: str
+    label: str
+    extensions: tuple
+    even_size: bool = False
+
+    @property
+    def is_gif(self):
+        """GIF goes through the palette passes, the post-processing stages and the in-process encoder"""
+        return self.name == "gif"
+
+    def filters(self):
+        """Return the filters the encoder needs after the shared crop/fps/scale chain"""
+        return [EVEN_SIZE] if self.even_size else []
+
+    def output_args(self, options):
+        """Return the encoder and muxer options for options, the frames keep the timestamps mpdecimate left them"""
+        # -vsync rather than -fps_mode, which needs FFmpeg 5.1 or newer
+        args = ["-an", "-vsync", "passthrough"]
+        if self.name == "webp":
+            args.extend(["-c:v", "libwebp_anim", "-lossless", "1" if options.lossless else "0",
+                         "-quality", str(options.quality), "-compression_level", str(options.webp_method),
+                         "-pix_fmt", "bgra" if options.lossless else "yuv420p", "-loop", "0" if options.loop else "1"])
+        elif self.name == "apng":
+            # -f apng, .png alone would select the still image muxer
+            args.extend(["-c:v", "apng", "-pred", "mixed", "-pix_fmt", "rgb24", "-plays", "0" if options.loop else "1",
+                         "-f", "apng"])
+        elif self.name == "mp4":
+            args.extend(["-c:v", "libx264", "-preset", "medium", "-crf", str(crf(self.name, options.quality)),
+                         "-pix_fmt", "yuv420p", "-movflags", "+faststart"])
+        elif self.name == "webm":
+            args.extend(["-c:v", "libvpx-vp9", "-crf", str(crf(self.name, options.quality)), "-b:v", "0",
+                         "-row-mt", "1", "-deadline", "good", "-cpu-used", "4", "-pix_fmt", "yuv420p"])
+        return args
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+FORMATS = {output.name: output for output in (
+    OutputFormat("gif", "GIF", (".gif",)),
+    OutputFormat("webp", "WebP", (".webp",)),
+    OutputFormat("apng", "APNG", (".apng", ".png")),
+    OutputFormat("mp4", "MP4", (".mp4", ".m4v"), even_size=True),
+    OutputFormat("webm", "WebM", (".webm",), even_size=True),
+)}
+
+FORMAT_NAMES = list(FORMATS)
+
+
+def output_format(output_file):
+    """Return the OutputFormat for the extension of output_file, GIF for unknown extensions"""
+    extension = os.path.splitext(output_file)[1].lower()
+    for output in FORMATS.values():
+        if extension in output.extensions:
+            return output
+    return FORMATS["gif"]
+
+
+def crf(name, quality):
+    """Map a 0 to 100 quality onto the CRF range of the MP4 or WebM encoder"""
+    best, worst = CRF_RANGE[name]
+    return round(worst - (worst - best) * min(max(quality, 0), 100) / 100)
+
+
+def file_filter():
+    """Return the file dialog filter listing every output format, GIF first"""
+    return ";;".join(f"{output.label} Files ({' '.join('*' + extension for extension in output.extensions)})"
+                     for output in FORMATS.values())
@@ -0,0 +1,260 @@
+"""
+Frame access through FFmpeg's rawvideo pipe, decoded straight into reusable buffers without temp files
+"""
+
+import threading
+import subprocess
+from collections import OrderedDict
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class FrameSource:
+    """Decode RGB24 frames of a media file at arbitrary timestamps into one reusable buffer
+
+    The buffer returned by frame_at and yielded by iter_frames is overwritten by the next decode, callers that keep a
+    frame must copy it.
+    """
+
+    def __init__(self, file_path, width, height, max_size=None):
+        """width and height are the source dimensions, max_size (w, h) downscales frames to fit inside it"""
+        self.file_path = file_path
+        self.source_width = width
+        self.source_height = height
+        self.width, self.height = fit_size(width, height, max_size)
+        self.frame_size = self.width * self.height * 3
+        self.buffer = bytearray(self.frame_size)
+        self._view = memoryview(self.buffer)
+
+    @property
+    def scale(self):
+        """Ratio between the decoded and the source width"""
+        return self.width / self.source_width if self.source_width else 1.0
+
+    def command(self, timestamp=0.0, frames=None, fps=None, duration=None):
+        """Return the FFmpeg command that writes raw RGB24 frames to stdout"""
+        cmd = ["ffmpeg", "-v", "error", "-nostdin"]
+        if timestamp > 0:
+            cmd.extend(["-ss", f"{timestamp:.3f}"])
+        cmd.extend(["-i", self.file_path])
+        if duration is not None:
+            cmd.extend(["-t", f"{duration:.3f}"])
+
+        filters = []
+        if fps:
+            filters.append(f"fps={fps}")
+        if (self.width, self.height) != (self.source_width, self.source_height):
+            filters.append(f"scale={self.width}:{self.height}:flags=bilinear")
+        if filters:
+            cmd.extend(["-vf", ",".join(filters)])
+
+        if frames is not None:
+            cmd.extend(["-frames:v", str(frames)])
+        cmd.extend(["-an", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"])
+        return cmd
+
+    def frame_at(self, timestamp):
+        """Decode the frame shown at timestamp (seconds), returns the shared buffer or None past the end"""
+        process = subprocess.Popen(self.command(timestamp, frames=1), stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            complete = self._read_frame(process.stdout)
+        finally:
+            process.stdout.close()
+            process.wait()
+        return self.buffer if complete else None
+
+    def iter_frames(self, start=0.0, duration=None, fps=None):
+        """Yield (timestamp, buffer) for consecutive frames decoded by a single FFmpeg process
+
+        Frames are resampled to fps when it is given, otherwise they come at the source rate and timestamp is None.
+        """
+        process = subprocess.Popen(self.command(start, fps=fps, duration=duration), stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            index = 0
+            while self._read_frame(process.stdout):
+                yield (start + index / fps) if fps else None, self.buffer
+                index += 1
+        finally:
+            process.stdout.close()
+            process.kill()
+            process.wait()
+
+    def _read_frame(self, stream):
+        """Fill the buffer from stream, returns False if the stream ended first"""
+        offset = 0
+        while offset < self.frame_size:
+            count = stream.readinto(self._view[offset:])
+            if not count:
+                return False
+            offset += count
+        return True
+
+
+class FrameCache:
+    """Thread-safe LRU cache of decoded frames, bounded by the total number of bytes it holds"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached frame for key and mark it as recently used, None if it is not cached"""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        """Store a frame (bytes), evicting the least recently used frames beyond max_bytes"""
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            self._frames[key] = frame
+            self.nbytes += len(frame)
+            while self.nbytes > self.max_bytes and len(self._frames) > 1:
+                _, evicted = self._frames.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+
+class FramePrefetcher:
+    """Background thread that decodes the frame under the cursor and then the frames around it
+
+    Frames are addressed by index on a grid of step seconds. request() only keeps the newest index, so a fast drag
+    decodes where the cursor ends up instead of every position it passed through. A request that falls inside the
+    range being decoded does not restart FFmpeg, the running decode reaches it first. on_frame(index, frame) is called
+    from the worker thread for every frame that gets decoded.
+    """
+
+    def __init__(self, source, cache, step, on_frame=None, ahead=12, behind=4):
+        """source must be a FrameSource used only by this prefetcher, its buffer is overwritten from the thread"""
+        self.source = source
+        self.cache = cache
+        self.step = step
+        self.on_frame = on_frame
+        self.ahead = ahead
+        self.behind = behind
+        self._target = None
+        self._streaming = None
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="jifmaker-prefetch", daemon=True)
+        self._thread.start()
+
+    def request(self, index):
+        """Ask for the frame at index, replacing any request that has not been started yet"""
+        with self._condition:
+            self._target = index
+            self._condition.notify()
+
+    def close(self):
+        """Stop the thread, waiting for the current decode to finish"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _next_request(self):
+        with self._condition:
+            while self._target is None and not self._stopped:
+                self._condition.wait()
+            if self._stopped:
+                return None
+            index, self._target = self._target, None
+            return index
+
+    def _interrupted(self):
+        with self._condition:
+            if self._stopped:
+                return True
+            if self._target is None:
+                return False
+            return self._streaming is None or not self._streaming[0] <= self._target <= self._streaming[1]
+
+    def _run(self):
+        while True:
+            index = self._next_request()
+            if index is None:
+                return
+
+            if index not in self.cache:
+                buffer = self.source.frame_at(index * self.step)
+                if buffer is not None:
+                    frame = bytes(buffer)
+                    self.cache.put(index, frame)
+                    if self.on_frame:
+                        self.on_frame(index, frame)
+
+            # Fill the neighbourhood, one sequential decode per gap is far cheaper than seeking per frame
+            for first, last in ((index + 1, index + self.ahead), (max(index - self.behind, 0), index - 1)):
+                if self._interrupted():
+                    break
+                self._prefetch_range(first, last)
+
+    def _prefetch_range(self, first, last):
+        missing = [i for i in range(first, last + 1) if i not in self.cache]
+        if not missing:
+            return
+        first = missing[0]
+        count = last - first + 1
+        with self._condition:
+            self._streaming = (first, last)
+        frames = self.source.iter_frames(first * self.step, duration=count * self.step, fps=1 / self.step)
+        try:
+            for offset, (_, buffer) in enumerate(frames):
+                if offset >= count or self._interrupted():
+                    break
+                if first + offset not in self.cache:
+                    frame = bytes(buffer)
+                    self.cache.put(first + offset, frame)
+                    if self.on_frame:
+                        self.on_frame(first + offset, frame)
+        finally:
+            frames.close()
+            with self._condition:
+                self._streaming = None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def scrub_step(duration, fps, max_positions=2000):
+    """Return the scrubber step in seconds, one source frame unless that gives more than max_positions steps"""
+    frame_step = 1 / fps if fps > 0 else 0.1
+    return max(frame_step, duration / max_positions)
+
+
+def fit_size(width, height, max_size=None):
+    """Return (width, height) scaled down to fit inside max_size while keeping the aspect ratio"""
+    if not max_size or (width <= max_size[0] and height <= max_size[1]):
+        return width, height
+    ratio = min(max_size[0] / width, max_size[1] / height)
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
@@ -0,0 +1,203 @@
+"""
+Minimal reader for the block structure of GIF files, enough to measure and reassemble frames without decoding them
+"""
+
+import io
+import struct
+from dataclasses import dataclass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass
+class GifFrame:
+    """The raw bytes of one frame: its graphic control extension (if any) and its image block"""
+    control: bytes
+    image: bytes
+
+    def __len__(self):
+        return len(self.control) + len(self.image)
+
+    @property
+    def delay(self):
+        """Display time in hundredths of a second, 0 without a graphic control extension"""
+        return struct.unpack_from("<H", self.control, 4)[0] if len(self.control) >= 6 else 0
+
+    def with_delay(self, delay):
+        """Return a copy of the frame shown for delay hundredths of a second"""
+        control = self.control or b"\x21\xf9\x04\x00\x00\x00\x00\x00"
+        return GifFrame(control[:4] + struct.pack("<H", min(max(delay, 0), 0xFFFF)) + control[6:], self.image)
+
+    def with_local_palette(self, palette, size_bits):
+        """Return a copy that carries palette as its local color table, unless it already has one"""
+        flags = self.image[9]
+        if flags & 0x80:
+            return self
+        flags = (flags & ~0x07) | 0x80 | size_bits
+        return GifFrame(self.control, self.image[:9] + bytes([flags]) + palette + self.image[10:])
+
+
+class GifReader:
+    """Read a GIF one block at a time, so frames can be processed without loading the whole file
+
+    source is a path or a binary file object. header and the extensions before the first frame are read on open,
+    iterating yields GifFrames and adds later extensions to extensions. Raises ValueError for data that is not a GIF
+    or ends inside a block.
+    """
+
+    def __init__(self, source):
+        self._file = source if hasattr(source, "read") else open(source, "rb")
+        try:
+            header = self._file.read(13)
+            if header[:6] not in (b"GIF87a", b"GIF89a") or len(header) < 13:
+                raise ValueError("Not a GIF file")
+            if header[10] & 0x80:
+                header += self._read(3 * (2 << (header[10] & 0x07)))
+            self.header = header
+            self.extensions = []
+            self._next = self._read_frame()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        while self._next is not None:
+            frame, self._next = self._next, None
+            yield frame
+            self._next = self._read_frame()
+
+    def close(self):
+        self._file.close()
+
+    def _read(self, size):
+        data = self._file.read(size)
+        if len(data) < size:
+            raise ValueError("Truncated GIF")
+        return data
+
+    def _read_sub_blocks(self):
+        data = bytearray()
+        while True:
+            size = self._read(1)
+            data += size
+            if size[0] == 0:
+                return bytes(data)
+            data += self._read(size[0])
+
+    def _read_frame(self):
+        """Return the next GifFrame, None at the trailer, other extensions than graphic controls go to extensions"""
+        control = b""
+        while True:
+            introducer = self._file.read(1)
+            if not introducer or introducer == b"\x3b":
+                return None
+            if introducer == b"\x21":
+                block = introducer + self._read(1)
+                block += self._read_sub_blocks()
+                if block[1] == 0xF9:
+                    control = block
+                else:
+                    self.extensions.append(block)
+            elif introducer == b"\x2c":
+                descriptor = introducer + self._read(9)
+                if descriptor[9] & 0x80:
+                    descriptor += self._read(3 * (2 << (descriptor[9] & 0x07)))
+                image = descriptor + self._read(1) + self._read_sub_blocks()
+                return GifFrame(control, image)
+            else:
+                raise ValueError(f"Unexpected block 0x{introducer[0]:02x} at offset {self._file.tell() - 1}")
+
+
+@dataclass
+class GifFile:
+    """A GIF split into its header (signature, screen descriptor, global palette), extensions and frames"""
+    header: bytes
+    extensions: list
+    frames: list
+
+    @property
+    def width(self):
+        return struct.unpack_from("<H", self.header, 6)[0]
+
+    @property
+    def height(self):
+        return struct.unpack_from("<H", self.header, 8)[0]
+
+    @property
+    def palette(self):
+        """The global color table, empty if there is none"""
+        return self.header[13:]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def parse_gif(data):
+    """Split the bytes of a GIF into a GifFile, raises ValueError if they are not a GIF or are cut short"""
+    with GifReader(io.BytesIO(data)) as reader:
+        frames = list(reader)
+        return GifFile(reader.header, reader.extensions, frames)
+
+
+def read_gif(path):
+    """Parse the GIF at path"""
+    with open(path, "rb") as f:
+        return parse_gif(f.read())
+
+
+def frame_sizes(path):
+    """Return the number of bytes each frame of the GIF at path takes up"""
+    return [len(frame) for frame in read_gif(path).frames]
+
+
+def write_gif(path, header, extensions, frames):
+    """Write a GIF from its header, the extensions placed before the first frame and a list of GifFrames"""
+    with open(path, "wb") as f:
+        f.write(header)
+        for extension in extensions:
+            f.write(extension)
+        for frame in frames:
+            f.write(frame.control)
+            f.write(frame.image)
+        f.write(b"\x3b")
+
+
+def concat_gifs(paths, output_path, durations=None):
+    """Join GIFs of the same size into one animation that keeps the header and loop setting of the first
+
+    Files whose global palette differs from the first one have it copied into each of their frames as a local
+    palette. durations (hundredths of a second per file) stretch the last frame of a file so the file keeps that
+    length even when trailing frames were dropped. Returns the number of frames written.
+    """
+    first = None
+    frames = []
+    for index, path in enumerate(paths):
+        gif = read_gif(path)
+        if first is None:
+            first = gif
+        elif (gif.width, gif.height) != (first.width, first.height):
+            raise ValueError(f"{path} is {gif.width}x{gif.height}, expected {first.width}x{first.height}")
+
+        parts = gif.frames
+        if gif.palette != first.palette and gif.header[10] & 0x80:
+            parts = [frame.with_local_palette(gif.palette, gif.header[10] & 0x07) for frame in parts]
+        if durations is not None and parts:
+            shown = sum(frame.delay for frame in parts[:-1])
+            parts[-1] = parts[-1].with_delay(max(parts[-1].delay, durations[index] - shown))
+        frames.extend(parts)
+
+    if first is None:
+        raise ValueError("No GIFs to join")
+    write_gif(output_path, first.header, first.extensions, frames)
+    return len(frames)
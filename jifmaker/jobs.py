@@ -0,0 +1,135 @@
+"""
+Job queue for the window: conversions with a snapshot of the settings they were queued with, run in queue order
+"""
+
+import time
+import itertools
+from dataclasses import dataclass
+
+from jifmaker.engine import ConversionOptions, format_size
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+QUEUED = "Queued"
+PAUSED = "Paused"
+RUNNING = "Running"
+DONE = "Done"
+FAILED = "Failed"
+CANCELLED = "Cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass
+class Job:
+    """One queued conversion and how far it got"""
+    id: int
+    input_file: str
+    output_file: str
+    options: ConversionOptions
+    info: object = None  # MediaInfo of the input, None if it could not be probed
+    status: str = QUEUED
+    progress: float = 0.0  # Fraction done, 0 while it is unknown
+    size: int = 0  # Output bytes once it is done
+    started: float = 0.0
+    elapsed: float = 0.0
+    message: str = ""
+
+    def describe(self):
+        """Return the status as shown in the queue"""
+        if self.status == DONE:
+            return f"Done, {format_size(self.size / 1024)} in {self.elapsed:.1f}s"
+        if self.status == FAILED:
+            return f"Failed: {self.message}"
+        return self.status
+
+
+class JobQueue:
+    """Jobs in the order they run, paused jobs keep their place but are skipped until they are resumed"""
+
+    def __init__(self):
+        self.jobs = []
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add(self, input_file, output_file, options, info=None):
+        """Append a job, options is frozen so later changes in the window do not affect it"""
+        job = Job(next(self._ids), input_file, output_file, options, info)
+        self.jobs.append(job)
+        return job
+
+    def get(self, job_id):
+        """Return the job with job_id, None if it was cleared"""
+        return next((job for job in self.jobs if job.id == job_id), None)
+
+    def move(self, job_id, offset):
+        """Move a job offset places towards the end of the queue (negative moves it up), returns its new index"""
+        job = self.get(job_id)
+        index = self.jobs.index(job)
+        target = min(max(index + offset, 0), len(self.jobs) - 1)
+        self.jobs.insert(target, self.jobs.pop(index))
+        return target
+
+    def pause(self, job_id):
+        """Hold a queued job, returns False if it is already running or finished"""
+        job = self.get(job_id)
+        if job is None or job.status != QUEUED:
+            return False
+        job.status = PAUSED
+        return True
+
+    def resume(self, job_id):
+        """Let a paused job run again in its place"""
+        job = self.get(job_id)
+        if job is None or job.status != PAUSED:
+            return False
+        job.status = QUEUED
+        return True
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started yet, returns True if it is running and its worker has to be stopped"""
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        if job.status == RUNNING:
+            return True
+        job.status = CANCELLED
+        return False
+
+    def next_job(self):
+        """Return the first job waiting to run, None if there is none"""
+        return next((job for job in self.jobs if job.status == QUEUED), None)
+
+    def running(self):
+        return [job for job in self.jobs if job.status == RUNNING]
+
+    def start(self, job):
+        job.status = RUNNING
+        job.progress = 0.0
+        job.started = time.monotonic()
+
+    def finish(self, job, status, message="", size=0):
+        """Record how a running job ended"""
+        job.status = status
+        job.message = message
+        job.size = size
+        job.elapsed = time.monotonic() - job.started
+        if status == DONE:
+            job.progress = 1.0
+
+    def clear_finished(self):
+        """Drop done, failed and cancelled jobs, returns how many were removed"""
+        count = len(self.jobs)
+        self.jobs = [job for job in self.jobs if job.status not in FINISHED]
+        return count - len(self.jobs)
@@ -1,20 +1,54 @@
 import os
 import sys
-import math 
+import time
 
-import subprocess
-import json
 import tempfile
-import shutil  # Added for checking if ffprobe is available
 
-from PyQt5.QtCore import Qt, QSettings
+from PyQt5.QtCore import Qt, QSettings, QSize
 from PyQt5.QtGui import QPixmap, QIcon
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QLineEdit, QPushButton, 
                              QSpinBox, QComboBox, QCheckBox, QGroupBox,
                              QFileDialog, QTextEdit, QMessageBox, QSlider,
-                             QGridLayout, QTabWidget, QProgressBar,
-                             QSizePolicy, QFormLayout) 
+                             QGridLayout, QTabWidget, QProgressBar, QDoubleSpinBox,
+                             QSizePolicy, QFormLayout, QTableWidget, QTableWidgetItem,
+                             QAbstractItemView, QHeaderView)
+
+from jifmaker.cache import get_probe_cache
+from jifmaker.chunked import build_chunked_plan
+from jifmaker.engine import (ConversionOptions, BACKEND_NAMES, DITHER_MODES, GIFSICLE_LEVELS,
+                             FFMPEG_NOT_FOUND, backend_for, build_plan, default_output_path, format_size, format_time,
+                             frame_report, probe, time_to_seconds)
+from jifmaker.formats import file_filter, output_format
+from jifmaker.frames import FrameCache, FramePrefetcher, FrameSource, scrub_step
+from jifmaker.jobs import JobQueue, RUNNING
+from jifmaker.preview import FrameBridge, frame_to_qimage
+from jifmaker.scheduler import UpdateScheduler
+from jifmaker.target import RETRIES, smaller_rung
+from jifmaker.worker import (ConversionWorker, EstimateWorker, ProbeWorker, QueueRunner, TargetSearchWorker,
+                             conversion_worker)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+PREVIEW_DECODE_SIZE = (960, 720)  # Preview frames are decoded no larger than this
+
+SCRUB_CACHE_BYTES = 256 * 1024 * 1024  # Memory cap for decoded scrubber frames
+
+PREVIEW_SIZE = QSize(400, 300)  # Fixed size of the preview label
+
+PREVIEW_DEBOUNCE_MS = 60  # Quiet time before the preview is rescaled while a spinbox is held down
+
+ESTIMATE_DEBOUNCE_MS = 400  # Quiet time before sample encodes for the size estimate are started
+
+QUEUE_COLUMNS = ["File", "Status", "Progress", "Size", "Time"]
+
+QUEUE_JOBS = max(1, min(4, (os.cpu_count() or 2) // 2))  # Default number of queued jobs converted at the same time
+
+COMPRESSION_TAB = 1  # Index of the Advanced Compression tab, built when it is first shown
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -64,6 +98,16 @@ class JIFMaker(QMainWindow):
         self.preview_label.setText("Output preview will appear here")
         preview_layout.addRow("", self.preview_label)  # Empty label for the preview
         
+        # Timeline scrubber over the trim range
+        scrub_layout = QHBoxLayout()
+        self.scrub_slider = QSlider(Qt.Horizontal)
+        self.scrub_slider.setEnabled(False)
+        self.scrub_slider.valueChanged.connect(self.scrub_to)
+        self.scrub_label = QLabel("00:00:00")
+        scrub_layout.addWidget(self.scrub_slider)
+        scrub_layout.addWidget(self.scrub_label)
+        preview_layout.addRow("", scrub_layout)
+        
         left_panel.addWidget(preview_group)
         
         # New group box for output info
@@ -109,10 +153,11 @@ class JIFMaker(QMainWindow):
         self.tabs.addTab(self.basic_tab, "Basic Processing")
         self.setup_basic_tab()
         
-        # Create advanced compression tab
+        # Create advanced compression tab, its widgets are built when it is first shown
         self.compression_tab = QWidget()
+        self.compression_built = False
         self.tabs.addTab(self.compression_tab, "Advanced Compression")
-        self.setup_compression_tab()
+        self.tabs.currentChanged.connect(self.on_tab_changed)
         
         # Command preview
         command_group = QGroupBox("FFmpeg Command")
@@ -129,7 +174,66 @@ class JIFMaker(QMainWindow):
         self.process_button.clicked.connect(self.process_file)
         right_panel.addWidget(self.process_button)
         
-        # Removed progress bar entirely
+        # Progress of the running conversion
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        progress_layout.addWidget(self.progress_bar)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_processing)
+        progress_layout.addWidget(self.cancel_button)
+        right_panel.addLayout(progress_layout)
+        
+        self.progress_label = QLabel("Idle")
+        right_panel.addWidget(self.progress_label)
+        
+        # Queued conversions, each with the settings it was queued with, several running at once
+        queue_group = QGroupBox("Job Queue")
+        queue_layout = QVBoxLayout(queue_group)
+        self.queue_table = QTableWidget(0, len(QUEUE_COLUMNS))
+        self.queue_table.setHorizontalHeaderLabels(QUEUE_COLUMNS)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queue_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.queue_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.queue_table.verticalHeader().setVisible(False)
+        self.queue_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.queue_table.setMaximumHeight(160)
+        queue_layout.addWidget(self.queue_table)
+        
+        queue_buttons = QHBoxLayout()
+        self.enqueue_button = QPushButton("Add to Queue")
+        self.enqueue_button.setToolTip("Queue the input file with the current settings, or drop several files")
+        self.enqueue_button.clicked.connect(self.enqueue_current)
+        self.pause_job_button = QPushButton("Pause/Resume")
+        self.pause_job_button.clicked.connect(self.toggle_job_pause)
+        self.job_up_button = QPushButton("Up")
+        self.job_up_button.clicked.connect(lambda: self.move_job(-1))
+        self.job_down_button = QPushButton("Down")
+        self.job_down_button.clicked.connect(lambda: self.move_job(1))
+        self.cancel_job_button = QPushButton("Cancel Job")
+        self.cancel_job_button.clicked.connect(self.cancel_job)
+        self.clear_jobs_button = QPushButton("Clear Finished")
+        self.clear_jobs_button.clicked.connect(self.clear_finished_jobs)
+        for button in (self.enqueue_button, self.pause_job_button, self.job_up_button, self.job_down_button,
+                       self.cancel_job_button, self.clear_jobs_button):
+            queue_buttons.addWidget(button)
+        queue_layout.addLayout(queue_buttons)
+        
+        queue_options = QHBoxLayout()
+        queue_options.addWidget(QLabel("Concurrent Jobs:"))
+        self.concurrent_jobs_spin = QSpinBox()
+        self.concurrent_jobs_spin.setRange(1, max(2, (os.cpu_count() or 1) * 2))
+        self.concurrent_jobs_spin.setValue(QUEUE_JOBS)
+        self.concurrent_jobs_spin.setToolTip("How many queued files are converted at the same time")
+        queue_options.addWidget(self.concurrent_jobs_spin)
+        self.pause_queue_check = QCheckBox("Pause Queue")
+        self.pause_queue_check.setToolTip("Finish the running jobs but do not start new ones")
+        queue_options.addWidget(self.pause_queue_check)
+        queue_options.addStretch()
+        queue_layout.addLayout(queue_options)
+        
+        right_panel.addWidget(queue_group)
         
         # Removed log_group from right_panel
         
@@ -138,16 +242,48 @@ class JIFMaker(QMainWindow):
         # Variables
         self.temp_dir = tempfile.mkdtemp()
         self.current_pixmap = None
+        self.media_info = None
+        self.frame_source = None
+        self.worker = None
+        self.target_worker = None
+        self.target_request = None  # Requested options and TargetResult of a target-size conversion
+        self.target_retries = 0
+        
+        # Queued jobs run next to the conversion started with Process
+        self.job_queue = JobQueue()
+        self.queue_runner = QueueRunner(self.job_queue, self.temp_dir, QUEUE_JOBS, self)
+        self.queue_runner.job_changed.connect(self.update_job_row)
+        self.queue_runner.log.connect(self.output_log.append)
+        self.concurrent_jobs_spin.valueChanged.connect(self.queue_runner.set_max_jobs)
+        self.pause_queue_check.toggled.connect(self.queue_runner.set_paused)
+        self.probe_workers = []  # Dropped files being probed before they are queued
+        
+        # Decoded preview frames for scrubbing, filled ahead of the cursor by the prefetcher
+        self.frame_cache = FrameCache(SCRUB_CACHE_BYTES)
+        self.prefetcher = None
+        self.scrub_step = 0.1
+        self.frame_bridge = FrameBridge(self)
+        self.frame_bridge.frame_ready.connect(self.on_scrub_frame)
         self.original_width = 0
         self.original_height = 0
         self.original_duration = 0
         self.original_fps = 0
         
+        # Size estimates come from sample encodes on a background thread
+        self.estimator = EstimateWorker(self)
+        self.estimator.estimated.connect(self.on_size_estimated)
+        
+        # Derived outputs are recomputed once per event loop tick, and only when their inputs changed
+        self.updates = UpdateScheduler(self)
+        self.updates.register("command", self.update_command_preview, self.command_key)
+        self.updates.register("estimate", self.estimate_file_size, self.estimate_key, ESTIMATE_DEBOUNCE_MS)
+        self.updates.register("preview", self.update_preview, self.preview_key, PREVIEW_DEBOUNCE_MS)
+        
         # Connect signals
         self.connect_signals()
         
         # Initial command preview
-        self.update_command_preview()
+        self.updates.run("command")
     
     def setup_basic_tab(self):
         layout = QVBoxLayout(self.basic_tab)
@@ -206,28 +342,28 @@ class JIFMaker(QMainWindow):
         self.top_margin_spin = QSpinBox()
         self.top_margin_spin.setRange(0, 1000)
         self.top_margin_spin.setValue(0)
-        self.top_margin_spin.valueChanged.connect(self.update_preview)
+        self.top_margin_spin.valueChanged.connect(self.invalidate_preview)
         margin_layout.addWidget(self.top_margin_spin, 0, 1)
         
         margin_layout.addWidget(QLabel("Bottom:"), 0, 2)
         self.bottom_margin_spin = QSpinBox()
         self.bottom_margin_spin.setRange(0, 1000)
         self.bottom_margin_spin.setValue(0)
-        self.bottom_margin_spin.valueChanged.connect(self.update_preview)
+        self.bottom_margin_spin.valueChanged.connect(self.invalidate_preview)
         margin_layout.addWidget(self.bottom_margin_spin, 0, 3)
         
         margin_layout.addWidget(QLabel("Left:"), 1, 0)
         self.left_margin_spin = QSpinBox()
         self.left_margin_spin.setRange(0, 1000)
         self.left_margin_spin.setValue(0)
-        self.left_margin_spin.valueChanged.connect(self.update_preview)
+        self.left_margin_spin.valueChanged.connect(self.invalidate_preview)
         margin_layout.addWidget(self.left_margin_spin, 1, 1)
         
         margin_layout.addWidget(QLabel("Right:"), 1, 2)
         self.right_margin_spin = QSpinBox()
         self.right_margin_spin.setRange(0, 1000)
         self.right_margin_spin.setValue(0)
-        self.right_margin_spin.valueChanged.connect(self.update_preview)
+        self.right_margin_spin.valueChanged.connect(self.invalidate_preview)
         margin_layout.addWidget(self.right_margin_spin, 1, 3)
         
         options_layout.addRow("Margins (Cropping):", margin_group)  # Sub-group
@@ -256,7 +392,7 @@ class JIFMaker(QMainWindow):
         dither_layout = QHBoxLayout()
         dither_layout.addWidget(QLabel("Dithering:"))
         self.dither_combo = QComboBox()
-        self.dither_combo.addItems(["bayer", "heckbert", "floyd_steinberg", "sierra2", "sierra2_4a", "none"])
+        self.dither_combo.addItems(DITHER_MODES)
         dither_layout.addWidget(self.dither_combo)
         dither_layout.addStretch()
         options_layout.addRow("Dithering:", self.dither_combo)
@@ -276,12 +412,12 @@ class JIFMaker(QMainWindow):
         trim_controls = QHBoxLayout()
         trim_controls.addWidget(QLabel("Start:"))
         self.start_time_edit = QLineEdit("00:00:00")
-        self.start_time_edit.setPlaceholderText("HH:MM:SS")
+        self.start_time_edit.setPlaceholderText("HH:MM:SS.mmm")
         trim_controls.addWidget(self.start_time_edit)
         
         trim_controls.addWidget(QLabel("End:"))
         self.end_time_edit = QLineEdit()
-        self.end_time_edit.setPlaceholderText("HH:MM:SS")
+        self.end_time_edit.setPlaceholderText("HH:MM:SS.mmm")
         trim_controls.addWidget(self.end_time_edit)
         
         trim_layout.addLayout(trim_controls)
@@ -290,6 +426,19 @@ class JIFMaker(QMainWindow):
         layout.addWidget(options_group)
         layout.addStretch()
     
+    def on_tab_changed(self, index):
+        if index == COMPRESSION_TAB:
+            self.build_compression_tab()
+    
+    def build_compression_tab(self):
+        """Create the Advanced Compression widgets unless they exist, until then current_options uses the defaults"""
+        if self.compression_built:
+            return
+        self.setup_compression_tab()
+        self.compression_built = True
+        for signal in self.compression_signals():
+            signal.connect(self.invalidate_outputs)
+    
     def setup_compression_tab(self):
         layout = QVBoxLayout(self.compression_tab)
         
@@ -307,6 +456,8 @@ class JIFMaker(QMainWindow):
         self.frame_diff_slider = QSlider(Qt.Horizontal)
         self.frame_diff_slider.setRange(0, 100)
         self.frame_diff_slider.setValue(10)
+        self.frame_diff_slider.setToolTip("Merge frames into the previous one when less than this share of the "
+                                          "picture changed (0% keeps every frame)")
         self.frame_diff_label = QLabel("10%")
         diff_layout.addWidget(self.frame_diff_slider)
         diff_layout.addWidget(self.frame_diff_label)
@@ -319,10 +470,6 @@ class JIFMaker(QMainWindow):
         # Advanced compression
         advanced_group = QGroupBox("Advanced Compression")
         advanced_layout = QFormLayout(advanced_group)  # Changed to QFormLayout
-        self.compression_combo = QComboBox()
-        self.compression_combo.addItems(["Low", "Medium", "High", "Very High"])
-        self.compression_combo.setCurrentIndex(1)
-        advanced_layout.addRow("Compression Level:", self.compression_combo)
         
         # Optimization options
         opt_layout = QHBoxLayout()
@@ -335,23 +482,113 @@ class JIFMaker(QMainWindow):
         self.no_extensions_check.setToolTip("Disable GIF extensions (can reduce size but limit functionality)")
         opt_layout.addWidget(self.no_extensions_check)
         advanced_layout.addRow("", opt_layout)  # Horizontal layout for checkboxes
-        
+
+        self.single_pass_check = QCheckBox("Single-Pass Encode")
+        self.single_pass_check.setChecked(False)
+        self.single_pass_check.setToolTip("Generate and apply the palette in one FFmpeg run so the input is only "
+                                          "decoded once (buffers the scaled frames in memory)")
+        advanced_layout.addRow("", self.single_pass_check)
+
+        self.reuse_palette_check = QCheckBox("Cache Palettes")
+        self.reuse_palette_check.setChecked(True)
+        self.reuse_palette_check.setToolTip("Reuse the palette of an earlier conversion with the same input, trim, "
+                                            "crop, size and colors instead of generating it again")
+        advanced_layout.addRow("", self.reuse_palette_check)
+
+        self.sampled_palette_check = QCheckBox("Sampled Palette")
+        self.sampled_palette_check.setChecked(False)
+        self.sampled_palette_check.setToolTip("Compute the palette from keyframes spread over the clip instead of "
+                                              "every frame, much faster for long clips")
+        advanced_layout.addRow("", self.sampled_palette_check)
+
+        self.fast_decode_check = QCheckBox("Fast Decode")
+        self.fast_decode_check.setChecked(False)
+        self.fast_decode_check.setToolTip("Decode with threads, at reduced size where the codec supports it and with "
+                                          "a cheaper scaler when the GIF is much smaller than the video")
+        advanced_layout.addRow("", self.fast_decode_check)
+        
+        self.chunks_spin = QSpinBox()
+        self.chunks_spin.setRange(1, 64)
+        self.chunks_spin.setValue(1)
+        self.chunks_spin.setToolTip("Split the trim range into this many time chunks and encode them in parallel "
+                                    "with one shared palette (1 = encode in one piece)")
+        advanced_layout.addRow("Parallel Chunks:", self.chunks_spin)
+
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItems(BACKEND_NAMES)
+        self.backend_combo.setToolTip("auto encodes clips short enough to hold in memory in process with "
+                                      "Pillow/NumPy (one decode, no palette file), longer ones with FFmpeg")
+        advanced_layout.addRow("Encoder:", self.backend_combo)
+
+        self.memory_limit_spin = QSpinBox()
+        self.memory_limit_spin.setRange(64, 65536)
+        self.memory_limit_spin.setSingleStep(64)
+        self.memory_limit_spin.setValue(512)
+        self.memory_limit_spin.setSuffix(" MB")
+        self.memory_limit_spin.setToolTip("Memory the in-process encoder may use, longer clips are streamed through "
+                                          "a fixed set of frame buffers instead of being held in memory")
+        advanced_layout.addRow("Memory Limit:", self.memory_limit_spin)
+
         layout.addWidget(advanced_group)
+
+        # WebP, APNG, MP4 and WebM outputs, picked by the output file extension
+        format_group = QGroupBox("Other Output Formats")
+        format_layout = QFormLayout(format_group)
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(0, 100)
+        self.quality_spin.setValue(75)
+        self.quality_spin.setToolTip("Quality of lossy WebP, MP4 and WebM outputs, higher is larger")
+        format_layout.addRow("Quality:", self.quality_spin)
+
+        self.webp_method_spin = QSpinBox()
+        self.webp_method_spin.setRange(0, 6)
+        self.webp_method_spin.setValue(4)
+        self.webp_method_spin.setToolTip("WebP compression effort, 0 is fastest and 6 smallest")
+        format_layout.addRow("WebP Method:", self.webp_method_spin)
+
+        self.lossless_check = QCheckBox("Lossless WebP")
+        self.lossless_check.setChecked(False)
+        format_layout.addRow("", self.lossless_check)
+
+        layout.addWidget(format_group)
         
         # Post-processing
         post_group = QGroupBox("Post-Processing")
         post_layout = QFormLayout(post_group)  # Changed to QFormLayout
+        self.optimize_frames_check = QCheckBox("Optimize Frames")
+        self.optimize_frames_check.setChecked(False)
+        self.optimize_frames_check.setToolTip("Crop every frame to the pixels that changed, no gifsicle needed")
+        post_layout.addRow("Optimize Frames:", self.optimize_frames_check)
+
         self.gifsicle_check = QCheckBox("Use Gifsicle Optimization")
         self.gifsicle_check.setChecked(False)
         self.gifsicle_check.setToolTip("Use gifsicle for additional optimization (must be installed)")
         post_layout.addRow("Use Gifsicle Optimization:", self.gifsicle_check)
         
         self.gifsicle_level_combo = QComboBox()
-        self.gifsicle_level_combo.addItems(["O1 (Fast)", "O2", "O3 (Best)"])
+        self.gifsicle_level_combo.addItems(GIFSICLE_LEVELS)
         self.gifsicle_level_combo.setCurrentIndex(2)
         post_layout.addRow("Level:", self.gifsicle_level_combo)
         
         layout.addWidget(post_group)
+        
+        # Target size
+        target_group = QGroupBox("Target Size")
+        target_layout = QFormLayout(target_group)
+        self.target_size_check = QCheckBox("Fit to Target Size")
+        self.target_size_check.setChecked(False)
+        self.target_size_check.setToolTip("Lower FPS, width and colors until the estimated size fits, "
+                                          "using short sampled trial encodes")
+        target_layout.addRow("", self.target_size_check)
+        
+        self.target_size_spin = QDoubleSpinBox()
+        self.target_size_spin.setRange(0.1, 1000.0)
+        self.target_size_spin.setDecimals(1)
+        self.target_size_spin.setValue(8.0)
+        self.target_size_spin.setSuffix(" MB")
+        target_layout.addRow("Max Size:", self.target_size_spin)
+        
+        layout.addWidget(target_group)
         layout.addStretch()
     
     def connect_signals(self):
@@ -371,21 +608,59 @@ class JIFMaker(QMainWindow):
             self.bottom_margin_spin.valueChanged,
             self.left_margin_spin.valueChanged,
             self.right_margin_spin.valueChanged,
+        ]
+        
+        for signal in signals:
+            signal.connect(self.invalidate_outputs)
+        
+        # Show the first frame of the trim range once a start time has been entered
+        self.start_time_edit.editingFinished.connect(self.show_trim_start)
+        self.end_time_edit.editingFinished.connect(self.update_scrub_range)
+        
+        # Connect input file edit to update output filename
+        self.input_file_edit.textChanged.connect(self.update_output_filename)
+    
+    def compression_signals(self):
+        """Return the signals of the Advanced Compression widgets that should update the command preview"""
+        return [
             self.frame_skip_spin.valueChanged,
             self.frame_diff_slider.valueChanged,
-            self.compression_combo.currentTextChanged,
             self.optimize_transparency_check.stateChanged,
             self.no_extensions_check.stateChanged,
+            self.single_pass_check.stateChanged,
+            self.reuse_palette_check.stateChanged,
+            self.sampled_palette_check.stateChanged,
+            self.fast_decode_check.stateChanged,
+            self.chunks_spin.valueChanged,
+            self.backend_combo.currentTextChanged,
+            self.memory_limit_spin.valueChanged,
+            self.quality_spin.valueChanged,
+            self.webp_method_spin.valueChanged,
+            self.lossless_check.stateChanged,
+            self.optimize_frames_check.stateChanged,
             self.gifsicle_check.stateChanged,
             self.gifsicle_level_combo.currentTextChanged,
         ]
-        
-        for signal in signals:
-            signal.connect(self.update_command_preview)
-            signal.connect(self.estimate_file_size)
-        
-        # Connect input file edit to update output filename
-        self.input_file_edit.textChanged.connect(self.update_output_filename)
+    
+    def invalidate_outputs(self):
+        """Schedule the command preview and size estimate for the next event loop tick"""
+        self.updates.invalidate("command", "estimate")
+    
+    def invalidate_preview(self):
+        """Schedule a debounced rescale of the preview"""
+        self.updates.invalidate("preview")
+    
+    def command_key(self):
+        return self.input_file_edit.text(), self.output_file_edit.text(), self.current_options()
+    
+    def estimate_key(self):
+        return self.current_options(), self.media_info, output_format(self.output_file_edit.text()).name
+    
+    def preview_key(self):
+        pixmap = self.current_pixmap.cacheKey() if self.current_pixmap else None
+        return (pixmap, self.width_spin.value(), self.height_spin.value(), self.top_margin_spin.value(),
+                self.bottom_margin_spin.value(), self.left_margin_spin.value(), self.right_margin_spin.value(),
+                self.maintain_aspect_check.isChecked(), self.original_width, self.original_height)
     
     def browse_input_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
@@ -405,71 +680,42 @@ class JIFMaker(QMainWindow):
     def browse_output_file(self):
         file_path, _ = QFileDialog.getSaveFileName(
             self, "Select Output File", "", 
-            "GIF Files (*.gif);;WebP Files (*.webp);;All Files (*)"
+            f"{file_filter()};;All Files (*)"
         )
         if file_path:
             self.output_file_edit.setText(file_path)
     
     def analyze_input_file(self, file_path):
         """Get information about the input file"""
-        # Check if ffprobe is available before proceeding
-        if not shutil.which("ffprobe"):
-            self.file_info.setPlainText("Error: ffprobe not found. Please install FFmpeg and ensure it's in your PATH.\n\nDownload from: https://ffmpeg.org/download.html")
+        if not os.path.isfile(file_path):
+            # Checked first, probe also raises FileNotFoundError when ffprobe is missing
+            self.file_info.setPlainText(f"Error: {file_path} does not exist")
             self.preview_label.setText("Could not load preview")
             return
-        
         try:
-            # Use ffprobe to get file information
-            cmd = [
-                "ffprobe", 
-                "-v", "quiet",
-                "-print_format", "json",
-                "-show_format",
-                "-show_streams",
-                file_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            info = json.loads(result.stdout)
+            # Use ffprobe to get file information, known files come from the probe cache
+            probe_cache = get_probe_cache()
+            hits = probe_cache.hits
+            info = probe(file_path, probe_cache)
+            result = "hit" if probe_cache.hits > hits else "miss"
+            self.output_log.append(f"Metadata for {os.path.basename(file_path)}: cache {result} "
+                                   f"({probe_cache.describe()})")
             
             # Extract relevant information
             file_info_text = f"File: {os.path.basename(file_path)}\n"
             
-            # Find video stream
-            video_stream = None
-            for stream in info.get('streams', []):
-                if stream.get('codec_type') == 'video':
-                    video_stream = stream
-                    break
-            
-            if video_stream:
-                width = video_stream.get('width', 'N/A')
-                height = video_stream.get('height', 'N/A')
-                duration = float(video_stream.get('duration', info.get('format', {}).get('duration', 0)))
-                fps_str = video_stream.get('avg_frame_rate', '0/1')
-                
-                # Calculate FPS safely
-                try:
-                    if '/' in fps_str:
-                        num, den = fps_str.split('/')
-                        fps = float(num) / float(den) if float(den) != 0 else 0
-                    else:
-                        fps = float(fps_str)
-                except (ValueError, ZeroDivisionError):
-                    fps = 0
-                
-                codec = video_stream.get('codec_name', 'N/A')
-                
-                file_info_text += f"Dimensions: {width}x{height}\n"
-                file_info_text += f"Duration: {self.format_time(duration)}\n"
-                file_info_text += f"FPS: {fps:.2f}\n"
-                file_info_text += f"Codec: {codec}\n"
+            if info.has_video:
+                file_info_text += f"Dimensions: {info.width}x{info.height}\n"
+                file_info_text += f"Duration: {format_time(info.duration)}\n"
+                file_info_text += f"FPS: {info.fps:.2f}\n"
+                file_info_text += f"Codec: {info.codec}\n"
                 
                 # Set video properties
-                self.original_width = int(width)
-                self.original_height = int(height)
-                self.original_duration = duration
-                self.original_fps = fps
+                self.media_info = info
+                self.original_width = info.width
+                self.original_height = info.height
+                self.original_duration = info.duration
+                self.original_fps = info.fps
                 self.width_spin.setValue(self.original_width)
                 self.calculate_height()  # Set height based on aspect ratio
                 
@@ -484,137 +730,126 @@ class JIFMaker(QMainWindow):
                 # Update duration label
                 self.dimensions_label.setText(f"{self.width_spin.value()}x{self.height_spin.value()}")
                 
-                # Extract first frame for preview
-                self.extract_frame(file_path, 0)
+                # Decode preview frames straight from FFmpeg, downscaled to a size the preview can use
+                self.frame_source = FrameSource(file_path, info.width, info.height, PREVIEW_DECODE_SIZE)
+                self.start_scrubbing(file_path, info)
+                self.show_trim_start()
                 
                 # Estimate file size
-                self.estimate_file_size()
+                self.updates.invalidate("estimate")
             
             self.file_info.setPlainText(file_info_text)
             
         except FileNotFoundError:
-            # Specific handling for when ffprobe isn't found (even if the pre-check passes, this is a fallback)
-            self.file_info.setPlainText("Error: ffprobe not found. Please install FFmpeg and ensure it's in your PATH.\n\nDownload from: https://ffmpeg.org/download.html")
+            # ffprobe isn't installed or isn't on the PATH
+            self.file_info.setPlainText(f"Error: {FFMPEG_NOT_FOUND}")
             self.preview_label.setText("Could not load preview")
         except Exception as e:
             self.file_info.setPlainText(f"Error analyzing file: {str(e)}")
             self.preview_label.setText("Could not load preview")
     
     def estimate_file_size(self):
-        """Estimate the output file size based on current settings"""
-        if not hasattr(self, 'original_width') or self.original_width == 0:
+        """Start estimating the output size from sample encodes, the label is updated when the result arrives"""
+        if self.media_info is None or not self.media_info.has_video:
             self.size_label.setText("Unknown")
             return
-        
-        # Get current settings
-        width = self.width_spin.value()
-        # Get height or calculate it if auto
-        if self.height_spin.value() > 0:
-            height = self.height_spin.value()
-        else:
-            # Calculate height based on aspect ratio
-            height = int(width * (self.original_height / self.original_width))
-            
-        colors = self.colors_spin.value()
-        fps = self.fps_spin.value()
-        frame_skip = self.frame_skip_spin.value()
-        duration = self.original_duration
-        
-        # Adjust duration for trim settings
-        start_time = self.start_time_edit.text()
-        end_time = self.end_time_edit.text()
-        
-        if start_time and start_time != "00:00:00":
-            try:
-                start_sec = self.time_to_seconds(start_time)
-                duration -= start_sec
-            except:
-                pass
-        
-        if end_time:
-            try:
-                end_sec = self.time_to_seconds(end_time)
-                if end_sec > 0:
-                    duration = min(duration, end_sec - (start_sec if 'start_sec' in locals() else 0))
-            except:
-                pass
-        
-        # Calculate estimated frames
-        total_frames = (duration * self.original_fps) / frame_skip
-        
-        # Calculate estimated size (improved rough estimation for palette-based formats)
-        # Use bits per pixel based on color palette: log2(colors)
-        pixels = width * height
-        bits_per_pixel = math.log2(colors) if colors > 1 else 1
-        size_estimate = (pixels * total_frames * bits_per_pixel) / (8 * 1024)  # Convert to KB
-        
-        # Apply compression factors
-        compression_map = {"Low": 1.0, "Medium": 0.7, "High": 0.5, "Very High": 0.3}
-        compression_factor = compression_map.get(self.compression_combo.currentText(), 0.7)
-        size_estimate *= compression_factor
-        
-        # Apply frame difference factor
-        diff_factor = 1.0 - (self.frame_diff_slider.value() / 300.0)  # Up to 33% reduction
-        size_estimate *= diff_factor
-        size_estimate /= 10  # Adjusted factor for better realism
-        
-        # Format the size
-        if size_estimate < 1024:
-            self.size_label.setText(f"{size_estimate:.1f} KB")
-        else:
-            self.size_label.setText(f"{size_estimate/1024:.1f} MB")
+        self.size_label.setText("Estimating...")
+        self.estimator.request(self.media_info.path, self.current_options(), self.media_info,
+                               self.output_file_edit.text())
     
-    def time_to_seconds(self, time_str):
-        """Convert HH:MM:SS format to seconds"""
-        if not time_str or time_str.strip() == '':
-            return 0
-        parts = time_str.split(':')
-        if len(parts) == 3:
-            try:
-                return int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
-            except ValueError:
-                return 0
-        elif len(parts) == 2:
-            try:
-                return int(parts[0]) * 60 + int(parts[1])
-            except ValueError:
-                return 0
+    def on_size_estimated(self, generation, estimate):
+        """Show a finished estimate unless the settings changed since it was requested"""
+        if generation != self.estimator.generation:
+            return
+        if estimate is None:
+            self.size_label.setText("Unknown")
+            self.size_label.setToolTip("")
+            return
+        self.size_label.setText(estimate.describe())
+        if estimate.exact:
+            self.size_label.setToolTip(f"Exact, encoded in {estimate.elapsed:.1f}s")
         else:
-            try:
-                return int(parts[0])
-            except ValueError:
-                return 0
+            self.size_label.setToolTip(f"Extrapolated from {estimate.samples} samples "
+                                       f"({estimate.sampled_seconds:.0f}s encoded in {estimate.elapsed:.1f}s)")
     
-    def extract_frame(self, file_path, frame_num):
-        """Extract a specific frame from the video for preview"""
+    def show_frame(self, timestamp):
+        """Decode the frame at timestamp (seconds) and show it in the preview"""
+        if self.frame_source is None:
+            return
         try:
-            # Create temporary frame file
-            frame_path = os.path.join(self.temp_dir, f"frame_{frame_num}.jpg")
-            
-            # Extract frame using ffmpeg
-            cmd = [
-                "ffmpeg",
-                "-y",
-                "-i", file_path,
-                "-vframes", "1",
-                "-q:v", "2",
-                frame_path
-            ]
-            
-            subprocess.run(cmd, capture_output=True, check=True)
-            
-            # Load and display the frame
-            self.current_pixmap = QPixmap(frame_path)
-            if not self.current_pixmap.isNull():
-                self.update_preview()
-            
-            # Clean up
-            if os.path.exists(frame_path):
-                os.remove(frame_path)
+            buffer = self.frame_source.frame_at(timestamp)
+            if buffer is None:
+                self.preview_label.setText("No frame at this position")
+                return
+            self.display_frame(buffer)
+            self.frame_cache.put(round(timestamp / self.scrub_step), bytes(buffer))
                 
         except Exception as e:
             self.preview_label.setText(f"Error extracting frame: {str(e)}")
     
+    def display_frame(self, frame):
+        """Show an RGB24 frame decoded at the frame source size"""
+        # The QImage wraps the frame, the pixmap conversion is the only copy
+        image = frame_to_qimage(frame, self.frame_source.width, self.frame_source.height)
+        self.current_pixmap = QPixmap.fromImage(image)
+        if not self.current_pixmap.isNull():
+            # A new frame is shown right away, only setting changes are debounced
+            self.updates.run("preview")
+    
+    def start_scrubbing(self, file_path, info):
+        """Reset the frame cache and start a prefetcher for a newly opened file"""
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        self.frame_cache.clear()
+        self.scrub_step = scrub_step(info.duration, info.fps)
+        
+        # The prefetcher decodes into its own buffer from its own thread
+        source = FrameSource(file_path, info.width, info.height, PREVIEW_DECODE_SIZE)
+        self.prefetcher = FramePrefetcher(source, self.frame_cache, self.scrub_step,
+                                          self.frame_bridge.frame_ready.emit)
+    
+    def update_scrub_range(self):
+        """Limit the scrubber to the trim range"""
+        if self.media_info is None:
+            return
+        start = time_to_seconds(self.start_time_edit.text())
+        end = time_to_seconds(self.end_time_edit.text()) or self.media_info.duration
+        end = min(end, self.media_info.duration)
+        first = round(start / self.scrub_step)
+        last = max(first, int(end / self.scrub_step) - 1)
+        
+        self.scrub_slider.blockSignals(True)
+        self.scrub_slider.setRange(first, last)
+        self.scrub_slider.blockSignals(False)
+        self.scrub_slider.setEnabled(True)
+    
+    def show_trim_start(self):
+        """Show the first frame of the trim range"""
+        self.update_scrub_range()
+        self.scrub_slider.blockSignals(True)
+        self.scrub_slider.setValue(self.scrub_slider.minimum())
+        self.scrub_slider.blockSignals(False)
+        self.scrub_label.setText(format_time(self.scrub_slider.value() * self.scrub_step))
+        self.show_frame(time_to_seconds(self.start_time_edit.text()))
+        if self.prefetcher is not None:
+            self.prefetcher.request(self.scrub_slider.value())
+    
+    def scrub_to(self, index):
+        """Show the frame under the scrubber, decoding it in the background when it is not cached yet"""
+        self.scrub_label.setText(format_time(index * self.scrub_step))
+        frame = self.frame_cache.get(index)
+        if frame is not None:
+            self.display_frame(frame)
+        
+        # Also keeps the frames around the cursor decoded
+        if self.prefetcher is not None:
+            self.prefetcher.request(index)
+    
+    def on_scrub_frame(self, index, frame):
+        """Show a frame from the prefetcher if the scrubber is still on it"""
+        if index == self.scrub_slider.value():
+            self.display_frame(frame)
+    
     def update_preview(self):
         """Update the preview with the current dimensions and margins - SIMPLIFIED VERSION"""
         if self.current_pixmap and not self.current_pixmap.isNull():
@@ -635,26 +870,18 @@ class JIFMaker(QMainWindow):
             crop_width = self.original_width - left - right
             crop_height = self.original_height - top - bottom
             
-            # Create a copy of the original pixmap
-            cropped_pixmap = self.current_pixmap.copy(left, top, crop_width, crop_height)
+            # Create a copy of the original pixmap, margins are in source pixels and the frame may be downscaled
+            scale = self.current_pixmap.width() / self.original_width
+            cropped_pixmap = self.current_pixmap.copy(int(left * scale), int(top * scale),
+                                                      int(crop_width * scale), int(crop_height * scale))
             
-            # Scale the cropped pixmap to the output dimensions
-            scaled_pixmap = cropped_pixmap.scaled(
-                width, 
-                height,
-                Qt.IgnoreAspectRatio if not self.maintain_aspect_check.isChecked() else Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            # Size the output would have, then fit it into the fixed preview label (400x300)
+            aspect_mode = Qt.IgnoreAspectRatio if not self.maintain_aspect_check.isChecked() else Qt.KeepAspectRatio
+            output_size = cropped_pixmap.size().scaled(width, height, aspect_mode)
+            preview_size = output_size.scaled(PREVIEW_SIZE, Qt.KeepAspectRatio)
             
-            # Scale the output preview to fit the fixed preview label size (400x300)
-            preview_width = 400
-            preview_height = 300
-            output_scaled = scaled_pixmap.scaled(
-                preview_width,
-                preview_height,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            # One smooth rescale straight to the preview size instead of going through the output size
+            output_scaled = cropped_pixmap.scaled(preview_size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
             
             # Set the preview to show only the output
             self.preview_label.setPixmap(output_scaled)
@@ -670,9 +897,7 @@ class JIFMaker(QMainWindow):
             elif self.sender() == self.height_spin and self.height_spin.value() > 0:
                 self.calculate_width()
         
-        self.update_preview()
-        self.update_command_preview()
-        self.estimate_file_size()
+        self.updates.invalidate("preview", "command", "estimate")
     
     def calculate_height(self):
         """Calculate height based on width and original aspect ratio"""
@@ -692,13 +917,6 @@ class JIFMaker(QMainWindow):
             self.width_spin.setValue(width)
             self.width_spin.blockSignals(False)
     
-    def format_time(self, seconds):
-        """Format seconds into HH:MM:SS format"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
-    
     def update_command_preview(self):
         input_file = self.input_file_edit.text()
         output_file = self.output_file_edit.text()
@@ -707,131 +925,63 @@ class JIFMaker(QMainWindow):
             self.command_preview.setPlainText("Please select input and output files")
             return
         
-        cmd = self.generate_ffmpeg_command()
-        self.command_preview.setPlainText(" ".join(cmd))
+        options = self.current_options()
+        backend = backend_for(input_file, options, self.media_info, output_file)
+        if backend.name != "ffmpeg":
+            self.command_preview.setPlainText(f"In-process {backend.name} encoder, no FFmpeg commands are run")
+            return
+        self.command_preview.setPlainText(self.generate_ffmpeg_command(options).command_line())
     
-    def generate_ffmpeg_command(self):
-        input_file = self.input_file_edit.text()
-        output_file = self.output_file_edit.text()
-        fps = self.fps_spin.value()
-        width = self.width_spin.value()
-        height = self.height_spin.value()
-        colors = self.colors_spin.value()
-        dither = self.dither_combo.currentText()
-        loop = self.loop_check.isChecked()
-        start_time = self.start_time_edit.text()
-        end_time = self.end_time_edit.text()
-        
-        # Get margin values
-        top = self.top_margin_spin.value()
-        bottom = self.bottom_margin_spin.value()
-        left = self.left_margin_spin.value()
-        right = self.right_margin_spin.value()
-        
-        # Get compression settings
-        frame_skip = self.frame_skip_spin.value()
-        optimize_transparency = self.optimize_transparency_check.isChecked()
-        no_extensions = self.no_extensions_check.isChecked()
-        use_gifsicle = self.gifsicle_check.isChecked()
-        
-        # Calculate crop dimensions
-        crop_width = self.original_width - left - right
-        crop_height = self.original_height - top - bottom
-        
-        # If height is set to auto (value <= 0), calculate based on aspect ratio
-        if height <= 0:
-            height = -1  # Let FFmpeg calculate height to preserve aspect ratio
-        
-        # Define palette path for GIF processing
-        palette_path = os.path.join(self.temp_dir, "palette.png")
-        
-        # Build the base command
-        cmd = ["ffmpeg", "-y"]
-        
-        # Add start time if specified
-        if start_time and start_time != "00:00:00":
-            cmd.extend(["-ss", start_time])
-        
-        # Add input file
-        cmd.extend(["-i", input_file])
-        
-        # Add end time if specified
-        if end_time:
-            cmd.extend(["-to", end_time])
-        
-        # For GIF output, use the two-pass method with palette generation
-        if output_file.lower().endswith('.gif'):
-            # Calculate duration if any trimming is applied
-            duration = None
-            start_sec = 0
-            end_sec = self.original_duration
-            
-            if start_time and start_time != "00:00:00":
-                start_sec = self.time_to_seconds(start_time)
-            if end_time:
-                end_sec = self.time_to_seconds(end_time)
-            
-            if start_sec > 0 or end_sec < self.original_duration:
-                duration = end_sec - start_sec
-                if duration <= 0:
-                    duration = None  # Invalid trim, process full video
-        
-        # First pass: generate palette
-        palette_cmd = ["ffmpeg", "-y"]
-        if start_sec > 0:
-            palette_cmd.extend(["-ss", start_time])
-        palette_cmd.extend(["-i", input_file])
-        if duration is not None:
-            palette_cmd.extend(["-t", str(duration)])
-        
-        filters = []
-        if any([top, bottom, left, right]):
-            filters.append(f"crop={crop_width}:{crop_height}:{left}:{top}")
-        filters.append(f"palettegen=max_colors={colors}:stats_mode=diff")
-        
-        palette_cmd.extend(["-vf", ",".join(filters), palette_path])
-        
-        # Second pass: create GIF
-        gif_cmd = ["ffmpeg", "-y"]
-        if start_sec > 0:
-            gif_cmd.extend(["-ss", start_time])
-        gif_cmd.extend(["-i", input_file])
-        if duration is not None:
-            gif_cmd.extend(["-t", str(duration)])
-        gif_cmd.extend(["-i", palette_path])
-        
-        filters = []
-        if any([top, bottom, left, right]):
-            filters.append(f"crop={crop_width}:{crop_height}:{left}:{top}")
-        if frame_skip > 1:
-            filters.append(f"select='not(mod(n\\,{frame_skip}))'")
-        filters.append(f"fps={fps},scale={width}:{height}:flags=lanczos")
-        
-        gif_cmd.extend(["-filter_complex", 
-                        f"{','.join(filters)}[x];[x][1:v]paletteuse=dither={dither}:diff_mode=rectangle"])
-        
-        # Add compression options
-        if optimize_transparency:
-            gif_cmd.extend(["-gifflags", "+transdiff"])
-        
-        if no_extensions:
-            gif_cmd.extend(["-gifflags", "-offsetting"])
-        
-        if loop:
-            gif_cmd.extend(["-loop", "0"])
-        else:
-            gif_cmd.extend(["-loop", "-1"])
-        
-        gif_cmd.append(output_file)
-        
-        # Add gifsicle optimization if requested
-        if use_gifsicle:
-            gifsicle_level = self.gifsicle_level_combo.currentText()
-            level_map = {"O1 (Fast)": "-O1", "O2": "-O2", "O3 (Best)": "-O3"}
-            gif_cmd.extend(["&&", "gifsicle", level_map[gifsicle_level], output_file, "-o", output_file])
-        
-        # Return both commands (we'll handle execution differently)
-        return palette_cmd + ["&&"] + gif_cmd
+    def current_options(self):
+        """Snapshot the Basic Processing and Advanced Compression settings"""
+        compression = self.compression_options() if self.compression_built else {}
+        return ConversionOptions(
+            fps=self.fps_spin.value(),
+            width=self.width_spin.value(),
+            height=-1 if self.height_spin.value() == self.height_spin.minimum() else self.height_spin.value(),
+            colors=self.colors_spin.value(),
+            dither=self.dither_combo.currentText(),
+            loop=self.loop_check.isChecked(),
+            start_time=self.start_time_edit.text(),
+            end_time=self.end_time_edit.text(),
+            top=self.top_margin_spin.value(),
+            bottom=self.bottom_margin_spin.value(),
+            left=self.left_margin_spin.value(),
+            right=self.right_margin_spin.value(),
+            **compression,
+        )
+    
+    def compression_options(self):
+        """Return the Advanced Compression settings as ConversionOptions fields"""
+        return dict(
+            frame_skip=self.frame_skip_spin.value(),
+            frame_diff=self.frame_diff_slider.value(),
+            optimize_transparency=self.optimize_transparency_check.isChecked(),
+            no_extensions=self.no_extensions_check.isChecked(),
+            single_pass=self.single_pass_check.isChecked(),
+            reuse_palette=self.reuse_palette_check.isChecked(),
+            sampled_palette=self.sampled_palette_check.isChecked(),
+            fast_decode=self.fast_decode_check.isChecked(),
+            optimize_frames=self.optimize_frames_check.isChecked(),
+            gifsicle=self.gifsicle_check.isChecked(),
+            gifsicle_level=self.gifsicle_level_combo.currentIndex() + 1,
+            chunks=self.chunks_spin.value(),
+            backend=self.backend_combo.currentText(),
+            memory_limit=self.memory_limit_spin.value(),
+            quality=self.quality_spin.value(),
+            lossless=self.lossless_check.isChecked(),
+            webp_method=self.webp_method_spin.value(),
+        )
+
+    def generate_ffmpeg_command(self, options=None, output_file=None):
+        """Build the conversion plan for the current files and settings"""
+        options = options or self.current_options()
+        output_file = output_file or self.output_file_edit.text()
+        if options.chunks > 1 and self.media_info is not None and output_format(output_file).is_gif:
+            # Chunk boundaries depend on the length of the input
+            return build_chunked_plan(self.input_file_edit.text(), output_file, options, self.media_info,
+                                      self.temp_dir)
+        return build_plan(self.input_file_edit.text(), output_file, options, self.temp_dir, self.media_info)
     
     def process_file(self):
         input_file = self.input_file_edit.text()
@@ -845,166 +995,168 @@ class JIFMaker(QMainWindow):
             QMessageBox.warning(self, "Error", "Input file does not exist")
             return
         
-        # Set cursor to busy
-        QApplication.setOverrideCursor(Qt.WaitCursor)
-        
-        cmd_parts = self.generate_ffmpeg_command()
+        if self.worker is not None or self.target_worker is not None:
+            return
         
-        # For GIF processing, we need to handle the two commands separately
-        if output_file.lower().endswith('.gif'):
-            # Check if we need to use gifsicle (which changes the command structure)
-            use_gifsicle = self.gifsicle_check.isChecked()
-            
-            if use_gifsicle:
-                # Split the command into palette generation, GIF creation, and gifsicle optimization
-                and_indices = [i for i, part in enumerate(cmd_parts) if part == "&&"]
-                
-                if len(and_indices) == 2:
-                    palette_cmd = cmd_parts[:and_indices[0]]
-                    gif_cmd = cmd_parts[and_indices[0]+1:and_indices[1]]
-                    gifsicle_cmd = cmd_parts[and_indices[1]+1:]
-                else:
-                    # Fallback if we don't find the expected structure
-                    palette_cmd = cmd_parts[:cmd_parts.index("&&")]
-                    gif_cmd = cmd_parts[cmd_parts.index("&&")+1:-6]
-                    gifsicle_cmd = cmd_parts[-6:]
-            else:
-                # Split the command into palette generation and GIF creation
-                and_index = cmd_parts.index("&&")
-                palette_cmd = cmd_parts[:and_index]
-                gif_cmd = cmd_parts[and_index + 1:]
-            
-            # Extract palette path from the GIF command
-            palette_path = gif_cmd[gif_cmd.index("-i") + 2]  # The palette path is after the second -i
-            
-            try:
-                # Run palette generation
-                self.output_log.append(f"Running palette generation: {' '.join(palette_cmd)}")
-                # Removed progress bar visibility and range setting
-                QApplication.processEvents()
-                
-                result1 = subprocess.run(
-                    palette_cmd, 
-                    capture_output=True, 
-                    text=True, 
-                    check=True
-                )
-                
-                self.output_log.append("Palette generation completed successfully!")
-                
-                # Run GIF creation
-                self.output_log.append(f"Running GIF creation: {' '.join(gif_cmd)}")
-                QApplication.processEvents()
-                
-                result2 = subprocess.run(
-                    gif_cmd, 
-                    capture_output=True, 
-                    text=True, 
-                    check=True
-                )
-                
-                self.output_log.append("GIF creation completed successfully!")
-                
-                # Run gifsicle optimization if requested
-                if use_gifsicle:
-                    self.output_log.append(f"Running gifsicle optimization: {' '.join(gifsicle_cmd)}")
-                    QApplication.processEvents()
-                    
-                    result3 = subprocess.run(
-                        gifsicle_cmd, 
-                        capture_output=True, 
-                        text=True, 
-                        check=True
-                    )
-                    
-                    self.output_log.append("Gifsicle optimization completed successfully!")
-                
-                # Removed progress bar visibility
-                self.output_log.append("Processing completed successfully!")
-                self.output_log.append("FFmpeg output:")
-                
-                # Clean up palette file
-                if os.path.exists(palette_path):
-                    os.remove(palette_path)
-                
-                # Restore cursor and show success message
-                QApplication.restoreOverrideCursor()
-                QMessageBox.information(self, "Success", "Processing completed successfully!")
-                
-            except subprocess.CalledProcessError as e:
-                # Removed progress bar visibility
-                self.output_log.append(f"Error processing file: {e}")
-                if e.stdout:
-                    self.output_log.append("FFmpeg output:")
-                    self.output_log.append(e.stdout)
-                if e.stderr:
-                    self.output_log.append("FFmpeg errors:")
-                    self.output_log.append(e.stderr)
-                
-                # Restore cursor and show error message
-                QApplication.restoreOverrideCursor()
-                QMessageBox.critical(self, "Error", f"Processing failed: {str(e)}")
-                
-            except Exception as e:
-                # Removed progress bar visibility
-                self.output_log.append(f"Unexpected error: {e}")
-                
-                # Restore cursor and show error message
-                QApplication.restoreOverrideCursor()
-                QMessageBox.critical(self, "Error", f"Unexpected error: {str(e)}")
+        options = self.current_options()
+        if self.compression_built and self.target_size_check.isChecked():
+            if self.media_info is None:
+                QMessageBox.warning(self, "Error", "The input file could not be analyzed for a target size")
+                return
+            self.search_target_size(input_file, output_file, options)
+        else:
+            self.start_conversion(output_file, options)
+    
+    def search_target_size(self, input_file, output_file, options):
+        """Look for settings that fit the target size in the background, the conversion starts once it is done"""
+        budget = int(self.target_size_spin.value() * 1024 * 1024)
+        self.target_worker = TargetSearchWorker(input_file, options, self.media_info, budget, output_file, self)
+        self.target_worker.finished.connect(self.on_target_found)
+        
+        self.process_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.progress_bar.setRange(0, 0)
+        self.progress_label.setText(f"Searching for settings under {self.target_size_spin.value():.1f} MB...")
+        self.output_log.append(self.progress_label.text())
+        self.target_worker.start()
+    
+    def on_target_found(self, result):
+        """Apply the settings found by the target-size search and convert with them"""
+        worker, self.target_worker = self.target_worker, None
+        worker.deleteLater()
+        if result is None:
+            message = "Processing cancelled" if worker.cancelled else f"Target size search failed: {worker.error}"
+            self.on_processing_finished(False, message)
+            return
         
-        # For non-GIF processing
+        self.output_log.append(f"Target size: {result.describe()}")
+        self.target_request = (worker.options, result)
+        self.target_retries = RETRIES
+        self.apply_target_options(result.options)
+        self.start_conversion(self.output_file_edit.text(), result.options)
+    
+    def apply_target_options(self, options):
+        """Show the fps, colors and size picked for a target-size conversion in the controls"""
+        for spin, value in ((self.fps_spin, options.fps), (self.colors_spin, options.colors)):
+            spin.setValue(value)
+        self.width_spin.blockSignals(True)
+        self.width_spin.setValue(options.width)
+        self.width_spin.blockSignals(False)
+        if options.height > 0:
+            self.height_spin.setValue(options.height)
         else:
-            try:
-                self.output_log.append(f"Running command: {' '.join(cmd_parts)}")
-                # Removed progress bar visibility and range setting
-                QApplication.processEvents()
-                
-                result = subprocess.run(
-                    cmd_parts, 
-                    capture_output=True, 
-                    text=True, 
-                    check=True
-                )
-                
-                # Removed progress bar visibility
-                self.output_log.append("Processing completed successfully!")
-                self.output_log.append("FFmpeg output:")
-                self.output_log.append(result.stdout)
-                if result.stderr:
-                    self.output_log.append("FFmpeg errors/warnings:")
-                    self.output_log.append(result.stderr)
-                    
-                # Restore cursor and show success message
-                QApplication.restoreOverrideCursor()
-                QMessageBox.information(self, "Success", "Processing completed successfully!")
-                    
-            except subprocess.CalledProcessError as e:
-                # Removed progress bar visibility
-                self.output_log.append(f"Error processing file: {e}")
-                self.output_log.append("FFmpeg output:")
-                self.output_log.append(e.stdout)
-                if e.stderr:
-                    self.output_log.append("FFmpeg errors:")
-                    self.output_log.append(e.stderr)
-                
-                # Restore cursor and show error message
-                QApplication.restoreOverrideCursor()
-                QMessageBox.critical(self, "Error", f"Processing failed: {str(e)}")
-                
-            except FileNotFoundError:
-                # Removed progress bar visibility
-                self.output_log.append("Error: FFmpeg not found. Please install FFmpeg and ensure it's in your PATH.")
-                
-                # Restore cursor and show error message
-                QApplication.restoreOverrideCursor()
-                QMessageBox.critical(self, 
-                                     "Error", 
-                                     "FFmpeg not found. Please install FFmpeg and ensure it's in your PATH.")
+            self.calculate_height()
+        self.updates.invalidate("preview", "command", "estimate")
+    
+    def retry_target_size(self):
+        """Convert again one rung smaller when the output is over the target size, like convert_to_size
+
+        Returns True if a new conversion was started.
+        """
+        requested, result = self.target_request
+        output_file = self.output_file_edit.text()
+        size = os.path.getsize(output_file)
+        smaller = smaller_rung(requested, result.options, size, result.budget)
+        if smaller is None or self.target_retries == 0:
+            if size > result.budget:
+                self.output_log.append(f"{os.path.basename(output_file)} is {format_size(size / 1024)}, "
+                                       f"over the target size of {format_size(result.budget / 1024)}")
+            return False
+        
+        self.target_retries -= 1
+        self.target_request = (requested, result.step_down(smaller))
+        self.output_log.append(f"{os.path.basename(output_file)} is {format_size(size / 1024)}, "
+                               f"retrying one rung smaller")
+        self.apply_target_options(smaller)
+        self.start_conversion(output_file, smaller)
+        return True
+    
+    def start_conversion(self, output_file, options):
+        """Run the conversion plan for options on a background QProcess, or threads when it is chunked or in process"""
+        self.worker = conversion_worker(self.input_file_edit.text(), output_file, options, self.media_info,
+                                        self.temp_dir, self)
+        self.worker.log.connect(self.output_log.append)
+        self.worker.stage_started.connect(self.on_stage_started)
+        self.worker.progress.connect(self.on_progress)
+        self.worker.finished.connect(self.on_processing_finished)
+        
+        self.process_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.worker.start()
+    
+    def cancel_processing(self):
+        """Cancel the running conversion or target-size search"""
+        if self.target_worker is not None:
+            self.target_worker.cancel()
+        if self.worker is not None:
+            self.worker.cancel()
+    
+    def on_stage_started(self, number, count, description):
+        """Show which stage is running, busy until it reports frame progress"""
+        self.progress_bar.setRange(0, 0)
+        self.progress_label.setText(f"Step {number}/{count}: {description}")
+    
+    def on_progress(self, update):
+        """Update the progress bar from FFmpeg's -progress output"""
+        if update.fraction is not None:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(int(update.fraction * 100))
+        text = self.progress_label.text().split(" - ")[0]
+        self.progress_label.setText(f"{text} - {update.describe()}")
+    
+    def on_processing_finished(self, success, message):
+        """Reset the controls and report the result of the conversion"""
+        if self.worker is not None:
+            self.worker.deleteLater()
+            self.worker = None
+        if success and self.target_request is not None and self.retry_target_size():
+            return
+        self.target_request = None
+        self.process_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(100 if success else 0)
+        self.progress_label.setText(message)
+        self.output_log.append(message)
+        
+        # Clean up palette file
+        palette_path = os.path.join(self.temp_dir, "palette.png")
+        if os.path.exists(palette_path):
+            os.remove(palette_path)
+        
+        if success:
+            if self.current_options().frame_diff > 0 and output_format(self.output_file_edit.text()).is_gif:
+                try:
+                    self.output_log.append(frame_report(self.output_file_edit.text(), self.fps_spin.value()).describe())
+                except (OSError, ValueError):
+                    pass
+            QMessageBox.information(self, "Success", message)
+        elif message != "Processing cancelled":
+            QMessageBox.critical(self, "Error", f"Processing failed: {message}")
     
     def closeEvent(self, event):
         """Clean up temporary files when closing the application"""
         import shutil
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        self.updates.stop()
+        self.estimator.shutdown()
+        if self.target_worker is not None:
+            self.target_worker.finished.disconnect()
+            self.target_worker.cancel()
+        if self.worker is not None and self.worker.is_running():
+            self.worker.finished.disconnect()
+            self.worker.cancel()
+            if isinstance(self.worker, ConversionWorker):
+                self.worker.process.waitForFinished(3000)
+            else:
+                self.worker.wait(3)
+        for worker in self.probe_workers:
+            worker.probed.disconnect()
+            worker.finished.disconnect()
+            worker.cancel()
+        self.queue_runner.shutdown()
         if os.path.exists(self.temp_dir):
             shutil.rmtree(self.temp_dir)
         event.accept()
@@ -1015,10 +1167,13 @@ class JIFMaker(QMainWindow):
             event.acceptProposedAction()
     
     def dropEvent(self, event):
-        """Handle drop event for file drops"""
-        urls = event.mimeData().urls()
-        if urls:
-            file_path = urls[0].toLocalFile()
+        """Open a dropped file, several files or a folder are queued with the current settings instead"""
+        paths = [url.toLocalFile() for url in event.mimeData().urls() if url.toLocalFile()]
+        if len(paths) > 1 or (paths and os.path.isdir(paths[0])):
+            self.enqueue_files(paths)
+            return
+        if paths:
+            file_path = paths[0]
             if file_path:
                 self.input_file_edit.setText(file_path)
                 self.analyze_input_file(file_path)
@@ -1029,27 +1184,116 @@ class JIFMaker(QMainWindow):
                     output_path = f"{base}_processed.gif"
                     self.output_file_edit.setText(output_path)
     
+    def enqueue_current(self):
+        """Queue the input file with the current settings and output file"""
+        input_file = self.input_file_edit.text()
+        output_file = self.output_file_edit.text()
+        if not input_file or not output_file or not os.path.exists(input_file):
+            QMessageBox.warning(self, "Error", "Please select an existing input file and an output file")
+            return
+        job = self.job_queue.add(input_file, output_file, self.current_options(), self.media_info)
+        self.output_log.append(f"Queued job {job.id}: {os.path.basename(input_file)}")
+        self.refresh_queue_table()
+        self.queue_runner.schedule()
+    
+    def enqueue_files(self, paths):
+        """Queue every media file in paths (folders are searched) with a snapshot of the current settings
+
+        The files are found and probed on a background thread, each one is queued as soon as its probe returns.
+        """
+        worker = ProbeWorker(paths, self.current_options(), self)
+        worker.probed.connect(self.on_file_probed)
+        worker.finished.connect(self.on_files_probed)
+        self.probe_workers.append(worker)
+        worker.start()
+    
+    def on_file_probed(self, input_file, info):
+        """Queue a dropped file with the settings taken when it was dropped"""
+        self.job_queue.add(input_file, default_output_path(input_file), self.sender().options, info)
+        self.refresh_queue_table()
+        self.queue_runner.schedule()
+    
+    def on_files_probed(self, queued):
+        """Report how many dropped files were queued once the last one is probed"""
+        worker = self.sender()
+        self.probe_workers.remove(worker)
+        worker.deleteLater()
+        self.output_log.append(f"Queued {queued} files")
+    
+    def selected_job(self):
+        row = self.queue_table.currentRow()
+        return self.job_queue.jobs[row] if 0 <= row < len(self.job_queue) else None
+    
+    def toggle_job_pause(self):
+        """Hold the selected queued job, or let a held one run again"""
+        job = self.selected_job()
+        if job is not None and (self.job_queue.pause(job.id) or self.job_queue.resume(job.id)):
+            self.update_job_row(job.id)
+            self.queue_runner.schedule()
+    
+    def move_job(self, offset):
+        """Move the selected job up or down the queue"""
+        job = self.selected_job()
+        if job is not None:
+            row = self.job_queue.move(job.id, offset)
+            self.refresh_queue_table()
+            self.queue_table.selectRow(row)
+    
+    def cancel_job(self):
+        job = self.selected_job()
+        if job is not None:
+            self.queue_runner.cancel(job.id)
+    
+    def clear_finished_jobs(self):
+        self.job_queue.clear_finished()
+        self.refresh_queue_table()
+    
+    def refresh_queue_table(self):
+        """Rebuild the queue rows after jobs were added, moved or removed"""
+        self.queue_table.setRowCount(len(self.job_queue))
+        for row, job in enumerate(self.job_queue.jobs):
+            self.fill_job_row(row, job)
+    
+    def update_job_row(self, job_id):
+        job = self.job_queue.get(job_id)
+        if job is not None:
+            self.fill_job_row(self.job_queue.jobs.index(job), job)
+    
+    def fill_job_row(self, row, job):
+        """Show a job's status, progress, output size and elapsed time"""
+        elapsed = time.monotonic() - job.started if job.status == RUNNING else job.elapsed
+        cells = [os.path.basename(job.input_file), job.status, "",
+                 format_size(job.size / 1024) if job.size else "", f"{elapsed:.1f}s" if elapsed else ""]
+        for column, text in enumerate(cells):
+            item = QTableWidgetItem(text)
+            item.setToolTip(job.message or job.input_file)
+            self.queue_table.setItem(row, column, item)
+        bar = self.queue_table.cellWidget(row, 2)
+        if bar is None:
+            bar = QProgressBar()
+            self.queue_table.setCellWidget(row, 2, bar)
+        bar.setValue(int(job.progress * 100))
+    
     def update_output_filename(self):
         """Auto-generate output filename whenever input changes"""
         input_file = self.input_file_edit.text()
         if input_file:
-            base, ext = os.path.splitext(input_file)
-            output_path = f"{base}_processed.gif"
-            self.output_file_edit.setText(output_path)
+            # Keep the output format that was picked
+            extension = output_format(self.output_file_edit.text()).extensions[0]
+            self.output_file_edit.setText(default_output_path(input_file, extension=extension))
     
-def main():
-    """Main entry point for the application"""
-    import argparse
-
-    parser = argparse.ArgumentParser(description='JIFMaker - Convert videos to GIFs')
-    parser.add_argument('--version', action='version', version='%(prog)s 0.1.0')
-
-    args = parser.parse_args()
-
+def run_window():
+    """Open the window and run the event loop, returns the exit code"""
     app = QApplication(sys.argv)
     window = JIFMaker()
     window.show()
-    sys.exit(app.exec_())
+    return app.exec_()
+
+
+def main():
+    """Main entry point for the application, see jifmaker.cli"""
+    from jifmaker.cli import main as cli_main
+    sys.exit(cli_main())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,265 @@
+"""
+Built-in GIF frame optimizer: crops every frame to what changed and makes unchanged pixels transparent, streaming
+
+Usage: python -m jifmaker.optimize INPUT [OUTPUT]  (optimizes INPUT in place without OUTPUT)
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from jifmaker.engine import format_size
+from jifmaker.gifio import GifFrame, GifReader, parse_gif
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class Unoptimizable(ValueError):
+    """Raised when a GIF cannot be rewritten with the global palette and "do not dispose" frames"""
+
+
+@dataclass(frozen=True)
+class OptimizeReport:
+    """Sizes before and after optimize_gif, optimized is False when the original was kept"""
+    before: int
+    after: int
+    frames_in: int
+    frames_out: int
+    elapsed: float
+    optimized: bool = True
+    reason: str = ""
+
+    @property
+    def saved(self):
+        return self.before - self.after
+
+    def describe(self):
+        """Return a one line summary for the log"""
+        if not self.optimized:
+            return f"Frame optimization kept the original {format_size(self.before / 1024)}: {self.reason}"
+        percent = 100 * self.saved / self.before if self.before else 0
+        return (f"Frame optimization: {format_size(self.before / 1024)} -> {format_size(self.after / 1024)} "
+                f"(-{percent:.1f}%), {self.frames_in} -> {self.frames_out} frames in {self.elapsed:.1f}s")
+
+
+class PaletteMap:
+    """Exact RGB to index lookup for a GIF's global color table"""
+
+    def __init__(self, palette, transparent=None):
+        """palette is the raw color table, transparent an index no opaque pixel may map to"""
+        colors = np.frombuffer(palette, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        keys = (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+        order = np.arange(len(keys))
+        if transparent is not None:
+            keys, order = np.delete(keys, transparent), np.delete(order, transparent)
+        self.keys, first = np.unique(keys, return_index=True)
+        self.indices = order[first].astype(np.uint8)
+        self.palette = palette
+        self.transparent = transparent
+        if transparent is None:
+            # A slot whose color repeats an earlier one is never referenced and can be transparent
+            unused = np.setdiff1d(np.arange(len(colors)), self.indices)
+            self.transparent = int(unused[0]) if len(unused) else None
+
+    def lookup(self, pixels):
+        """Map an (H, W, 3) uint8 array to palette indices, raises Unoptimizable for colors not in the palette"""
+        pixels = pixels.astype(np.int32)
+        keys = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+        position = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        if not np.array_equal(self.keys[position], keys):
+            raise Unoptimizable("a frame uses colors outside the global palette")
+        return self.indices[position]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def changed_box(previous, frame):
+    """Return (top, bottom, left, right) of the pixels that differ between two RGBA frames, None if none do"""
+    changed = np.any(previous != frame, axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    if len(rows) == 0:
+        return None
+    columns = np.flatnonzero(changed.any(axis=0))
+    return rows[0], rows[-1] + 1, columns[0], columns[-1] + 1
+
+
+def encode_frame(indices, palette, left, top):
+    """LZW encode an index array with Pillow and return its image block, placed at (left, top)"""
+    image = Image.fromarray(indices, "P")
+    image.putpalette(palette)
+    buffer = io.BytesIO()
+    image.save(buffer, "GIF", optimize=False)
+    block = parse_gif(buffer.getvalue()).frames[0].image
+    return block[:1] + struct.pack("<HH", int(left), int(top)) + block[5:]
+
+
+def graphic_control(delay, transparent=None):
+    """Return a graphic control extension for a "do not dispose" frame"""
+    flags = (1 << 2) | (transparent is not None)
+    return struct.pack("<BBBBHBB", 0x21, 0xF9, 4, flags, min(max(delay, 0), 0xFFFF), transparent or 0, 0)
+
+
+def declared_transparency(path):
+    """Return the transparent index the encoder declared in the frames of path, None if it declared none"""
+    with GifReader(path) as reader:
+        for frame in reader:
+            if len(frame.control) >= 8 and frame.control[3] & 0x01:
+                return frame.control[6]
+    return None
+
+
+def kept_on_screen(control, delay):
+    """Return a source frame's graphic control extension with delay and "do not dispose" set"""
+    if len(control) < 8:
+        return graphic_control(delay)
+    flags = (control[3] & ~0x1C) | (1 << 2)
+    return control[:3] + bytes([flags]) + struct.pack("<H", min(max(delay, 0), 0xFFFF)) + control[6:]
+
+
+def optimized_frames(path):
+    """Yield (GifFrame, source frame count so far) for the optimized frames of the GIF at path
+
+    Every frame is cropped to what changed since the previous composited frame, with unchanged pixels transparent.
+    When the source frame is drawn on the same canvas (the frame before it was not disposed) and its own encoding is
+    smaller, it is kept instead. Only the previous composited frame and the one being processed are held in memory.
+    Frames identical to the one before are merged into it by adding their delay.
+    """
+    with GifReader(path) as reader:
+        header = reader.header
+    if not header[10] & 0x80:
+        raise Unoptimizable("the GIF has no global palette")
+    colors = PaletteMap(header[13:], declared_transparency(path))
+
+    previous = None
+    pending = None  # Written once the delay of the frames merged into it is known
+    reusable = True  # The canvas before the source frame equals the previous composited frame
+    count = 0
+    with Image.open(path) as image, GifReader(path) as reader:
+        for source, frame in zip(reader, ImageSequence.Iterator(image)):
+            count += 1
+            delay = source.delay
+            current = np.asarray(frame.convert("RGBA"))
+            disposal = (source.control[3] >> 2) & 0x07 if len(source.control) >= 8 else 0
+
+            box = (0, current.shape[0], 0, current.shape[1]) if previous is None else changed_box(previous, current)
+            if box is None:
+                pending = pending.with_delay(pending.delay + delay)
+                reusable = reusable and disposal <= 1
+                continue
+            top, bottom, left, right = box
+
+            candidates = []
+            if reusable:
+                candidates.append(GifFrame(kept_on_screen(source.control, delay), source.image))
+            try:
+                candidates.extend(_sub_frames(colors, previous, current, box, delay))
+            except Unoptimizable:
+                if not candidates:
+                    raise
+
+            if pending is not None:
+                yield pending, count - 1
+            pending = min(candidates, key=len)
+            previous = current
+            reusable = disposal <= 1
+
+    if pending is not None:
+        yield pending, count
+
+
+def _sub_frames(colors, previous, current, box, delay):
+    """Return the cropped frame with and without transparent unchanged pixels, raises Unoptimizable if neither fits"""
+    top, bottom, left, right = box
+    region = current[top:bottom, left:right]
+    clear = region[..., 3] == 0
+    if previous is not None and np.any(clear & (previous[top:bottom, left:right, 3] != 0)):
+        raise Unoptimizable("a frame clears pixels, which needs disposal")
+    keep = clear if previous is None else np.all(region == previous[top:bottom, left:right], axis=2) | clear
+    if clear.any() and colors.transparent is None:
+        raise Unoptimizable("no free palette slot for transparency")
+
+    indices = colors.lookup(np.where(clear[..., None], 0, region[..., :3]))
+    frames = []
+    if not clear.any():
+        frames.append(GifFrame(graphic_control(delay), encode_frame(indices, colors.palette, left, top)))
+    if keep.any() and colors.transparent is not None:
+        # Transparent runs usually compress better, but on dithered content the real colors can win
+        indices[keep] = colors.transparent
+        frames.append(GifFrame(graphic_control(delay, colors.transparent),
+                               encode_frame(indices, colors.palette, left, top)))
+    return frames
+
+
+def optimize_gif(input_file, output_file=None):
+    """Rewrite a GIF as minimal "do not dispose" sub-frames, in place when output_file is None
+
+    The original is kept (and copied to output_file) when it cannot be expressed this way or the result would not be
+    smaller. Returns an OptimizeReport.
+    """
+    start = time.perf_counter()
+    output_file = output_file or input_file
+    before = os.path.getsize(input_file)
+    temp_file = f"{output_file}.optimizing"
+
+    written = 0
+    count = 0
+    reason = ""
+    try:
+        with GifReader(input_file) as reader:
+            header, extensions = reader.header, reader.extensions
+        with open(temp_file, "wb") as f:
+            f.write(header)
+            for extension in extensions:
+                f.write(extension)
+            for frame, count in optimized_frames(input_file):
+                f.write(frame.control)
+                f.write(frame.image)
+                written += 1
+            f.write(b"\x3b")
+        after = os.path.getsize(temp_file)
+        if after >= before:
+            reason = "the optimized GIF was not smaller"
+    except Unoptimizable as e:
+        reason = str(e)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+    if reason:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        if output_file != input_file:
+            shutil.copyfile(input_file, output_file)
+        return OptimizeReport(before, before, count, count, time.perf_counter() - start, False, reason)
+
+    os.replace(temp_file, output_file)
+    return OptimizeReport(before, after, count, written, time.perf_counter() - start)
+
+
+def main(argv=None):
+    """Entry point for python -m jifmaker.optimize, the frame optimizer stage of a conversion plan"""
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 2):
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        return 2
+    report = optimize_gif(*argv)
+    print(report.describe(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
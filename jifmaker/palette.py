@@ -0,0 +1,143 @@
+"""
+Shared palettes: one set of colors computed across several inputs, so a series of similar clips is encoded alike,
+and the quality check of sampled palettes against the full-range scan
+"""
+
+import os
+import time
+import subprocess
+import dataclasses
+from dataclasses import dataclass
+
+import numpy as np
+
+from jifmaker.backends import decodes_with_pillow, get_backend
+from jifmaker.decode import plan_decode
+from jifmaker.engine import build_filters, build_plan, input_seek, palette_sample_count, trimmed_duration
+from jifmaker.pipeline import FramePool, decode_raw, sample_frames
+from jifmaker.quantize import load_palette, palette_error, palette_from_samples, save_palette
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+SAMPLE_FPS = 1  # Frames per second of each input that count towards a shared palette
+
+SAMPLE_SIZE = (160, 90)  # Samples are squeezed to one size, the color statistics do not depend on the aspect ratio
+
+SAMPLES_PER_INPUT = 32  # Longer inputs are thinned out evenly, so every input weighs about the same
+
+CHECK_FRAMES = 24  # Frames spread over the clip that both palettes are measured on
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class PaletteComparison:
+    """Time and mean quantization error of a sampled palette next to the full-range scan"""
+    samples: int  # Frames the sampled palette was computed from, 0 if the clip was too short to sample
+    full_time: float
+    sampled_time: float
+    full_error: float
+    sampled_error: float
+
+    @property
+    def speedup(self):
+        return self.full_time / self.sampled_time if self.sampled_time else 0.0
+
+    @property
+    def error_increase(self):
+        """Relative change of the mean error, 0.05 means the sampled palette is 5% further off"""
+        return self.sampled_error / self.full_error - 1 if self.full_error else 0.0
+
+    def describe(self):
+        return (f"Sampled palette from {self.samples} frames in {self.sampled_time:.2f}s vs {self.full_time:.2f}s "
+                f"({self.speedup:.1f}x faster), mean error {self.sampled_error:.2f} vs {self.full_error:.2f} "
+                f"({self.error_increase:+.1%})")
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def sample_command(input_file, options):
+    """Return the FFmpeg command that writes the trimmed, cropped input as SAMPLE_SIZE rgb24 frames at SAMPLE_FPS"""
+    width, height = SAMPLE_SIZE
+    sampling = dataclasses.replace(options, fps=SAMPLE_FPS, width=width, height=height, frame_diff=0)
+    decode = plan_decode(sampling)
+    seek = input_seek(input_file, options)
+    cmd = ["ffmpeg", "-v", "error", "-nostdin"] + decode.input_args() + seek.input_args(input_file)
+    filters = build_filters(sampling, decode)
+    cmd.extend(["-vf", ",".join(seek.filters() + filters), "-an", "-f", "rawvideo", "-pix_fmt", "rgb24", "-"])
+    return cmd
+
+
+def sample_input(input_file, options, samples=SAMPLES_PER_INPUT):
+    """Return at most samples SAMPLE_SIZE frames spread over the trimmed range of input_file"""
+    width, height = SAMPLE_SIZE
+    if decodes_with_pillow(input_file):
+        sampling = dataclasses.replace(options, fps=SAMPLE_FPS, width=width, height=height, frame_diff=0)
+        frames = get_backend("pillow").iter_frames(input_file, sampling)
+        pool = None
+    else:
+        pool = FramePool((height, width, 3), 2)
+        frames = decode_raw(sample_command(input_file, options), pool)
+
+    # Halving the kept frames whenever there are twice too many keeps them evenly spread without knowing the length
+    picked = []
+    step = 1
+    for index, frame in enumerate(frames):
+        if index % step == 0:
+            picked.append(np.array(frame))
+        if pool is not None:
+            pool.release(frame)
+        if len(picked) == 2 * samples:
+            picked = picked[::2]
+            step *= 2
+    return picked[::2] if len(picked) > samples else picked
+
+
+def build_shared_palette(inputs, options, path):
+    """Compute one palette for all inputs with options and write it to path as a palettegen style PNG
+
+    One entry is left for transparency, like palettegen does. Returns the (N, 3) palette, raises ValueError if no
+    input had a frame to sample.
+    """
+    samples = []
+    for input_file in inputs:
+        samples.extend(sample_input(input_file, options))
+    if not samples:
+        raise ValueError("No frames to build a shared palette from")
+    palette = palette_from_samples(samples, options.colors - 1)
+    save_palette(palette, path)
+    return palette
+
+
+def compare_palettes(input_file, options, info, temp_dir):
+    """Generate the full-range and the sampled palette for input_file and measure both on the same frames
+
+    Returns a PaletteComparison. The frames are decoded like the in-process encoder does, at half resolution.
+    """
+    expected = max(1, round(trimmed_duration(options, info) * options.fps))
+    frames = sample_frames(get_backend("pillow").iter_frames(input_file, options, info), expected, CHECK_FRAMES)
+
+    measured = []
+    for sampled in (False, True):
+        directory = os.path.join(temp_dir, "sampled" if sampled else "full")
+        os.makedirs(directory, exist_ok=True)
+        variant = dataclasses.replace(options, sampled_palette=sampled, single_pass=False, palette_file="",
+                                      reuse_palette=False)
+        stage = build_plan(input_file, os.path.join(directory, "check.gif"), variant, directory, info).stages[0]
+        start = time.perf_counter()
+        subprocess.run(stage.args, capture_output=True, check=True)
+        measured.append((time.perf_counter() - start, palette_error(frames, load_palette(stage.args[-1]))))
+
+    (full_time, full_error), (sampled_time, sampled_error) = measured
+    samples = palette_sample_count(trimmed_duration(options, info), options.fps)
+    return PaletteComparison(samples, full_time, sampled_time, full_error, sampled_error)
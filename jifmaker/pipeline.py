@@ -0,0 +1,401 @@
+"""
+Streaming frame pipeline: generator stages that pass preallocated frame buffers along under a memory ceiling
+
+Stages are chained decode -> decimate -> quantize -> write, each one pulling from the one before it. Decoded frames
+live in a FramePool, the decoder runs ahead in a thread and waits for a free buffer whenever the stages after it fall
+behind, so memory stays flat however long or large the input is.
+"""
+
+import sys
+import queue
+import struct
+import itertools
+import threading
+import subprocess
+
+import numpy as np
+
+from jifmaker.chunked import Cancelled
+from jifmaker.engine import DECIMATE_HI, DECIMATE_LO
+from jifmaker.optimize import encode_frame, graphic_control
+from jifmaker.quantize import is_near_duplicate
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+MB = 1024 * 1024
+
+PIPELINE_DEPTH = 8  # Frames the decoder may run ahead of the other stages
+
+MIN_BUFFERS = 3  # The frame being decoded, the last kept frame and the frame compared with it
+
+# Frame-sized working memory besides the pool: palette samples, the indices on screen and the sub-frame being encoded
+WORKING_FRAMES = 4
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class FramePool:
+    """A fixed set of preallocated (H, W, 3) uint8 frame buffers shared by the stages of a pipeline
+
+    acquire() blocks until a later stage releases a buffer, which is the pipeline's backpressure.
+    """
+
+    def __init__(self, shape, count):
+        self.shape = tuple(shape)
+        self.count = count
+        self._free = [np.empty(self.shape, dtype=np.uint8) for _ in range(count)]
+        self._changed = threading.Condition()
+        self._closed = False
+
+    @classmethod
+    def within(cls, shape, memory_limit, resident=0):
+        """Return the largest pool (up to what the decoder can use) that keeps the process under memory_limit bytes
+
+        resident is the memory already in use. Raises ValueError if not even MIN_BUFFERS frames fit.
+        """
+        frame_size = int(np.prod(shape))
+        count = (memory_limit - resident) // frame_size - WORKING_FRAMES
+        if count < MIN_BUFFERS:
+            needed = cls.required(shape, resident)
+            raise ValueError(f"A memory limit of {memory_limit // MB} MB is too low for {shape[1]}x{shape[0]} "
+                             f"frames, at least {-(-needed // MB)} MB is needed")
+        return cls(shape, min(count, PIPELINE_DEPTH + MIN_BUFFERS))
+
+    @staticmethod
+    def required(shape, resident=0):
+        """Return the lowest memory limit in bytes a pool of shape frames fits under next to resident bytes"""
+        return resident + (MIN_BUFFERS + WORKING_FRAMES) * int(np.prod(shape))
+
+    @property
+    def nbytes(self):
+        return self.count * int(np.prod(self.shape))
+
+    def acquire(self, cancelled=None):
+        """Return a free buffer, waiting for one to be released, raises Cancelled once the pool is closed"""
+        with self._changed:
+            while not self._free:
+                if self._closed or (cancelled is not None and cancelled()):
+                    raise Cancelled()
+                self._changed.wait(0.1)
+            if self._closed:
+                raise Cancelled()
+            return self._free.pop()
+
+    def release(self, frame):
+        """Hand a buffer back for the decoder to fill again"""
+        with self._changed:
+            self._free.append(frame)
+            self._changed.notify()
+
+    def close(self):
+        """Wake up and cancel anything waiting in acquire()"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+
+class PeakTracker:
+    """Peak resident memory over one in-process job, used as a context manager around the job
+
+    The kernel keeps a single high-water mark for the whole process, so it is only reset when no other tracked job
+    is running. Jobs that overlapped report 0, their peaks cannot be told apart.
+    """
+
+    _lock = threading.Lock()
+    _running = set()
+
+    def __init__(self):
+        self.shared = False
+
+    def __enter__(self):
+        with self._lock:
+            if self._running:
+                self.shared = True
+                for tracker in self._running:
+                    tracker.shared = True
+            else:
+                reset_peak_memory()
+            self._running.add(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self._running.discard(self)
+
+    def peak(self):
+        """Return the peak resident bytes since the job started, 0 if unknown or another job ran alongside it"""
+        return 0 if self.shared else peak_memory()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def _release(pool, frame):
+    if pool is not None:
+        pool.release(frame)
+
+
+def start_decoder(cmd):
+    """Start an FFmpeg command that writes frames to stdout, returns (process, reader thread, stderr chunks)
+
+    stderr is drained in the thread so a chatty decoder never blocks on a full pipe.
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = []
+    reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    reader.start()
+    return process, reader, stderr
+
+
+def stop_decoder(decoder, cmd, ended):
+    """Stop a decoder from start_decoder, raises CalledProcessError if its output ended because it failed
+
+    A decoder whose frames are no longer wanted (ended is False) is killed and its exit code ignored.
+    """
+    process, reader, stderr = decoder
+    process.stdout.close()
+    if not ended:
+        process.kill()
+    process.wait()
+    reader.join()
+    process.stderr.close()
+    if ended and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=b"".join(stderr).decode(errors="replace"))
+
+
+def decode_raw(cmd, pool, cancelled=None):
+    """Yield pool buffers filled with the rgb24 rawvideo frames an FFmpeg command writes to stdout
+
+    Raises CalledProcessError once the frames run out if FFmpeg failed, so a broken input is not a short GIF.
+    """
+    decoder = start_decoder(cmd)
+    ended = False
+    try:
+        while True:
+            frame = pool.acquire(cancelled)
+            view = memoryview(frame).cast("B")
+            filled = 0
+            while filled < len(view):
+                read = decoder[0].stdout.readinto(view[filled:])
+                if not read:
+                    break
+                filled += read
+            if filled < len(view):
+                pool.release(frame)
+                ended = True
+                return
+            yield frame
+    finally:
+        stop_decoder(decoder, cmd, ended)
+
+
+def pooled(frames, pool, cancelled=None):
+    """Copy frames from any iterable into pool buffers, for decoders that allocate their own arrays"""
+    for frame in frames:
+        buffer = pool.acquire(cancelled)
+        buffer[...] = frame
+        yield buffer
+
+
+def prefetch(frames, depth=PIPELINE_DEPTH, pool=None):
+    """Run a frame generator in a thread, at most depth frames ahead of the consumer
+
+    Exceptions from the generator are raised in the consumer. Closing the returned generator early stops the thread
+    and closes pool, so a decoder waiting for a buffer gives up.
+    """
+    items = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for frame in frames:
+                if not put((frame, None)):
+                    break
+            else:
+                put((None, None))
+        except BaseException as e:
+            put((None, e))
+        finally:
+            frames.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    finished = False
+    try:
+        while True:
+            frame, error = items.get()
+            finished = error is not None or frame is None
+            if error is not None:
+                raise error
+            if frame is None:
+                return
+            yield frame
+    finally:
+        if not finished:
+            stopped.set()
+            if pool is not None:
+                pool.close()
+        thread.join()
+
+
+def frame_delays(fps):
+    """Yield GIF delays in hundredths of a second for frames at fps, rounded so they add up without drift"""
+    for index in itertools.count():
+        yield round((index + 1) * 100 / fps) - round(index * 100 / fps)
+
+
+def sample_frames(frames, expected, samples, pool=None):
+    """Return half resolution copies of samples frames spread over about expected frames, for palette generation"""
+    step = max(1, expected // samples)
+    picked = []
+    for index, frame in enumerate(frames):
+        if index % step == 0 and len(picked) < samples:
+            picked.append(frame[::2, ::2].copy())
+        _release(pool, frame)
+    return picked
+
+
+def decimate(frames, delays, frame_diff, pool=None):
+    """Merge frames that barely differ from the last kept one into it, like mpdecimate, yielding (frame, delay)
+
+    frame_diff is the Min Frame Difference percentage, 0 keeps every frame. A frame is only passed on once the next
+    different one arrives, its delay is not known before.
+    """
+    kept = None
+    kept_delay = 0
+    for frame, delay in zip(frames, delays):
+        if kept is not None and frame_diff > 0 and is_near_duplicate(kept, frame, frame_diff / 100, DECIMATE_LO,
+                                                                     DECIMATE_HI):
+            kept_delay += delay
+            _release(pool, frame)
+            continue
+        if kept is not None:
+            yield kept, kept_delay
+        kept, kept_delay = frame, delay
+    if kept is not None:
+        yield kept, kept_delay
+
+
+def quantize(frames, to_indices, pool=None):
+    """Map (frame, delay) pairs to (palette indices, delay) with to_indices, releasing every frame after it"""
+    for frame, delay in frames:
+        indices = to_indices(frame)
+        _release(pool, frame)
+        yield indices, delay
+
+
+def color_table(palette, transparent=None):
+    """Return a GIF color table for an (N, 3) palette, padded to a power of two with room for the transparent index"""
+    entries = max(len(palette), (transparent + 1) if transparent is not None else 0, 2)
+    size = 1 << (entries - 1).bit_length()
+    return np.asarray(palette, dtype=np.uint8).tobytes().ljust(size * 3, b"\x00")
+
+
+def write_gif(path, frames, palette, size, loop=True, transparent=None, cancelled=None):
+    """Write (indices, delay) pairs as a GIF of "do not dispose" frames, returns the number of frames written
+
+    Each frame is cropped to the indices that changed since the frame before it, unchanged pixels inside that box
+    become transparent when a transparent index is given. Frames identical to the one before are merged into it.
+    Only the indices on screen and the frame waiting for its final delay are held.
+    """
+    width, height = size
+    table = color_table(palette, transparent)
+    bits = (len(table) // 3 - 1).bit_length()
+    written = 0
+    with open(path, "wb") as f:
+        f.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0xF0 | (bits - 1), 0, 0) + table)
+        if loop:
+            f.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+        previous = None
+        pending = None  # (image block, delay) of the last frame, written once no further frame merges into it
+        for indices, delay in frames:
+            if cancelled is not None and cancelled():
+                raise Cancelled()
+            if previous is None:
+                box = (0, height, 0, width)
+            else:
+                changed = indices != previous
+                rows = np.flatnonzero(changed.any(axis=1))
+                columns = np.flatnonzero(changed.any(axis=0))
+                box = (rows[0], rows[-1] + 1, columns[0], columns[-1] + 1) if len(rows) else None
+
+            if box is None:
+                pending = (pending[0], pending[1] + delay)
+            else:
+                top, bottom, left, right = box
+                region = indices[top:bottom, left:right]
+                if previous is not None and transparent is not None:
+                    region = np.where(region == previous[top:bottom, left:right], transparent, region)
+                if pending is not None:
+                    f.write(graphic_control(pending[1], transparent) + pending[0])
+                    written += 1
+                pending = (encode_frame(region.astype(np.uint8), table, left, top), delay)
+                previous = indices
+
+        if pending is not None:
+            f.write(graphic_control(pending[1], transparent) + pending[0])
+            written += 1
+        f.write(b"\x3b")
+    return written
+
+
+def _read_status(field):
+    """Return a /proc/self/status memory field in bytes, None where there is no procfs"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def resident_memory():
+    """Return the resident memory of this process in bytes, 0 if the platform does not report it"""
+    return _read_status("VmRSS") or 0
+
+
+def reset_peak_memory():
+    """Start a new peak memory measurement, returns False where the kernel only keeps the lifetime peak
+
+    The mark belongs to the whole process, jobs measure through PeakTracker so they do not reset each other's.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory():
+    """Return the peak resident memory of this process in bytes since reset_peak_memory, 0 if unknown"""
+    peak = _read_status("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # macOS reports bytes, Linux kilobytes
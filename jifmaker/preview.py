@@ -0,0 +1,27 @@
+"""
+Qt helpers for showing decoded frames in the preview
+"""
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QImage
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class FrameBridge(QObject):
+    """Carries frames decoded by the prefetch thread over to the GUI thread"""
+
+    frame_ready = pyqtSignal(int, object)  # Frame index, RGB24 bytes
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def frame_to_qimage(buffer, width, height):
+    """Wrap an RGB24 buffer as a QImage without copying, the buffer must outlive the image"""
+    return QImage(buffer, width, height, width * 3, QImage.Format_RGB888)
@@ -0,0 +1,95 @@
+"""
+Parsing of FFmpeg's machine readable ``-progress`` output
+"""
+
+import time
+from dataclasses import dataclass
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class ProgressUpdate:
+    """One progress report, fraction and eta are None when the total frame count is unknown"""
+    frame: int
+    fps: float
+    fraction: float = None
+    eta: float = None
+    done: bool = False
+
+    def describe(self):
+        """Return a short human readable status line"""
+        text = f"{self.frame} frames, {self.fps:.1f} fps"
+        if self.fraction is not None:
+            text = f"{self.fraction * 100:.0f}% - {text}"
+        if self.eta is not None and not self.done:
+            minutes, seconds = divmod(int(self.eta), 60)
+            text += f", ETA {minutes:02d}:{seconds:02d}"
+        return text
+
+
+class ProgressTracker:
+    """Collect the key=value blocks FFmpeg writes with -progress and turn each block into a ProgressUpdate
+
+    With fps the position is taken from the output timestamp, which keeps advancing when duplicate frames are dropped
+    and the frame counter falls behind.
+    """
+
+    def __init__(self, total_frames=0, fps=0):
+        self.total_frames = total_frames
+        self.fps = fps
+        self.values = {}
+        self.start = time.monotonic()
+
+    def feed(self, line):
+        """Consume one line of output, returns a ProgressUpdate when a block is complete"""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        self.values[key] = value
+        if key == "progress":
+            return self.snapshot()
+        return None
+
+    def snapshot(self):
+        """Return the current state as a ProgressUpdate"""
+        frame = self._number("frame", int)
+        fps = self._number("fps", float)
+        done = self.values.get("progress") == "end"
+
+        fraction = eta = None
+        if self.total_frames > 0:
+            position = frame
+            if self.fps > 0:
+                position = max(frame, self._number("out_time_us", int) * self.fps / 1e6)
+            fraction = 1.0 if done else min(position / self.total_frames, 1.0)
+            if fps <= 0 and frame > 0:
+                # FFmpeg reports 0 fps for the first block, fall back to the wall clock
+                fps = frame / max(time.monotonic() - self.start, 1e-6)
+            if fps > 0:
+                # FFmpeg's fps counts written frames, the timeline advances faster when frames are dropped
+                rate = fps * position / frame if frame > 0 else fps
+                eta = max(self.total_frames - position, 0) / rate
+
+        return ProgressUpdate(frame, fps, fraction, eta, done)
+
+    def _number(self, key, cast):
+        try:
+            return cast(self.values.get(key, 0))
+        except ValueError:
+            return cast(0)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def with_progress(args):
+    """Return an FFmpeg command that writes -progress blocks to stdout instead of stats to stderr"""
+    if not args or args[0] != "ffmpeg":
+        return list(args)
+    return [args[0], "-progress", "pipe:1", "-nostats"] + list(args[1:])
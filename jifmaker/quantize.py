@@ -0,0 +1,167 @@
+"""
+Vectorized palette quantization with NumPy and Pillow, used by the in-process encoding backend
+"""
+
+import numpy as np
+from PIL import Image
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+LUT_BITS = 5  # Bits per channel of the color lookup table, 32x32x32 cells
+
+PALETTE_SAMPLES = 16  # Frames spread over the clip that the palette is computed from
+
+BAYER_8X8 = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+], dtype=np.int16)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class PaletteLUT:
+    """Nearest-color lookup for a fixed palette over 5-bit RGB cells, so mapping a frame is one gather
+
+    Cells are resolved the first time a frame uses them, a clip typically touches a few thousand of the 32768.
+    """
+
+    def __init__(self, palette):
+        """palette is an (N, 3) uint8 array with N <= 256"""
+        self.palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+        self.lut = np.zeros(1 << (3 * LUT_BITS), dtype=np.uint8)
+        self.known = np.zeros(len(self.lut), dtype=bool)
+        self._palette = self.palette.astype(np.float32)
+        self._norms = np.square(self._palette).sum(axis=1)
+
+    def _resolve(self, cells):
+        """Fill in the lut entries of the flat cell indices"""
+        shift = 8 - LUT_BITS
+        mask = (1 << LUT_BITS) - 1
+        centers = np.stack([cells >> (2 * LUT_BITS), (cells >> LUT_BITS) & mask, cells & mask], axis=1)
+        centers = ((centers << shift) + (1 << (shift - 1))).astype(np.float32)
+        # |c - p|^2 = |c|^2 - 2 c.p + |p|^2, |c|^2 is the same for every palette entry so only the rest is compared
+        distances = self._norms - 2 * (centers @ self._palette.T)
+        self.lut[cells] = distances.argmin(axis=1)
+        self.known[cells] = True
+
+    def indices(self, frame, dither="none"):
+        """Map an (H, W, 3) uint8 frame to palette indices, with ordered dithering unless dither is "none" """
+        shift = 8 - LUT_BITS
+        if dither != "none":
+            height, width = frame.shape[:2]
+            threshold = np.tile(BAYER_8X8, (height // 8 + 1, width // 8 + 1))[:height, :width]
+            # Offsets spread over one lookup cell so neighbouring pixels round to different colors
+            offset = ((threshold - 32) * (1 << shift) // 64)[:, :, None]
+            frame = np.clip(frame.astype(np.int16) + offset, 0, 255).astype(np.uint8)
+        cells = frame >> shift
+        index = (cells[..., 0].astype(np.int32) << (2 * LUT_BITS)) | (cells[..., 1].astype(np.int32) << LUT_BITS) \
+            | cells[..., 2]
+        missing = np.flatnonzero(np.bincount(index.ravel(), minlength=len(self.lut)).astype(bool) & ~self.known)
+        if len(missing):
+            self._resolve(missing)
+        return self.lut[index]
+
+    def to_image(self, frame, dither="none"):
+        """Return a Pillow "P" image of the frame mapped onto the palette"""
+        image = Image.fromarray(self.indices(frame, dither), "P")
+        image.putpalette(self.palette.tobytes())
+        return image
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def build_palette(frames, colors=256, samples=PALETTE_SAMPLES):
+    """Return an (N, 3) palette of at most colors entries computed from frames spread over the sequence"""
+    if not frames:
+        raise ValueError("No frames to build a palette from")
+    step = max(1, len(frames) // samples)
+    # Every other pixel keeps the color statistics at a quarter of the median cut work
+    return palette_from_samples([frame[::2, ::2] for frame in frames[::step][:samples]], colors)
+
+
+def palette_from_samples(samples, colors=256):
+    """Return an (N, 3) palette of at most colors entries for a list of (H, W, 3) sample frames of the same width"""
+    if not samples:
+        raise ValueError("No frames to build a palette from")
+    mosaic = np.concatenate(samples, axis=0)
+    quantized = Image.fromarray(mosaic, "RGB").quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+    used = len(quantized.getcolors(colors) or []) or colors
+    return np.frombuffer(bytes(quantized.getpalette()[:used * 3]), dtype=np.uint8).reshape(-1, 3)
+
+
+def save_palette(palette, path):
+    """Write an (N, 3) palette as a 16x16 RGBA PNG laid out like FFmpeg's palettegen output, for paletteuse
+
+    Unused entries repeat the last color and the final entry is the transparent one paletteuse needs for transdiff.
+    """
+    palette = np.asarray(palette, dtype=np.uint8)[:255]
+    entries = np.empty((256, 4), dtype=np.uint8)
+    entries[:, 3] = 255
+    entries[:len(palette), :3] = palette
+    entries[len(palette):, :3] = palette[-1]
+    entries[255] = (0, 255, 0, 0)
+    Image.fromarray(entries.reshape(16, 16, 4), "RGBA").save(path)
+
+
+def load_palette(path, colors=256):
+    """Return the (N, 3) opaque colors of a palette PNG written by palettegen or save_palette, at most colors"""
+    with Image.open(path) as image:
+        entries = np.asarray(image.convert("RGBA")).reshape(-1, 4)
+    opaque = entries[entries[:, 3] == 255, :3]
+    if not len(opaque):
+        raise ValueError(f"{path} holds no opaque palette colors")
+    # Padding repeats colors, keep the first occurrence of each in palette order
+    _, first = np.unique(opaque, axis=0, return_index=True)
+    return opaque[np.sort(first)][:colors]
+
+
+def palette_error(frames, palette):
+    """Return the mean RGB distance between the pixels of frames and the palette colors they are mapped to"""
+    lut = PaletteLUT(palette)
+    total = count = 0
+    for frame in frames:
+        mapped = lut.palette[lut.indices(frame)].astype(np.float32)
+        total += np.sqrt(np.square(mapped - frame).sum(axis=-1)).sum()
+        count += frame.shape[0] * frame.shape[1]
+    if not count:
+        raise ValueError("No frames to measure the palette error on")
+    return float(total / count)
+
+
+def changed_blocks(previous, frame, low):
+    """Compare two frames in 8x8 blocks like FFmpeg's mpdecimate
+
+    Returns (largest block difference, share of blocks that differ by more than low), differences are summed
+    absolute pixel differences averaged over the three channels.
+    """
+    height, width = frame.shape[0] // 8 * 8, frame.shape[1] // 8 * 8
+    previous, frame = previous[:height, :width], frame[:height, :width]
+    diff = np.maximum(previous, frame) - np.minimum(previous, frame)  # |a - b| without leaving uint8
+    # Rows of 8 pixels x 3 channels are summed first, a single reduction over two axes is several times slower
+    blocks = diff.reshape(height // 8, 8, width // 8, 24).sum(axis=3, dtype=np.uint32).sum(axis=1) // 3
+    if blocks.size == 0:
+        return 0, 0.0
+    return int(blocks.max()), float((blocks > low).mean())
+
+
+def is_near_duplicate(previous, frame, fraction, low, high):
+    """Return True if frame can be merged into previous: no block changed more than high and at most fraction of
+    the blocks changed more than low"""
+    largest, share = changed_blocks(previous, frame, low)
+    return largest <= high and share <= fraction
@@ -0,0 +1,88 @@
+"""
+Coalesces widget changes into one recomputation per event loop tick and skips outputs whose inputs did not change
+"""
+
+from PyQt5.QtCore import QObject, QTimer
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class UpdateTask:
+    """One derived output of the window: how to compute it, what it depends on and how long to wait for more changes"""
+
+    def __init__(self, compute, key, delay=0):
+        self.compute = compute
+        self.key = key
+        self.delay = delay
+        self.last_key = None
+        self.dirty = False
+        self.runs = 0
+        self.skips = 0
+
+
+class UpdateScheduler(QObject):
+    """Run registered updates lazily after their inputs were invalidated
+
+    invalidate() only marks tasks dirty. Tasks with no delay run on the next event loop tick, so every signal fired by
+    one change (a spinbox editing its buddy, a dozen signals from loading settings) results in a single run. Tasks with
+    a delay are debounced, each invalidation restarts their timer. Before running a task its key function is evaluated
+    and the task is skipped when the key equals the one it last ran with.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tasks = {}
+        self._timers = {}
+
+    def register(self, name, compute, key, delay=0):
+        """Add a task, key() must return a hashable snapshot of everything compute() reads"""
+        self.tasks[name] = UpdateTask(compute, key, delay)
+        if delay not in self._timers:
+            timer = QTimer(self)
+            timer.setSingleShot(True)
+            timer.setInterval(delay)
+            timer.timeout.connect(lambda delay=delay: self._run_due(delay))
+            self._timers[delay] = timer
+
+    def invalidate(self, *names):
+        """Mark tasks (all of them if no name is given) as needing a recompute"""
+        for name in names or self.tasks:
+            task = self.tasks[name]
+            task.dirty = True
+            self._timers[task.delay].start()
+
+    def run(self, name, force=False):
+        """Run a task now if its inputs changed (or force is set), returns True if it ran"""
+        task = self.tasks[name]
+        task.dirty = False
+        key = task.key()
+        if not force and task.last_key is not None and key == task.last_key:
+            task.skips += 1
+            return False
+        task.last_key = key
+        task.runs += 1
+        task.compute()
+        return True
+
+    def flush(self):
+        """Run every pending task immediately, regardless of its delay"""
+        for timer in self._timers.values():
+            timer.stop()
+        for name, task in self.tasks.items():
+            if task.dirty:
+                self.run(name)
+
+    def stop(self):
+        """Drop every pending update, the window calls this when it closes so no timer fires into torn down widgets"""
+        for timer in self._timers.values():
+            timer.stop()
+        for task in self.tasks.values():
+            task.dirty = False
+
+    def _run_due(self, delay):
+        for name, task in self.tasks.items():
+            if task.dirty and task.delay == delay:
+                self.run(name)
@@ -0,0 +1,217 @@
+"""
+Target-size mode, searches fps, width and colors for the best quality GIF that fits a byte budget
+"""
+
+import os
+import re
+import time
+import dataclasses
+from dataclasses import dataclass, field
+
+from jifmaker.engine import backend_for, format_size
+from jifmaker.estimate import estimate_output_size
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2, "G": 1024 ** 3, "GB": 1024 ** 3}
+
+FPS_STEPS = (30, 25, 20, 15, 12, 10, 8, 6, 5)
+
+COLOR_STEPS = (256, 192, 128, 96, 64, 48, 32)
+
+WIDTH_FACTOR = 0.85  # Each width rung is 15% narrower than the one above it
+
+MIN_WIDTH = 120
+
+RETRIES = 2  # Encodes one rung smaller when the real output is still over budget
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Trial:
+    """One rung of the quality ladder and the size estimated for it"""
+    rung: int
+    options: object
+    estimate: object
+
+
+@dataclass
+class TargetResult:
+    """Outcome of a target-size search, options is the smallest rung when nothing fits the budget
+
+    retries counts the rungs the conversion stepped down after the search, estimate is None once it did since the
+    search never estimated those settings.
+    """
+    budget: int
+    options: object
+    estimate: object
+    fits: bool
+    trials: list = field(default_factory=list)
+    elapsed: float = 0.0
+    retries: int = 0
+
+    def describe(self):
+        """Return a one line summary of the chosen settings and what the search cost"""
+        height = f"x{self.options.height}" if self.options.height > 0 else "px"
+        verdict = "fits" if self.fits else "does NOT fit"
+        if self.estimate is not None:
+            basis = f"est. {format_size(self.estimate.size / 1024)}"
+        else:
+            basis = f"{self.retries} {'rung' if self.retries == 1 else 'rungs'} below the search"
+        return (f"{self.options.width}{height}, {self.options.fps} fps, {self.options.colors} colors "
+                f"({basis}) {verdict} {format_size(self.budget / 1024)}, "
+                f"{len(self.trials)} trial encodes in {self.elapsed:.1f}s")
+
+    def step_down(self, options):
+        """Return this result for the smaller rung options that a retry converted with"""
+        return dataclasses.replace(self, options=options, estimate=None, retries=self.retries + 1)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def parse_size(text):
+    """Parse a size such as "8MB", "500K" or "2.5m" (binary units) into bytes, raises ValueError if it is invalid"""
+    match = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z]*)\s*", text)
+    if not match or match.group(2).upper() not in SIZE_UNITS:
+        raise ValueError(f"Invalid size: {text!r}")
+    size = int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+    if size <= 0:
+        raise ValueError(f"Invalid size: {text!r}")
+    return size
+
+
+def _smaller_width(options, min_width):
+    width = int(options.width * WIDTH_FACTOR) // 2 * 2
+    if width < min_width:
+        return None
+    height = options.height
+    if height > 0:
+        height = max(2, round(height * width / options.width / 2) * 2)
+    return dataclasses.replace(options, width=width, height=height)
+
+
+def _lower_fps(options, min_width):
+    lower = [fps for fps in FPS_STEPS if fps < options.fps]
+    return dataclasses.replace(options, fps=lower[0]) if lower else None
+
+
+def _fewer_colors(options, min_width):
+    lower = [colors for colors in COLOR_STEPS if colors < options.colors]
+    return dataclasses.replace(options, colors=lower[0]) if lower else None
+
+
+def quality_ladder(options, min_width=MIN_WIDTH):
+    """Return settings from options down to the smallest output, each rung a little smaller than the one before
+
+    Width is reduced most often because it costs the least visible quality per byte saved, then frame rate, then
+    colors. Every rung is the previous one with one more step applied, so output size shrinks along the ladder.
+    """
+    ladder = [options]
+    steps = [_smaller_width, _lower_fps, _smaller_width, _fewer_colors]
+    current = options
+    while True:
+        for step in steps:
+            reduced = step(current, min_width)
+            if reduced is not None:
+                current = reduced
+                ladder.append(current)
+                break
+        else:
+            return ladder
+        steps = steps[1:] + steps[:1]
+
+
+def search_target_size(input_file, options, info, budget, estimate=estimate_output_size, cancelled=None,
+                       output_file=None):
+    """Bisect the quality ladder for the best rung whose estimated size fits budget (bytes)
+
+    The requested settings are tried first, then the search needs about log2(len(ladder)) trial encodes, each in
+    the format of output_file. Returns None if cancelled() became true or the input has no video.
+    """
+    start = time.perf_counter()
+    ladder = quality_ladder(options)
+    trials = {}
+
+    def fits(rung):
+        if rung not in trials:
+            result = estimate(input_file, ladder[rung], info, cancelled=cancelled, output_file=output_file)
+            if result is None:
+                return None
+            trials[rung] = Trial(rung, ladder[rung], result)
+        return trials[rung].estimate.size <= budget
+
+    best = None
+    verdict = fits(0)
+    if verdict is None:
+        return None
+    if verdict:
+        best = 0
+    else:
+        low, high = 1, len(ladder) - 1
+        while low <= high:
+            middle = (low + high) // 2
+            verdict = fits(middle)
+            if verdict is None:
+                return None
+            if verdict:
+                best, high = middle, middle - 1
+            else:
+                low = middle + 1
+
+    # Nothing fits, settle for the smallest output the ladder can produce
+    rung = best if best is not None else len(ladder) - 1
+    if fits(rung) is None:
+        return None
+    return TargetResult(budget, ladder[rung], trials[rung].estimate, best is not None,
+                        sorted(trials.values(), key=lambda trial: trial.rung), time.perf_counter() - start)
+
+
+def smaller_rung(options, current, size, budget):
+    """Return the rung of the quality ladder of options below current when size is over budget, None otherwise"""
+    if size <= budget:
+        return None
+    ladder = quality_ladder(options)
+    rung = ladder.index(current) + 1
+    return ladder[rung] if rung < len(ladder) else None
+
+
+def _convert(input_file, output_file, options, info, log):
+    return backend_for(input_file, options, info, output_file).convert(input_file, output_file, options, info, log)
+
+
+def convert_to_size(input_file, output_file, options, info, budget, log=None, retries=RETRIES):
+    """Search for settings under budget and convert with them, returns (ConversionResult, TargetResult)
+
+    Estimates can be a little off, if the real GIF is over budget the next rungs of the ladder are encoded until it
+    fits or retries run out. Each encode goes to the backend choose_backend picks for its settings, chunked when
+    options.chunks asks for it, like a conversion without a budget.
+    """
+    log = log or (lambda message: None)
+    target = search_target_size(input_file, options, info, budget, output_file=output_file)
+    if target is None:
+        raise ValueError(f"Cannot estimate the size of {input_file}")
+    log(f"Target size: {target.describe()}")
+
+    result = _convert(input_file, output_file, target.options, info, log)
+    while retries > 0:
+        smaller = smaller_rung(options, target.options, result.size, budget)
+        if smaller is None:
+            break
+        retries -= 1
+        log(f"{os.path.basename(output_file)} is {format_size(result.size / 1024)}, retrying one rung smaller")
+        result = _convert(input_file, output_file, smaller, info, log)
+        target = target.step_down(smaller)
+
+    target.fits = result.size <= budget
+    return result, target
@@ -0,0 +1,247 @@
+"""
+Job telemetry: wall and CPU time, frames, bytes and peak memory of every conversion stage, written as JSON lines and
+aggregated into Prometheus-style counters
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+import subprocess
+import dataclasses
+from dataclasses import dataclass, field
+
+try:
+    import resource
+except ImportError:  # Windows, stages are measured by wall time only
+    resource = None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+FFMPEG_FRAMES = re.compile(r"frame=\s*(\d+)")  # FFmpeg's periodic stats line, the last one has the total
+
+POLL_INTERVAL = 0.1  # Seconds between checks of cancelled() while a stage runs
+
+METRIC_PREFIX = "jifmaker"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass
+class StageMetrics:
+    """What one stage of a conversion cost, None where it could not be measured"""
+    name: str
+    description: str
+    wall: float = 0.0
+    cpu: float = None  # User and system seconds of the stage's process and the children it waited for
+    frames: int = None  # Frames the stage wrote
+    bytes_in: int = 0
+    bytes_out: int = 0
+    peak_rss: int = None  # Bytes
+    exit_code: int = 0
+
+    def describe(self):
+        parts = [f"{self.wall:.2f}s"]
+        if self.cpu is not None:
+            parts.append(f"{self.cpu:.2f}s CPU")
+        if self.frames is not None:
+            parts.append(f"{self.frames} frames")
+        parts.append(f"{self.bytes_in / 1024:.0f} KB in, {self.bytes_out / 1024:.0f} KB out")
+        if self.peak_rss:
+            parts.append(f"{self.peak_rss / 2 ** 20:.0f} MB peak")
+        return f"{self.description}: {', '.join(parts)}"
+
+
+@dataclass
+class JobReport:
+    """The stages of one conversion, one line of a JSON-lines job report"""
+    input_file: str
+    output_file: str
+    backend: str = "ffmpeg"
+    started: float = field(default_factory=time.time)  # Unix time
+    elapsed: float = 0.0
+    success: bool = True
+    error: str = ""
+    stages: list = field(default_factory=list)
+    _lock: object = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, metrics):
+        """Record a finished stage, parallel chunks add theirs from several threads"""
+        with self._lock:
+            self.stages.append(metrics)
+
+    def finish(self, success=True, error=""):
+        self.elapsed = time.time() - self.started
+        self.success = success
+        self.error = error
+        return self
+
+    def to_dict(self):
+        data = {f.name: getattr(self, f.name) for f in dataclasses.fields(self) if not f.name.startswith("_")}
+        data["stages"] = [dataclasses.asdict(stage) for stage in self.stages]
+        return data
+
+    def describe(self):
+        """Return one line per stage"""
+        return "\n".join(stage.describe() for stage in self.stages)
+
+
+class Metrics:
+    """Prometheus-style counters summed over job reports, safe to update from several threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}  # (metric, labels) -> value
+
+    def _add(self, metric, labels, value):
+        key = (metric, tuple(sorted(labels.items())))
+        self._values[key] = self._values.get(key, 0) + value
+
+    def add(self, report):
+        """Count a finished (or failed) job and the cost of its stages"""
+        with self._lock:
+            self._add("jobs_total", {"status": "ok" if report.success else "failed"}, 1)
+            self._add("job_seconds_total", {}, report.elapsed)
+            for stage in report.stages:
+                labels = {"stage": stage.name}
+                self._add("stage_runs_total", labels, 1)
+                self._add("stage_seconds_total", labels, stage.wall)
+                self._add("stage_cpu_seconds_total", labels, stage.cpu or 0)
+                self._add("stage_frames_total", labels, stage.frames or 0)
+                self._add("stage_bytes_in_total", labels, stage.bytes_in)
+                self._add("stage_bytes_out_total", labels, stage.bytes_out)
+                key = ("stage_peak_rss_bytes", tuple(sorted(labels.items())))
+                self._values[key] = max(self._values.get(key, 0), stage.peak_rss or 0)
+
+    def render(self):
+        """Return the counters in the Prometheus text exposition format"""
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = []
+        for index, ((metric, labels), value) in enumerate(values):
+            name = f"{METRIC_PREFIX}_{metric}"
+            if index == 0 or values[index - 1][0][0] != metric:
+                lines.append(f"# TYPE {name} {'gauge' if metric.endswith('_bytes') else 'counter'}")
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{name}{{{label_text}}} {value:g}" if labels else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the counters to path in one step, for a node_exporter textfile collector"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(self.render())
+        os.replace(temp_path, path)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+_report_lock = threading.Lock()
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def stage_inputs(args):
+    """Return the files a stage command reads: FFmpeg's -i inputs, or the existing files among other commands' args"""
+    if os.path.basename(args[0]).startswith("ffmpeg"):
+        paths = [args[index + 1] for index, arg in enumerate(args[:-1]) if arg == "-i"]
+    else:
+        paths = args[1:]
+    return [path for path in dict.fromkeys(paths) if os.path.isfile(path)]
+
+
+def exit_code(status):
+    """Turn a wait status into a Popen-style return code, negative for the signal that killed the process
+
+    os.waitstatus_to_exitcode does the same from Python 3.9 on.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def wait_process(process, cancelled=None):
+    """Wait for a Popen process and set its returncode, returns its resource usage or None where wait4 is missing
+
+    The usage covers the process and the children it waited for. cancelled() is polled while it runs, the process
+    is killed once it is true.
+    """
+    if resource is None:
+        while True:
+            try:
+                process.wait(timeout=POLL_INTERVAL)
+                return None
+            except subprocess.TimeoutExpired:
+                if cancelled is not None and cancelled():
+                    process.kill()
+    while True:
+        pid, status, usage = os.wait4(process.pid, 0 if cancelled is None else os.WNOHANG)
+        if pid:
+            process.returncode = exit_code(status)
+            return usage
+        if cancelled():
+            process.kill()
+        time.sleep(POLL_INTERVAL)
+
+
+def run_stage(name, description, args, cancelled=None):
+    """Run one stage command and measure it, returns (StageMetrics, stderr)
+
+    CPU time and peak memory come from wait4, so they cover the stage's process and the children it waited for.
+    cancelled() is polled while the command runs, the process is killed once it is true (a negative exit_code).
+    Raises OSError when the command cannot be started.
+    """
+    bytes_in = sum(file_size(path) for path in stage_inputs(args))
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # communicate() would reap the process before its resource usage can be read
+    stderr = []
+    reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    reader.start()
+
+    usage = wait_process(process, cancelled)
+    wall = time.perf_counter() - start
+    reader.join()
+    process.stderr.close()
+    text = b"".join(stderr).decode(errors="replace")
+
+    frames = FFMPEG_FRAMES.findall(text)
+    metrics = StageMetrics(name, description, wall, frames=int(frames[-1]) if frames else None, bytes_in=bytes_in,
+                           bytes_out=file_size(args[-1]), exit_code=process.returncode)
+    if usage is not None:
+        metrics.cpu = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in kilobytes, except on macOS where it is in bytes
+        metrics.peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return metrics, text
+
+
+def thread_cpu_time():
+    """Return the CPU seconds of the calling thread where the platform reports them, else of the whole process"""
+    if resource is not None and hasattr(resource, "RUSAGE_THREAD"):
+        usage = resource.getrusage(resource.RUSAGE_THREAD)
+        return usage.ru_utime + usage.ru_stime
+    return time.process_time()
+
+
+def append_report(path, report):
+    """Append report to the JSON-lines file at path"""
+    line = json.dumps(report.to_dict())
+    with _report_lock, open(path, "a") as file:
+        file.write(line + "\n")
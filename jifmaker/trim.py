@@ -0,0 +1,165 @@
+"""
+Trimming: millisecond timestamps, cached keyframe positions and input seeking that decodes only the frames it must
+"""
+
+import os
+import re
+import json
+import math
+import bisect
+import subprocess
+from dataclasses import dataclass
+
+from jifmaker.cache import find_tool, get_keyframe_cache
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+TIMESTAMP = re.compile(r"^(?:(\d+):)?(?:(\d+):)?(\d+(?:\.\d+)?)$")  # [HH:][MM:]SS[.mmm]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Seek:
+    """Where a trimmed decode starts and how long it runs
+
+    With the keyframes known the input is seeked straight to the keyframe at or before start and the trim filter
+    drops the offset between the two, before any other filter sees those frames. Otherwise FFmpeg's input seeking
+    finds the keyframe itself. Either way the input is seeked accurately, demuxers that only seek approximately (GIF)
+    still start at the right frame.
+    """
+    start: float = 0.0
+    duration: float = None  # None runs to the end of the input
+    keyframe: float = None  # None when the keyframes are unknown
+
+    @property
+    def offset(self):
+        """Seconds decoded after the keyframe that are not part of the trim
+
+        Rounded down to the millisecond, a frame exactly at start must not be dropped by a rounding error.
+        """
+        return 0.0 if self.keyframe is None else math.floor((self.start - self.keyframe) * 1000 + 1e-6) / 1000
+
+    def input_args(self, input_file):
+        """Return the -ss, -t and -i input options, they must come before -i so that they only apply to this input"""
+        args = []
+        if self.keyframe is None:
+            if self.start > 0:
+                args.extend(["-ss", format_timestamp(self.start)])
+            if self.duration is not None:
+                args.extend(["-t", format_seconds(self.duration)])
+        else:
+            if self.keyframe > 0:
+                args.extend(["-ss", f"{self.keyframe:.6f}"])
+            if self.duration is not None:
+                args.extend(["-t", format_seconds(self.offset + self.duration)])
+        return args + ["-i", input_file]
+
+    def filters(self):
+        """Return the filters that drop the frames between the keyframe and the trim start, before any other filter"""
+        if not self.offset:
+            return []
+        return [f"trim=start={format_seconds(self.offset)},setpts=PTS-STARTPTS"]
+
+    def describe(self):
+        if self.keyframe is None:
+            return f"Seeking to {format_timestamp(self.start)}"
+        return f"Seeking to keyframe {self.keyframe:.3f}s, trimming {self.offset:.3f}s to the start"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def parse_timestamp(text):
+    """Return the seconds of a [HH:][MM:]SS[.mmm] timestamp to the millisecond, an int when whole, 0 if invalid"""
+    match = TIMESTAMP.match(text.strip()) if text else None
+    if match is None:
+        return 0
+    *units, seconds = match.groups()
+    whole = 0
+    for unit in units:
+        if unit is not None:
+            whole = whole * 60 + int(unit)
+    milliseconds = round(float(seconds) * 1000) + whole * 60_000
+    return milliseconds // 1000 if milliseconds % 1000 == 0 else milliseconds / 1000
+
+
+def format_timestamp(seconds):
+    """Format seconds as HH:MM:SS, with .mmm only when there is a fraction of a second"""
+    milliseconds = round(seconds * 1000)
+    hours, rest = divmod(milliseconds, 3_600_000)
+    minutes, rest = divmod(rest, 60_000)
+    secs, millis = divmod(rest, 1000)
+    text = f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{text}.{millis:03d}" if millis else text
+
+
+def format_seconds(seconds):
+    """Format a duration for FFmpeg, to the millisecond without trailing zeros"""
+    return f"{seconds:.3f}".rstrip("0").rstrip(".")
+
+
+def probe_keyframes(input_file):
+    """Return the sorted keyframe times of the first video stream of input_file, relative to the start of the file
+
+    ffprobe reads them from the packet flags without decoding, without ffprobe FFmpeg decodes only the keyframes.
+    Raises OSError or CalledProcessError when neither can read the file.
+    """
+    if find_tool("ffprobe"):
+        cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries",
+               "packet=pts_time,flags:format=start_time", "-of", "json", input_file]
+        data = json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout)
+        origin = float(data.get("format", {}).get("start_time", 0) or 0)
+        times = [float(packet["pts_time"]) - origin for packet in data.get("packets", [])
+                 if "K" in packet.get("flags", "") and packet.get("pts_time", "N/A") != "N/A"]
+    else:
+        cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-skip_frame", "nokey", "-i", input_file, "-map", "0:v:0",
+               "-vf", "showinfo", "-f", "null", "-"]
+        stderr = subprocess.run(cmd, capture_output=True, text=True, check=True).stderr
+        times = [float(value) for value in re.findall(r"pts_time:(-?[\d.]+)", stderr)]
+    return sorted({max(0.0, time) for time in times})
+
+
+def keyframe_times(input_file, cache=None):
+    """Return the keyframe times of input_file from the keyframe cache or by probing, None if they are unknown
+
+    Like engine.probe, pass cache=False to always probe.
+    """
+    if cache is None:
+        cache = get_keyframe_cache()
+    elif cache is False:
+        cache = None
+    if not os.path.isfile(input_file):
+        return None
+
+    data = cache.get(input_file) if cache is not None else None
+    if data is None:
+        try:
+            data = json.dumps(probe_keyframes(input_file))
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            return None
+        if cache is not None:
+            cache.put(input_file, data)
+    return json.loads(data) or None
+
+
+def plan_seek(start, duration=None, keyframes=None):
+    """Return the Seek for a trim of duration seconds from start, through the last keyframe at or before start
+
+    Keyframe times are rounded down to the microsecond, FFmpeg's time unit: seeking to a keyframe must neither drop
+    it as a frame before the seek point nor, rounded down further, fall back to the keyframe before it.
+    """
+    if not keyframes or start <= 0:
+        return Seek(start, duration)
+    index = bisect.bisect_right(keyframes, start) - 1
+    keyframe = math.floor(keyframes[index] * 1_000_000) / 1_000_000 if index >= 0 else 0.0
+    return Seek(start, duration, keyframe)
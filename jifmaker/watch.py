@@ -0,0 +1,472 @@
+"""
+Watch-folder mode for JIFMaker (``jifmaker watch``): media files that appear or change in a directory are converted
+once they have finished writing, and what was converted or still waits is kept on disk across restarts
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import ctypes
+import select
+import struct
+import threading
+import subprocess
+import dataclasses
+import collections
+import ctypes.util
+
+from jifmaker.batch import add_option_arguments, convert_job, is_up_to_date, options_from_args, record_job
+from jifmaker.cache import find_tool
+from jifmaker.engine import FFMPEG_NOT_FOUND, MEDIA_EXTENSIONS, ConversionOptions, default_output_path
+from jifmaker.formats import FORMATS
+from jifmaker.telemetry import JobReport, Metrics
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Constants
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+INOTIFY_EVENT = struct.Struct("iIII")  # Watch descriptor, mask, cookie, length of the name that follows
+
+SETTLE_SECONDS = 2.0  # A file is converted once its size and mtime have not changed for this long
+
+POLL_INTERVAL = 1.0  # Seconds between directory scans when inotify is not available
+
+TICK = 0.25  # Seconds between checks of the files that are still being written
+
+QUEUE_SIZE = 16  # Stable files waiting for a free worker, the rest wait (pending in the state) until there is room
+
+STATE_FILE = ".jifmaker_watch.json"
+
+DONE = "done"
+FAILED = "failed"
+PENDING = "pending"
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class InotifyWatcher:
+    """Files changed under a directory, reported by Linux inotify through libc"""
+
+    def __init__(self, directory, recursive=False):
+        """Raises OSError where inotify is not available"""
+        self.directory = directory
+        self.recursive = recursive
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}  # Watch descriptor -> directory
+        self._add_tree(directory)
+
+    def _add_tree(self, directory):
+        roots = [root for root, _, _ in os.walk(directory)] if self.recursive else [directory]
+        for root in roots:
+            descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(root), WATCH_MASK)
+            if descriptor < 0:
+                raise OSError(ctypes.get_errno(), f"Cannot watch {root}")
+            self._directories[descriptor] = root
+
+    def wait(self, timeout):
+        """Return the paths of the files that changed, waiting up to timeout seconds for the first one"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, look at everything instead
+                changed.update(scan_files(self.directory, self.recursive))
+                continue
+            directory = self._directories.get(descriptor)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files can land in a new directory before its watch exists
+                    self._add_tree(path)
+                    changed.update(scan_files(path, True))
+                continue
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Files changed under a directory, found by comparing scans where inotify is not available"""
+
+    def __init__(self, directory, recursive=False, interval=POLL_INTERVAL):
+        self.directory = directory
+        self.recursive = recursive
+        self.interval = interval
+        self._seen = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        seen = {}
+        for path in scan_files(self.directory, self.recursive):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            seen[path] = (stat.st_size, stat.st_mtime_ns)
+        return seen
+
+    def wait(self, timeout):
+        """Return the paths of the files that are new or changed since the last scan, scanning every interval"""
+        time.sleep(max(0.0, min(timeout, self._next_scan - time.monotonic())))
+        if time.monotonic() < self._next_scan:
+            return set()
+        self._next_scan = time.monotonic() + self.interval
+        seen, self._seen = self._seen, self._scan()
+        return {path for path, key in self._seen.items() if seen.get(path) != key}
+
+    def close(self):
+        pass
+
+
+class WatchState:
+    """Inputs of a watched directory that were converted, failed or wait to be, saved as JSON after every change
+
+    Each input is stored with the (size, mtime_ns) it had, so a file that changes afterwards is converted again. A
+    state file that cannot be read is logged and replaced, every input is then looked at again.
+    """
+
+    def __init__(self, path, log=print):
+        self.path = path
+        self.sections = {DONE: {}, FAILED: {}, PENDING: {}}  # Section -> input path -> [size, mtime_ns]
+        self._lock = threading.Lock()
+        try:
+            with open(path) as file:
+                data = json.load(file)
+            if not isinstance(data, dict):
+                raise ValueError("not a JSON object")
+            for section in self.sections:
+                self.sections[section].update(data.get(section, {}))
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError) as e:
+            log(f"Warning: ignoring unreadable state file {path} ({e})")
+            for entries in self.sections.values():
+                entries.clear()
+
+    def get(self, section, input_file):
+        with self._lock:
+            key = self.sections[section].get(input_file)
+        return tuple(key) if key is not None else None
+
+    def pending(self):
+        with self._lock:
+            return list(self.sections[PENDING])
+
+    def mark(self, input_file, section, key):
+        """Move input_file to section with its (size, mtime_ns) key and save, a None section forgets it"""
+        with self._lock:
+            for entries in self.sections.values():
+                entries.pop(input_file, None)
+            if section is not None:
+                self.sections[section][input_file] = list(key)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump(self.sections, file, indent=1)
+            os.replace(temp_path, self.path)
+
+
+class FolderWatcher:
+    """Convert the media files that appear or change in a directory on a bounded pool of workers
+
+    A file is queued once its size and mtime have been stable for settle seconds, repeated events for it are merged.
+    Outputs use the batch naming (suffix, output_dir and the extension of the output format) and are never picked up
+    as inputs. Conversions still queued when the watcher stops stay pending in the state and run after a restart.
+    """
+
+    def __init__(self, directory, options, output_dir=None, suffix="_processed", extension=".gif", jobs=1,
+                 recursive=False, settle=SETTLE_SECONDS, queue_size=QUEUE_SIZE, state_path=None, polling=False,
+                 budget=None, report_path=None, metrics_path=None, log=print):
+        self.directory = os.path.abspath(directory)
+        self.options = options
+        self.output_dir = output_dir
+        self.suffix = suffix
+        self.extension = extension
+        self.jobs = max(1, jobs)
+        self.recursive = recursive
+        self.settle_seconds = settle
+        self.polling = polling
+        self.budget = budget
+        self.report_path = report_path
+        self.metrics_path = metrics_path
+        self.log = log
+        self.state = WatchState(state_path or os.path.join(self.directory, STATE_FILE), log)
+        self.converted = 0
+        self.failed = 0
+
+        self._settling = {}  # Input path -> (size, mtime_ns, monotonic time it last changed)
+        self._ready = collections.deque()  # (input path, key) that are stable and wait for room in the queue
+        self._queue = queue.Queue(max(1, queue_size))
+        self._active = set()  # Inputs in the queue or being converted
+        self._metrics = Metrics()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def output_path(self, input_file):
+        return default_output_path(input_file, self.output_dir, self.suffix, self.extension)
+
+    def is_input(self, path):
+        """Return True for media files, not hidden, partial or our own outputs"""
+        name = os.path.basename(path)
+        return (name.lower().endswith(MEDIA_EXTENSIONS) and not name.startswith(".")
+                and not os.path.splitext(name)[0].endswith(self.suffix))
+
+    def notice(self, path):
+        """Start timing a new or changed input, it is queued once it stops changing"""
+        path = os.path.abspath(path)
+        if not self.is_input(path):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        key = (stat.st_size, stat.st_mtime_ns)
+        if key in (self.state.get(DONE, path), self.state.get(FAILED, path)):
+            return
+        if self.state.get(PENDING, path) is None and is_up_to_date(path, self.output_path(path)):
+            self.state.mark(path, DONE, key)
+            return
+        if self._settling.get(path, (None, None))[:2] != key:
+            self._settling[path] = key + (time.monotonic(),)
+
+    def settle(self, now=None):
+        """Move the inputs whose size and mtime did not change for settle_seconds to the ready list"""
+        now = time.monotonic() if now is None else now
+        for path, (size, mtime_ns, since) in list(self._settling.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Deleted (or renamed away) before it was converted
+                del self._settling[path]
+                if self.state.get(PENDING, path) is not None:
+                    self.state.mark(path, None, None)
+                continue
+            key = (stat.st_size, stat.st_mtime_ns)
+            if key != (size, mtime_ns):
+                self._settling[path] = key + (now,)
+                continue
+            with self._lock:
+                active = path in self._active
+            # An input that changes while it is converted is queued again once that conversion has finished
+            if now - since < self.settle_seconds or active:
+                continue
+            del self._settling[path]
+            # An empty file is noticed again when something is written to it
+            if key[0] > 0:
+                self._ready.append((path, key))
+                self.state.mark(path, PENDING, key)
+
+    def dispatch(self):
+        """Queue ready inputs while there is room, the rest wait for the next call"""
+        while self._ready:
+            path, key = self._ready[0]
+            with self._lock:
+                try:
+                    self._queue.put_nowait((path, key))
+                except queue.Full:
+                    return
+                self._active.add(path)
+            self._ready.popleft()
+
+    def idle(self):
+        with self._lock:
+            return not self._settling and not self._ready and not self._active
+
+    def stop(self):
+        """Stop watching, conversions that already started are finished first"""
+        self._stop.set()
+
+    def run(self, once=False):
+        """Watch until stop() is called, or with once until everything already there has been converted
+
+        Returns the process exit code, 1 when a conversion failed.
+        """
+        watcher = None
+        if not self.polling:
+            try:
+                watcher = InotifyWatcher(self.directory, self.recursive)
+            except OSError as e:
+                self.log(f"inotify is not available ({e}), scanning every {POLL_INTERVAL:g}s instead")
+        if watcher is None:
+            watcher = PollingWatcher(self.directory, self.recursive)
+
+        workers = [threading.Thread(target=self._work, name=f"jifmaker-watch-{index}", daemon=True)
+                   for index in range(self.jobs)]
+        for worker in workers:
+            worker.start()
+
+        # Inputs left pending by the last run first, then whatever arrived while nothing was watching
+        for path in self.state.pending() + scan_files(self.directory, self.recursive):
+            self.notice(path)
+        self.log(f"Watching {self.directory} with {self.jobs} workers ({type(watcher).__name__})")
+        try:
+            while not self._stop.is_set():
+                for path in watcher.wait(TICK):
+                    self.notice(path)
+                self.settle()
+                self.dispatch()
+                if once and self.idle():
+                    break
+        finally:
+            with self._lock:
+                running = len(self._active) - self._queue.qsize()
+            if running > 0:
+                self.log(f"Stopping, waiting for {running} running conversions")
+            self._stop.set()
+            for worker in workers:
+                worker.join()
+            watcher.close()
+        return 1 if self.failed else 0
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                path, key = self._queue.get(timeout=TICK)
+            except queue.Empty:
+                continue
+            try:
+                self._convert(path, key)
+            finally:
+                with self._lock:
+                    self._active.discard(path)
+
+    def _convert(self, input_file, key):
+        output_file = self.output_path(input_file)
+        self.log(f"Converting {input_file}")
+        try:
+            result, target = convert_job(input_file, output_file, self.options, self.budget)
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            lines = (getattr(e, "stderr", None) or "").strip().splitlines()
+            self.log(f"FAILED {input_file}: {e}" + (f"\n{lines[-1]}" if lines else ""))
+            self.state.mark(input_file, FAILED, key)
+            with self._lock:
+                self.failed += 1
+                record_job(JobReport(input_file, output_file).finish(False, str(e)), self.report_path,
+                           self._metrics, self.metrics_path)
+            return
+
+        self.state.mark(input_file, DONE, key)
+        self.log(f"{input_file} -> {output_file} ({result.size / (1024 * 1024):.1f} MB, {result.elapsed:.1f}s)")
+        if target is not None:
+            self.log(f"    target: {target.describe()}")
+        with self._lock:
+            self.converted += 1
+            if result.report is not None:
+                record_job(result.report, self.report_path, self._metrics, self.metrics_path)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def scan_files(directory, recursive=False):
+    """Return the files in directory, and in its subdirectories when recursive"""
+    if recursive:
+        return [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+    try:
+        return [entry.path for entry in os.scandir(directory) if entry.is_file()]
+    except OSError:
+        return []
+
+
+def load_profile(path, options):
+    """Return options with the settings of a JSON profile ({"width": 480, "fps": 12, ...}) applied"""
+    with open(path) as file:
+        profile = json.load(file)
+    names = {field.name for field in dataclasses.fields(ConversionOptions)}
+    unknown = sorted(set(profile) - names)
+    if unknown:
+        raise ValueError(f"Unknown settings in {path}: {', '.join(unknown)}")
+    return dataclasses.replace(options, **profile)
+
+
+def add_arguments(parser):
+    """Add the watch options, the conversion settings are the same as for batch"""
+    parser.add_argument("directory", help="Directory to watch for new or changed media files")
+    parser.add_argument("-o", "--output-dir", help="Directory for the outputs (default: next to each input)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Watch subdirectories too")
+    parser.add_argument("-j", "--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Number of concurrent conversions (default: half the cores)")
+    parser.add_argument("--suffix", default="_processed", help="Suffix added to output file names")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="JSON file of conversion settings, applied over the options given here")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="Seconds a file's size must stay unchanged before it is converted")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="Stable files waiting for a worker, more wait as pending until there is room")
+    parser.add_argument("--state", metavar="FILE",
+                        help=f"Where finished and pending files are remembered (default: DIRECTORY/{STATE_FILE})")
+    parser.add_argument("--poll", action="store_true", help="Scan the directory instead of using inotify")
+    parser.add_argument("--once", action="store_true",
+                        help="Convert what is there (and what arrives meanwhile) and exit once nothing is left")
+    parser.add_argument("--report", metavar="FILE",
+                        help="Append a JSON line per job with the time, frames, bytes and memory of every stage")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="Write Prometheus-style counters summed over the jobs, updated after every job")
+    add_option_arguments(parser)
+
+
+def run(args):
+    """Entry point for ``jifmaker watch``, returns the process exit code"""
+    if not find_tool("ffmpeg"):
+        print(f"Error: {FFMPEG_NOT_FOUND}")
+        return 1
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a directory")
+        return 1
+
+    options = options_from_args(args)
+    if args.profile:
+        try:
+            options = load_profile(args.profile, options)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Error: could not load the profile: {e}")
+            return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    watcher = FolderWatcher(args.directory, options, args.output_dir, args.suffix, FORMATS[args.format].extensions[0],
+                            args.jobs, args.recursive, args.settle, args.queue_size, args.state, args.poll,
+                            args.target_size, args.report, args.metrics, log=lambda message: print(message, flush=True))
+    try:
+        return watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        return 0
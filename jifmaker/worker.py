@@ -0,0 +1,524 @@
+"""
+Background work for the window, conversion plans run with QProcess, in-process encodes and size estimates on threads
+"""
+
+import os
+import time
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, QProcess, pyqtSignal
+
+from jifmaker.chunked import Cancelled, build_chunked_plan, run_chunked
+from jifmaker.engine import (FFMPEG_NOT_FOUND, backend_for, build_plan, partial_path, probe, remember_palette,
+                             trimmed_duration)
+from jifmaker.estimate import estimate_output_size
+from jifmaker.formats import output_format
+from jifmaker.jobs import CANCELLED, DONE, FAILED
+from jifmaker.progress import ProgressTracker, ProgressUpdate, with_progress
+from jifmaker.target import search_target_size
+from jifmaker.telemetry import JobReport, StageMetrics, file_size, stage_inputs
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Classes
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+class ConversionWorker(QObject):
+    """Run the stages of a ConversionPlan one after another, reporting log lines and progress as they arrive"""
+
+    log = pyqtSignal(str)
+    stage_started = pyqtSignal(int, int, str)  # Stage number, stage count, description
+    progress = pyqtSignal(object)  # ProgressUpdate
+    finished = pyqtSignal(bool, str)  # Success, message
+
+    def __init__(self, plan, output_file, total_frames=0, parent=None):
+        """The plan writes to a temporary file which is renamed to output_file once every stage succeeded"""
+        super().__init__(parent)
+        self.plan = plan
+        self.output_file = output_file
+        self.total_frames = total_frames
+        self.process = None
+        self.stage_index = -1
+        self.tracker = None
+        self.cancelled = False
+        self.report = JobReport(plan.input_file, output_file)
+        self._stderr_buffer = ""
+        self._stage_start = 0.0
+        self._bytes_in = 0
+
+    def is_running(self):
+        return self.process is not None
+
+    def start(self):
+        if self.plan.palette_path and not any(stage.name == "palette" for stage in self.plan.stages):
+            self.log.emit(f"Reusing palette {self.plan.palette_path}")
+        self._start_stage(0)
+
+    def cancel(self):
+        """Kill the running stage, finished is emitted once the process has exited"""
+        if self.process is not None:
+            self.cancelled = True
+            self.log.emit("Cancelling...")
+            self.process.kill()
+
+    def _start_stage(self, index):
+        self.stage_index = index
+        stage = self.plan.stages[index]
+        args = with_progress(stage.args)
+
+        # Only the GIF creation pass emits frames as it goes, the palette is written at the very end
+        self.tracker = ProgressTracker(self.total_frames if stage.name == "encode" else 0, self.plan.options.fps)
+        self._stderr_buffer = ""
+
+        self.log.emit(f"Running {stage.description}: {' '.join(stage.args)}")
+        self._stage_start = time.perf_counter()
+        self._bytes_in = sum(file_size(path) for path in stage_inputs(stage.args))
+
+        self.process = QProcess(self)
+        self.process.readyReadStandardOutput.connect(self._read_stdout)
+        self.process.readyReadStandardError.connect(self._read_stderr)
+        self.process.finished.connect(self._stage_finished)
+        self.process.errorOccurred.connect(self._process_error)
+        self.process.start(args[0], args[1:])
+        if self.process is not None:
+            self.stage_started.emit(index + 1, len(self.plan.stages), stage.description)
+
+    def _read_stdout(self):
+        while self.process is not None and self.process.canReadLine():
+            line = bytes(self.process.readLine()).decode("utf-8", errors="replace")
+            update = self.tracker.feed(line)
+            if update is not None:
+                self.progress.emit(update)
+
+    def _read_stderr(self):
+        if self.process is None:
+            return
+        self._stderr_buffer += bytes(self.process.readAllStandardError()).decode("utf-8", errors="replace")
+        *lines, self._stderr_buffer = self._stderr_buffer.replace("\r", "\n").split("\n")
+        for line in lines:
+            if line.strip():
+                self.log.emit(line.rstrip())
+
+    def _flush_stderr(self):
+        if self._stderr_buffer.strip():
+            self.log.emit(self._stderr_buffer.rstrip())
+        self._stderr_buffer = ""
+
+    def _stage_finished(self, exit_code, exit_status):
+        self._read_stdout()
+        self._read_stderr()
+        self._flush_stderr()
+        self.process.deleteLater()
+        self.process = None
+        stage = self.plan.stages[self.stage_index]
+        # QProcess reaps the stage itself, so its CPU time and peak memory are not available here
+        self.report.add(StageMetrics(stage.name, stage.description, time.perf_counter() - self._stage_start,
+                                     frames=self.tracker.snapshot().frame if "frame" in self.tracker.values else None,
+                                     bytes_in=self._bytes_in, bytes_out=file_size(stage.args[-1]),
+                                     exit_code=exit_code))
+        description = stage.description[:1].upper() + stage.description[1:]
+
+        if self.cancelled:
+            self._finish(False, "Processing cancelled")
+        elif exit_status != QProcess.NormalExit or exit_code != 0:
+            self._finish(False, f"{description} failed with exit code {exit_code}")
+        else:
+            self.log.emit(f"{description} completed successfully!")
+            remember_palette(self.plan, stage)
+            if self.stage_index + 1 < len(self.plan.stages):
+                self._start_stage(self.stage_index + 1)
+            else:
+                try:
+                    os.replace(self.plan.output_file, self.output_file)
+                except OSError as e:
+                    self._finish(False, f"Could not write {self.output_file}: {e}")
+                    return
+                self._finish(True, "Processing completed successfully!")
+
+    def _process_error(self, error):
+        # A process that never started does not emit finished
+        if error == QProcess.FailedToStart and self.process is not None:
+            program = self.plan.stages[self.stage_index].args[0]
+            self.process.deleteLater()
+            self.process = None
+            message = FFMPEG_NOT_FOUND if program == "ffmpeg" else f"{program} not found, is it installed?"
+            self._finish(False, message)
+
+    def _finish(self, success, message):
+        if not success and os.path.exists(self.plan.output_file):
+            os.remove(self.plan.output_file)
+        log_report(self.log.emit, self.report.finish(success, "" if success else message))
+        self.finished.emit(success, message)
+
+
+class ChunkedWorker(QObject):
+    """Run a plan from build_chunked_plan on a background thread, with the same signals as ConversionWorker"""
+
+    log = pyqtSignal(str)
+    stage_started = pyqtSignal(int, int, str)
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, plan, output_file, parent=None):
+        """The plan writes to a temporary file which is renamed to output_file once every stage succeeded"""
+        super().__init__(parent)
+        self.plan = plan
+        self.output_file = output_file
+        self.cancelled = False
+        self.report = JobReport(plan.input_file, output_file)
+        self._thread = None
+        self._start = 0.0
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="jifmaker-chunks", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Kill the running FFmpeg processes, finished is emitted once they have exited"""
+        self.cancelled = True
+        self.log.emit("Cancelling...")
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _progress(self, done, total, frames):
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        fraction = done / total
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        self.progress.emit(ProgressUpdate(frames, frames / elapsed, fraction, eta, done == total))
+
+    def _run(self):
+        chunks = sum(stage.name == "chunk" for stage in self.plan.stages)
+        self.stage_started.emit(1, 1, f"GIF creation in {chunks} parallel chunks")
+        self._start = time.monotonic()
+        try:
+            run_chunked(self.plan, log=self.log.emit, progress=self._progress, cancelled=lambda: self.cancelled,
+                        report=self.report)
+            os.replace(self.plan.output_file, self.output_file)
+            success, message = True, "Processing completed successfully!"
+        except Cancelled:
+            success, message = False, "Processing cancelled"
+        except subprocess.CalledProcessError as e:
+            if e.stderr:
+                self.log.emit(e.stderr.strip())
+            success, message = False, f"{os.path.basename(e.cmd[0])} failed with exit code {e.returncode}"
+        except FileNotFoundError as e:
+            success, message = False, FFMPEG_NOT_FOUND if e.filename == "ffmpeg" else str(e)
+        except Exception as e:  # finished has to be emitted whatever the encoder raised, or the job never ends
+            success, message = False, str(e)
+
+        if not success and os.path.exists(self.plan.output_file):
+            os.remove(self.plan.output_file)
+        log_report(self.log.emit, self.report.finish(success, "" if success else message))
+        self.finished.emit(success, message)
+
+
+class BackendWorker(QObject):
+    """Run a Backend's convert on a background thread, with the same signals as ConversionWorker"""
+
+    log = pyqtSignal(str)
+    stage_started = pyqtSignal(int, int, str)
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, backend, input_file, output_file, options, info=None, parent=None):
+        super().__init__(parent)
+        self.backend = backend
+        self.input_file = input_file
+        self.output_file = output_file
+        self.options = options
+        self.info = info
+        self.cancelled = False
+        self._thread = None
+        self._start = 0.0
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="jifmaker-backend", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Stop at the next frame, finished is emitted once the encoder has returned"""
+        self.cancelled = True
+        self.log.emit("Cancelling...")
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _progress(self, done, total):
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        fraction = done / total
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        self.progress.emit(ProgressUpdate(done, done / elapsed, fraction, eta, done == total))
+
+    def _run(self):
+        self.stage_started.emit(1, 1, f"GIF creation with the {self.backend.name} encoder")
+        self._start = time.monotonic()
+        try:
+            result = self.backend.convert(self.input_file, self.output_file, self.options, self.info,
+                                          log=self.log.emit, progress=self._progress, cancelled=lambda: self.cancelled)
+            log_report(self.log.emit, result.report)
+            success, message = True, "Processing completed successfully!"
+        except Cancelled:
+            success, message = False, "Processing cancelled"
+        except subprocess.CalledProcessError as e:
+            if e.stderr:
+                self.log.emit(e.stderr.strip())
+            success, message = False, f"{os.path.basename(e.cmd[0])} failed with exit code {e.returncode}"
+        except FileNotFoundError as e:
+            success, message = False, FFMPEG_NOT_FOUND if e.filename == "ffmpeg" else str(e)
+        except Exception as e:  # finished has to be emitted whatever the encoder raised, or the job never ends
+            success, message = False, str(e)
+        self.finished.emit(success, message)
+
+
+class EstimateWorker(QObject):
+    """Compute size estimates one at a time on a background thread, only the newest request is reported
+
+    A request supersedes the one before it, a sample encode that is already running finishes but the remaining
+    samples of an outdated estimate are skipped.
+    """
+
+    estimated = pyqtSignal(int, object)  # Request generation, SizeEstimate or None if estimation failed
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jifmaker-estimate")
+
+    def request(self, input_file, options, info, output_file=None):
+        """Queue an estimate for input_file with options, returns the generation it will be reported with
+
+        output_file picks the format the samples are encoded in.
+        """
+        with self._lock:
+            if self.closed:
+                return None
+            self.generation += 1
+            generation = self.generation
+        self._executor.submit(self._run, generation, input_file, options, info, output_file)
+        return generation
+
+    def shutdown(self):
+        """Drop pending requests without waiting for the running sample encode"""
+        with self._lock:
+            self.closed = True
+            self.generation += 1
+        self._executor.shutdown(wait=False)
+
+    def _current(self, generation):
+        with self._lock:
+            return generation == self.generation
+
+    def _run(self, generation, input_file, options, info, output_file):
+        if not self._current(generation):
+            return
+        try:
+            estimate = estimate_output_size(input_file, options, info, output_file=output_file,
+                                            cancelled=lambda: not self._current(generation))
+        except (subprocess.CalledProcessError, OSError, ValueError):
+            estimate = None
+        if self._current(generation):
+            self.estimated.emit(generation, estimate)
+
+
+class TargetSearchWorker(QObject):
+    """Run a target-size search on a background thread"""
+
+    finished = pyqtSignal(object)  # TargetResult, None if the search was cancelled or failed
+
+    def __init__(self, input_file, options, info, budget, output_file=None, parent=None):
+        super().__init__(parent)
+        self.input_file = input_file
+        self.output_file = output_file
+        self.options = options
+        self.info = info
+        self.budget = budget
+        self.cancelled = False
+        self.error = None
+
+    def start(self):
+        threading.Thread(target=self._run, name="jifmaker-target", daemon=True).start()
+
+    def cancel(self):
+        """Stop after the running trial encode"""
+        self.cancelled = True
+
+    def _run(self):
+        try:
+            result = search_target_size(self.input_file, self.options, self.info, self.budget,
+                                        cancelled=lambda: self.cancelled, output_file=self.output_file)
+        except Exception as e:  # The window waits for finished, it is emitted whatever a trial encode raised
+            self.error = str(e)
+            result = None
+        self.finished.emit(result)
+
+
+class ProbeWorker(QObject):
+    """Find the media files of dropped paths and probe them on a background thread, one probed signal per file"""
+
+    probed = pyqtSignal(str, object)  # Input file, MediaInfo or None if it could not be probed
+    finished = pyqtSignal(int)  # Number of files probed
+
+    def __init__(self, paths, options, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.options = options  # Settings the files are queued with, taken when they were dropped
+        self.cancelled = False
+
+    def start(self):
+        threading.Thread(target=self._run, name="jifmaker-probe", daemon=True).start()
+
+    def cancel(self):
+        """Stop after the running probe"""
+        self.cancelled = True
+
+    def _run(self):
+        from jifmaker.batch import find_inputs
+        count = 0
+        for input_file in find_inputs(self.paths):
+            if self.cancelled:
+                break
+            try:
+                info = probe(input_file)
+            except (OSError, subprocess.CalledProcessError, ValueError):
+                info = None  # Converted without a progress total, and with FFmpeg unless it is an image
+            self.probed.emit(input_file, info)
+            count += 1
+        self.finished.emit(count)
+
+
+class QueueRunner(QObject):
+    """Run the jobs of a JobQueue in order, up to max_jobs at the same time
+
+    Each job gets the worker a single conversion would use and its own temp dir, so concurrent palettes never
+    collide. job_changed is emitted whenever a job's status or progress changes.
+    """
+
+    job_changed = pyqtSignal(int)  # Job id
+    log = pyqtSignal(str)
+
+    def __init__(self, queue, temp_dir, max_jobs=2, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+        self.temp_dir = temp_dir
+        self.max_jobs = max_jobs
+        self.paused = False
+        self.workers = {}  # Job id -> running worker
+
+    def set_max_jobs(self, count):
+        """Change how many jobs run at once, running jobs beyond the new count finish first"""
+        self.max_jobs = max(1, count)
+        self.schedule()
+
+    def set_paused(self, paused):
+        """Stop or resume starting queued jobs, jobs that are running are not interrupted"""
+        self.paused = paused
+        self.schedule()
+
+    def schedule(self):
+        """Start queued jobs until max_jobs are running"""
+        while not self.paused and len(self.workers) < self.max_jobs:
+            job = self.queue.next_job()
+            if job is None:
+                break
+            self._start(job)
+
+    def cancel(self, job_id):
+        """Cancel a job, a running one is reported as cancelled once its worker has stopped"""
+        if self.queue.cancel(job_id):
+            self.workers[job_id].cancel()
+        self.job_changed.emit(job_id)
+
+    def shutdown(self):
+        """Stop every running job without reporting back, used when the window closes"""
+        for worker in self.workers.values():
+            worker.finished.disconnect()
+            worker.cancel()
+            if isinstance(worker, ConversionWorker):
+                if worker.process is not None:
+                    worker.process.waitForFinished(3000)
+            else:
+                worker.wait(3)
+        self.workers.clear()
+
+    def _start(self, job):
+        job_dir = os.path.join(self.temp_dir, f"job_{job.id}")
+        os.makedirs(job_dir, exist_ok=True)
+        worker = conversion_worker(job.input_file, job.output_file, job.options, job.info, job_dir, self)
+        worker.job_id = job.id
+        # Bound slots, the thread based workers emit from their own threads and Qt queues these to this one
+        worker.progress.connect(self._on_progress)
+        worker.finished.connect(self._on_finished)
+        self.workers[job.id] = worker
+        self.queue.start(job)
+        self.log.emit(f"Job {job.id} started: {os.path.basename(job.input_file)}")
+        self.job_changed.emit(job.id)
+        worker.start()
+
+    def _on_progress(self, update):
+        job = self.queue.get(self.sender().job_id)
+        if job is not None and update.fraction is not None:
+            job.progress = update.fraction
+            self.job_changed.emit(job.id)
+
+    def _on_finished(self, success, message):
+        worker = self.sender()
+        self.workers.pop(worker.job_id, None)
+        worker.deleteLater()
+        shutil.rmtree(os.path.join(self.temp_dir, f"job_{worker.job_id}"), ignore_errors=True)
+
+        job = self.queue.get(worker.job_id)
+        if job is not None:
+            if success:
+                self.queue.finish(job, DONE, message, os.path.getsize(job.output_file))
+            else:
+                self.queue.finish(job, CANCELLED if worker.cancelled else FAILED, message)
+            self.log.emit(f"Job {job.id} ({os.path.basename(job.input_file)}): {job.describe()}")
+            self.job_changed.emit(job.id)
+        self.schedule()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def log_report(log, report):
+    """Log the cost of each stage of a finished job"""
+    if report is not None and report.stages:
+        log("Stage breakdown:")
+        for stage in report.stages:
+            log(f"  {stage.describe()}")
+
+
+def conversion_worker(input_file, output_file, options, info, temp_dir, parent=None):
+    """Return the worker for one conversion: the in-process encoder, parallel chunks or a QProcess plan
+
+    The plan stages write to a temporary file next to output_file, temp_dir holds the palette and chunks.
+    """
+    backend = backend_for(input_file, options, info, output_file)
+    if backend.name != "ffmpeg":
+        return BackendWorker(backend, input_file, output_file, options, info, parent)
+    total_frames = int(trimmed_duration(options, info) * options.fps) if info is not None else 0
+    if options.chunks > 1 and info is not None and output_format(output_file).is_gif:
+        # Chunk boundaries depend on the length of the input, too short a range gets a single encode plan
+        plan = build_chunked_plan(input_file, partial_path(output_file), options, info, temp_dir)
+        if any(stage.name == "chunk" for stage in plan.stages):
+            return ChunkedWorker(plan, output_file, parent)
+        return ConversionWorker(plan, output_file, total_frames, parent)
+    return ConversionWorker(build_plan(input_file, partial_path(output_file), options, temp_dir, info), output_file,
+                            total_frames, parent)
@@ -0,0 +1,41 @@
+import shutil
+import subprocess
+
+import pytest
+
+from jifmaker import cache
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "ffmpeg: the test runs FFmpeg and is skipped when it is not installed")
+
+
+def pytest_runtest_setup(item):
+    if item.get_closest_marker("ffmpeg") and not shutil.which("ffmpeg"):
+        pytest.skip("FFmpeg is not installed")
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Point the on-disk caches at a fresh directory for every test, so runs never share probes or palettes"""
+    directory = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("JIFMAKER_CACHE_DIR", str(directory))
+    for name in ("_probe_cache", "_keyframe_cache", "_palette_cache"):
+        monkeypatch.setattr(cache, name, None)
+    yield str(directory)
+    for shared in (cache._probe_cache, cache._keyframe_cache):
+        if shared is not None:
+            shared.close()
+
+
+@pytest.fixture
+def make_clip():
+    """Return a function that writes a test clip of an FFmpeg source to path, 160x120 at 10 fps by default"""
+    def make(path, source="testsrc2", duration=1, size="160x120", rate=10, filters="", args=("-pix_fmt", "yuv420p")):
+        graph = f"{source}=size={size}:rate={rate}" + (f",{filters}" if filters else "")
+        command = ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", graph]
+        if duration is not None:
+            command += ["-t", str(duration)]
+        subprocess.run(command + list(args) + [str(path)], check=True)
+        return str(path)
+    return make
@@ -0,0 +1,70 @@
+import pytest
+from PIL import Image, ImageSequence
+
+from jifmaker.backends import PILLOW_PIXEL_BUDGET, choose_backend, get_backend, image_info, output_pixels, resample
+from jifmaker.engine import ConversionOptions, MediaInfo
+from jifmaker.gifio import read_gif
+
+
+def test_choose_backend():
+    """Test that short clips and WebP go in process and long, unknown, chunked or unsupported encodes go to FFmpeg"""
+    short = MediaInfo("in.mp4", width=320, height=240, duration=1.0, fps=30.0, has_video=True)
+    long = MediaInfo("in.mp4", width=1920, height=1080, duration=600.0, fps=30.0, has_video=True)
+    options = ConversionOptions(width=640, fps=15)
+    assert choose_backend("in.mp4", options, short).name == "pillow"
+    assert choose_backend("in.mp4", options, None).name == "ffmpeg"
+    assert output_pixels(options, long) > PILLOW_PIXEL_BUDGET
+    assert choose_backend("in.mp4", options, long).name == "ffmpeg"
+    assert choose_backend("in.webp", options, long).name == "pillow"
+    assert choose_backend("in.mp4", ConversionOptions(width=160, chunks=4), short).name == "ffmpeg"
+    assert choose_backend("in.mp4", ConversionOptions(backend="ffmpeg"), short).name == "ffmpeg"
+    assert choose_backend("in.mp4", ConversionOptions(width=160, dither="sierra2"), short).name == "ffmpeg"
+    assert choose_backend("in.mp4", ConversionOptions(width=160, no_extensions=True), short).name == "ffmpeg"
+    assert choose_backend("in.webp", ConversionOptions(width=160, dither="sierra2"), short).name == "pillow"
+    with pytest.raises(ValueError):
+        get_backend("gifski")
+
+
+def test_resample():
+    """Test that frames are repeated or dropped onto the output frame grid"""
+    timed = [(0.0, "a"), (0.25, "b"), (0.5, "c"), (1.0, None)]
+    assert list(resample(iter(timed), 0, None, 4)) == ["a", "b", "c", "c"]
+    assert list(resample(iter(timed), 0.5, None, 10)) == ["c"] * 5
+    assert list(resample(iter(timed), 0, 0.5, 2)) == ["a"]
+
+
+@pytest.mark.parametrize("extension", [pytest.param(".gif", marks=pytest.mark.ffmpeg), ".webp"])
+def test_pillow_backend_image_input(tmp_path, extension):
+    """Test that animated images are trimmed, scaled and re-timed, WebP without FFmpeg"""
+    source = tmp_path / f"in{extension}"
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+    frames = [Image.new("RGB", (64, 48), color) for color in colors]
+    frames[0].save(source, save_all=True, append_images=frames[1:], duration=500, loop=0, lossless=True)
+    info = image_info(str(source))
+    assert (info.width, info.height, info.duration) == (64, 48, 2.0)
+
+    options = ConversionOptions(width=32, fps=4, start_time="00:00:01", frame_diff=0, dither="none")
+    result = get_backend("pillow").convert(str(source), str(tmp_path / "out.gif"), options)
+
+    gif = read_gif(result.output_file)
+    assert (gif.width, gif.height) == (32, 24)
+    assert sum(frame.delay for frame in gif.frames) == 100
+    with Image.open(result.output_file) as image:
+        shown = [image.convert("RGB").getpixel((0, 0)) for _ in ImageSequence.Iterator(image)]
+    assert shown[0] == (0, 0, 255) and shown[-1] == (255, 255, 0)
+
+
+@pytest.mark.ffmpeg
+def test_pillow_backend_matches_ffmpeg_timing(tmp_path, make_clip):
+    """Test that both backends produce a GIF of the same size, frame count and length"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=2, size="320x240", rate=30)
+    info = MediaInfo(str(source), width=320, height=240, duration=2.0, fps=30.0, has_video=True)
+    options = ConversionOptions(width=160, fps=10, frame_diff=0)
+
+    results = [get_backend(name).convert(str(source), str(tmp_path / f"{name}.gif"), options, info)
+               for name in ("ffmpeg", "pillow")]
+    gifs = [read_gif(result.output_file) for result in results]
+    assert gifs[0].width == gifs[1].width and gifs[0].height == gifs[1].height
+    assert len(gifs[0].frames) == len(gifs[1].frames) == 20
+    assert sum(frame.delay for frame in gifs[1].frames) == 200
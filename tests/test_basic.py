@@ -1,7 +1,10 @@
 import sys
 import pytest
 from PyQt5.QtWidgets import QApplication
-from jifmaker.main import JIFMaker
+from jifmaker.engine import ConversionOptions, MediaInfo
+from jifmaker.frames import FrameSource
+from jifmaker.main import JIFMaker, PREVIEW_DECODE_SIZE
+from jifmaker.target import TargetResult, quality_ladder
 
 
 @pytest.fixture
@@ -43,3 +46,189 @@ def test_file_dialogs(window, qtbot):
 def test_process_button_initial_state(window):
     """Test that the process button is disabled when no files are selected"""
     assert window.process_button.isEnabled()  # Should be enabled but show error when clicked
+
+def test_single_pass_command(window):
+    """Test that single-pass mode builds one FFmpeg command with an in-graph palette"""
+    window.input_file_edit.setText("input.mp4")
+    window.output_file_edit.setText("output.gif")
+    window.tabs.setCurrentWidget(window.compression_tab)
+
+    two_pass = window.generate_ffmpeg_command()
+    assert [stage.name for stage in two_pass.stages] == ["palette", "encode"]
+
+    window.single_pass_check.setChecked(True)
+    single_pass = window.generate_ffmpeg_command()
+    assert [stage.name for stage in single_pass.stages] == ["encode"]
+    args = single_pass.stages[0].args
+    graph = args[args.index("-filter_complex") + 1]
+    assert "split[a][b]" in graph
+    assert "palettegen" in graph and "paletteuse" in graph
+    window.updates.flush()
+    assert "&&" not in window.command_preview.toPlainText()
+
+def test_chunked_command(window):
+    """Test that parallel chunks show one encode per chunk once the input length is known"""
+    window.input_file_edit.setText("input.mp4")
+    window.output_file_edit.setText("output.gif")
+    window.build_compression_tab()
+    window.chunks_spin.setValue(4)
+    assert window.current_options().chunks == 4
+    assert [stage.name for stage in window.generate_ffmpeg_command().stages] == ["palette", "encode"]
+
+    window.media_info = MediaInfo("input.mp4", width=640, height=360, duration=40.0, fps=30.0, has_video=True)
+    stages = [stage.name for stage in window.generate_ffmpeg_command().stages]
+    assert stages == ["palette", "chunk", "chunk", "chunk", "chunk"]
+
+def test_encoder_choice(window):
+    """Test that WebP inputs are encoded in process and the command preview says so"""
+    assert window.current_options().backend == "auto"
+    window.input_file_edit.setText("input.webp")
+    window.output_file_edit.setText("output.gif")
+    window.updates.flush()
+    assert "In-process pillow encoder" in window.command_preview.toPlainText()
+
+    window.build_compression_tab()
+    window.backend_combo.setCurrentText("ffmpeg")
+    window.updates.flush()
+    assert window.command_preview.toPlainText().startswith("ffmpeg")
+
+def test_target_size_controls(window):
+    """Test that target-size mode is off by default and budgets in megabytes"""
+    window.build_compression_tab()
+    assert window.target_size_check.isChecked() is False
+    assert window.target_size_spin.value() == 8.0
+    assert window.target_worker is None
+
+def test_target_size_retry(window, tmp_path):
+    """Test that an output over the target size is converted again one rung smaller"""
+    output = tmp_path / "clip.gif"
+    output.write_bytes(bytes(2000))
+    window.output_file_edit.setText(str(output))
+    options = ConversionOptions(width=800, fps=15)
+    ladder = quality_ladder(options)
+    window.target_request = (options, TargetResult(1000, ladder[0], None, True))
+    window.target_retries = 2
+    started = []
+    window.start_conversion = lambda output_file, options: started.append(options)
+
+    window.on_processing_finished(True, "Processing complete")
+    assert started == [ladder[1]]
+    assert window.target_retries == 1
+    assert window.width_spin.value() == ladder[1].width
+    assert "retrying one rung smaller" in window.output_log.toPlainText()
+
+def test_compression_tab_is_lazy(window):
+    """Test that the Advanced Compression tab is built when first shown and its defaults match the options"""
+    assert window.compression_built is False
+    assert not hasattr(window, "chunks_spin")
+    defaults = window.current_options()
+
+    window.tabs.setCurrentWidget(window.compression_tab)
+    assert window.compression_built is True
+    assert window.current_options() == defaults
+    compression = window.compression_options()
+    assert compression == {name: getattr(ConversionOptions(), name) for name in compression}
+    window.chunks_spin.setValue(3)
+    assert window.updates.tasks["command"].dirty
+    assert window.current_options().chunks == 3
+
+def test_updates_are_coalesced(window, qtbot):
+    """Test that a burst of setting changes recomputes the command once and skips unchanged settings"""
+    window.input_file_edit.setText("input.mp4")
+    window.output_file_edit.setText("output.gif")
+    window.updates.flush()
+    command = window.updates.tasks["command"]
+    runs = command.runs
+
+    for fps in range(16, 26):
+        window.fps_spin.setValue(fps)
+    assert command.runs == runs
+    qtbot.waitUntil(lambda: command.runs == runs + 1)
+    assert "fps=25" in window.command_preview.toPlainText()
+
+    # Back and forth to the same value leaves nothing to recompute
+    window.fps_spin.setValue(20)
+    window.fps_spin.setValue(25)
+    window.updates.flush()
+    assert command.runs == runs + 1
+    assert command.skips == 1
+
+def test_missing_input_file(window, tmp_path):
+    """Test that a missing input is reported as missing, not as FFmpeg being absent"""
+    missing = str(tmp_path / "deleted.mp4")
+    window.analyze_input_file(missing)
+    assert window.file_info.toPlainText() == f"Error: {missing} does not exist"
+
+def test_progress_controls_initial_state(window):
+    """Test that the progress bar is idle and cancel is disabled until a conversion starts"""
+    assert window.progress_bar.value() == 0
+    assert window.cancel_button.isEnabled() is False
+    assert window.worker is None
+
+@pytest.mark.ffmpeg
+def test_show_frame(window, tmp_path, make_clip):
+    """Test that preview frames are decoded from the pipe and cropped in source coordinates"""
+    clip = tmp_path / "clip.mp4"
+    make_clip(clip, size="1920x1080")
+    window.original_width, window.original_height = 1920, 1080
+    window.frame_source = FrameSource(str(clip), 1920, 1080, PREVIEW_DECODE_SIZE)
+
+    window.show_frame(0.5)
+    assert (window.current_pixmap.width(), window.current_pixmap.height()) == (960, 540)
+    assert window.preview_label.pixmap() is not None
+
+@pytest.mark.ffmpeg
+def test_scrubber(window, qtbot, tmp_path, make_clip):
+    """Test that moving the scrubber shows frames decoded by the prefetcher"""
+    clip = tmp_path / "clip.mp4"
+    make_clip(clip, duration=3, size="320x240")
+    info = MediaInfo(str(clip), width=320, height=240, duration=3.0, fps=10.0, has_video=True)
+    window.media_info = info
+    window.original_width, window.original_height = 320, 240
+    window.frame_source = FrameSource(str(clip), 320, 240, PREVIEW_DECODE_SIZE)
+    window.start_scrubbing(str(clip), info)
+    window.show_trim_start()
+    assert window.scrub_slider.isEnabled()
+    assert (window.scrub_slider.minimum(), window.scrub_slider.maximum()) == (0, 29)
+
+    first = window.current_pixmap.toImage()
+    with qtbot.waitSignal(window.frame_bridge.frame_ready, timeout=10000):
+        window.scrub_slider.setValue(20)
+    qtbot.waitUntil(lambda: window.current_pixmap.toImage() != first, timeout=10000)
+    assert window.scrub_label.text() == "00:00:02"
+
+@pytest.mark.ffmpeg
+def test_size_estimate(window, qtbot, tmp_path, make_clip):
+    """Test that the size label is filled in from a background sample encode"""
+    clip = tmp_path / "clip.mp4"
+    make_clip(clip, duration=2, size="320x240")
+    window.media_info = MediaInfo(str(clip), width=320, height=240, duration=2.0, fps=10.0, has_video=True)
+    window.width_spin.setValue(160)
+    window.updates.invalidate("estimate")
+    window.updates.flush()
+
+    assert window.size_label.text() == "Estimating..."
+    qtbot.waitUntil(lambda: window.size_label.text().endswith("KB"), timeout=20000)
+    assert window.size_label.toolTip().startswith("Exact")
+
+def test_enqueue_files(window, qtbot, tmp_path):
+    """Test that a dropped folder queues every media file with a snapshot of the current settings"""
+    for name in ("a.mp4", "b.webm", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    window.pause_queue_check.setChecked(True)
+    window.fps_spin.setValue(7)
+    window.enqueue_files([str(tmp_path)])
+    window.fps_spin.setValue(20)
+    # The files are probed off the GUI thread and queued when their probes return
+    qtbot.waitUntil(lambda: "Queued 2 files" in window.output_log.toPlainText(), timeout=10000)
+    assert window.probe_workers == []
+
+    assert [job.output_file for job in window.job_queue.jobs] == [str(tmp_path / "a_processed.gif"),
+                                                                  str(tmp_path / "b_processed.gif")]
+    assert all(job.options.fps == 7 for job in window.job_queue.jobs)
+    assert window.queue_table.rowCount() == 2
+    assert window.queue_table.item(0, 1).text() == "Queued"
+
+    window.queue_table.selectRow(1)
+    window.move_job(-1)
+    assert window.queue_table.item(0, 0).text() == "b.webm"
@@ -0,0 +1,130 @@
+import os
+import time
+import argparse
+import subprocess
+
+import pytest
+
+from jifmaker import batch
+from jifmaker.engine import ConversionOptions, ConversionResult
+
+
+def parse(*argv):
+    parser = argparse.ArgumentParser()
+    batch.add_arguments(parser)
+    return parser.parse_args(list(argv))
+
+
+def test_defaults_match_gui_options():
+    """Test that the batch defaults match the window defaults"""
+    assert batch.options_from_args(parse("in.mp4")) == ConversionOptions()
+
+
+def test_options_from_args():
+    """Test that command line flags map onto the conversion options"""
+    options = batch.options_from_args(parse("in.mp4", "--fps", "10", "--no-loop", "--crop", "1", "2", "3", "4",
+                                            "--single-pass", "--gifsicle-level", "2", "--chunks", "8", "--backend",
+                                            "pillow"))
+    assert options.fps == 10
+    assert options.loop is False
+    assert (options.top, options.bottom, options.left, options.right) == (1, 2, 3, 4)
+    assert options.single_pass is True
+    assert options.gifsicle_level == 2
+    assert options.chunks == 8
+    assert options.backend == "pillow"
+
+
+def test_target_size_argument(capsys):
+    """Test that --target-size takes human readable sizes and rejects anything else"""
+    assert parse("in.mp4").target_size is None
+    assert parse("in.mp4", "--target-size", "8MB").target_size == 8 * 1024 * 1024
+    with pytest.raises(SystemExit):
+        parse("in.mp4", "--target-size", "huge")
+    assert "Invalid size" in capsys.readouterr().err
+
+
+def test_target_size_needs_ffprobe(monkeypatch):
+    """Test that a budget without ffprobe fails with a message naming it"""
+    monkeypatch.setattr(batch, "find_tool", lambda name: None)
+    with pytest.raises(ValueError, match="ffprobe not found"):
+        batch.convert_job("in.mp4", "out.gif", ConversionOptions(), budget=1000)
+
+
+def test_find_inputs(tmp_path):
+    """Test that directories and globs expand to media files and skip previous outputs"""
+    for name in ["a.mp4", "b.MOV", "notes.txt", "a_processed.gif"]:
+        (tmp_path / name).write_bytes(b"")
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    (sub / "c.mkv").write_bytes(b"")
+
+    names = [os.path.basename(p) for p in batch.find_inputs([str(tmp_path)])]
+    assert names == ["a.mp4", "b.MOV"]
+
+    names = [os.path.basename(p) for p in batch.find_inputs([str(tmp_path)], recursive=True)]
+    assert sorted(names) == ["a.mp4", "b.MOV", "c.mkv"]
+
+    # The same file reached through two patterns is only converted once
+    assert len(batch.find_inputs([str(tmp_path / "*.mp4"), str(tmp_path / "a.mp4")])) == 1
+
+
+def test_is_up_to_date(tmp_path):
+    """Test that outputs newer than their inputs are skipped"""
+    source = tmp_path / "in.mp4"
+    output = tmp_path / "in_processed.gif"
+    source.write_bytes(b"")
+    assert not batch.is_up_to_date(str(source), str(output))
+
+    output.write_bytes(b"")
+    os.utime(source, (time.time() - 10, time.time() - 10))
+    assert batch.is_up_to_date(str(source), str(output))
+
+    os.utime(source, (time.time() + 10, time.time() + 10))
+    assert not batch.is_up_to_date(str(source), str(output))
+
+
+@pytest.mark.ffmpeg
+def test_convert_jobs_survives_errors(tmp_path, monkeypatch, capsys):
+    """Test that a failure without stderr, an unexpected error and an unreadable frame report do not stop the batch"""
+    for name in ("a.mp4", "b.mp4", "b.gif", "c.mp4"):
+        (tmp_path / name).write_bytes(b"not media")
+
+    def convert_job(input_file, output_file, options, budget=None):
+        if input_file.endswith("a.mp4"):
+            raise subprocess.CalledProcessError(1, ["ffmpeg"], stderr="")
+        if input_file.endswith("c.mp4"):
+            raise RuntimeError("unexpected")
+        return ConversionResult(output_file, 9, 0.1), None
+
+    monkeypatch.setattr(batch, "convert_job", convert_job)
+    jobs = [(str(tmp_path / f"{name}.mp4"), str(tmp_path / f"{name}.gif")) for name in "abc"]
+    assert batch.convert_jobs(jobs, ConversionOptions(), 1, 0, None) == 1
+    out = capsys.readouterr().out
+    assert "FAILED" in out and "frames: not available" in out and "unexpected" in out
+    assert "Converted 1 files (0 skipped, 2 failed)" in out
+
+
+@pytest.mark.ffmpeg
+def test_batch_run(tmp_path, capsys, make_clip):
+    """Test a small end-to-end batch conversion"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source)
+
+    assert batch.run(parse(str(tmp_path), "--width", "80", "-j", "2")) == 0
+    assert (tmp_path / "clip_processed.gif").exists()
+    assert "files/s" in capsys.readouterr().out
+
+    # A second run finds the output up to date
+    assert batch.run(parse(str(tmp_path), "--width", "80")) == 0
+    assert "1 skipped" in capsys.readouterr().out
+
+
+@pytest.mark.ffmpeg
+def test_batch_shared_palette(tmp_path, capsys, make_clip):
+    """Test that --shared-palette encodes every input with one palette built from all of them"""
+    for name, source in (("bars.mp4", "smptebars"), ("test.mp4", "testsrc2")):
+        make_clip(tmp_path / name, source)
+
+    assert batch.run(parse(str(tmp_path), "--width", "80", "--colors", "64", "--shared-palette")) == 0
+    assert "Shared palette of" in capsys.readouterr().out
+    assert (tmp_path / "bars_processed.gif").exists() and (tmp_path / "test_processed.gif").exists()
@@ -0,0 +1,42 @@
+import copy
+
+from benchmarks.suite import MATRIX, case_options, compare_results, suite_cases
+
+
+def results(**metrics):
+    return {"results": [dict({"case": "clip/base", "wall": 2.0, "cpu": 1.9, "bytes": 100_000,
+                              "peak_rss": 80 * 2 ** 20}, **metrics)]}
+
+
+def test_suite_cases():
+    """Test that the quick suite is a subset of the full one and every case changes one option of the base"""
+    full = suite_cases()
+    quick = suite_cases(quick=True)
+    assert len(full) == 4 * len(MATRIX) and set(map(repr, quick)) < set(map(repr, full))
+    assert case_options({"colors": 64}).colors == 64 and case_options({}).width == 480
+    assert not case_options({}).reuse_palette
+
+
+def test_compare_results():
+    """Test that growth past a threshold and the noise floor is a regression and everything else is not"""
+    baseline = results()
+    lines, regressions = compare_results(baseline, copy.deepcopy(baseline))
+    assert len(lines) == 1 and not regressions
+
+    _, regressions = compare_results(baseline, results(wall=2.5, bytes=110_000))
+    assert len(regressions) == 1 and "wall, bytes" in regressions[0]
+
+    # 20% of 0.1 s is below the noise floor, a faster and smaller result is never a regression
+    _, regressions = compare_results(results(wall=0.1), results(wall=0.12))
+    assert not regressions
+    _, regressions = compare_results(baseline, results(wall=1.0, bytes=50_000))
+    assert not regressions
+    assert not compare_results(baseline, results(wall=2.5), {"wall": 0.5})[1]
+
+
+def test_compare_missing_cases():
+    """Test that new cases and cases missing from the results are listed"""
+    current = results()
+    current["results"][0]["case"] = "clip/width=320"
+    lines, regressions = compare_results(results(), current)
+    assert "new case" in lines[0] and "missing" in lines[1] and not regressions
@@ -0,0 +1,124 @@
+import os
+import json
+import sqlite3
+import subprocess
+
+import pytest
+
+from jifmaker import engine
+from jifmaker.cache import PaletteCache, ProbeCache, user_cache_dir
+
+
+PROBE_JSON = json.dumps({"streams": [{"codec_type": "video", "width": 64, "height": 48, "duration": "2.0",
+                                      "avg_frame_rate": "10/1", "codec_name": "h264"}]})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ProbeCache(str(tmp_path / "probe.sqlite3"), max_entries=2)
+    yield cache
+    cache.close()
+
+
+def test_user_cache_dir_override(monkeypatch, tmp_path):
+    """Test that JIFMAKER_CACHE_DIR relocates the cache"""
+    monkeypatch.setenv("JIFMAKER_CACHE_DIR", str(tmp_path))
+    assert user_cache_dir() == str(tmp_path)
+
+
+def test_cache_keyed_by_size_and_mtime(cache, tmp_path):
+    """Test that a changed file is a miss even though its path is cached"""
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"abc")
+    assert cache.get(str(clip)) is None
+    cache.put(str(clip), PROBE_JSON)
+    assert cache.get(str(clip)) == PROBE_JSON
+
+    stat = clip.stat()
+    os.utime(clip, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert cache.get(str(clip)) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_lru_eviction(cache, tmp_path):
+    """Test that the least recently used entry is evicted once the cap is reached"""
+    paths = []
+    for name in "abc":
+        path = tmp_path / f"{name}.mp4"
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+
+    cache.put(paths[0], PROBE_JSON)
+    cache.put(paths[1], PROBE_JSON)
+    assert cache.get(paths[0]) is not None  # a is now more recent than b
+    cache.put(paths[2], PROBE_JSON)
+
+    assert len(cache) == 2
+    assert cache.get(paths[1]) is None
+    assert cache.get(paths[0]) is not None
+
+
+
+def test_cache_size_bound(tmp_path):
+    """Test that the least recently used entries are evicted once the stored data passes max_bytes"""
+    cache = ProbeCache(str(tmp_path / "probe.sqlite3"), max_bytes=2 * len(PROBE_JSON))
+    paths = []
+    for name in "abc":
+        path = tmp_path / f"{name}.mp4"
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+        cache.put(str(path), PROBE_JSON)
+
+    assert len(cache) == 2
+    assert cache.get(paths[0]) is None and cache.get(paths[2]) is not None
+    cache.close()
+
+
+def test_cache_errors_are_misses(cache, tmp_path):
+    """Test that a locked database reads as a miss and skips the write instead of raising"""
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"abc")
+
+    class Locked:
+        def execute(self, *args):
+            raise sqlite3.OperationalError("database is locked")
+
+        def rollback(self):
+            pass
+
+    cache._conn, conn = Locked(), cache._conn
+    cache.put(str(clip), PROBE_JSON)
+    assert cache.get(str(clip)) is None and cache.misses == 1
+    cache._conn = conn
+
+def test_probe_hit_skips_subprocess(cache, tmp_path, monkeypatch):
+    """Test that probing a known file never spawns ffprobe"""
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"abc")
+    cache.put(str(clip), PROBE_JSON)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("ffprobe should not run")
+
+    monkeypatch.setattr(subprocess, "run", fail)
+    info = engine.probe(str(clip), cache)
+    assert (info.width, info.height, info.fps) == (64, 48, 10)
+    assert cache.describe() == "probe cache: 1 hits, 0 misses"
+
+
+def test_palette_cache_lru_eviction(tmp_path):
+    """Test that cached palettes are found by key and the least recently used one is evicted"""
+    cache = PaletteCache(str(tmp_path), max_entries=2)
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"png")
+
+    assert cache.get("a") is None
+    for key in "ab":
+        cache.put(key, str(source))
+    os.utime(cache.path("b"), (0, 0))  # b was used long ago
+    cache.put("c", str(source))
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert open(cache.get("a"), "rb").read() == b"png"
+    assert cache.describe() == "palette cache: 1 hits, 2 misses"
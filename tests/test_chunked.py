@@ -0,0 +1,108 @@
+import time
+import threading
+import subprocess
+
+import pytest
+
+from jifmaker import chunked
+from jifmaker.chunked import build_chunked_plan, chunk_ranges, convert_chunked
+from jifmaker.engine import ConversionOptions, MediaInfo, convert
+from jifmaker.gifio import read_gif
+
+
+def test_chunk_ranges():
+    """Test that chunks cover the trim range on whole seconds without overlapping"""
+    assert chunk_ranges(0, 10, 4) == [(0, 3), (3, 3), (6, 3), (9, 1)]
+    assert chunk_ranges(5, 6.5, 2) == [(5, 4), (9, 2.5)]
+    assert chunk_ranges(0, 2, 8) == [(0, 1), (1, 1)]
+
+
+def test_build_chunked_plan():
+    """Test that every chunk maps its own time range onto the one global palette"""
+    info = MediaInfo("in.mp4", width=640, height=360, duration=30.0, fps=30.0, has_video=True)
+    options = ConversionOptions(chunks=3, start_time="00:00:03", gifsicle=True)
+    plan = build_chunked_plan("in.mp4", "out.gif", options, info, "/tmp/work")
+
+    assert [stage.name for stage in plan.stages] == ["palette", "chunk", "chunk", "chunk", "gifsicle"]
+    palette = plan.stages[0].args[-1]
+    chunks = [stage.args for stage in plan.stages[1:4]]
+    assert all(palette in args for args in chunks)
+    assert [args[args.index("-ss") + 1] for args in chunks] == ["00:00:03", "00:00:12", "00:00:21"]
+    assert "-t" not in chunks[-1]  # The last chunk runs to the end of the input
+    assert plan.stages[-1].args[-1] == "out.gif"
+
+
+def test_build_chunked_plan_unknown_duration():
+    """Test that a range that does not split into two chunks gets the plan of a single encode"""
+    info = MediaInfo("in.mp4", width=640, height=360, duration=0.0, fps=30.0, has_video=True)
+    plan = build_chunked_plan("in.mp4", "out.gif", ConversionOptions(chunks=4, reuse_palette=False), info, "/tmp/work")
+    assert [stage.name for stage in plan.stages] == ["palette", "encode"]
+
+
+def test_run_chunked_stops_on_first_failure(monkeypatch):
+    """Test that a failing chunk stops the chunks still encoding instead of waiting on them in order"""
+    info = MediaInfo("in.mp4", width=640, height=360, duration=30.0, fps=30.0, has_video=True)
+    plan = build_chunked_plan("in.mp4", "out.gif", ConversionOptions(chunks=3, reuse_palette=False), info, "/tmp/work")
+    first = plan.stages[1]
+    stopped = threading.Event()
+
+    def run(stage, cancelled, report=None):
+        if stage is first:
+            # The first chunk only finishes once it is told to stop, as a long chunk would
+            for _ in range(500):
+                if cancelled():
+                    stopped.set()
+                    raise chunked.Cancelled()
+                time.sleep(0.01)
+        elif stage.name == "chunk":
+            raise subprocess.CalledProcessError(1, stage.args)
+
+    monkeypatch.setattr(chunked, "_run", run)
+    monkeypatch.setattr(chunked, "remember_palette", lambda plan, stage: None)
+    with pytest.raises(subprocess.CalledProcessError):
+        chunked.run_chunked(plan, jobs=3)
+    assert stopped.is_set()
+
+
+@pytest.mark.ffmpeg
+def test_convert_chunked_unknown_duration(tmp_path, make_clip):
+    """Test that a chunked conversion of an input without a known duration is encoded in one piece"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=2)
+    info = MediaInfo(str(source), width=160, height=120, duration=0.0, fps=10.0, has_video=True)
+    result = convert_chunked(str(source), str(tmp_path / "out.gif"), ConversionOptions(width=80, chunks=3), info)
+    assert len(read_gif(result.output_file).frames) > 1
+    assert [stage.name for stage in result.report.stages] == ["palette", "encode"]
+
+
+@pytest.mark.ffmpeg
+def test_convert_chunked_without_ffprobe(tmp_path, make_clip, monkeypatch):
+    """Test that without ffprobe to find the duration the input is encoded in one piece"""
+    source = make_clip(tmp_path / "clip.mp4", duration=2)
+    monkeypatch.setattr(chunked, "find_tool", lambda name: None)
+    log = []
+    result = convert_chunked(source, str(tmp_path / "out.gif"), ConversionOptions(width=80, chunks=3), log=log.append)
+    assert log[0] == "ffprobe not found, encoding without chunks"
+    assert [stage.name for stage in result.report.stages] == ["palette", "encode"]
+
+
+@pytest.mark.ffmpeg
+def test_chunked_output_matches_single_encode(tmp_path, make_clip):
+    """Test that the joined GIF decodes to the same frames with the same timing as a single encode"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=5, size="320x240", rate=30)
+    info = MediaInfo(str(source), width=320, height=240, duration=5.0, fps=30.0, has_video=True)
+
+    single = convert(str(source), str(tmp_path / "single.gif"), ConversionOptions(width=160))
+    chunked = convert_chunked(str(source), str(tmp_path / "chunked.gif"), ConversionOptions(width=160, chunks=3),
+                              info, jobs=2)
+
+    def decoded(path):
+        result = subprocess.run(["ffmpeg", "-v", "error", "-i", path, "-f", "framemd5", "-"],
+                                capture_output=True, text=True, check=True)
+        return [line.split(",")[-1] for line in result.stdout.splitlines() if not line.startswith("#")]
+
+    assert decoded(chunked.output_file) == decoded(single.output_file)
+    single_gif, chunked_gif = read_gif(single.output_file), read_gif(chunked.output_file)
+    assert [frame.delay for frame in chunked_gif.frames] == [frame.delay for frame in single_gif.frames]
+    assert chunked_gif.extensions == single_gif.extensions  # Same loop setting
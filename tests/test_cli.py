@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+import pytest
+
+from jifmaker import __version__
+from jifmaker.cli import COMMANDS, build_parser, main
+
+
+def imported_modules(code):
+    """Run code in a fresh interpreter and return the modules it imported"""
+    script = f"import sys\n{code}\nprint(' '.join(sys.modules))"
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return set(output.split())
+
+
+def test_version(capsys):
+    """Test that --version prints the package version"""
+    with pytest.raises(SystemExit) as exit_info:
+        main(["--version"])
+    assert exit_info.value.code == 0
+    assert capsys.readouterr().out.strip() == f"jifmaker {__version__}"
+
+
+def test_cli_does_not_import_qt():
+    """Test that --version and the subcommand parsers run without importing Qt"""
+    version = "from jifmaker.cli import main\ntry:\n    main(['--version'])\nexcept SystemExit:\n    pass"
+    modules = imported_modules(version)
+    assert not any(module.startswith("PyQt5") for module in modules)
+    assert "numpy" not in modules
+
+    modules = imported_modules("from jifmaker.cli import build_parser\n"
+                               "build_parser('batch').parse_args(['batch', 'in.mp4'])")
+    assert "jifmaker.batch" in modules and not any(module.startswith("PyQt5") for module in modules)
+    assert "jifmaker.backends" not in modules and "numpy" not in modules
+
+    modules = imported_modules("from jifmaker.cli import build_parser\n"
+                               "build_parser('compare').parse_args(['compare', 'in.mp4'])")
+    assert "jifmaker.compare" in modules and "jifmaker.backends" not in modules and "numpy" not in modules
+
+
+def test_window_module_defers_encoders():
+    """Test that importing the window does not load the NumPy and Pillow encoders before they are needed"""
+    modules = imported_modules("import jifmaker.main")
+    assert "jifmaker.backends" not in modules and "numpy" not in modules
+
+
+def test_subcommand_options():
+    """Test that only the chosen subcommand gets its options"""
+    args = build_parser("compare").parse_args(["compare", "clip.mp4", "--formats", "gif", "webp"])
+    assert args.command == "compare" and args.formats == ["gif", "webp"]
+    assert set(COMMANDS) >= {"batch", "compare"}
@@ -0,0 +1,70 @@
+import pytest
+
+from jifmaker import decode
+from jifmaker.chunked import build_chunked_plan
+from jifmaker.decode import Decode, decode_threads, lowres_level, plan_decode
+from jifmaker.engine import ConversionOptions, MediaInfo, build_plan, convert
+
+
+def source(codec="mpeg4", width=3840, height=2160):
+    return MediaInfo("in.mp4", width=width, height=height, duration=30.0, fps=30.0, codec=codec, has_video=True)
+
+
+def test_default_decode_is_unchanged():
+    """Test that without fast decode the commands set no decoder options and scale with lanczos"""
+    assert plan_decode(ConversionOptions(width=320, frame_skip=2), source()) == Decode()
+    plan = build_plan("in.mp4", "out.gif", ConversionOptions(width=320), "/tmp/work", source())
+    assert "-threads" not in plan.stages[0].args and "flags=lanczos" in " ".join(plan.stages[0].args)
+
+
+def test_lowres_level():
+    """Test that the level keeps the decoded frames at least output sized and only applies to codecs that have it"""
+    assert lowres_level(ConversionOptions(width=320), source()) == 3
+    assert lowres_level(ConversionOptions(width=800), source()) == 2
+    assert lowres_level(ConversionOptions(width=800, height=600), source()) == 1
+    assert lowres_level(ConversionOptions(width=3000), source()) == 0
+    assert lowres_level(ConversionOptions(width=320), source("h264")) == 0
+    assert lowres_level(ConversionOptions(width=320, left=4), source()) == 2  # 4 px do not divide into eighths
+    assert lowres_level(ConversionOptions(width=320), None) == 0
+
+
+def test_plan_decode(monkeypatch):
+    """Test the threads, frame skipping and scaler of a fast decode"""
+    monkeypatch.setattr(decode.os, "cpu_count", lambda: 8)
+    assert decode_threads() == 8 and decode_threads(3) == 2 and decode_threads(16) == 1
+
+    fast = plan_decode(ConversionOptions(width=320, fast_decode=True, frame_skip=2, chunks=4), source("h264"))
+    assert fast == Decode(threads=2, skip_nonref=True, scaler="area")
+    assert fast.input_args() == ["-threads", "2", "-skip_frame", "noref"]
+
+    # 3840 / 8 = 480 decoded pixels per 320 output ones is close enough for lanczos
+    reduced = plan_decode(ConversionOptions(width=320, fast_decode=True), source())
+    assert (reduced.lowres, reduced.scaler) == (3, "lanczos")
+    assert plan_decode(ConversionOptions(width=320, fast_decode=True)).scaler == "lanczos"  # Unknown source size
+
+
+def test_fast_decode_plan():
+    """Test that every pass decodes alike and that crop margins shrink with the decoded frames"""
+    options = ConversionOptions(width=320, fast_decode=True, top=16, left=8, right=8)
+    plan = build_plan("in.mp4", "out.gif", options, "/tmp/work", source())
+    for stage in plan.stages:
+        assert stage.args[stage.args.index("-lowres") + 1] == "3"
+        assert stage.args.index("-lowres") < stage.args.index("-i")
+        assert "crop=iw-2:ih-2:1:2" in " ".join(stage.args)
+
+    chunked = build_chunked_plan("in.mp4", "out.gif", ConversionOptions(chunks=3, fast_decode=True), source(), "/tmp")
+    assert all(stage.args[stage.args.index("-threads") + 1] == str(decode_threads(3)) for stage in chunked.stages)
+
+
+@pytest.mark.ffmpeg
+def test_fast_decode_convert(tmp_path, make_clip):
+    """Test that a reduced-size decode of a cropped input writes a GIF of the requested width"""
+    clip = make_clip(tmp_path / "clip.avi", size="640x480", args=("-c:v", "mpeg4"))
+    output = tmp_path / "out.gif"
+    options = ConversionOptions(width=160, fps=10, fast_decode=True, top=8, bottom=8)
+    logs = []
+    convert(clip, str(output), options, logs.append, source("mpeg4", 640, 480))
+
+    assert any("1/4 size" in line for line in logs)
+    with open(output, "rb") as gif:
+        assert int.from_bytes(gif.read(8)[6:8], "little") == 160
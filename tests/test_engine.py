@@ -0,0 +1,93 @@
+import sys
+import subprocess
+
+import pytest
+
+from jifmaker.engine import (ConversionOptions, build_filters, build_plan, convert, format_time, frame_report,
+                             parse_frame_rate, parse_probe_output, time_to_seconds)
+
+
+def test_engine_does_not_import_qt():
+    """Test that scripted use of the engine never pulls in PyQt5"""
+    code = "import sys, jifmaker.engine, jifmaker.batch; print('PyQt5' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_time_helpers():
+    """Test the HH:MM:SS conversions"""
+    assert time_to_seconds("01:02:03") == 3723
+    assert time_to_seconds("02:03") == 123
+    assert time_to_seconds("7") == 7
+    assert time_to_seconds("") == 0
+    assert time_to_seconds("bad") == 0
+    assert format_time(3723.9) == "01:02:03"
+
+
+def test_parse_probe_output():
+    """Test that ffprobe JSON is turned into MediaInfo"""
+    info = parse_probe_output("clip.mp4", {
+        "streams": [{"codec_type": "audio"},
+                    {"codec_type": "video", "width": 640, "height": 360, "avg_frame_rate": "30000/1001",
+                     "codec_name": "h264"}],
+        "format": {"duration": "12.5"},
+    })
+    assert (info.width, info.height, info.duration, info.codec) == (640, 360, 12.5, "h264")
+    assert info.fps == pytest.approx(29.97, abs=0.01)
+    assert parse_frame_rate("0/0") == 0
+    assert parse_probe_output("song.mp3", {"streams": [{"codec_type": "audio"}]}).has_video is False
+
+
+def test_build_plan_two_pass():
+    """Test the palette and encode stages of the default plan"""
+    options = ConversionOptions(start_time="00:00:05", end_time="00:00:15", top=10, left=4, gifsicle=True)
+    plan = build_plan("in.mp4", "out.gif", options, "/tmp/work")
+
+    assert [stage.name for stage in plan.stages] == ["palette", "encode", "gifsicle"]
+    palette, encode, gifsicle = (stage.args for stage in plan.stages)
+    assert palette[-1] == encode[encode.index("-i", encode.index("-i") + 1) + 1]
+    assert encode[encode.index("-ss") + 1] == "00:00:05"
+    assert encode[encode.index("-t") + 1] == "10"
+    assert encode.index("-t") < encode.index("-i")  # An input option of the video, not of the palette
+    assert "crop=iw-4:ih-10:4:10" in encode[encode.index("-filter_complex") + 1]
+    assert gifsicle == ["gifsicle", "-O3", "out.gif", "-o", "out.gif"]
+    assert " && " in plan.command_line()
+
+
+@pytest.mark.ffmpeg
+def test_convert(tmp_path, make_clip):
+    """Test an end-to-end conversion through the engine"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source)
+
+    messages = []
+    result = convert(str(source), str(tmp_path / "clip.gif"), ConversionOptions(width=80), log=messages.append)
+    assert result.size > 0
+    assert (tmp_path / "clip.gif").read_bytes()[:6] == b"GIF89a"
+    assert len(messages) == 2
+    assert not any(p.name.startswith(".") for p in tmp_path.iterdir())
+
+
+def test_min_frame_difference_filter():
+    """Test that Min Frame Difference adds mpdecimate after scaling and 0% keeps every frame"""
+    filters = build_filters(ConversionOptions(frame_diff=25))
+    assert filters[-1] == "mpdecimate=hi=768:lo=320:frac=0.25"
+    assert not any("mpdecimate" in f for f in build_filters(ConversionOptions(frame_diff=0)))
+
+
+@pytest.mark.ffmpeg
+def test_duplicate_frames_are_merged(tmp_path, make_clip):
+    """Test that a frozen stretch becomes one long frame and the report counts the merged frames"""
+    source = tmp_path / "frozen.mp4"
+    # One second of motion, three seconds frozen on frame 5, then the remaining motion
+    make_clip(source, duration=None, filters="trim=0:1,loop=loop=30:size=1:start=5,setpts=N/10/TB")
+
+    kept = convert(str(source), str(tmp_path / "kept.gif"), ConversionOptions(width=160, fps=10, frame_diff=0))
+    merged = convert(str(source), str(tmp_path / "merged.gif"), ConversionOptions(width=160, fps=10, frame_diff=10))
+    assert merged.size < kept.size
+
+    report = frame_report(merged.output_file, 10)
+    assert report.expected == 40
+    assert report.removed == 30
+    assert report.saved > 0
+    assert frame_report(kept.output_file, 10).removed == 0
@@ -0,0 +1,83 @@
+
+import pytest
+
+from jifmaker import cache
+from jifmaker.backends import choose_backend
+from jifmaker.cache import PaletteCache
+from jifmaker.engine import ConversionOptions, MediaInfo, convert
+from jifmaker.estimate import EstimateCache, SizeEstimate, estimate_output_size, extrapolate, sample_windows
+
+
+def test_sample_windows():
+    """Test that samples are spread over the trim range and short ranges are encoded whole"""
+    assert sample_windows(0, 60) == [(9, 2), (29, 2), (49, 2)]
+    assert sample_windows(10, 30) == [(14, 2), (24, 2), (34, 2)]
+    assert sample_windows(0, 8) == [(0, 8)]
+    assert all(start + length <= 100 for start, length in sample_windows(40, 60, samples=5))
+
+
+def test_extrapolate():
+    """Test that the first frame of a window is counted once and the rest scale with the duration"""
+    assert extrapolate(100, [1000, 10, 10, 10], 1, 1) == 1130
+    assert extrapolate(100, [1000, 10, 10, 10], 1, 10) == 100 + 1000 + 10 * 39
+
+
+def test_describe():
+    """Test the size label text"""
+    assert SizeEstimate(2048, 2048, 2048, 1, 4, 0.1, exact=True).describe() == "2.0 KB"
+    assert SizeEstimate(2048, 1024, 3072, 3, 6, 0.1).describe() == "2.0 KB (1.0 KB - 3.0 KB)"
+
+
+@pytest.mark.ffmpeg
+def test_estimate_output_size(tmp_path, make_clip):
+    """Test that sampled estimates bracket the real size, are cached and are exact for short clips"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=20, size="320x240", rate=25)
+    info = MediaInfo(str(source), width=320, height=240, duration=20.0, fps=25.0, has_video=True)
+    options = ConversionOptions(width=160, fps=10)
+    cache = EstimateCache()
+
+    estimate = estimate_output_size(str(source), options, info, cache=cache)
+    backend = choose_backend(str(source), options, info)
+    actual = backend.convert(str(source), str(tmp_path / "clip.gif"), options, info).size
+    assert estimate.samples == 3 and not estimate.exact
+    assert estimate.low <= actual <= estimate.high
+    assert estimate_output_size(str(source), options, info, cache=cache) is estimate
+    assert len(cache) == 1
+
+    trimmed = ConversionOptions(width=160, fps=10, start_time="00:00:02", end_time="00:00:05")
+    exact = estimate_output_size(str(source), trimmed, info, cache=cache)
+    assert exact.exact
+    backend = choose_backend(str(source), trimmed, info)
+    assert exact.size == backend.convert(str(source), str(tmp_path / "trimmed.gif"), trimmed, info).size
+
+    assert estimate_output_size(str(source), options, MediaInfo(str(source))) is None
+
+
+@pytest.mark.ffmpeg
+def test_estimate_output_format(tmp_path, make_clip):
+    """Test that the samples are encoded in the format of the output file and cached apart from the GIF estimate"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=4, size="320x240", rate=25)
+    info = MediaInfo(str(source), width=320, height=240, duration=4.0, fps=25.0, has_video=True)
+    options = ConversionOptions(width=160, fps=10, backend="ffmpeg")
+    cache = EstimateCache()
+
+    gif = estimate_output_size(str(source), options, info, cache=cache, output_file=str(tmp_path / "out.gif"))
+    mp4 = estimate_output_size(str(source), options, info, cache=cache, output_file=str(tmp_path / "out.mp4"))
+    assert mp4.exact and mp4.size == convert(str(source), str(tmp_path / "out.mp4"), options).size
+    assert mp4.size != gif.size and len(cache) == 2
+
+
+@pytest.mark.ffmpeg
+def test_estimate_keeps_palette_cache_clean(tmp_path, monkeypatch, make_clip):
+    """Test that the palettes of sample windows are not stored in the palette cache"""
+    (tmp_path / "palettes").mkdir()
+    palettes = PaletteCache(str(tmp_path / "palettes"))
+    monkeypatch.setattr(cache, "_palette_cache", palettes)
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=20, size="320x240", rate=25)
+    info = MediaInfo(str(source), width=320, height=240, duration=20.0, fps=25.0, has_video=True)
+    estimate_output_size(str(source), ConversionOptions(width=160, fps=10, backend="ffmpeg"), info,
+                         cache=EstimateCache())
+    assert len(palettes) == 0
@@ -0,0 +1,112 @@
+import argparse
+
+import pytest
+from PIL import Image
+
+from jifmaker import compare
+from jifmaker.backends import choose_backend
+from jifmaker.batch import add_arguments, options_from_args
+from jifmaker.compare import FormatResult, compare_formats, format_report
+from jifmaker.engine import ConversionOptions, MediaInfo, build_plan, convert, default_output_path
+from jifmaker.formats import crf, file_filter, output_format
+from jifmaker.worker import conversion_worker
+
+
+def test_output_format():
+    """Test that the extension picks the format and unknown extensions stay GIF"""
+    assert output_format("out.WEBP").name == "webp"
+    assert output_format("out.png").name == "apng" and output_format("out.apng").name == "apng"
+    assert output_format("out.m4v").name == "mp4"
+    assert output_format("out.gif").is_gif and output_format("out").is_gif
+    assert file_filter().startswith("GIF Files (*.gif);;WebP Files (*.webp)")
+    assert default_output_path("in.mov", extension=".webm") == "in_processed.webm"
+
+
+def test_crf():
+    """Test that quality maps onto the CRF range, 100 is the best CRF and out of range values are clamped"""
+    assert crf("mp4", 100) == 18 and crf("mp4", 0) == 38 and crf("mp4", 75) == 23
+    assert crf("webm", 150) == 15
+
+
+def test_format_plans():
+    """Test that other formats are encoded in one stage with their encoder and without GIF post-processing"""
+    options = ConversionOptions(width=320, quality=60, loop=False, gifsicle=True, optimize_frames=True)
+    webp = build_plan("in.mp4", "out.webp", options, "/tmp/work")
+    assert [stage.name for stage in webp.stages] == ["encode"]
+    args = webp.stages[0].args
+    assert args[args.index("-c:v") + 1] == "libwebp_anim" and args[args.index("-vsync") + 1] == "passthrough"
+    assert args[args.index("-quality") + 1] == "60" and args[args.index("-loop") + 1] == "1"
+    assert "palettegen" not in " ".join(args) and args[-1] == "out.webp"
+
+    lossless = build_plan("in.mp4", "out.webp", ConversionOptions(lossless=True), "/tmp").stages[0].args
+    assert lossless[lossless.index("-lossless") + 1] == "1" and "bgra" in lossless
+
+    apng = build_plan("in.mp4", "out.png", ConversionOptions(), "/tmp").stages[0].args
+    assert apng[apng.index("-f") + 1] == "apng" and apng[apng.index("-plays") + 1] == "0"
+
+    for name, codec in (("out.mp4", "libx264"), ("out.webm", "libvpx-vp9")):
+        args = build_plan("in.mp4", name, ConversionOptions(), "/tmp").stages[0].args
+        assert args[args.index("-c:v") + 1] == codec and "-an" in args
+        assert "crop=trunc(iw/2)*2:trunc(ih/2)*2" in args[args.index("-vf") + 1]
+
+
+def test_other_formats_skip_gif_backends(tmp_path):
+    """Test that the in-process encoder and chunking are only used for GIF outputs"""
+    gif = tmp_path / "in.gif"
+    Image.new("RGB", (8, 8)).save(gif)
+    assert choose_backend(str(gif), ConversionOptions(), output_file="out.gif").name == "pillow"
+    assert choose_backend(str(gif), ConversionOptions(backend="pillow"), output_file="out.mp4").name == "ffmpeg"
+
+    info = MediaInfo("in.mp4", width=640, height=360, duration=30.0, fps=30.0, has_video=True)
+    worker = conversion_worker("in.mp4", str(tmp_path / "out.webm"), ConversionOptions(chunks=4, backend="ffmpeg"),
+                               info, str(tmp_path))
+    assert [stage.name for stage in worker.plan.stages] == ["encode"]
+
+
+def test_batch_format():
+    """Test that the output format options reach ConversionOptions"""
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args(["in.mp4", "--format", "webp", "--quality", "90", "--lossless", "--webp-method", "6"])
+    options = options_from_args(args)
+    assert (options.quality, options.lossless, options.webp_method) == (90, True, 6)
+
+
+@pytest.mark.ffmpeg
+@pytest.mark.parametrize("extension", [".webp", ".png", ".mp4", ".webm"])
+def test_convert_formats(tmp_path, extension, make_clip):
+    """Test that every format converts and that the animated images keep their frames"""
+    clip = make_clip(tmp_path / "clip.mp4")
+    output = tmp_path / f"out{extension}"
+    result = convert(clip, str(output), ConversionOptions(width=81, fps=10, frame_diff=0))
+    assert result.size == output.stat().st_size > 0
+    if extension in (".webp", ".png"):
+        with Image.open(output) as image:
+            assert image.width == 81 and getattr(image, "n_frames", 1) == 10
+
+
+@pytest.mark.ffmpeg
+def test_compare_formats(tmp_path, make_clip):
+    """Test that the comparison converts to each format and reports them against GIF"""
+    clip = make_clip(tmp_path / "clip.mp4")
+    results = compare_formats(clip, ConversionOptions(width=80, fps=10, backend="ffmpeg"), ["gif", "webp"],
+                              str(tmp_path))
+    assert [result.name for result in results] == ["gif", "webp"]
+    assert all(result.size > 0 and not result.error for result in results)
+
+    report = format_report(results + [FormatResult("mp4", error="Unknown encoder 'libx264'")])
+    assert "WebP" in report and "size," in report and "failed: Unknown encoder" in report
+
+
+def test_compare_formats_records_errors(tmp_path, monkeypatch):
+    """Test that a format whose encoder raises gets its error while the other formats are still compared"""
+    class Backend:
+        def convert(self, input_file, output_file, options, info=None):
+            if output_file.endswith(".webp"):
+                raise ValueError("Pillow cannot write WebP")
+            raise FileNotFoundError(2, "No such file or directory", "ffmpeg")
+
+    monkeypatch.setattr(compare, "backend_for", lambda *args: Backend())
+    results = compare_formats("clip.mp4", ConversionOptions(), ["webp", "gif"], str(tmp_path))
+    assert [result.name for result in results] == ["webp", "gif"]
+    assert results[0].error == "Pillow cannot write WebP" and "ffmpeg" in results[1].error
@@ -0,0 +1,88 @@
+import time
+import threading
+
+import pytest
+
+from jifmaker.frames import FrameCache, FramePrefetcher, FrameSource, fit_size, scrub_step
+
+
+@pytest.fixture
+def clip(tmp_path, make_clip):
+    path = tmp_path / "clip.mp4"
+    make_clip(path, duration=2, size="320x240")
+    return str(path)
+
+
+def test_scrub_step():
+    """Test that the scrubber steps one frame at a time on short clips and coarser on long ones"""
+    assert scrub_step(10, 25) == 0.04
+    assert scrub_step(3600, 25) == 1.8
+
+
+def test_fit_size():
+    """Test that frames are only ever scaled down, keeping the aspect ratio"""
+    assert fit_size(3840, 2160, (960, 720)) == (960, 540)
+    assert fit_size(320, 240, (960, 720)) == (320, 240)
+    assert fit_size(640, 480) == (640, 480)
+
+
+@pytest.mark.ffmpeg
+def test_frame_at_reuses_buffer(clip):
+    """Test that seeking decodes different frames into the same buffer"""
+    source = FrameSource(clip, 320, 240)
+    first = bytes(source.frame_at(0.0))
+    buffer = source.frame_at(1.5)
+    assert buffer is source.buffer
+    assert len(buffer) == 320 * 240 * 3
+    assert bytes(buffer) != first
+    assert source.frame_at(10.0) is None
+
+
+@pytest.mark.ffmpeg
+def test_downscaled_frames(clip):
+    """Test decoding at a reduced size"""
+    source = FrameSource(clip, 320, 240, max_size=(160, 160))
+    assert (source.width, source.height) == (160, 120)
+    assert source.scale == 0.5
+    assert len(source.frame_at(0.5)) == 160 * 120 * 3
+
+
+@pytest.mark.ffmpeg
+def test_iter_frames(clip):
+    """Test reading consecutive frames from one process"""
+    source = FrameSource(clip, 320, 240)
+    timestamps = [timestamp for timestamp, _ in source.iter_frames(start=0.5, duration=1.0, fps=4)]
+    assert timestamps == [0.5, 0.75, 1.0, 1.25]
+
+
+def test_frame_cache_lru():
+    """Test that the cache evicts the least recently used frames beyond its byte cap"""
+    cache = FrameCache(max_bytes=30)
+    for key in range(3):
+        cache.put(key, bytes(10))
+    assert cache.get(0) is not None  # 0 is now more recent than 1
+    cache.put(3, bytes(10))
+
+    assert cache.nbytes == 30
+    assert 1 not in cache
+    assert all(key in cache for key in (0, 2, 3))
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+@pytest.mark.ffmpeg
+def test_prefetcher_fills_neighbours(clip):
+    """Test that a request decodes the frame under the cursor and the frames ahead of it"""
+    cache = FrameCache(max_bytes=64 * 1024 * 1024)
+    decoded = threading.Event()
+    prefetcher = FramePrefetcher(FrameSource(clip, 320, 240, max_size=(160, 120)), cache, step=0.1,
+                                 on_frame=lambda index, frame: decoded.set(), ahead=5, behind=2)
+    try:
+        prefetcher.request(5)
+        assert decoded.wait(10)
+        deadline = time.monotonic() + 10
+        while not all(index in cache for index in range(3, 11)) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert all(index in cache for index in range(3, 11))
+        assert len(cache.get(10)) == 160 * 120 * 3
+    finally:
+        prefetcher.close()
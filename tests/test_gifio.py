@@ -0,0 +1,66 @@
+import subprocess
+
+import pytest
+
+from jifmaker.gifio import concat_gifs, frame_sizes, parse_gif, read_gif
+
+
+def test_parse_rejects_other_files():
+    """Test that data without a GIF signature is rejected"""
+    with pytest.raises(ValueError):
+        parse_gif(b"\x89PNG\r\n\x1a\n" + bytes(32))
+
+
+
+def test_parse_rejects_truncated_files():
+    """Test that a GIF cut off anywhere raises ValueError instead of reading past the end"""
+    data = (b"GIF89a\x01\x00\x01\x00\x80\x00\x00" + bytes(6)  # Header with a two color global table
+            + b"\x21\xf9\x04\x00\x0a\x00\x00\x00"  # Graphic control extension
+            + b"\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02\x44\x01\x00"  # One 1x1 frame
+            + b"\x3b")
+    assert len(parse_gif(data).frames) == 1
+
+    for end in range(6, len(data)):
+        try:
+            parse_gif(data[:end])
+        except ValueError:
+            pass
+    with pytest.raises(ValueError, match="Truncated GIF"):
+        parse_gif(data[:32])
+
+@pytest.mark.ffmpeg
+def test_read_gif(tmp_path, make_clip):
+    """Test that every frame of an FFmpeg GIF is found and the blocks add up to the file size"""
+    path = tmp_path / "clip.gif"
+    make_clip(path, size="64x48", args=("-loop", "0"))
+    gif = read_gif(str(path))
+
+    assert (gif.width, gif.height) == (64, 48)
+    assert len(gif.frames) == 10
+    assert any(b"NETSCAPE2.0" in extension for extension in gif.extensions)
+    size = len(gif.header) + sum(map(len, gif.extensions)) + sum(frame_sizes(str(path))) + 1
+    assert size == path.stat().st_size
+
+
+@pytest.mark.ffmpeg
+def test_concat_gifs(tmp_path, make_clip):
+    """Test that joined GIFs keep every frame, stretch short parts and get local palettes when theirs differ"""
+    paths = []
+    for index, source in enumerate(["testsrc2", "mandelbrot"]):
+        path = tmp_path / f"part{index}.gif"
+        # Each part gets its own optimized palette
+        # The palette is only written at the end of the input, so the input itself has to end
+        make_clip(path, source, duration=None, size="64x48", filters="trim=duration=1",
+                  args=("-vf", "split[a][b];[a]palettegen[p];[b][p]paletteuse", "-loop", "0"))
+        paths.append(str(path))
+
+    output = tmp_path / "joined.gif"
+    assert concat_gifs(paths, str(output), durations=[100, 300]) == 20
+    joined = read_gif(str(output))
+    assert sum(frame.delay for frame in joined.frames) == 400
+    assert all(frame.image[9] & 0x80 for frame in joined.frames[10:])
+
+    # FFmpeg decodes the result without complaint
+    result = subprocess.run(["ffmpeg", "-v", "error", "-i", str(output), "-f", "null", "-"], capture_output=True,
+                            text=True)
+    assert result.returncode == 0 and not result.stderr
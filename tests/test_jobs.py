@@ -0,0 +1,67 @@
+
+import pytest
+
+from jifmaker.engine import ConversionOptions, MediaInfo
+from jifmaker.jobs import CANCELLED, DONE, PAUSED, QUEUED, RUNNING, JobQueue
+from jifmaker.worker import QueueRunner
+
+
+def test_job_queue_order():
+    """Test that jobs run in queue order, paused jobs are skipped and moving is clamped to the queue"""
+    queue = JobQueue()
+    first, second, third = (queue.add(f"{name}.mp4", f"{name}.gif", ConversionOptions()) for name in "abc")
+    assert queue.next_job() is first
+
+    assert queue.pause(first.id) and first.status == PAUSED
+    assert queue.next_job() is second
+    assert queue.move(third.id, -5) == 0
+    assert queue.next_job() is third
+    assert queue.resume(first.id) and queue.next_job() is third
+    assert [job.id for job in queue.jobs] == [third.id, first.id, second.id]
+
+
+def test_job_queue_cancel_and_clear():
+    """Test that waiting jobs are cancelled at once, running ones are left to their worker"""
+    queue = JobQueue()
+    waiting = queue.add("a.mp4", "a.gif", ConversionOptions())
+    running = queue.add("b.mp4", "b.gif", ConversionOptions())
+    queue.start(running)
+    assert queue.cancel(waiting.id) is False and waiting.status == CANCELLED
+    assert queue.cancel(running.id) is True and running.status == RUNNING
+    assert not queue.pause(running.id)
+
+    queue.finish(running, DONE, size=2048)
+    assert running.describe().startswith("Done, 2.0 KB")
+    assert queue.clear_finished() == 2 and len(queue) == 0
+
+
+@pytest.mark.ffmpeg
+@pytest.mark.parametrize("backend", ["ffmpeg", "pillow"])
+def test_queue_runner(qtbot, tmp_path, backend, make_clip):
+    """Test that queued jobs run at most max_jobs at a time with their own settings and all finish"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source)
+    info = MediaInfo(str(source), width=160, height=120, duration=1.0, fps=10.0, has_video=True)
+    queue = JobQueue()
+    jobs = [queue.add(str(source), str(tmp_path / f"out{index}.gif"),
+                      ConversionOptions(width=40 * (index + 1), fps=5, backend=backend), info) for index in range(4)]
+    queue.pause(jobs[3].id)
+    runner = QueueRunner(queue, str(tmp_path / "work"), max_jobs=2)
+    running = []
+    runner.job_changed.connect(lambda job_id: running.append(len(queue.running())))
+
+    runner.schedule()
+    qtbot.waitUntil(lambda: not runner.workers and queue.next_job() is None, timeout=30000)
+
+    assert max(running) == 2
+    assert [job.status for job in jobs] == [DONE, DONE, DONE, PAUSED]
+    assert all(job.size == (tmp_path / f"out{index}.gif").stat().st_size for index, job in enumerate(jobs[:3]))
+    assert not (tmp_path / "out3.gif").exists()
+    assert not runner.workers
+
+    queue.resume(jobs[3].id)
+    runner.set_paused(True)
+    assert jobs[3].status == QUEUED
+    runner.set_paused(False)
+    runner.cancel(jobs[3].id)
+    qtbot.waitUntil(lambda: jobs[3].status == CANCELLED, timeout=30000)
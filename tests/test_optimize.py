@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from jifmaker.engine import ConversionOptions, build_plan
+from jifmaker.gifio import GifReader, read_gif, write_gif
+from jifmaker.optimize import OptimizeReport, PaletteMap, Unoptimizable, changed_box, optimize_gif
+
+
+def decoded(path):
+    """Return the composited RGBA frames of a GIF, repeated per 1/100 s of delay so merged frames compare equal"""
+    frames = []
+    with Image.open(path) as image:
+        for frame in ImageSequence.Iterator(image):
+            frames.extend([np.asarray(frame.convert("RGBA")).tobytes()] * (frame.info.get("duration", 0) // 10))
+    return frames
+
+
+def write_animation(path, frames, duration=100):
+    """Save (H, W, 3) uint8 frames as a GIF with full frames and one shared palette"""
+    images = [Image.fromarray(frame, "RGB").quantize(colors=16, method=Image.Quantize.MEDIANCUT) for frame in frames]
+    palette = images[0]
+    images = [Image.fromarray(frame, "RGB").quantize(palette=palette) for frame in frames]
+    images[0].save(path, "GIF", save_all=True, append_images=images[1:], duration=duration, loop=0, optimize=False,
+                   disposal=1)
+
+
+def test_changed_box():
+    """Test that the changed box covers exactly the differing pixels"""
+    previous = np.zeros((8, 10, 4), dtype=np.uint8)
+    frame = previous.copy()
+    assert changed_box(previous, frame) is None
+    frame[2, 3] = 255
+    frame[5, 7, 0] = 1
+    assert changed_box(previous, frame) == (2, 6, 3, 8)
+
+
+def test_palette_map():
+    """Test exact color lookup, the free duplicate slot for transparency and colors outside the palette"""
+    colors = PaletteMap(bytes([0, 0, 0, 255, 0, 0, 0, 0, 0, 0, 255, 0]))
+    assert colors.transparent == 2  # Repeats index 0, so nothing maps to it
+    pixels = np.array([[[255, 0, 0], [0, 0, 0], [0, 255, 0]]], dtype=np.uint8)
+    assert colors.lookup(pixels).tolist() == [[1, 0, 3]]
+    with pytest.raises(Unoptimizable):
+        colors.lookup(np.array([[[1, 2, 3]]], dtype=np.uint8))
+
+
+def test_reader_matches_read_gif(tmp_path):
+    """Test that streaming the frames gives the same blocks as parsing the whole file"""
+    rng = np.random.default_rng(1)
+    path = tmp_path / "clip.gif"
+    write_animation(str(path), [rng.integers(0, 255, (16, 24, 3), dtype=np.uint8) for _ in range(4)])
+
+    gif = read_gif(str(path))
+    with GifReader(str(path)) as reader:
+        assert reader.header == gif.header
+        assert reader.extensions == gif.extensions
+        assert list(reader) == gif.frames
+
+
+def test_optimize_gif(tmp_path):
+    """Test that a moving square is cropped to its path, identical frames merged and the animation unchanged"""
+    frames = []
+    for index in range(6):
+        frame = np.full((60, 80, 3), 40, dtype=np.uint8)
+        frame[10:20, 5 + 5 * index:15 + 5 * index] = (250, 200, 0)
+        frames.append(frame)
+    source, output = tmp_path / "in.gif", tmp_path / "out.gif"
+    write_animation(str(source), frames)
+    # Pillow merges identical frames when saving, repeat the last block to get some
+    gif = read_gif(str(source))
+    write_gif(str(source), gif.header, gif.extensions, gif.frames + gif.frames[-1:] * 2)
+
+    report = optimize_gif(str(source), str(output))
+
+    assert report.optimized and report.after < report.before
+    assert (report.frames_in, report.frames_out) == (8, 6)
+    assert output.stat().st_size == report.after
+    assert decoded(str(output)) == decoded(str(source))
+    assert max(frame.image[7] | frame.image[8] << 8 for frame in read_gif(str(output)).frames[1:]) <= 10
+
+
+def test_optimize_keeps_original(tmp_path):
+    """Test that a GIF the optimizer cannot shrink is copied unchanged with the reason in the report"""
+    source, output = tmp_path / "in.gif", tmp_path / "out.gif"
+    write_animation(str(source), [np.full((8, 8, 3), 90, dtype=np.uint8)])
+
+    report = optimize_gif(str(source), str(output))
+
+    assert not report.optimized
+    assert output.read_bytes() == source.read_bytes()
+    assert "kept the original" in report.describe()
+    assert OptimizeReport(1000, 750, 10, 8, 0.5).describe().startswith("Frame optimization: ")
+
+
+
+def test_optimize_removes_temp_file(tmp_path):
+    """Test that a GIF which fails to read leaves no temporary file next to the output"""
+    frames = [np.full((8, 8, 3), 30 * index, dtype=np.uint8) for index in range(4)]
+    source, output = tmp_path / "in.gif", tmp_path / "out.gif"
+    write_animation(str(source), frames)
+    source.write_bytes(source.read_bytes()[:-5])
+
+    with pytest.raises(ValueError):
+        optimize_gif(str(source), str(output))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["in.gif"]
+
+def test_optimize_stage():
+    """Test that the optimizer runs after the encode and before gifsicle"""
+    options = ConversionOptions(optimize_frames=True, gifsicle=True)
+    plan = build_plan("in.mp4", "out.gif", options, "/tmp")
+    assert [stage.name for stage in plan.stages] == ["palette", "encode", "optimize", "gifsicle"]
+    assert plan.stages[2].args[-2:] == ["jifmaker.optimize", "out.gif"]
+
+
+@pytest.mark.ffmpeg
+def test_optimize_ffmpeg_output(tmp_path, make_clip):
+    """Test that an FFmpeg GIF decodes to the same frames after optimization whether or not it got smaller"""
+    path = tmp_path / "clip.gif"
+    make_clip(path, duration=2, size="96x64", args=("-loop", "0"))
+    before = decoded(str(path))
+
+    report = optimize_gif(str(path))
+
+    assert path.stat().st_size == report.after <= report.before
+    assert decoded(str(path)) == before
@@ -0,0 +1,156 @@
+import numpy as np
+import pytest
+
+from jifmaker import engine
+from jifmaker.cache import PaletteCache
+from jifmaker.chunked import build_chunked_plan
+from jifmaker.engine import (ConversionOptions, MediaInfo, build_plan, convert, palette_key, palette_sample_count,
+                             sampled_palette_args)
+from jifmaker.palette import build_shared_palette, compare_palettes, sample_input
+from jifmaker.quantize import load_palette, palette_error, save_palette
+
+
+@pytest.fixture
+def palette_cache(tmp_path, monkeypatch):
+    directory = tmp_path / "palettes"
+    directory.mkdir()
+    cache = PaletteCache(str(directory))
+    monkeypatch.setattr(engine, "get_palette_cache", lambda: cache)
+    return cache
+
+
+def test_palette_key_ignores_encode_settings(tmp_path):
+    """Test that fps, dither and loop share a palette while colors, crop and trim do not"""
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"abc")
+    key = palette_key(str(clip), ConversionOptions())
+
+    assert palette_key(str(clip), ConversionOptions(fps=24, dither="bayer", loop=False)) == key
+    assert palette_key(str(clip), ConversionOptions(start_time="00:00:00")) == key
+    assert palette_key(str(clip), ConversionOptions(colors=64)) != key
+    assert palette_key(str(clip), ConversionOptions(top=8)) != key
+    assert palette_key(str(clip), ConversionOptions(end_time="00:00:05")) != key
+    assert palette_key(str(clip), ConversionOptions(sampled_palette=True)) != key
+    assert palette_key(str(tmp_path / "missing.mp4"), ConversionOptions()) is None
+
+
+def test_cached_palette_skips_palette_stage(tmp_path, palette_cache):
+    """Test that a plan for the same frames reuses the cached palette instead of generating it"""
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"abc")
+    plan = build_plan(str(clip), "out.gif", ConversionOptions(), str(tmp_path))
+    assert [stage.name for stage in plan.stages] == ["palette", "encode"]
+    assert plan.palette_key
+
+    save_palette(np.array([[0, 0, 0], [255, 255, 255]]), plan.palette_path)
+    engine.remember_palette(plan, plan.stages[0])
+    replan = build_plan(str(clip), "out.gif", ConversionOptions(fps=24, single_pass=True), str(tmp_path))
+    assert [stage.name for stage in replan.stages] == ["encode"]
+    assert replan.palette_path == palette_cache.path(plan.palette_key)
+    assert replan.palette_path in replan.stages[0].args
+
+    uncached = build_plan(str(clip), "out.gif", ConversionOptions(reuse_palette=False), str(tmp_path))
+    assert [stage.name for stage in uncached.stages] == ["palette", "encode"]
+
+
+def test_chunked_plan_uses_palette_file():
+    """Test that every chunk is mapped onto a given shared palette without a palette pass"""
+    info = MediaInfo("in.mp4", width=640, height=360, duration=30.0, fps=30.0, has_video=True)
+    options = ConversionOptions(chunks=3, palette_file="/tmp/shared.png")
+    plan = build_chunked_plan("in.mp4", "out.gif", options, info, "/tmp/work")
+
+    assert [stage.name for stage in plan.stages] == ["chunk", "chunk", "chunk"]
+    assert all("/tmp/shared.png" in stage.args for stage in plan.stages)
+
+
+def test_save_and_load_palette(tmp_path):
+    """Test that a saved palette reads back in order, without the padding and the transparent entry"""
+    palette = np.array([[10, 20, 30], [200, 100, 0], [0, 0, 0]], dtype=np.uint8)
+    path = str(tmp_path / "palette.png")
+    save_palette(palette, path)
+
+    assert np.array_equal(load_palette(path), palette)
+    assert np.array_equal(load_palette(path, colors=2), palette[:2])
+
+
+@pytest.mark.ffmpeg
+def test_convert_reuses_palette(tmp_path, palette_cache, make_clip):
+    """Test that a second conversion at another frame rate skips palettegen and still writes a GIF"""
+    clip = make_clip(tmp_path / "clip.mp4", duration=2)
+    logs = []
+    convert(clip, str(tmp_path / "a.gif"), ConversionOptions(width=80, fps=10), logs.append)
+    assert len(palette_cache) == 1
+
+    logs.clear()
+    result = convert(clip, str(tmp_path / "b.gif"), ConversionOptions(width=80, fps=5, dither="none"), logs.append)
+    assert result.size > 0
+    assert logs[0].startswith("Reusing palette")
+    assert not any("palette generation" in line for line in logs)
+
+
+@pytest.mark.ffmpeg
+def test_shared_palette(tmp_path, make_clip):
+    """Test that one palette is built from every input and that FFmpeg accepts it for paletteuse"""
+    first = make_clip(tmp_path / "first.mp4", "testsrc2", duration=2)
+    second = make_clip(tmp_path / "second.mp4", "smptebars", duration=2)
+    options = ConversionOptions(width=80, colors=32)
+    assert len(sample_input(first, options, samples=1)) == 1
+
+    path = str(tmp_path / "shared.png")
+    palette = build_shared_palette([first, second], options, path)
+    assert 2 <= len(palette) <= 31  # One entry stays free for transparency
+    assert np.array_equal(load_palette(path), palette)
+
+    for clip in (first, second):
+        output = tmp_path / "out.gif"
+        convert(clip, str(output), ConversionOptions(width=80, palette_file=path))
+        assert output.stat().st_size > 0
+
+
+def test_palette_sample_count():
+    """Test that the sample size grows with the duration within its bounds and is 0 for clips too short to sample"""
+    assert palette_sample_count(60, 15) == 30
+    assert palette_sample_count(10, 15) == 8
+    assert palette_sample_count(3600, 15) == 64
+    assert palette_sample_count(1, 10) == 0
+
+
+def test_sampled_palette_plan():
+    """Test that a sampled palette seeks to evenly spaced keyframes of the trim range"""
+    options = ConversionOptions(sampled_palette=True, start_time="00:00:10", end_time="00:01:10", top=4)
+    plan = build_plan("in.mp4", "out.gif", options, "/tmp/work")
+    palette = plan.stages[0]
+    assert palette.description == "sampled palette generation"
+    positions = [float(palette.args[index + 1]) for index, arg in enumerate(palette.args) if arg == "-ss"]
+    assert positions == pytest.approx([11 + 2 * index for index in range(30)])
+    assert palette.args.count("-noaccurate_seek") == 30
+    graph = palette.args[palette.args.index("-filter_complex") + 1]
+    assert "concat=n=30" in graph and "stats_mode=full" in graph and "crop=" in graph
+    assert plan.stages[1].args.count("-i") == 2  # The encode pass is unchanged
+
+    # Without an end time or probed duration only the keyframes are decoded, short clips are scanned in full
+    assert "nokey" in build_plan("in.mp4", "out.gif", ConversionOptions(sampled_palette=True), "/tmp").stages[0].args
+    info = MediaInfo("in.mp4", width=640, height=360, duration=1.0, fps=30.0, has_video=True)
+    assert sampled_palette_args("in.mp4", ConversionOptions(), 0, info.duration, "palettegen", "p.png") is None
+
+
+def test_palette_error():
+    """Test that frames made of palette colors have no error and others the distance to the nearest color"""
+    palette = np.array([[0, 0, 0], [255, 255, 255]], dtype=np.uint8)
+    exact = np.zeros((4, 4, 3), dtype=np.uint8)
+    exact[:2] = 255
+    assert palette_error([exact], palette) == 0
+    assert palette_error([np.full((4, 4, 3), 3, dtype=np.uint8)], palette) == pytest.approx(3 * 3 ** 0.5)
+
+
+@pytest.mark.ffmpeg
+def test_compare_palettes(tmp_path, make_clip):
+    """Test that the quality check generates both palettes and measures them on the same frames"""
+    clip = make_clip(tmp_path / "clip.mp4", duration=6)
+    info = MediaInfo(clip, width=160, height=120, duration=6.0, fps=10.0, has_video=True)
+    comparison = compare_palettes(clip, ConversionOptions(width=80, fps=10), info, str(tmp_path))
+
+    assert comparison.samples == 8
+    assert comparison.full_time > 0 and comparison.sampled_time > 0
+    assert 0 < comparison.full_error < 50 and 0 < comparison.sampled_error < 50
+    assert "8 frames" in comparison.describe()
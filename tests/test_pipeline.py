@@ -0,0 +1,165 @@
+import time
+import itertools
+import subprocess
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from jifmaker.backends import get_backend
+from jifmaker.chunked import Cancelled
+from jifmaker.engine import ConversionOptions, MediaInfo
+from jifmaker.gifio import read_gif
+from jifmaker.pipeline import (MB, FramePool, PeakTracker, decimate, frame_delays, peak_memory, prefetch, pooled,
+                               quantize, resident_memory, sample_frames, write_gif)
+
+
+def test_frame_delays():
+    """Test that delays in hundredths of a second add up to the duration without drift"""
+    assert list(itertools.islice(frame_delays(30), 3)) == [3, 4, 3]
+    assert sum(itertools.islice(frame_delays(15), 150)) == 1000
+
+
+def test_decimate():
+    """Test that a near-identical frame is merged into the one before it, keeping the total duration"""
+    still = np.zeros((16, 16, 3), dtype=np.uint8)
+    moved = np.full((16, 16, 3), 255, dtype=np.uint8)
+    kept = list(decimate([still, still.copy(), moved], [7, 7, 6], 10))
+    assert [delay for _, delay in kept] == [14, 6]
+    assert kept[1][0] is moved
+    assert [delay for _, delay in decimate([still, still], [5, 5], 0)] == [5, 5]
+
+
+def test_frame_pool_limit():
+    """Test that the pool fits in the memory limit and refuses limits below its minimum"""
+    pool = FramePool.within((480, 640, 3), 64 * MB)
+    assert pool.nbytes <= 64 * MB
+    with pytest.raises(ValueError):
+        FramePool.within((2160, 3840, 3), 64 * MB)
+
+
+def test_peak_tracker():
+    """Test that overlapping jobs do not report each other's peak and a job alone reports its own"""
+    with PeakTracker() as first:
+        with PeakTracker() as second:
+            pass
+        assert first.peak() == 0 and second.peak() == 0
+    with PeakTracker() as alone:
+        np.ones(16 * MB, dtype=np.uint8)
+    if peak_memory():
+        assert alone.peak() >= resident_memory()
+
+
+def test_backpressure():
+    """Test that the decoder runs at most a pool of frames ahead, however far behind the consumer is"""
+    pool = FramePool((4, 4, 3), 3)
+    produced = []
+
+    def source():
+        for index in range(20):
+            produced.append(index)
+            yield np.full((4, 4, 3), index, dtype=np.uint8)
+
+    seen = []
+    for frame in prefetch(pooled(source(), pool), pool=pool):
+        time.sleep(0.005)
+        assert len(produced) - len(seen) <= pool.count + 1  # The one waiting for a buffer is not copied yet
+        seen.append(int(frame[0, 0, 0]))
+        pool.release(frame)
+    assert seen == list(range(20))
+
+    # Stopping early wakes up the decoder, which waits for a buffer nobody will release
+    pool = FramePool((4, 4, 3), 2)
+    frames = prefetch(pooled(itertools.repeat(np.zeros((4, 4, 3), dtype=np.uint8)), pool), pool=pool)
+    next(frames)
+    frames.close()
+    with pytest.raises(Cancelled):
+        pool.acquire()
+
+
+def test_write_gif(tmp_path):
+    """Test that frames are cropped to what changed, identical ones merged and the animation decodes unchanged"""
+    palette = np.array([[0, 0, 0], [255, 0, 0], [0, 255, 0]], dtype=np.uint8)
+    frames = []
+    for index in range(4):
+        indices = np.zeros((20, 30), dtype=np.uint8)
+        indices[5:10, 2 + 4 * min(index, 2):8 + 4 * min(index, 2)] = 1 + (index > 0)
+        frames.append((indices, 10))
+    path = tmp_path / "out.gif"
+
+    assert write_gif(str(path), iter(frames), palette, (30, 20), transparent=len(palette)) == 3
+
+    gif = read_gif(str(path))
+    assert [frame.delay for frame in gif.frames] == [10, 10, 20]
+    assert max(frame.image[7] | frame.image[8] << 8 for frame in gif.frames[1:]) < 30
+    with Image.open(path) as image:
+        shown = [np.asarray(frame.convert("RGB")) for frame in ImageSequence.Iterator(image)]
+    for (indices, _), picture in zip(frames, shown):
+        assert np.array_equal(palette[indices], picture)
+
+
+def test_sample_frames():
+    """Test that samples are spread over the clip at half resolution and every frame goes back to the pool"""
+    pool = FramePool((8, 8, 3), 2)
+    frames = pooled((np.full((8, 8, 3), index, dtype=np.uint8) for index in range(40)), pool)
+    samples = sample_frames((frame for frame in frames), 40, 4, pool)
+    assert [int(sample[0, 0, 0]) for sample in samples] == [0, 10, 20, 30]
+    assert samples[0].shape == (4, 4, 3)
+    assert len(pool._free) == 2
+
+
+def test_quantize_releases():
+    """Test that every frame goes back to the pool once it is mapped"""
+    pool = FramePool((2, 2, 3), 2)
+    frames = [(pool.acquire(), 5), (pool.acquire(), 5)]
+    assert [delay for _, delay in quantize(iter(frames), lambda frame: frame[..., 0], pool)] == [5, 5]
+    assert len(pool._free) == 2
+
+
+@pytest.mark.ffmpeg
+def test_streamed_matches_buffered(tmp_path, make_clip):
+    """Test that a clip over the memory limit is streamed to the same GIF as one held in memory, reporting the peak"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=3, size="640x480")
+    info = MediaInfo(str(source), width=640, height=480, duration=3.0, fps=10.0, has_video=True)
+    options = ConversionOptions(width=640, fps=10)
+    backend = get_backend("pillow")
+
+    buffered_log, streamed_log = [], []
+    buffered = backend.convert(str(source), str(tmp_path / "buffered.gif"), options, info, buffered_log.append)
+    limit = resident_memory() // MB + 16  # Room for the pool, not for 30 frames of 900 KB
+    streamed = backend.convert(str(source), str(tmp_path / "streamed.gif"),
+                               ConversionOptions(width=640, fps=10, memory_limit=limit), info, streamed_log.append)
+
+    assert buffered_log[0].startswith("Decoding") and streamed_log[0].startswith("Streaming")
+    with open(buffered.output_file, "rb") as a, open(streamed.output_file, "rb") as b:
+        assert a.read() == b.read()
+    if peak_memory():
+        assert streamed.peak_memory > 0 and any("Peak memory" in line for line in streamed_log)
+
+
+@pytest.mark.ffmpeg
+def test_memory_limit_below_resident(tmp_path, make_clip):
+    """Test that a limit below what the process already uses streams with the fewest buffers instead of failing"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, size="320x180")
+    info = MediaInfo(str(source), width=320, height=180, duration=1.0, fps=10.0, has_video=True)
+    log = []
+    result = get_backend("pillow").convert(str(source), str(tmp_path / "out.gif"),
+                                           ConversionOptions(width=320, fps=10, memory_limit=1), info, log.append)
+    assert "too low" in log[0] and log[1].startswith("Streaming")
+    assert len(read_gif(result.output_file).frames) > 1
+
+
+@pytest.mark.ffmpeg
+@pytest.mark.parametrize("memory_limit", [512, 1])
+def test_decode_failure_raises(tmp_path, memory_limit):
+    """Test that a failed decode fails the conversion, held in memory or streamed, instead of writing a short GIF"""
+    source = tmp_path / "broken.mp4"
+    source.write_bytes(b"not a video")
+    info = MediaInfo(str(source), width=320, height=180, duration=1.0, fps=10.0, has_video=True)
+    options = ConversionOptions(width=320, fps=10, memory_limit=memory_limit)
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        get_backend("pillow").convert(str(source), str(tmp_path / "out.gif"), options, info)
+    assert "broken.mp4" in error.value.stderr
+    assert not (tmp_path / "out.gif").exists()
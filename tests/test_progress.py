@@ -0,0 +1,56 @@
+import pytest
+
+from jifmaker.progress import ProgressTracker, with_progress
+
+
+BLOCK = """frame=30
+fps=15.00
+out_time_us=2000000
+out_time=00:00:02.000000
+speed=1.5x
+progress={}
+"""
+
+
+def feed(tracker, text):
+    updates = [tracker.feed(line) for line in text.splitlines()]
+    return [update for update in updates if update is not None]
+
+
+def test_with_progress():
+    """Test that progress flags are only added to FFmpeg commands"""
+    assert with_progress(["ffmpeg", "-y", "-i", "in.mp4"]) == ["ffmpeg", "-progress", "pipe:1", "-nostats",
+                                                                "-y", "-i", "in.mp4"]
+    assert with_progress(["gifsicle", "-O3"]) == ["gifsicle", "-O3"]
+
+
+def test_progress_blocks():
+    """Test that every complete block yields one update with a fraction and an ETA"""
+    tracker = ProgressTracker(total_frames=60)
+    (update,) = feed(tracker, BLOCK.format("continue"))
+    assert update.frame == 30
+    assert update.fraction == 0.5
+    assert update.eta == 2.0
+    assert not update.done
+    assert "50%" in update.describe() and "ETA 00:02" in update.describe()
+
+    (update,) = feed(tracker, BLOCK.format("end"))
+    assert update.done and update.fraction == 1.0
+
+
+def test_progress_without_total():
+    """Test that an unknown frame count still reports frames and speed"""
+    tracker = ProgressTracker()
+    (update,) = feed(tracker, "frame=5\nfps=N/A\nnot a key value line\nprogress=continue\n")
+    assert update.frame == 5
+    assert update.fraction is None and update.eta is None
+
+
+def test_progress_follows_timestamps():
+    """Test that dropped duplicate frames do not hold the progress back when fps is known"""
+    tracker = ProgressTracker(total_frames=60, fps=15)
+    (update,) = feed(tracker, BLOCK.replace("frame=30", "frame=10").format("continue"))
+    assert update.frame == 10
+    assert update.fraction == 0.5
+    # 15 written frames per second cover 45 frames of the timeline, 30 are left
+    assert update.eta == pytest.approx(30 / 45)
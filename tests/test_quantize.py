@@ -0,0 +1,47 @@
+import numpy as np
+
+from jifmaker.quantize import PaletteLUT, build_palette, changed_blocks, is_near_duplicate
+
+
+def test_palette_lut_picks_nearest_color():
+    """Test that the lookup table maps every pixel to the closest palette entry of its cell"""
+    rng = np.random.default_rng(0)
+    palette = rng.integers(0, 256, (64, 3)).astype(np.uint8)
+    lut = PaletteLUT(palette)
+    pixels = rng.integers(0, 256, (1, 500, 3)).astype(np.uint8)
+
+    indices = lut.indices(pixels)[0]
+    centers = (pixels[0].astype(int) >> 3 << 3) + 4
+    best = ((centers[:, None, :] - palette[None].astype(int)) ** 2).sum(axis=2).min(axis=1)
+    assert np.array_equal(((centers - palette[indices].astype(int)) ** 2).sum(axis=1), best)
+
+
+def test_dithered_image_uses_palette():
+    """Test that ordered dithering mixes neighbouring palette colors for an in-between shade"""
+    lut = PaletteLUT(np.array([[0, 0, 0], [255, 255, 255]], dtype=np.uint8))
+    gray = np.full((16, 16, 3), 128, dtype=np.uint8)
+    assert len(np.unique(lut.indices(gray))) == 1
+    image = lut.to_image(gray, "bayer")
+    assert image.mode == "P"
+    assert sorted(np.unique(np.asarray(image))) == [0, 1]
+
+
+def test_build_palette():
+    """Test that the palette holds the colors of the frames and never more than requested"""
+    frames = [np.zeros((8, 8, 3), dtype=np.uint8), np.full((8, 8, 3), 200, dtype=np.uint8)]
+    palette = build_palette(frames, 16)
+    assert len(palette) <= 16
+    assert {tuple(color) for color in palette} >= {(0, 0, 0), (200, 200, 200)}
+
+
+def test_near_duplicates():
+    """Test that small changes count as duplicates and one strongly changed block does not"""
+    frame = np.zeros((32, 32, 3), dtype=np.uint8)
+    noisy = frame.copy()
+    noisy[0, 0] = 30
+    assert changed_blocks(frame, noisy, 320) == (30, 0.0)
+    assert is_near_duplicate(frame, noisy, 0.1, 320, 768)
+
+    changed = frame.copy()
+    changed[:8, :8] = 255
+    assert not is_near_duplicate(frame, changed, 0.5, 320, 768)
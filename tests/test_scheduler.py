@@ -0,0 +1,57 @@
+import sys
+
+import pytest
+from PyQt5.QtWidgets import QApplication
+
+from jifmaker.scheduler import UpdateScheduler
+
+
+@pytest.fixture
+def app(qtbot):
+    test_app = QApplication.instance()
+    if not test_app:
+        test_app = QApplication(sys.argv)
+    return test_app
+
+
+def test_invalidations_coalesce(app, qtbot):
+    """Test that many invalidations within one tick run the task once"""
+    scheduler = UpdateScheduler()
+    state = {"value": 0}
+    calls = []
+    scheduler.register("task", lambda: calls.append(state["value"]), lambda: state["value"])
+
+    for value in range(1, 6):
+        state["value"] = value
+        scheduler.invalidate("task")
+    assert calls == []
+    qtbot.waitUntil(lambda: calls == [5])
+
+
+def test_unchanged_key_is_skipped(app):
+    """Test that a task does not run again when its key did not change"""
+    scheduler = UpdateScheduler()
+    calls = []
+    scheduler.register("task", lambda: calls.append(1), lambda: "same")
+
+    assert scheduler.run("task") is True
+    scheduler.invalidate("task")
+    scheduler.flush()
+    assert calls == [1]
+    assert scheduler.tasks["task"].skips == 1
+    assert scheduler.run("task", force=True) is True
+
+
+def test_debounce(app, qtbot):
+    """Test that a delayed task waits until invalidations stop"""
+    scheduler = UpdateScheduler()
+    state = {"value": 0}
+    calls = []
+    scheduler.register("slow", lambda: calls.append(state["value"]), lambda: state["value"], delay=50)
+
+    for value in range(1, 4):
+        state["value"] = value
+        scheduler.invalidate("slow")
+        qtbot.wait(10)
+    assert calls == []
+    qtbot.waitUntil(lambda: calls == [3], timeout=1000)
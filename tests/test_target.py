@@ -0,0 +1,112 @@
+
+import pytest
+
+from jifmaker.engine import ConversionOptions, MediaInfo
+from jifmaker.estimate import SizeEstimate
+from jifmaker.target import TargetResult, convert_to_size, parse_size, quality_ladder, search_target_size, smaller_rung
+
+
+def fake_estimate(calls):
+    """Estimator whose size is proportional to pixels x fps x bits per color, without encoding anything"""
+    def estimate(input_file, options, info, cancelled=None, output_file=None):
+        calls.append(options)
+        size = options.width * options.width * 9 // 16 * options.fps * options.colors.bit_length() // 100
+        return SizeEstimate(size, size, size, 3, 6, 0.0)
+    return estimate
+
+
+def test_parse_size():
+    """Test the size formats accepted by --target-size"""
+    assert parse_size("8MB") == 8 * 1024 * 1024
+    assert parse_size("500k") == 500 * 1024
+    assert parse_size("2.5M") == int(2.5 * 1024 * 1024)
+    assert parse_size("1234") == 1234
+    for text in ("", "MB", "8 parsecs", "0"):
+        with pytest.raises(ValueError):
+            parse_size(text)
+
+
+def test_quality_ladder():
+    """Test that every rung is one step smaller than the one above it"""
+    ladder = quality_ladder(ConversionOptions(width=800, fps=15, colors=256))
+    assert ladder[0] == ConversionOptions(width=800, fps=15, colors=256)
+    for upper, lower in zip(ladder, ladder[1:]):
+        assert (lower.width <= upper.width and lower.fps <= upper.fps and lower.colors <= upper.colors)
+        assert lower != upper
+    assert ladder[-1].width >= 120 and ladder[-1].fps == 5 and ladder[-1].colors == 32
+
+    # An explicit height shrinks with the width
+    ladder = quality_ladder(ConversionOptions(width=800, height=400))
+    assert all(options.height * 2 == pytest.approx(options.width, rel=0.05) for options in ladder)
+
+
+def test_search_target_size():
+    """Test that the search returns the best rung under budget with a logarithmic number of trials"""
+    info = MediaInfo("in.mp4", width=1280, height=720, duration=60, fps=30, has_video=True)
+    options = ConversionOptions(width=800, fps=15, colors=256)
+    ladder = quality_ladder(options)
+    calls = []
+    estimate = fake_estimate(calls)
+
+    budget = 2_000_000
+    result = search_target_size("in.mp4", options, info, budget, estimate=estimate)
+    sizes = [estimate("in.mp4", rung, info).size for rung in ladder]
+    best = next(index for index, size in enumerate(sizes) if size <= budget)
+    assert result.fits and result.options == ladder[best]
+    assert len(result.trials) <= 2 + len(ladder).bit_length()
+
+    # Settings that already fit are kept after a single trial
+    result = search_target_size("in.mp4", options, info, 10 ** 12, estimate=estimate)
+    assert result.options == options and len(result.trials) == 1
+
+    # Nothing fits, the smallest rung is reported as not fitting
+    result = search_target_size("in.mp4", options, info, 1, estimate=estimate)
+    assert not result.fits and result.options == ladder[-1]
+
+
+def test_search_can_be_cancelled():
+    """Test that a cancelled estimate ends the search"""
+    info = MediaInfo("in.mp4", width=1280, height=720, duration=60, fps=30, has_video=True)
+    result = search_target_size("in.mp4", ConversionOptions(), info, 1000,
+                                estimate=lambda *args, **kwargs: None)
+    assert result is None
+
+
+def test_smaller_rung():
+    """Test that an output over budget steps one rung down the ladder until the ladder ends"""
+    options = ConversionOptions(width=800, fps=15, colors=256)
+    ladder = quality_ladder(options)
+    assert smaller_rung(options, ladder[2], 1000, 1000) is None
+    assert smaller_rung(options, ladder[2], 1001, 1000) == ladder[3]
+    assert smaller_rung(options, ladder[-1], 1001, 1000) is None
+
+
+
+def test_retried_rung_drops_estimate():
+    """Test that a result stepped down after the search no longer reports the estimate of the searched rung"""
+    options = ConversionOptions(width=800, fps=15, colors=256)
+    ladder = quality_ladder(options)
+    estimate = SizeEstimate(900 * 1024, 800 * 1024, 1000 * 1024, 3, 3.0, 0.5)
+    result = TargetResult(1024 * 1024, ladder[0], estimate, True)
+    assert "est. " in result.describe()
+
+    retried = result.step_down(ladder[1]).step_down(ladder[2])
+    assert retried.options == ladder[2] and retried.estimate is None and retried.retries == 2
+    assert "est. " not in retried.describe() and "2 rungs below the search" in retried.describe()
+
+@pytest.mark.ffmpeg
+def test_convert_to_size(tmp_path, make_clip):
+    """Test that the converted GIF fits the budget and is encoded by the requested backend"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=12, size="640x360", rate=25)
+    info = MediaInfo(str(source), width=640, height=360, duration=12.0, fps=25.0, has_video=True)
+    output = tmp_path / "clip.gif"
+    budget = 400 * 1024
+
+    result, target = convert_to_size(str(source), str(output), ConversionOptions(width=640), info, budget)
+    assert result.size == output.stat().st_size
+    assert result.size <= budget and target.fits
+    assert target.options.width < 640 or target.options.fps < 15 or target.options.colors < 256
+
+    pillow, _ = convert_to_size(str(source), str(output), ConversionOptions(width=640, backend="pillow"), info, budget)
+    assert pillow.report.backend == "pillow"
@@ -0,0 +1,120 @@
+import argparse
+import json
+import subprocess
+import sys
+
+import pytest
+
+from jifmaker import batch
+from jifmaker.engine import ConversionOptions, convert
+from jifmaker.telemetry import (JobReport, Metrics, StageMetrics, append_report, exit_code, run_stage, stage_inputs,
+                                wait_process)
+
+
+def test_stage_inputs(tmp_path):
+    """Test that FFmpeg stages read their -i files and other commands the existing files among their args"""
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"data")
+    assert stage_inputs(["ffmpeg", "-i", str(clip), "-i", str(tmp_path / "missing.png"), "out.gif"]) == [str(clip)]
+    assert stage_inputs(["gifsicle", "-O2", str(clip), "-o", str(clip)]) == [str(clip)]
+
+
+@pytest.mark.ffmpeg
+def test_run_stage(tmp_path, make_clip):
+    """Test that a stage is measured: time, frames from FFmpeg's stats, bytes and the child's resources"""
+    clip = make_clip(tmp_path / "clip.mp4")
+    output = tmp_path / "out.gif"
+    metrics, stderr = run_stage("encode", "GIF creation", ["ffmpeg", "-y", "-i", clip, str(output)])
+    assert metrics.exit_code == 0 and metrics.wall > 0
+    assert metrics.frames == 10
+    assert metrics.bytes_in == (tmp_path / "clip.mp4").stat().st_size
+    assert metrics.bytes_out == output.stat().st_size > 0
+    if sys.platform != "win32":
+        assert metrics.cpu > 0 and metrics.peak_rss > 1024 * 1024
+    assert "GIF creation: " in metrics.describe()
+
+    failed, stderr = run_stage("encode", "GIF creation", ["ffmpeg", "-i", str(tmp_path / "missing.mp4"), "x.gif"])
+    assert failed.exit_code != 0 and "missing.mp4" in stderr
+
+
+@pytest.mark.ffmpeg
+def test_run_stage_cancelled(tmp_path):
+    """Test that a cancelled stage is killed instead of running to the end"""
+    args = ["ffmpeg", "-f", "lavfi", "-i", "testsrc2=rate=10", "-f", "null", "-"]
+    metrics, _ = run_stage("encode", "endless", args, cancelled=lambda: True)
+    assert metrics.exit_code < 0 and metrics.wall < 5
+
+
+@pytest.mark.ffmpeg
+def test_convert_report(tmp_path, make_clip):
+    """Test that a conversion returns the metrics of its palette and encode stages"""
+    clip = make_clip(tmp_path / "clip.mp4")
+    result = convert(clip, str(tmp_path / "out.gif"), ConversionOptions(width=80, fps=10, reuse_palette=False))
+    report = result.report
+    assert [stage.name for stage in report.stages] == ["palette", "encode"]
+    assert report.success and report.elapsed > 0
+    assert report.stages[1].frames == 10 and report.stages[1].bytes_out == result.size
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="wait statuses are POSIX")
+def test_wait_process():
+    """Test that exit codes and killing signals are decoded like Popen.wait does, on every supported Python"""
+    assert exit_code(3 << 8) == 3 and exit_code(9) == -9
+    process = subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"])
+    usage = wait_process(process)
+    assert process.returncode == 3 and usage.ru_utime >= 0
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    wait_process(process, cancelled=lambda: True)
+    assert process.returncode == -9
+
+
+def test_metrics_render(tmp_path):
+    """Test that job reports are summed into Prometheus counters with one TYPE line per metric"""
+    metrics = Metrics()
+    report = JobReport("a.mp4", "a.gif", elapsed=2.0)
+    report.add(StageMetrics("palette", "palette generation", 0.5, 0.4, 1, 1000, 700, 20 * 1024 * 1024))
+    report.add(StageMetrics("encode", "GIF creation", 1.5, 1.2, 30, 1700, 5000, 30 * 1024 * 1024))
+    metrics.add(report)
+    metrics.add(JobReport("b.mp4", "b.gif").finish(False, "failed"))
+    text = metrics.render()
+    assert 'jifmaker_jobs_total{status="ok"} 1' in text and 'jifmaker_jobs_total{status="failed"} 1' in text
+    assert 'jifmaker_stage_frames_total{stage="encode"} 30' in text
+    assert text.count("# TYPE jifmaker_stage_seconds_total counter") == 1
+    assert "# TYPE jifmaker_stage_peak_rss_bytes gauge" in text
+
+    path = tmp_path / "jifmaker.prom"
+    metrics.write(str(path))
+    assert path.read_text() == text
+
+
+def test_append_report(tmp_path):
+    """Test that each report is one JSON line with its stages"""
+    path = tmp_path / "jobs.jsonl"
+    report = JobReport("a.mp4", "a.gif")
+    report.add(StageMetrics("encode", "GIF creation", 1.0, frames=5))
+    append_report(str(path), report.finish())
+    append_report(str(path), JobReport("b.mp4", "b.gif").finish(False, "boom"))
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert lines[0]["stages"][0]["frames"] == 5 and lines[0]["success"]
+    assert lines[1]["error"] == "boom" and lines[1]["stages"] == []
+
+
+@pytest.mark.ffmpeg
+def test_batch_report(tmp_path, capsys, make_clip):
+    """Test that batch --report and --metrics record every job"""
+    make_clip(tmp_path / "a.mp4")
+    (tmp_path / "broken.mp4").write_bytes(b"not a video")
+    parser = argparse.ArgumentParser()
+    batch.add_arguments(parser)
+    report, metrics = tmp_path / "jobs.jsonl", tmp_path / "jifmaker.prom"
+    args = parser.parse_args([str(tmp_path / "a.mp4"), str(tmp_path / "broken.mp4"), "--width", "80",
+                              "--backend", "ffmpeg", "--report", str(report), "--metrics", str(metrics)])
+    assert batch.run(args) == 1
+    assert "stages: palette" in capsys.readouterr().out
+
+    jobs = {json.loads(line)["input_file"].rsplit("/", 1)[-1]: json.loads(line)
+            for line in report.read_text().splitlines()}
+    assert jobs["a.mp4"]["success"] and [stage["name"] for stage in jobs["a.mp4"]["stages"]] == ["palette", "encode"]
+    assert not jobs["broken.mp4"]["success"]
+    text = metrics.read_text()
+    assert 'jifmaker_jobs_total{status="failed"} 1' in text and 'jifmaker_jobs_total{status="ok"} 1' in text
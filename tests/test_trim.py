@@ -0,0 +1,70 @@
+import pytest
+
+from jifmaker.cache import ProbeCache
+from jifmaker.engine import ConversionOptions, build_plan, time_to_seconds
+from jifmaker.trim import Seek, format_seconds, format_timestamp, keyframe_times, parse_timestamp, plan_seek
+
+
+def test_parse_timestamp():
+    """Test that timestamps keep their milliseconds and whole ones stay integers"""
+    assert parse_timestamp("00:08:20.250") == 500.25
+    assert parse_timestamp("1:02.5") == 62.5
+    assert parse_timestamp("12.3456") == 12.346
+    assert parse_timestamp("01:02:03") == 3723 and isinstance(parse_timestamp("01:02:03"), int)
+    assert parse_timestamp("1:2:3:4") == 0
+    assert parse_timestamp("-5") == 0
+    assert time_to_seconds("00:00:01.5") == 1.5
+
+
+def test_format_timestamp():
+    """Test that milliseconds are only written when there are any"""
+    assert format_timestamp(3) == "00:00:03"
+    assert format_timestamp(500.25) == "00:08:20.250"
+    assert format_timestamp(3599.9996) == "01:00:00"
+    assert format_seconds(4.5) == "4.5" and format_seconds(2) == "2" and format_seconds(0.0004) == "0"
+
+
+def test_plan_seek():
+    """Test that the input is seeked to the keyframe at or before the start and the rest is trimmed"""
+    keyframes = [0.0, 8.3333333, 16.6666667]
+    seek = plan_seek(10.25, 5, keyframes)
+    assert (seek.keyframe, seek.offset) == (8.333333, 1.916)
+    assert seek.input_args("in.mp4") == ["-ss", "8.333333", "-t", "6.916", "-i", "in.mp4"]
+    assert seek.filters() == ["trim=start=1.916,setpts=PTS-STARTPTS"]
+
+    on_keyframe = plan_seek(16.6666667, None, keyframes)
+    assert on_keyframe.filters() == [] and "-t" not in on_keyframe.input_args("in.mp4")
+
+    # Without keyframes FFmpeg seeks to the start itself
+    assert plan_seek(2.5, 1).input_args("in.mp4") == ["-ss", "00:00:02.500", "-t", "1", "-i", "in.mp4"]
+    assert Seek().input_args("in.mp4") == ["-i", "in.mp4"]
+
+
+def test_build_plan_millisecond_trim():
+    """Test that a millisecond trim reaches FFmpeg without being rounded to whole seconds"""
+    options = ConversionOptions(start_time="00:00:01.250", end_time="00:00:03.750")
+    plan = build_plan("in.mp4", "out.gif", options, "/tmp/work")
+    for stage in plan.stages:
+        assert stage.args[stage.args.index("-ss") + 1] == "00:00:01.250"
+        assert stage.args[stage.args.index("-t") + 1] == "2.5"
+
+
+@pytest.mark.ffmpeg
+def test_keyframe_times_cached(tmp_path, make_clip):
+    """Test that keyframes are probed once per file version and used to seek"""
+    source = tmp_path / "clip.mp4"
+    make_clip(source, duration=6, args=("-g", "20", "-pix_fmt", "yuv420p"))
+    cache = ProbeCache(str(tmp_path / "keyframes.sqlite3"))
+    try:
+        assert keyframe_times(str(source), cache) == pytest.approx([0, 2, 4])
+        assert keyframe_times(str(source), cache) == pytest.approx([0, 2, 4])
+        assert (cache.hits, cache.misses) == (1, 1)
+    finally:
+        cache.close()
+    assert keyframe_times(str(tmp_path / "missing.mp4"), cache=False) is None
+
+    plan = build_plan(str(source), str(tmp_path / "out.gif"), ConversionOptions(start_time="00:00:03.500"),
+                      str(tmp_path))
+    args = plan.stages[-1].args
+    assert float(args[args.index("-ss") + 1]) == pytest.approx(2)
+    assert "trim=start=1.5,setpts=PTS-STARTPTS" in args[args.index("-filter_complex") + 1]
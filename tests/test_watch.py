@@ -0,0 +1,142 @@
+import argparse
+import json
+import shutil
+import sys
+import threading
+import time
+
+import pytest
+
+from jifmaker.engine import ConversionOptions
+from jifmaker.watch import DONE, PENDING, FolderWatcher, WatchState, add_arguments, load_profile
+
+
+def test_is_input(tmp_path):
+    """Test that outputs, partial and hidden files are never taken as inputs"""
+    watcher = FolderWatcher(str(tmp_path), ConversionOptions())
+    assert watcher.is_input(str(tmp_path / "clip.MP4"))
+    assert not watcher.is_input(str(tmp_path / "clip_processed.gif"))
+    assert not watcher.is_input(str(tmp_path / ".clip_processed.gif.part.gif"))
+    assert not watcher.is_input(str(tmp_path / "notes.txt"))
+
+
+def test_load_profile(tmp_path):
+    """Test that a profile overrides the settings it names and rejects unknown ones"""
+    profile = tmp_path / "profile.json"
+    profile.write_text(json.dumps({"width": 320, "fps": 8}))
+    options = load_profile(str(profile), ConversionOptions(colors=64))
+    assert (options.width, options.fps, options.colors) == (320, 8, 64)
+
+    profile.write_text(json.dumps({"widht": 320}))
+    with pytest.raises(ValueError, match="widht"):
+        load_profile(str(profile), ConversionOptions())
+
+
+def test_state_persists(tmp_path):
+    """Test that the state is saved on every change and read back by a new instance"""
+    path = str(tmp_path / "state.json")
+    state = WatchState(path)
+    state.mark("/in/a.mp4", PENDING, (10, 1))
+    state.mark("/in/b.mp4", DONE, (20, 2))
+    state.mark("/in/a.mp4", DONE, (10, 1))
+    state.mark("/in/c.mp4", PENDING, (30, 3))
+
+    restored = WatchState(path)
+    assert restored.get(DONE, "/in/a.mp4") == (10, 1) and restored.get(PENDING, "/in/a.mp4") is None
+    assert restored.pending() == ["/in/c.mp4"]
+
+
+def test_state_unreadable(tmp_path):
+    """Test that a truncated or foreign state file is logged and replaced by an empty state"""
+    path = tmp_path / "state.json"
+    for text in ('{"done": {"/in/a.mp4": [1', "[]", '{"done": ["/in/a.mp4"]}'):
+        path.write_text(text)
+        log = []
+        state = WatchState(str(path), log.append)
+        assert log[0].startswith("Warning: ignoring unreadable state file")
+        assert state.get(DONE, "/in/a.mp4") is None and state.pending() == []
+
+        state.mark("/in/b.mp4", DONE, (1, 1))
+        assert WatchState(str(path)).get(DONE, "/in/b.mp4") == (1, 1)
+
+
+def test_settle_waits_for_stable_size(tmp_path):
+    """Test that an input is queued only after it stopped growing, once however many events it had"""
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"x" * 100)
+    watcher = FolderWatcher(str(tmp_path), ConversionOptions(), settle=1.0)
+    watcher.notice(str(clip))
+    watcher.notice(str(clip))
+    start = watcher._settling[str(clip)][2]
+
+    watcher.settle(start + 0.5)
+    with open(clip, "ab") as file:
+        file.write(b"x" * 100)
+    watcher.settle(start + 1.2)  # Grew, the wait starts over
+    assert not watcher._ready
+
+    watcher.settle(start + 2.5)
+    assert [path for path, _ in watcher._ready] == [str(clip)]
+    assert watcher.state.get(PENDING, str(clip))[0] == 200
+
+
+def test_queue_is_bounded(tmp_path):
+    """Test that stable inputs beyond the queue size wait for room instead of being queued"""
+    watcher = FolderWatcher(str(tmp_path), ConversionOptions(), queue_size=1)
+    watcher._ready.extend([("/in/a.mp4", (1, 1)), ("/in/b.mp4", (1, 1))])
+    watcher.dispatch()
+    assert watcher._queue.qsize() == 1 and len(watcher._ready) == 1
+    assert not watcher.idle()
+
+
+def test_watch_arguments():
+    """Test that watch takes the batch conversion settings"""
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args(["inbox", "--width", "320", "--format", "webp", "--settle", "5", "--once"])
+    assert (args.directory, args.width, args.format, args.settle, args.once) == ("inbox", 320, "webp", 5.0, True)
+
+
+@pytest.mark.ffmpeg
+def test_restart_resumes_pending(tmp_path, make_clip):
+    """Test that pending inputs of an earlier run are converted and finished ones are not converted again"""
+    clip = make_clip(tmp_path / "a.mp4")
+    state_path = str(tmp_path / "state.json")
+    WatchState(state_path).mark(clip, PENDING, (1, 1))
+    messages = []
+    options = ConversionOptions(width=80, backend="ffmpeg")
+
+    watcher = FolderWatcher(str(tmp_path), options, settle=0.1, state_path=state_path, log=messages.append)
+    assert watcher.run(once=True) == 0
+    assert watcher.converted == 1 and (tmp_path / "a_processed.gif").exists()
+    assert WatchState(state_path).get(DONE, clip) is not None
+
+    again = FolderWatcher(str(tmp_path), options, settle=0.1, state_path=state_path, log=messages.append)
+    assert again.run(once=True) == 0 and again.converted == 0
+
+
+@pytest.mark.ffmpeg
+@pytest.mark.parametrize("polling", [False, True])
+def test_watch_converts_new_files(tmp_path, polling, make_clip):
+    """Test that a file dropped into the watched directory is converted while the watcher runs"""
+    if not polling and not sys.platform.startswith("linux"):
+        pytest.skip("inotify is only available on Linux")
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    messages = []
+    watcher = FolderWatcher(str(inbox), ConversionOptions(width=80, backend="ffmpeg"), settle=0.3, polling=polling,
+                            state_path=str(tmp_path / "state.json"), log=messages.append)
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        time.sleep(0.3)
+        shutil.move(make_clip(tmp_path / "clip.mp4"), inbox / "clip.mp4")
+        deadline = time.monotonic() + 20
+        while watcher.converted == 0 and time.monotonic() < deadline:
+            time.sleep(0.1)
+    finally:
+        watcher.stop()
+        thread.join()
+    assert watcher.converted == 1, messages
+    assert (inbox / "clip_processed.gif").exists()
+    assert ("Inotify" if not polling else "Polling") in messages[0]
@@ -0,0 +1,65 @@
+import pytest
+
+from jifmaker.engine import ConversionOptions, build_plan, partial_path
+from jifmaker.worker import ConversionWorker
+
+
+pytestmark = pytest.mark.ffmpeg
+
+
+@pytest.fixture
+def source(tmp_path, make_clip):
+    path = tmp_path / "clip.mp4"
+    make_clip(path, duration=2, size="320x240", rate=25)
+    return path
+
+
+def make_worker(source, tmp_path, **options):
+    output = tmp_path / "clip.gif"
+    plan = build_plan(str(source), partial_path(str(output)), ConversionOptions(width=160, **options), str(tmp_path))
+    return ConversionWorker(plan, str(output), total_frames=30), output
+
+
+def test_worker_runs_all_stages(qtbot, source, tmp_path):
+    """Test that the worker streams log lines and progress and renames the finished GIF into place"""
+    worker, output = make_worker(source, tmp_path)
+    logs, updates, stages = [], [], []
+    worker.log.connect(logs.append)
+    worker.progress.connect(updates.append)
+    worker.stage_started.connect(lambda number, count, name: stages.append((number, count)))
+
+    with qtbot.waitSignal(worker.finished, timeout=30000) as blocker:
+        worker.start()
+
+    assert blocker.args[0] is True
+    assert stages == [(1, 2), (2, 2)]
+    assert updates and updates[-1].done
+    assert any("GIF creation completed" in line for line in logs)
+    assert output.read_bytes()[:6] == b"GIF89a"
+    assert not worker.is_running()
+
+
+def test_worker_cancel(qtbot, source, tmp_path):
+    """Test that cancelling kills FFmpeg and leaves no output behind"""
+    worker, output = make_worker(source, tmp_path)
+    worker.stage_started.connect(lambda *args: worker.cancel())
+
+    with qtbot.waitSignal(worker.finished, timeout=30000) as blocker:
+        worker.start()
+
+    assert blocker.args == [False, "Processing cancelled"]
+    assert not output.exists()
+    assert not tmp_path.joinpath(".clip.gif.part.gif").exists()
+
+
+def test_worker_rename_failure(qtbot, source, tmp_path):
+    """Test that an output that cannot be replaced fails the conversion instead of raising in the slot"""
+    worker, output = make_worker(source, tmp_path)
+    output.mkdir()
+    (output / "keep").write_bytes(b"")
+
+    with qtbot.waitSignal(worker.finished, timeout=30000) as blocker:
+        worker.start()
+
+    assert blocker.args[0] is False and blocker.args[1].startswith("Could not write")
+    assert not tmp_path.joinpath(".clip.gif.part.gif").exists()